@@ -0,0 +1,118 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    DB load-strategy benchmark.
+
+    Loads the same synthetic ReadingUtilisation rows with each load strategy in
+    DBBackend.load_rows (per_row, executemany, fast_executemany, bulk) and
+    reports rows/sec. Runs against the embedded SQLite backend by default, so
+    it works on a laptop; use --backend sqlserver for the database in DB_CONFIG.
+    On SQLite fast_executemany behaves like executemany. Logging goes through
+    log_config like the pipeline's; --record-log-every 1 --sync-log reproduces
+    the old log-every-record behaviour of per_row.
+
+    Usage:
+        python -m benchmarks.bench_db_load --rows 200000
+        python -m benchmarks.bench_db_load --backend sqlserver --strategies executemany fast_executemany bulk
+        python -m benchmarks.bench_db_load --strategies per_row --log-level INFO --record-log-every 1 --sync-log
+-------------------------------------------------------------------------------
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.mock_api import MockDataset, SCALES
+from fedpipeline.config import LOGGING_CONFIG
+from fedpipeline.db_backend import LOAD_STRATEGIES, SQLiteBackend, SqlServerBackend
+from fedpipeline.log_config import configure_logging, stop_logging
+
+BENCH_TABLE = "BenchLoadReadingUtilisation"
+COLUMNS = ["ereserve_id", "integration_user_id", "item_id", "item_usage_id", "created_at", "updated_at"]
+
+
+def synthetic_rows(count: int) -> list:
+    counts = dict(SCALES["large"])
+    counts["reading-utilisations"] = count
+    dataset = MockDataset(counts)
+    rows = []
+    for i in range(count):
+        attributes, _ = dataset.builders["reading-utilisations"](i)
+        rows.append((
+            i + 1, attributes["integration-user-id"], attributes["item-id"],
+            attributes["item-usage-id"], attributes["created-at"], attributes["updated-at"],
+        ))
+    return rows
+
+
+def run_strategy(backend, strategy: str, rows: list, batch_size: int) -> dict:
+    query = f"INSERT INTO {BENCH_TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cursor.execute(f"""
+            CREATE TABLE {BENCH_TABLE} (
+                ereserve_id INT PRIMARY KEY NOT NULL,
+                integration_user_id INT,
+                item_id INT,
+                item_usage_id INT,
+                created_at DATETIME,
+                updated_at DATETIME
+            )
+        """)
+        conn.commit()
+
+        start = time.perf_counter()
+        failed = backend.load_rows(conn, query, rows, BENCH_TABLE, strategy=strategy, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+
+        cursor.execute(f"SELECT COUNT(*) FROM {BENCH_TABLE}")
+        loaded = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {BENCH_TABLE}")
+        conn.commit()
+    finally:
+        conn.close()
+    return {"strategy": strategy, "seconds": elapsed, "loaded": loaded, "failed": failed,
+            "rows_per_sec": loaded / elapsed if elapsed else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DB load strategies")
+    parser.add_argument("--backend", choices=["sqlite", "sqlserver"], default="sqlite")
+    parser.add_argument("--sqlite-path", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--strategies", nargs="+", choices=LOAD_STRATEGIES, default=list(LOAD_STRATEGIES))
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="INFO includes the sampled per-record logging done by per_row")
+    parser.add_argument("--record-log-every", type=int, default=None,
+                        help="Override LOGGING_CONFIG RECORD_LOG_EVERY (1 logs every record)")
+    parser.add_argument("--log-format", choices=["text", "json"], default=None)
+    parser.add_argument("--sync-log", action="store_true", help="Write log records from the loading thread")
+    args = parser.parse_args()
+
+    if args.record_log_every is not None:
+        LOGGING_CONFIG["RECORD_LOG_EVERY"] = args.record_log_every
+    log_path = os.path.join(tempfile.gettempdir(), "fedpipeline_bench_db_load.log")
+    configure_logging(filename=log_path, level=args.log_level, fmt=args.log_format, use_async=not args.sync_log)
+
+    if args.backend == "sqlite":
+        path = args.sqlite_path or os.path.join(tempfile.mkdtemp(prefix="fedpipeline_bench_"), "bench.sqlite3")
+        backend = SQLiteBackend(path)
+    else:
+        backend = SqlServerBackend()
+
+    print(f"Generating {args.rows} synthetic ReadingUtilisation rows...")
+    rows = synthetic_rows(args.rows)
+
+    print(f"{'strategy':<20}{'sec':>10}{'rows/s':>14}{'loaded':>10}{'failed':>8}   ({backend.name})")
+    for strategy in args.strategies:
+        result = run_strategy(backend, strategy, rows, args.batch_size)
+        print(f"{result['strategy']:<20}{result['seconds']:>10.2f}{result['rows_per_sec']:>14.0f}"
+              f"{result['loaded']:>10}{result['failed']:>8}")
+    stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Sparse fieldset benchmark.
+
+    For each endpoint, fetches the same pages twice: once as full resources and
+    once with the fields[<type>] fieldset from jobs.ENTITY_ATTRIBUTES. It then
+    reports bytes received and JSON decode time for both. Runs against an
+    in-process mock API by default; --api-url measures a real eReserve instance
+    with the configured credentials. Flags endpoints whose server ignored the
+    fieldset.
+
+    Usage:
+        python -m benchmarks.bench_sparse_fields --scale small
+        python -m benchmarks.bench_sparse_fields --api-url https://.../public/v1 --pages 3
+-------------------------------------------------------------------------------
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.mock_api import create_server, start_in_thread
+
+
+def measure(fetch, url: str, pages: int, repeat: int) -> dict:
+    total_bytes, decode_seconds, items, fetched = 0, 0.0, 0, 0
+    first_item = None
+    while url and fetched < pages:
+        response = fetch(url, record=False)
+        if not response:
+            return None
+        body = response.content
+        start = time.perf_counter()
+        for _ in range(repeat):
+            page = json.loads(body)
+        decode_seconds += (time.perf_counter() - start) / repeat
+        total_bytes += len(body)
+        items += len(page.get("data", []))
+        if first_item is None and page.get("data"):
+            first_item = page["data"][0]
+        fetched += 1
+        url = page.get("links", {}).get("next")
+    return {"bytes": total_bytes, "decode_ms": decode_seconds * 1000, "items": items, "first_item": first_item}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure byte and decode-time savings of sparse fieldsets")
+    parser.add_argument("--api-url", help="Base URL of a real API (default: start the mock in-process)")
+    parser.add_argument("--scale", default="small", help="Mock dataset scale when no --api-url is given")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=5, help="Pages fetched per endpoint and variant")
+    parser.add_argument("--repeat", type=int, default=5, help="json.loads repetitions per page when timing")
+    args = parser.parse_args()
+
+    server = None
+    if args.api_url:
+        os.environ["FEDPIPELINE_API_BASE_URL"] = args.api_url
+    else:
+        server = create_server(scale=args.scale)
+        start_in_thread(server)
+        os.environ["FEDPIPELINE_API_BASE_URL"] = server.base_url
+
+    # Imported after the base URL is set, because API_CONFIG is built at import time
+    from fedpipeline.api_handler import fetch_data_from_api
+    from fedpipeline.config import API_BASE_URL
+    from fedpipeline.jobs import ENTITY_ATTRIBUTES
+
+    print(f"{'endpoint':<26}{'full KB':>10}{'sparse KB':>11}{'saved':>8}"
+          f"{'full ms':>10}{'sparse ms':>11}{'saved':>8}  note")
+    try:
+        for entity, attributes in ENTITY_ATTRIBUTES.items():
+            url = f"{API_BASE_URL}/{entity}?page[size]={args.page_size}"
+            full = measure(fetch_data_from_api, url, args.pages, args.repeat)
+            sparse = measure(fetch_data_from_api, f"{url}&fields[{entity}]={','.join(attributes)}",
+                             args.pages, args.repeat)
+            if not full or not sparse:
+                print(f"{entity:<26}{'request failed':>30}")
+                continue
+
+            note = ""
+            item = sparse["first_item"] or {}
+            if item.get("relationships") or set(item.get("attributes", {})) - set(attributes):
+                note = "server ignored fields"
+            elif full["items"] != sparse["items"]:
+                note = f"item counts differ ({full['items']} vs {sparse['items']})"
+            byte_saving = 1 - sparse["bytes"] / full["bytes"] if full["bytes"] else 0
+            time_saving = 1 - sparse["decode_ms"] / full["decode_ms"] if full["decode_ms"] else 0
+            print(f"{entity:<26}{full['bytes'] / 1024:>10.1f}{sparse['bytes'] / 1024:>11.1f}{byte_saving:>8.0%}"
+                  f"{full['decode_ms']:>10.2f}{sparse['decode_ms']:>11.2f}{time_saving:>8.0%}  {note}")
+    finally:
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,610 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Offline stand-in for the eReserve JSON:API used by the pipeline.
+
+    Serves every endpoint in API_CONFIG from synthetic data that is generated on
+    the fly from the record index, so millions of usage rows cost no memory.
+    Supports login, page[size]/page[number] pagination via links.next,
+    filter[school_id] on units, filter[updated_at] (BETWEEN / >= / <=),
+    filter[id][gt] and filter[id][lte] with sort=id (keyset paging and work
+    queue id ranges), filter[id]=1,2,3, fields[<type>] sparse fieldsets,
+    include=<relationships> (compound documents),
+    token expiry (401) and injectable latency and errors.
+
+    Usage:
+        python -m benchmarks.mock_api --scale small --port 8081
+        set FEDPIPELINE_API_BASE_URL=http://127.0.0.1:8081/public/v1
+        python -m fedpipeline.main --once
+-------------------------------------------------------------------------------
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+API_PREFIX = "/public/v1"
+
+# Record counts per entity. Usage tables dominate, as they do in production.
+SCALES = {
+    "tiny": {
+        "schools": 3, "integration-users": 50, "readings": 200, "units": 30,
+        "unit-offerings": 40, "teaching-sessions": 6, "reading-lists": 40,
+        "reading-list-items": 400, "reading-list-usages": 500,
+        "reading-list-item-usages": 1000, "reading-utilisations": 2000,
+    },
+    "small": {
+        "schools": 10, "integration-users": 2000, "readings": 10000, "units": 800,
+        "unit-offerings": 1200, "teaching-sessions": 30, "reading-lists": 1500,
+        "reading-list-items": 20000, "reading-list-usages": 20000,
+        "reading-list-item-usages": 50000, "reading-utilisations": 100000,
+    },
+    "medium": {
+        "schools": 20, "integration-users": 20000, "readings": 50000, "units": 3000,
+        "unit-offerings": 5000, "teaching-sessions": 60, "reading-lists": 6000,
+        "reading-list-items": 120000, "reading-list-usages": 150000,
+        "reading-list-item-usages": 400000, "reading-utilisations": 1000000,
+    },
+    "large": {
+        "schools": 30, "integration-users": 60000, "readings": 150000, "units": 6000,
+        "unit-offerings": 10000, "teaching-sessions": 90, "reading-lists": 12000,
+        "reading-list-items": 300000, "reading-list-usages": 500000,
+        "reading-list-item-usages": 1500000, "reading-utilisations": 4000000,
+    },
+}
+
+# Synthetic updated-at values are spread evenly (and monotonically by id) over
+# the five years up to today, which lets updated_at filters be answered with a
+# bisection and keeps the pipeline's rolling date window populated.
+HISTORY_END = datetime.combine(datetime.now().date(), datetime.min.time())
+HISTORY_START = HISTORY_END - timedelta(days=5 * 365)
+
+GENRES = ["Book Chapter", "Journal Article", "Book", "Web Page", "Video"]
+IMPORTANCE = ["Essential", "Recommended", "Further Reading"]
+UNIT_PREFIXES = ["ITECH", "BUACC", "HEALT", "SCMED", "EDBED", "NURBN", "XXABC"]
+
+
+def _ts(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _spread(i: int, modulo: int) -> int:
+    # Cheap deterministic scatter so foreign keys are not simply sequential
+    return (i * 2654435761) % modulo
+
+
+class MockDataset:
+    def __init__(self, counts: dict, orphan_rate: float = 0.0):
+        self.counts = dict(counts)
+        self.orphan_rate = orphan_rate
+        self.builders = {
+            "schools": self._school,
+            "integration-users": self._integration_user,
+            "readings": self._reading,
+            "units": self._unit,
+            "unit-offerings": self._unit_offering,
+            "teaching-sessions": self._teaching_session,
+            "reading-lists": self._reading_list,
+            "reading-list-items": self._reading_list_item,
+            "reading-list-usages": self._reading_list_usage,
+            "reading-list-item-usages": self._reading_list_item_usage,
+            "reading-utilisations": self._reading_utilisation,
+        }
+
+    # ---- index helpers ------------------------------------------------------
+
+    def updated_at(self, entity: str, i: int) -> datetime:
+        span = (HISTORY_END - HISTORY_START).total_seconds()
+        return HISTORY_START + timedelta(seconds=int(span * i / max(1, self.counts[entity])))
+
+    def index_range_for_dates(self, entity: str, start: datetime = None, end: datetime = None):
+        # updated_at is monotonic in the index, so the matching rows are contiguous
+        n = self.counts[entity]
+        lo = 0 if start is None else self._first_index(entity, lambda d: d >= start)
+        hi = n if end is None else self._first_index(entity, lambda d: d > end)
+        return lo, max(lo, hi)
+
+    def _first_index(self, entity: str, predicate) -> int:
+        lo, hi = 0, self.counts[entity]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if predicate(self.updated_at(entity, mid)):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def index_range_for_school(self, school_id: int):
+        # Units are assigned to schools in contiguous blocks
+        n_units, n_schools = self.counts["units"], self.counts["schools"]
+        if school_id < 1 or school_id > n_schools:
+            return 0, 0
+        lo = -(-(school_id - 1) * n_units // n_schools)
+        hi = -(-school_id * n_units // n_schools)
+        return lo, hi
+
+    def school_for_unit(self, i: int) -> int:
+        return i * self.counts["schools"] // self.counts["units"] + 1
+
+    def _fk(self, entity: str, i: int, salt: int = 0) -> int:
+        n = self.counts[entity]
+        if self.orphan_rate and _spread(i + salt, 10000) < self.orphan_rate * 10000:
+            return n + 1 + _spread(i, 1000)  # points past the end: a missing parent
+        return _spread(i + salt, n) + 1
+
+    # ---- resources -----------------------------------------------------------
+
+    def resource(self, entity: str, i: int, base_url: str, fields: set = None) -> dict:
+        # fields is a JSON:API sparse fieldset: only those attributes and
+        # relationships are returned (an empty set leaves just id/type/links)
+        attributes, relationships = self.builders[entity](i)
+        if fields is not None:
+            attributes = {name: value for name, value in attributes.items() if name in fields}
+            relationships = {name: rel for name, rel in (relationships or {}).items() if name in fields}
+        record_id = str(i + 1)
+        resource = {"id": record_id, "type": entity, "attributes": attributes}
+        if relationships:
+            resource["relationships"] = {
+                name: {"data": {"type": rel_type, "id": str(rel_id)} if rel_id is not None else None}
+                for name, (rel_type, rel_id) in relationships.items()
+            }
+        resource["links"] = {"self": f"{base_url}/{entity}/{record_id}"}
+        return resource
+
+    def _stamps(self, entity: str, i: int) -> dict:
+        updated = self.updated_at(entity, i)
+        created = updated - timedelta(days=_spread(i, 90))
+        return {"created-at": _ts(max(created, HISTORY_START)), "updated-at": _ts(updated)}
+
+    def _school(self, i):
+        return {"name": f"School of Synthetic Studies {i + 1}"}, None
+
+    def _integration_user(self, i):
+        attrs = {
+            "identifier": f"user{i + 1:07d}",
+            "roles": "Learner" if i % 20 else "Instructor",
+            "first-name": f"First{i + 1}",
+            "last-name": f"Last{i + 1}",
+            "email": f"user{i + 1}@students.example.edu.au",
+            "lti-consumer-user-id": uuid.UUID(int=i + 1).hex,
+            "lti-lis-person-sourcedid": f"{30000000 + i}",
+        }
+        attrs.update(self._stamps("integration-users", i))
+        return attrs, None
+
+    def _reading(self, i):
+        attrs = {
+            "reading-title": f"Synthetic reading number {i + 1}: a study of data pipelines",
+            "genre": GENRES[i % len(GENRES)],
+            "source-document-title": f"Journal of Benchmarks vol. {i % 40 + 1}",
+            "article-number": str(i % 500 + 1),
+        }
+        attrs.update(self._stamps("readings", i))
+        return attrs, None
+
+    def _unit(self, i):
+        prefix = UNIT_PREFIXES[i % len(UNIT_PREFIXES)]
+        code = f"{prefix}{1000 + i % 9000}"
+        if i % 4 == 0:
+            code += f" / {prefix}{5000 + i % 4000}"
+        return {"code": code, "name": f"Synthetic Unit {i + 1}"}, {
+            "school": ("schools", self.school_for_unit(i)),
+        }
+
+    def _unit_offering(self, i):
+        unit_id = self._fk("units", i)
+        list_id = self._fk("reading-lists", i, 7)
+        attrs = {
+            "unit-id": unit_id,
+            "reading-list-id": list_id,
+            "source-unit-code": f"ITECH{1000 + i % 9000}",
+            "source-unit-name": f"Synthetic Unit {unit_id}",
+            "source-unit-offering": f"ITECH{1000 + i % 9000}_2025_S{i % 2 + 1}",
+            "result": "linked",
+        }
+        attrs.update(self._stamps("unit-offerings", i))
+        return attrs, {"unit": ("units", unit_id), "reading-list": ("reading-lists", list_id)}
+
+    def _teaching_session(self, i):
+        year = 2021 + i // 6
+        attrs = {
+            "name": f"{year}{i % 6 + 1:02d} - Semester {i % 6 + 1}",
+            "start-date": f"{year}-{(i % 6) * 2 + 1:02d}-01",
+            "end-date": f"{year}-{(i % 6) * 2 + 2:02d}-28",
+            "archived": year < 2024,
+        }
+        attrs.update(self._stamps("teaching-sessions", i))
+        return attrs, None
+
+    def _reading_list(self, i):
+        unit_id = self._fk("units", i)
+        session_id = self._fk("teaching-sessions", i, 3)
+        attrs = {
+            "unit-id": unit_id,
+            "teaching-session-id": session_id,
+            "name": f"Reading list {i + 1}",
+            "duration": "Semester",
+            "start-date": "2025-03-01",
+            "end-date": "2025-06-30",
+            "hidden": i % 17 == 0,
+            "usage-count": _spread(i, 5000),
+            "item-count": _spread(i, 60),
+            "approved-item-count": _spread(i, 50),
+            "deleted": i % 50 == 0,
+        }
+        attrs.update(self._stamps("reading-lists", i))
+        return attrs, {"unit": ("units", unit_id), "teaching-session": ("teaching-sessions", session_id)}
+
+    def _reading_list_item(self, i):
+        list_id = self._fk("reading-lists", i)
+        reading_id = self._fk("readings", i, 11)
+        attrs = {
+            "list-id": list_id,
+            "reading-id": reading_id,
+            "status": "available" if i % 9 else "withdrawn",
+            "hidden": i % 23 == 0,
+            "reading-utilisations-count": _spread(i, 400),
+            "reading-importance": IMPORTANCE[i % len(IMPORTANCE)],
+            "usage-count": _spread(i, 900),
+        }
+        attrs.update(self._stamps("reading-list-items", i))
+        return attrs, {"list": ("reading-lists", list_id), "reading": ("readings", reading_id)}
+
+    def _reading_list_usage(self, i):
+        list_id = self._fk("reading-lists", i)
+        user_id = self._fk("integration-users", i, 5)
+        attrs = {
+            "list-id": list_id,
+            "integration-user-id": user_id,
+            "item-usage-count": _spread(i, 40),
+        }
+        attrs.update(self._stamps("reading-list-usages", i))
+        return attrs, {"list": ("reading-lists", list_id), "integration-user": ("integration-users", user_id)}
+
+    def _reading_list_item_usage(self, i):
+        item_id = self._fk("reading-list-items", i)
+        list_usage_id = self._fk("reading-list-usages", i, 13)
+        user_id = self._fk("integration-users", i, 5)
+        attrs = {
+            "item-id": item_id,
+            "list-usage-id": list_usage_id,
+            "integration-user-id": user_id,
+            "utilisation-count": _spread(i, 12),
+        }
+        attrs.update(self._stamps("reading-list-item-usages", i))
+        return attrs, {
+            "item": ("reading-list-items", item_id),
+            "list-usage": ("reading-list-usages", list_usage_id),
+            "integration-user": ("integration-users", user_id),
+        }
+
+    def _reading_utilisation(self, i):
+        item_id = self._fk("reading-list-items", i)
+        item_usage_id = self._fk("reading-list-item-usages", i, 17)
+        user_id = self._fk("integration-users", i, 5)
+        attrs = {
+            "integration-user-id": user_id,
+            "item-id": item_id,
+            "item-usage-id": item_usage_id,
+        }
+        attrs.update(self._stamps("reading-utilisations", i))
+        return attrs, {
+            "item": ("reading-list-items", item_id),
+            "item-usage": ("reading-list-item-usages", item_usage_id),
+            "integration-user": ("integration-users", user_id),
+        }
+
+
+class MockServerSettings:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 token_ttl_requests: int = 0, token_ttl_seconds: float = 0.0, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token_ttl_requests = token_ttl_requests
+        self.token_ttl_seconds = token_ttl_seconds
+        self.seed = seed
+
+
+class MockServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.logins = 0
+        self.pages = 0
+        self.items = 0
+        self.bytes_sent = 0
+        self.unauthorized = 0
+        self.injected_errors = 0
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "logins": self.logins,
+                "pages": self.pages,
+                "items": self.items,
+                "bytes_sent": self.bytes_sent,
+                "unauthorized": self.unauthorized,
+                "injected_errors": self.injected_errors,
+            }
+
+
+def _parse_date(value: str, end_of_day: bool = False):
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", ""))
+    except ValueError:
+        return None
+    if end_of_day and len(value) <= 10:
+        parsed += timedelta(days=1) - timedelta(seconds=1)
+    return parsed
+
+
+def parse_updated_at_filter(value: str):
+    # Mirrors the formats built by UsageStagingProcessor.build_filtered_url
+    match = re.match(r"^\s*BETWEEN\s+(\S+)\s+AND\s+(\S+)\s*$", value, re.IGNORECASE)
+    if match:
+        return _parse_date(match.group(1)), _parse_date(match.group(2), end_of_day=True)
+    match = re.match(r"^\s*(>=|<=)\s*(\S+)\s*$", value)
+    if match:
+        if match.group(1) == ">=":
+            return _parse_date(match.group(2)), None
+        return None, _parse_date(match.group(2), end_of_day=True)
+    return None, None
+
+
+class MockEReserveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockEReserve/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug("mock_api: " + format % args)
+
+    @property
+    def app(self) -> "MockEReserveServer":
+        return self.server
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.api+json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.app.stats.lock:
+            self.app.stats.bytes_sent += len(payload)
+
+    def _inject_faults(self) -> bool:
+        settings = self.app.settings
+        if settings.latency_ms or settings.jitter_ms:
+            delay = settings.latency_ms + self.app.random.uniform(0, settings.jitter_ms)
+            time.sleep(delay / 1000.0)
+        if settings.error_rate and self.app.random.random() < settings.error_rate:
+            with self.app.stats.lock:
+                self.app.stats.injected_errors += 1
+            self._send_json(503, {"errors": [{"status": "503", "title": "Injected failure"}]})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if urlsplit(self.path).path != f"{API_PREFIX}/users/login":
+            self._send_json(404, {"errors": [{"status": "404", "title": "Not found"}]})
+            return
+        if self._inject_faults():
+            return
+        token = self.app.issue_token()
+        with self.app.stats.lock:
+            self.app.stats.logins += 1
+        self._send_json(200, {"data": {"type": "users", "id": "1"}}, {"Authorization": f"Bearer {token}"})
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/__stats":
+            self._send_json(200, self.app.stats.as_dict())
+            return
+        if not parts.path.startswith(API_PREFIX + "/"):
+            self._send_json(404, {"errors": [{"status": "404", "title": "Not found"}]})
+            return
+        entity = parts.path[len(API_PREFIX) + 1:].strip("/")
+        if entity not in self.app.dataset.builders:
+            self._send_json(404, {"errors": [{"status": "404", "title": f"Unknown resource {entity}"}]})
+            return
+        if not self.app.check_token(self.headers.get("Authorization")):
+            with self.app.stats.lock:
+                self.app.stats.unauthorized += 1
+            self._send_json(401, {"errors": [{"status": "401", "title": "Token expired"}]})
+            return
+        if self._inject_faults():
+            return
+        self._send_json(200, self.app.build_page(entity, parts.query))
+
+
+class MockEReserveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dataset: MockDataset, settings: MockServerSettings = None):
+        super().__init__(address, MockEReserveHandler)
+        self.dataset = dataset
+        self.settings = settings or MockServerSettings()
+        self.stats = MockServerStats()
+        self.random = random.Random(self.settings.seed)
+        self.tokens = {}
+        self.tokens_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def issue_token(self) -> str:
+        token = uuid.uuid4().hex
+        with self.tokens_lock:
+            self.tokens[token] = {"issued": time.monotonic(), "requests": 0}
+        return token
+
+    def check_token(self, header: str) -> bool:
+        if not header:
+            return False
+        token = header.split(" ", 1)[-1]
+        with self.tokens_lock:
+            info = self.tokens.get(token)
+            if info is None:
+                return False
+            info["requests"] += 1
+            if self.settings.token_ttl_requests and info["requests"] > self.settings.token_ttl_requests:
+                return False
+            if self.settings.token_ttl_seconds and time.monotonic() - info["issued"] > self.settings.token_ttl_seconds:
+                return False
+        return True
+
+    def build_page(self, entity: str, query: str) -> dict:
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        page_size = max(1, min(int(params.get("page[size]", 20)), 5000))
+        page_number = max(1, int(params.get("page[number]", 1)))
+
+        lo, hi = 0, self.dataset.counts[entity]
+        if entity == "units" and "filter[school_id]" in params:
+            lo, hi = self.dataset.index_range_for_school(int(params["filter[school_id]"]))
+        if "filter[updated_at]" in params:
+            start, end = parse_updated_at_filter(params["filter[updated_at]"])
+            date_lo, date_hi = self.dataset.index_range_for_dates(entity, start, end)
+            lo, hi = max(lo, date_lo), min(hi, date_hi)
+        if "filter[id][gt]" in params:
+            # Record ids are index + 1 and pages are always in id order, so sort=id needs nothing
+            lo = max(lo, min(hi, int(params["filter[id][gt]"])))
+        if "filter[id][lte]" in params:
+            hi = min(hi, max(lo, int(params["filter[id][lte]"])))
+        indexes = range(lo, hi)
+        if "filter[id]" in params:
+            # A comma-separated id list; ids that do not exist are left out
+            wanted = {int(value) - 1 for value in params["filter[id]"].split(",") if value.strip().isdigit()}
+            indexes = [i for i in sorted(wanted) if lo <= i < hi]
+        total = len(indexes)
+        page_count = max(1, -(-total // page_size))
+
+        first = (page_number - 1) * page_size
+        fields = None
+        if f"fields[{entity}]" in params:
+            fields = {name for name in params[f"fields[{entity}]"].split(",") if name}
+        data = [self.dataset.resource(entity, i, self.base_url, fields) for i in indexes[first:first + page_size]]
+        included = self.included(entity, indexes[first:first + page_size], params)
+
+        def page_link(number):
+            link_params = dict(params)
+            link_params["page[number]"] = str(number)
+            return f"{self.base_url}/{entity}?{urlencode(link_params, safe='[]')}"
+
+        links = {"self": page_link(page_number), "first": page_link(1), "last": page_link(page_count)}
+        if page_number < page_count:
+            links["next"] = page_link(page_number + 1)
+        if page_number > 1:
+            links["prev"] = page_link(page_number - 1)
+
+        with self.stats.lock:
+            self.stats.pages += 1
+            self.stats.items += len(data)
+        document = {"data": data, "links": links, "meta": {"record-count": total, "page-count": page_count}}
+        if included is not None:
+            document["included"] = included
+        return document
+
+    def included(self, entity: str, indexes, params: dict):
+        # include=a,b: the related resources of the page, each once; references
+        # to parents that do not exist (orphans) are left out
+        if "include" not in params:
+            return None
+        names = {name for name in params["include"].split(",") if name}
+        included, seen = [], set()
+        for i in indexes:
+            _, relationships = self.dataset.builders[entity](i)
+            for name, (rel_type, rel_id) in (relationships or {}).items():
+                if name not in names or rel_id is None or (rel_type, rel_id) in seen:
+                    continue
+                seen.add((rel_type, rel_id))
+                if rel_type in self.dataset.counts and 1 <= rel_id <= self.dataset.counts[rel_type]:
+                    fields = None
+                    if f"fields[{rel_type}]" in params:
+                        fields = {field for field in params[f"fields[{rel_type}]"].split(",") if field}
+                    included.append(self.dataset.resource(rel_type, rel_id - 1, self.base_url, fields))
+        return included
+
+
+def create_server(scale: str = "small", host: str = "127.0.0.1", port: int = 0,
+                  overrides: dict = None, orphan_rate: float = 0.0,
+                  settings: MockServerSettings = None) -> MockEReserveServer:
+    counts = dict(SCALES[scale])
+    counts.update(overrides or {})
+    return MockEReserveServer((host, port), MockDataset(counts, orphan_rate), settings)
+
+
+def start_in_thread(server: MockEReserveServer) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, name="mock-ereserve-api", daemon=True)
+    thread.start()
+    return thread
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Synthetic dataset size preset")
+    parser.add_argument("--usage-rows", type=int, default=None,
+                        help="Override the reading-utilisations count (other usage tables scale with it)")
+    parser.add_argument("--orphan-rate", type=float, default=0.0,
+                        help="Fraction of child rows that reference a parent that does not exist")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--token-ttl-requests", type=int, default=0,
+                        help="Expire tokens (401) after this many requests; 0 disables")
+    parser.add_argument("--token-ttl-seconds", type=float, default=0.0,
+                        help="Expire tokens (401) after this many seconds; 0 disables")
+
+
+def server_kwargs_from_args(args) -> dict:
+    overrides = {}
+    if args.usage_rows:
+        overrides = {
+            "reading-utilisations": args.usage_rows,
+            "reading-list-item-usages": max(1, args.usage_rows * 3 // 8),
+            "reading-list-usages": max(1, args.usage_rows // 8),
+        }
+    return {
+        "scale": args.scale,
+        "overrides": overrides,
+        "orphan_rate": args.orphan_rate,
+        "settings": MockServerSettings(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+            token_ttl_requests=args.token_ttl_requests, token_ttl_seconds=args.token_ttl_seconds,
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline mock of the eReserve JSON:API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    server = create_server(host=args.host, port=args.port, **server_kwargs_from_args(args))
+    logging.info(f"Mock eReserve API serving {server.dataset.counts} at {server.base_url}")
+    logging.info(f"Set FEDPIPELINE_API_BASE_URL={server.base_url} to point the pipeline at it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,226 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    End-to-end benchmark runner for the eReserve Data Pipeline.
+
+    Starts the mock eReserve API (benchmarks/mock_api.py) in its own process and
+    drives the real pipeline stages against it. Every stage runs in a fresh
+    process so its peak RSS is measured in isolation. Reports pages/sec,
+    rows/sec, bytes received, peak RSS and wall time per stage, and can compare
+    the results against a saved baseline to flag regressions.
+
+    Usage:
+        python -m benchmarks.run_benchmarks --scale small
+        python -m benchmarks.run_benchmarks --scale medium --json bench.json
+        python -m benchmarks.run_benchmarks --baseline bench.json --tolerance 0.15
+-------------------------------------------------------------------------------
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.mock_api import add_server_arguments, server_kwargs_from_args
+
+# Stages are run in this order, which is also the order job() uses
+JOB_STAGES = [
+    "process_integration_users",
+    "process_schools",
+    "process_readings",
+    "process_units",
+    "process_teaching_sessions",
+    "process_reading_lists",
+    "process_reading_list_items",
+    "process_unit_offerings",
+    "process_reading_list_usage",
+    "process_reading_list_item_usage",
+    "process_reading_utilisation",
+]
+# Needs a database connection, so only runs with --db sqlite / configured
+DB_ONLY_STAGES = ["process_usage_data"]
+
+
+def _serve(server_kwargs: dict, ready):
+    from benchmarks.mock_api import create_server
+    server = create_server(**server_kwargs)
+    ready.put(server.base_url)
+    server.serve_forever()
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _server_stats(base_url: str) -> dict:
+    stats_url = base_url.split("/public/v1")[0] + "/__stats"
+    with urllib.request.urlopen(stats_url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _run_stage(stage: str, db_mode: str, log_path: str, log_level: str) -> dict:
+    # Runs inside a fresh worker process; FEDPIPELINE_API_BASE_URL is inherited
+    logging.basicConfig(
+        filename=log_path,
+        level=getattr(logging, log_level),
+        format="%(asctime)s | %(levelname)-8s | %(message)s",
+    )
+    from fedpipeline import jobs
+
+    rows = {"count": 0}
+    real_insert = jobs.insert_records
+
+    def counting_insert(query, records, entity_name):
+        rows["count"] += len(records)
+        if db_mode != "none":
+            real_insert(query, records, entity_name)
+
+    jobs.insert_records = counting_insert
+
+    start = time.perf_counter()
+    if stage == "process_usage_data":
+        from fedpipeline.usage_staging_processor import process_usage_data
+        metrics = process_usage_data()
+        rows["count"] = metrics.get("records_processed", 0)
+    else:
+        getattr(jobs, stage)()
+    elapsed = time.perf_counter() - start
+
+    return {"seconds": elapsed, "rows": rows["count"], "peak_rss_mb": _peak_rss_mb()}
+
+
+def run_benchmarks(args) -> list:
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue()
+    server = ctx.Process(target=_serve, args=(server_kwargs_from_args(args), ready), daemon=True)
+    server.start()
+    base_url = ready.get(timeout=30)
+    os.environ["FEDPIPELINE_API_BASE_URL"] = base_url
+    print(f"Mock eReserve API running at {base_url}")
+    print(HEADER)
+
+    if args.db == "sqlite":
+        # A fresh embedded database per benchmark run, shared by all stages
+        os.environ["FEDPIPELINE_DB_BACKEND"] = "sqlite"
+        os.environ["FEDPIPELINE_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="fedpipeline_bench_"), "bench.sqlite3")
+
+    stages = args.stages or (JOB_STAGES + (DB_ONLY_STAGES if args.db != "none" else []))
+    log_path = args.log or os.path.join(tempfile.gettempdir(), "fedpipeline_benchmark.log")
+    results = []
+    try:
+        for stage in stages:
+            before = _server_stats(base_url)
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                outcome = executor.submit(_run_stage, stage, args.db, log_path, args.log_level).result()
+            after = _server_stats(base_url)
+
+            pages = after["pages"] - before["pages"]
+            seconds = outcome["seconds"]
+            result = {
+                "stage": stage,
+                "seconds": round(seconds, 3),
+                "pages": pages,
+                "items": after["items"] - before["items"],
+                "rows": outcome["rows"],
+                "mb_received": round((after["bytes_sent"] - before["bytes_sent"]) / (1024 * 1024), 2),
+                "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+                "rows_per_sec": round(outcome["rows"] / seconds, 1) if seconds else None,
+                "peak_rss_mb": round(outcome["peak_rss_mb"], 1) if outcome["peak_rss_mb"] else None,
+                "unauthorized": after["unauthorized"] - before["unauthorized"],
+                "injected_errors": after["injected_errors"] - before["injected_errors"],
+            }
+            results.append(result)
+            print(_format_row(result))
+    finally:
+        server.terminate()
+        server.join(timeout=10)
+    return results
+
+
+HEADER = f"{'stage':<34}{'sec':>9}{'pages':>8}{'pages/s':>10}{'rows':>10}{'rows/s':>11}{'MB in':>9}{'RSS MB':>9}"
+
+
+def _format_row(result: dict) -> str:
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "n/a"
+    return (
+        f"{result['stage']:<34}{fmt(result['seconds'], '9.2f')}{result['pages']:>8}"
+        f"{fmt(result['pages_per_sec'], '10.1f')}{result['rows']:>10}{fmt(result['rows_per_sec'], '11.1f')}"
+        f"{result['mb_received']:>9.2f}{fmt(result['peak_rss_mb'], '9.1f')}"
+    )
+
+
+def compare_with_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["stage"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["stage"])
+        if not previous:
+            continue
+        if previous.get("rows_per_sec") and result.get("rows_per_sec") is not None:
+            if result["rows_per_sec"] < previous["rows_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{result['stage']}: rows/sec {previous['rows_per_sec']} -> {result['rows_per_sec']}"
+                )
+        if previous.get("peak_rss_mb") and result.get("peak_rss_mb") is not None:
+            if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(
+                    f"{result['stage']}: peak RSS {previous['peak_rss_mb']} MB -> {result['peak_rss_mb']} MB"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against the mock eReserve API")
+    add_server_arguments(parser)
+    parser.add_argument("--stages", nargs="+", choices=JOB_STAGES + DB_ONLY_STAGES,
+                        help="Only run these stages (default: all)")
+    parser.add_argument("--db", choices=["none", "sqlite", "configured"], default="none",
+                        help="'none' measures fetch and transform only; 'sqlite' also loads into a fresh "
+                             "embedded database; 'configured' loads into the database in DB_CONFIG")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a JSON file written by --json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown / memory growth before a stage counts as a regression")
+    parser.add_argument("--log", help="Pipeline log file for the benchmark run (default: temp dir)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "db": args.db, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("REGRESSIONS DETECTED:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
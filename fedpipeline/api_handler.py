@@ -1,10 +1,21 @@
 import requests
 import logging
+import threading
 import time
 from fedpipeline.config import API_CONFIG, CREDENTIALS
+from fedpipeline.landing_zone import record_page, is_landing_zone_enabled
+from fedpipeline.tracing import span
 
 current_token = None
 
+# Statuses with which a server refuses a request's parameters. Only these make
+# a fetch path drop optional parameters (keyset paging, fieldsets, include=);
+# timeouts, resets and 5xx are transient and are retried instead.
+REJECTED_STATUSES = (400, 422)
+
+# Status of the last failed request on each thread (None: no response at all)
+_last_failure = threading.local()
+
 def get_token_cached():
     global current_token
     if not current_token:
@@ -53,23 +64,58 @@ def get_new_token():
     logging.error(f"Failed to get new token after {max_retries} attempts")
     return None  
 
-def fetch_data_from_api(url, retry=True):
+def fetch_data_from_api(url, retry=True, record=True, stream=False):
+    # record=False keeps partial pages (e.g. ID-only scans) out of the landing zone.
+    # stream=True leaves the body unread for incremental parsing (json_stream.PageStream)
+    # unless the landing zone needs it.
     global current_token
     try:
         headers = {"Authorization": get_token_cached()}
-        response = requests.get(url, headers=headers)
+        with span("http.get", "http", url=url) as request:
+            response = requests.get(url, headers=headers, stream=stream)
+            request.set(status=response.status_code, bytes=None if stream else len(response.content))
+        _last_failure.status = response.status_code if response.status_code >= 400 else None
         response.raise_for_status()
+        if record and is_landing_zone_enabled():
+            record_page(url, response.content)
         return response
     except requests.exceptions.HTTPError as e:
         if e.response is not None and e.response.status_code == 401 and retry:
             logging.warning(f"Token expired. Fetching new token and retrying {url}")
             current_token = get_new_token()  # refresh token
             if current_token:
-                return fetch_data_from_api(url, retry=False)
+                return fetch_data_from_api(url, retry=False, record=record, stream=stream)
             else:
                 logging.error("Token refresh failed. Cannot retry.")
                 current_token = None
         logging.error(f"HTTP error during fetch from {url}: {e}")
     except Exception as e:
+        _last_failure.status = None
         logging.error(f"Failed to fetch data from {url}: {e}")
-    return None
\ No newline at end of file
+    return None
+
+def last_failure_status():
+    # HTTP status of this thread's last failed fetch_data_from_api call, None
+    # when it got no response (timeout, connection reset)
+    return getattr(_last_failure, "status", None)
+
+def last_request_rejected() -> bool:
+    # Whether this thread's last failed request was refused for its parameters
+    return last_failure_status() in REJECTED_STATUSES
+
+def is_transient_failure() -> bool:
+    # No response, rate limiting or a server error: worth trying again
+    status = last_failure_status()
+    return status is None or status == 429 or status >= 500
+
+def fetch_with_retry(url, record=True, stream=False):
+    # fetch_data_from_api, retrying transient failures with exponential
+    # backoff; None once the retries are used up or the server refused the request
+    retries = API_CONFIG.get("RETRIES", 3)
+    for attempt in range(retries + 1):
+        response = fetch_data_from_api(url, record=record, stream=stream)
+        if response or not is_transient_failure() or attempt == retries:
+            return response
+        wait_time = API_CONFIG.get("RETRY_BACKOFF_SECONDS", 2) * 2 ** attempt
+        logging.warning(f"Request failed, retrying in {wait_time}s... (attempt {attempt + 1}/{retries})")
+        time.sleep(wait_time)
\ No newline at end of file
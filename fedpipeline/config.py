@@ -1,17 +1,28 @@
+import os
+
 # API Configuration
+# FEDPIPELINE_API_BASE_URL points the pipeline at another eReserve instance
+# (e.g. the local mock server in benchmarks/mock_api.py) without code changes.
+API_BASE_URL = os.environ.get(
+    "FEDPIPELINE_API_BASE_URL",
+    "https://learningresources-staging.federation.edu.au/public/v1"
+).rstrip("/")
+
 API_CONFIG = {
-    "LOGIN_URL": "https://learningresources-staging.federation.edu.au/public/v1/users/login",
-    "SCHOOLS_URL": "https://learningresources-staging.federation.edu.au/public/v1/schools",
-    "INTEGRATION_USERS_URL": "https://learningresources-staging.federation.edu.au/public/v1/integration-users",
-    "READINGS_URL": "https://learningresources-staging.federation.edu.au/public/v1/readings",
-    "UNITS_URL": "https://learningresources-staging.federation.edu.au/public/v1/units",
-    "UNIT_OFFERINGS_URL": "https://learningresources-staging.federation.edu.au/public/v1/unit-offerings",
-    "TEACHING_SESSIONS_URL": "https://learningresources-staging.federation.edu.au/public/v1/teaching-sessions",
-    "READING_LISTS_URL": "https://learningresources-staging.federation.edu.au/public/v1/reading-lists",
-    "READING_LIST_USAGE_URL": "https://learningresources-staging.federation.edu.au/public/v1/reading-list-usages",
-    "READING_LIST_ITEMS_URL": "https://learningresources-staging.federation.edu.au/public/v1/reading-list-items",
-    "READING_LIST_ITEM_USAGE_URL": "https://learningresources-staging.federation.edu.au/public/v1/reading-list-item-usages",
-    "READING_UTILISATION_URL": "https://learningresources-staging.federation.edu.au/public/v1/reading-utilisations",
+    "LOGIN_URL": f"{API_BASE_URL}/users/login",
+    "SCHOOLS_URL": f"{API_BASE_URL}/schools",
+    "INTEGRATION_USERS_URL": f"{API_BASE_URL}/integration-users",
+    "READINGS_URL": f"{API_BASE_URL}/readings",
+    "UNITS_URL": f"{API_BASE_URL}/units",
+    "UNIT_OFFERINGS_URL": f"{API_BASE_URL}/unit-offerings",
+    "TEACHING_SESSIONS_URL": f"{API_BASE_URL}/teaching-sessions",
+    "READING_LISTS_URL": f"{API_BASE_URL}/reading-lists",
+    "READING_LIST_USAGE_URL": f"{API_BASE_URL}/reading-list-usages",
+    "READING_LIST_ITEMS_URL": f"{API_BASE_URL}/reading-list-items",
+    "READING_LIST_ITEM_USAGE_URL": f"{API_BASE_URL}/reading-list-item-usages",
+    "READING_UTILISATION_URL": f"{API_BASE_URL}/reading-utilisations",
+    "RETRIES": 3,                   # Retries of a listing request after a timeout, reset or 5xx
+    "RETRY_BACKOFF_SECONDS": 2,     # Wait before the first retry; doubled for each one after it
 }
 
 # UNIT Codes Prefixes
@@ -25,6 +36,9 @@ CREDENTIALS = {
 
 # DB Configuration
 DB_CONFIG = {
+    "BACKEND": os.environ.get("FEDPIPELINE_DB_BACKEND", "sqlserver"),   # sqlserver or sqlite
+    "SQLITE_PATH": os.environ.get("FEDPIPELINE_SQLITE_PATH", "eReserveData.sqlite3"),
+    "SQLITE_BUSY_TIMEOUT": 60,          # Seconds a SQLite writer waits for another process's lock
     "DRIVER": "ODBC Driver 17 for SQL Server",
     "SERVER": "localhost",
     "DATABASE": "eReserveData",
@@ -32,6 +46,28 @@ DB_CONFIG = {
     "PWD": "password"
 }
 
+# How rows are sent to the database: per_row, executemany, fast_executemany or bulk
+# (multi-row VALUES). per_row isolates bad records; the others are much faster.
+DB_LOAD_CONFIG = {
+    "STRATEGY": "per_row",              # Used by db_handler.insert_records
+    "STAGING_STRATEGY": "executemany",  # Used when loading usage staging tables
+    "PARENT_KEY_FILTER": True,          # Drop usage rows with missing parents in process, before staging
+    "TYPED_BATCHES": True,              # Convert rows to the column types (fedpipeline.typed_batches) before binding
+    "MERGE_CHUNK_ROWS": int(os.environ.get("FEDPIPELINE_MERGE_CHUNK_ROWS", "0")),  # Staging MERGE per ereserve_id range of this many rows, committing each; 0 = one transaction
+    "MERGE_CHUNK_RETRIES": 2,           # Chunked only: retries of the transfer within the run, resuming after the last committed chunk
+    "BATCH_SIZE": 1000
+}
+
+# Parent backfill (fedpipeline.parent_backfill): before usage rows are staged,
+# catalogue records they reference that are missing from the database
+# (reading lists, items, readings, teaching sessions, integration users) are
+# fetched by id with filter[id] and inserted.
+PARENT_BACKFILL_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_PARENT_BACKFILL", "1") != "0",
+    "IDS_PER_REQUEST": 100,         # Ids per filter[id] request
+    "WORKERS": 4                    # Requests in flight at once
+}
+
 # Page size to fetch data in batches
 PAGE_SIZE = 1000
 
@@ -41,4 +77,201 @@ DATE_FILTER_CONFIG = {
     "YEARS_BACK": 0.5,              # How many years back from today (0.5 = 6 months, 1.0 = 1 year)
     "START_DATE": "2023-01-01",     # Format: YYYY-MM-DD 
     "END_DATE": "2023-01-31"
-}
\ No newline at end of file
+}
+
+# Profiling configuration
+# Can also be switched on for a single run with `--profile` / `--tracemalloc`
+# or the FEDPIPELINE_PROFILE / FEDPIPELINE_TRACEMALLOC environment variables.
+PROFILING_CONFIG = {
+    "ENABLED": False,               # Wrap each stage in cProfile and write a report per stage
+    "TRACEMALLOC": False,           # Also track peak memory and allocation hot spots (slower)
+    "TOP_FUNCTIONS": 30,            # Number of functions listed in each report
+    "TOP_ALLOCATIONS": 20,          # Number of allocation sites listed in each report
+    "OUTPUT_DIR": "profiles"        # Relative to the directory holding pipeline.log
+}
+
+# Span tracing (fedpipeline.tracing): run, stage, page, HTTP request, JSON decode,
+# row building and DB batch spans, written per run as a Chrome trace-event file.
+# Can also be switched on for a single run with `--trace` or FEDPIPELINE_TRACE=1.
+TRACING_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_TRACE") == "1",
+    "OUTPUT_DIR": "traces",         # Relative to the directory holding pipeline.log
+    "MAX_EVENTS": 500000            # Spans kept per run; later ones are counted and dropped
+}
+
+# Raw landing zone: every fetched API page is also written, compressed and
+# append-only, to <PATH>/<entity>/<run>/part-*.ndjson.gz so tables can be
+# rebuilt offline with `python -m fedpipeline.replay`.
+LANDING_ZONE_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_LANDING_ZONE") == "1",   # or --landing-zone on fedpipeline.main
+    "PATH": os.environ.get("FEDPIPELINE_LANDING_ZONE_PATH", "landing"),
+    "COMPRESSION": "gzip",          # gzip or zstd (zstd needs the zstandard package)
+    "PAGES_PER_FILE": 100           # Rotate part files so replay can decode them in parallel
+}
+
+# Delete detection: after loading, fetch only the IDs of each entity and remove
+# (or flag) rows whose ereserve_id no longer exists upstream.
+# Also available as `--reconcile` on fedpipeline.main or `python -m fedpipeline.reconciliation`.
+RECONCILIATION_CONFIG = {
+    "ENABLED": False,
+    "MODE": "soft",                 # soft: set is_deleted/deleted_at, hard: DELETE rows (children first)
+    "ENTITIES": [],                 # API entity names to reconcile, e.g. ["reading-lists"]; empty = all
+    "ID_FIELDSET": "",              # fields[<type>] value for ID-only pages; "" asks for no attributes
+    "MAX_DELETE_RATIO": 0.2,        # Refuse to remove more than this share of a table in one pass
+    "BATCH_SIZE": 500,              # IDs per UPDATE/DELETE statement
+    "RECHECK_IDS_PER_REQUEST": 100  # IDs per filter[id] lookup when re-checking an offset-paged scan
+}
+
+# Sparse fieldsets: requests carry fields[<type>]=<the attributes jobs.ENTITY_ATTRIBUTES
+# maps to columns>, so the API leaves out unused attributes and relationships.
+# Entities whose server rejects or ignores the parameter fall back to full resources.
+SPARSE_FIELDSETS_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_SPARSE_FIELDS", "1") != "0"
+}
+
+# Streaming JSON: decode API pages incrementally (fedpipeline.json_stream) and
+# hand items to the formatters one at a time instead of building each page and
+# every raw item in memory first.
+STREAMING_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_STREAM_JSON") == "1",
+    "CHUNK_SIZE": 64 * 1024         # Bytes read from the socket per step
+}
+
+# Transform pool (fedpipeline.transform_pool): page bodies are decoded and
+# formatted into rows in worker processes, started once and reused for every
+# listing, while fetching and loading stay in the pipeline process. Takes the
+# place of streaming for the pages it decodes. Also available as
+# `--transform-pool` on fedpipeline.main.
+TRANSFORM_POOL_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_TRANSFORM_POOL") == "1",
+    "WORKERS": int(os.environ.get("FEDPIPELINE_TRANSFORM_WORKERS", "0")),  # 0 = one per CPU but the pipeline's
+    "START_METHOD": ""              # multiprocessing start method; "" uses the platform default
+}
+
+# Pagination (fedpipeline.keyset_paging): whole listings are read in id order,
+# each page asking for ids after the last one seen, so rows changing mid-run
+# cannot shift pages. Servers that reject or ignore this are paged with
+# links.next. Records served twice are dropped either way.
+PAGINATION_CONFIG = {
+    "KEYSET": os.environ.get("FEDPIPELINE_KEYSET_PAGING", "1") != "0",
+    "SORT": "id",                   # sort= value for id order
+    "AFTER_FILTER": "filter[id][gt]",   # Filter for "id greater than"
+    "UPTO_FILTER": "filter[id][lte]",   # Filter for "id at most" (work queue id ranges)
+    "DEDUP": True                   # Drop repeated resource ids within a listing
+}
+
+# Sideloading (fedpipeline.sideloading): the reading list, item and unit offering
+# listings ask for the parents they reference with include=, and included resources
+# the database does not have yet are inserted before the listing's own rows.
+# Servers that reject or ignore include= are listed without it.
+SIDELOAD_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_SIDELOAD", "1") != "0",
+    "FLUSH_ROWS": 5000              # Included resources held before they are inserted during the crawl
+}
+
+# Entity state store (fedpipeline.entity_state): per table, a memory-mapped local
+# file of sorted ereserve_id -> updated_at (and row_hash for the usage tables).
+# Fetched records whose updated_at matches are dropped before they are formatted
+# and loaded. A file that is missing, damaged or out of step with its table
+# (row counts or id sums differ) is rebuilt from the database.
+ENTITY_STATE_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_ENTITY_STATE", "1") != "0",
+    "PATH": os.environ.get("FEDPIPELINE_ENTITY_STATE_PATH", "state"),
+    "COMPARE": "updated_at",        # or "row_hash": format first, drop usage rows whose hash matches
+    "READBACK_BATCH": 500           # Ids per query when reading back what a load committed
+}
+
+# Full-history loads (the first run's usage tables, and the fallback after a failed
+# staging run) buffer formatted rows in fedpipeline.spill_buffer.SpillBuffer and
+# insert them chunk by chunk. Past the budget, rows are spilled to a temporary file.
+SPILL_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_SPILL", "1") != "0",
+    "MEMORY_BUDGET_MB": int(os.environ.get("FEDPIPELINE_SPILL_BUDGET_MB", "256")),
+    "CHUNK_ROWS": 50000,            # Rows per spilled chunk and per insert
+    "DIRECTORY": os.environ.get("FEDPIPELINE_SPILL_DIR", "")       # "" = the system temp directory
+}
+
+# Logging (see fedpipeline/log_config.py). Records are handed to a background
+# thread through a queue, so the pipeline never waits on log file I/O.
+LOGGING_CONFIG = {
+    "FILE": "pipeline.log",
+    "LEVEL": os.environ.get("FEDPIPELINE_LOG_LEVEL", "INFO"),
+    "FORMAT": os.environ.get("FEDPIPELINE_LOG_FORMAT", "text"),    # text or json (one object per line)
+    "ASYNC": True,                  # False writes synchronously from the calling thread
+    "MODULE_LEVELS": {              # Per-module verbosity, by source file name or logger name
+        "urllib3": "WARNING",
+        # "db_backend": "WARNING",
+    },
+    "RECORD_LOG_EVERY": 1000,       # Row-by-row loads log one sample record per this many (0 = none)
+    "MAX_RECORD_ERRORS": 20         # Failed rows logged individually per load; the rest are summarised
+}
+
+# Scheduler (fedpipeline.job_scheduler.start_scheduler). Each stage group runs on
+# its own cron cadence ("minute hour day-of-month month day-of-week", local time).
+# A group whose slot passed while no scheduler was running is caught up once on
+# start. A lease in the PipelineSchedule table keeps two instances from running
+# the same group at once.
+SCHEDULE_CONFIG = {
+    "CADENCES": {                   # Groups are defined in job_scheduler.STAGE_GROUPS
+        "schools": os.environ.get("FEDPIPELINE_SCHEDULE_SCHOOLS", "0 1 * * 0"),        # Weekly, Sunday 01:00
+        "catalogue": os.environ.get("FEDPIPELINE_SCHEDULE_CATALOGUE", "0 2 * * *"),    # Nightly at 02:00
+        # Nightly at 02:00 with the catalogue; FEDPIPELINE_SCHEDULE_USAGE_HOURLY=1 opts in to hourly at :30
+        "usage": os.environ.get("FEDPIPELINE_SCHEDULE_USAGE", "30 * * * *"
+                                if os.environ.get("FEDPIPELINE_SCHEDULE_USAGE_HOURLY") == "1" else "0 2 * * *"),
+    },
+    "CATCH_UP": True,               # Run once for slots missed during downtime; False waits for the next slot
+    "LEASE_SECONDS": 600,           # Lease length; renewed every third of it while a run is going
+    "POLL_SECONDS": 60              # Longest sleep between schedule checks
+}
+
+# Queue mode (fedpipeline.work_queue): the coordinator splits a run into work
+# items in PipelineWorkQueue and any number of worker processes, on this or other
+# hosts, claim and load them. Also available as `--queue` on fedpipeline.main.
+WORK_QUEUE_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_WORK_QUEUE") == "1",
+    "PAGES_PER_ITEM": 5,            # API pages per work item
+    "PROBE_WORKERS": 4,             # Concurrent requests when finding the items' id bounds
+    "LOCAL_WORKERS": 0,             # Worker processes the coordinator starts itself (it also works items)
+    "CLAIM_TIMEOUT_SECONDS": 1800,  # Unfinished claims older than this go back to PENDING
+    "MAX_ATTEMPTS": 3,              # Claims per item before it is marked FAILED
+    "POLL_SECONDS": 0.5             # Idle wait between claim attempts
+}
+
+# Run planner (fedpipeline.run_planner): before a run, each endpoint is probed for
+# its size and speed and, with the stage timings of earlier runs (PipelineStageStats),
+# page sizes, load strategies and queue work items are chosen per entity. The
+# predicted run time is logged next to the actual one. Off unless turned on.
+PLANNER_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_RUN_PLANNER", "0") == "1",
+    "MAX_PAGE_SIZE": int(os.environ.get("FEDPIPELINE_MAX_PAGE_SIZE", "5000")),  # Largest page[size] asked for; servers that cap lower are detected
+    "BULK_ROWS": 20000,             # Tables with this many rows load with the backend's bulk strategy (plain inserts: first run only)
+    "BULK_BATCH_SIZE": 10000,       # Rows per batch for those
+    "MAX_WORKERS": 8,               # Queue mode: most work items one entity is split into
+    "MIN_PAGES_PER_WORKER": 5,      # Queue mode: fewest pages per work item
+    "PROBE_WORKERS": 4,             # Endpoints probed at once
+    "HISTORY_DAYS": 30,             # Stage timings this recent inform predictions
+    "DEFAULT_ROW_SECONDS": 0.0001   # Time per row until a stage has history
+}
+
+# Schema migrations (fedpipeline.migrations): sql/migrations/<backend>/NNNN_*.sql
+# files applied in order on top of sql/db.sql and recorded in SchemaMigrations.
+MIGRATIONS_CONFIG = {
+    "AUTO_APPLY": os.environ.get("FEDPIPELINE_AUTO_MIGRATE", "1") != "0",    # Apply pending ones at startup; off: refuse to start while any are pending
+    "OPTIONAL": [],                 # SQL Server only: "usage_columnstore" or "usage_partitioning"
+}
+
+# Usage rollups (fedpipeline.usage_rollups): daily counts per unit/teaching session
+# and per reading, created by migration 0002 and updated from the rows each
+# staging MERGE writes. Also available as `python -m fedpipeline.usage_rollups`.
+USAGE_ROLLUP_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_USAGE_ROLLUPS", "1") != "0",
+}
+
+# Initial load mode (fedpipeline.initial_load): for the first run into empty
+# tables, indexes and foreign key checks are turned off during the load and
+# restored (and validated) at the end.
+INITIAL_LOAD_CONFIG = {
+    "ENABLED": os.environ.get("FEDPIPELINE_INITIAL_LOAD_MODE", "1") != "0",
+    "BATCH_SIZE": 50000,            # Rows per commit while the mode is on
+    "STRATEGY": "",                 # Load strategy; "" uses the backend's (fast_executemany on SQL Server)
+}
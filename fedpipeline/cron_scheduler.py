@@ -0,0 +1,311 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Cron-style cadences and DB-backed leases for the pipeline scheduler.
+
+    CronSchedule parses the usual five fields (minute hour day-of-month month
+    day-of-week, with *, lists, ranges, */n steps and @hourly/@daily/@weekly/
+    @monthly) and computes the next fire time in local time.
+
+    ScheduleStore keeps one PipelineSchedule row per stage group (the table
+    comes from migration 0005). Each row holds when the group last ran, which
+    drives catch-up after downtime, and a lease (owner + expiry). A conditional
+    UPDATE takes the lease, so only one instance runs a group at a time. A
+    LeaseKeeper thread renews the lease while the group runs. When an instance
+    dies mid-run, its lease expires. The next instance to take that lease marks
+    the abandoned IN_PROGRESS run as FAILED.
+
+    Usage:
+        python -m fedpipeline.cron_scheduler               # show cadences, next runs and leases
+        python -m fedpipeline.cron_scheduler --expire      # expire leases held by this host
+-------------------------------------------------------------------------------
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from fedpipeline.config import SCHEDULE_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.migrations import require_table
+
+MACROS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@nightly": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+# (low, high) per field; day-of-week accepts 7 as another Sunday
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+def _parse_field(text: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            # "5/15" means every 15 starting at 5
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, low, high) for text, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        # Cron counts Sunday as 0 (and 7); datetime.weekday() counts Monday as 0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        # As in cron, a restricted day-of-month and day-of-week match either one
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        # First matching minute strictly after moment
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def __repr__(self):
+        return f"CronSchedule({self.expression!r})"
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    # SQLite hands DATETIME columns back as the ISO strings they were stored as
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class ScheduleStore:
+    def __init__(self, owner: str = None, lease_seconds: int = None):
+        self.backend = get_backend()
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds or SCHEDULE_CONFIG.get("LEASE_SECONDS", 600)
+        self._table_checked = False
+
+    def _check_table(self, conn):
+        if not self._table_checked:
+            require_table(self.backend, conn, "PipelineSchedule", "0005_pipeline_schedule")
+            self._table_checked = True
+
+    def _ensure_rows(self, conn, groups: Iterable[str]):
+        cursor = conn.cursor()
+        for group in groups:
+            cursor.execute("SELECT COUNT(*) FROM PipelineSchedule WHERE group_name = ?", (group,))
+            if cursor.fetchone()[0]:
+                continue
+            try:
+                cursor.execute("INSERT INTO PipelineSchedule (group_name) VALUES (?)", (group,))
+                conn.commit()
+            except Exception:
+                # Another instance inserted it first
+                conn.rollback()
+
+    def last_runs(self, groups: Iterable[str]) -> Dict[str, Optional[datetime]]:
+        groups = list(groups)
+        with self.backend.connect() as conn:
+            self._check_table(conn)
+            self._ensure_rows(conn, groups)
+            cursor = conn.cursor()
+            cursor.execute("SELECT group_name, last_run_time FROM PipelineSchedule")
+            known = {row[0]: _as_datetime(row[1]) for row in cursor.fetchall()}
+        return {group: known.get(group) for group in groups}
+
+    def acquire(self, group: str) -> bool:
+        # Takes the group's lease if it is free, expired or already ours. A
+        # run left IN_PROGRESS by an expired holder is marked FAILED.
+        now = datetime.now()
+        with self.backend.connect() as conn:
+            self._check_table(conn)
+            self._ensure_rows(conn, [group])
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT lease_owner, lease_run_id FROM PipelineSchedule WHERE group_name = ?", (group,)
+            )
+            previous_owner, previous_run_id = cursor.fetchone()
+            cursor.execute("""
+                UPDATE PipelineSchedule
+                SET lease_owner = ?, lease_expires_at = ?, lease_run_id = NULL
+                WHERE group_name = ?
+                  AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires_at < ?)
+            """, (self.owner, now + timedelta(seconds=self.lease_seconds), group, self.owner, now))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return False
+
+            if previous_owner and previous_owner != self.owner and previous_run_id:
+                cursor.execute("""
+                    UPDATE PipelineRunHistory
+                    SET run_end_time = ?, status = 'FAILED'
+                    WHERE run_id = ? AND status = 'IN_PROGRESS'
+                """, (now, previous_run_id))
+                if cursor.rowcount:
+                    logging.warning(f"Lease on {group} held by {previous_owner} expired; "
+                                    f"marked its run {previous_run_id} as FAILED")
+            conn.commit()
+        return True
+
+    def attach_run(self, groups: Iterable[str], run_id: Optional[int]):
+        # Records which run holds the leases, so a successor can close it if this process dies
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            for group in groups:
+                cursor.execute(
+                    "UPDATE PipelineSchedule SET lease_run_id = ? WHERE group_name = ? AND lease_owner = ?",
+                    (run_id, group, self.owner)
+                )
+            conn.commit()
+
+    def renew(self, groups: Iterable[str]) -> List[str]:
+        # Extends our leases; returns the groups whose lease was lost
+        lost = []
+        expires_at = datetime.now() + timedelta(seconds=self.lease_seconds)
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            for group in groups:
+                cursor.execute(
+                    "UPDATE PipelineSchedule SET lease_expires_at = ? WHERE group_name = ? AND lease_owner = ?",
+                    (expires_at, group, self.owner)
+                )
+                if cursor.rowcount != 1:
+                    lost.append(group)
+            conn.commit()
+        return lost
+
+    def release(self, groups: Iterable[str], run_time: datetime = None, status: str = None,
+                run_id: Optional[int] = None):
+        # Drops our leases; with run_time also records the run for the cadence
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            for group in groups:
+                if run_time is not None:
+                    cursor.execute("""
+                        UPDATE PipelineSchedule
+                        SET last_run_time = ?, last_status = ?, last_run_id = ?
+                        WHERE group_name = ? AND lease_owner = ?
+                    """, (run_time, status, run_id, group, self.owner))
+                cursor.execute("""
+                    UPDATE PipelineSchedule
+                    SET lease_owner = NULL, lease_expires_at = NULL, lease_run_id = NULL
+                    WHERE group_name = ? AND lease_owner = ?
+                """, (group, self.owner))
+            conn.commit()
+
+    def status(self) -> List[tuple]:
+        with self.backend.connect() as conn:
+            self._check_table(conn)
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT group_name, last_run_time, last_status, last_run_id, lease_owner, lease_expires_at
+                FROM PipelineSchedule ORDER BY group_name
+            """)
+            return cursor.fetchall()
+
+
+class LeaseKeeper:
+    # Renews a set of leases from a background thread while a run is going,
+    # every third of the lease length
+
+    def __init__(self, store: ScheduleStore, groups: List[str]):
+        self.store = store
+        self.groups = list(groups)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def _run(self):
+        interval = max(self.store.lease_seconds / 3, 1)
+        while not self._stop.wait(interval):
+            try:
+                lost = self.store.renew(self.groups)
+                if lost:
+                    logging.error(f"Lost the schedule lease on {', '.join(lost)}; another instance may take over")
+            except Exception as e:
+                logging.error(f"Failed to renew schedule leases: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def cadences() -> Dict[str, CronSchedule]:
+    return {group: CronSchedule(expression) for group, expression in SCHEDULE_CONFIG.get("CADENCES", {}).items()}
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Show the pipeline schedule and leases")
+    parser.add_argument("--expire", action="store_true",
+                        help="Expire leases held by processes on this host, e.g. after a crash, instead of "
+                             "waiting for LEASE_SECONDS (the next run then closes their IN_PROGRESS rows)")
+    args = parser.parse_args()
+
+    store = ScheduleStore()
+    if args.expire:
+        with store.backend.connect() as conn:
+            store._check_table(conn)
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE PipelineSchedule SET lease_expires_at = ? WHERE lease_owner LIKE ?",
+                (datetime.now() - timedelta(seconds=1), f"{socket.gethostname()}:%")
+            )
+            conn.commit()
+            print(f"Expired {cursor.rowcount} lease(s)")
+
+    schedules = cadences()
+    last_runs = store.last_runs(schedules)
+    now = datetime.now()
+    for group_name, last_run_time, last_status, last_run_id, owner, expires_at in store.status():
+        schedule = schedules.get(group_name)
+        last = _as_datetime(last_run_time)
+        next_run = schedule.next_after(last) if schedule and last else now
+        print(f"{group_name:<12} {schedule.expression if schedule else '-':<14} last={last} ({last_status}, "
+              f"run {last_run_id}) next={next_run:%Y-%m-%d %H:%M} lease={owner or '-'} until {expires_at}")
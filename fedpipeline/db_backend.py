@@ -0,0 +1,581 @@
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, date
+from typing import List, Tuple, Dict, Optional, Sequence
+from fedpipeline.config import DB_CONFIG
+from fedpipeline.log_config import RecordLogSampler
+from fedpipeline.tracing import span
+from fedpipeline.typed_batches import base_type
+
+LOAD_STRATEGIES = ("per_row", "executemany", "fast_executemany", "bulk")
+
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+_INSERT_VALUES_RE = re.compile(r"^(?P<prefix>\s*INSERT\s+INTO\s.*?\bVALUES)\s*\((?P<params>[\s?,]+)\)\s*$",
+                               re.IGNORECASE | re.DOTALL)
+
+
+def _strip_sql_comments(sql: str) -> str:
+    return _SQL_COMMENT_RE.sub("", sql)
+
+
+# Dialect-specific pieces of the load path: connections, temp/staging tables,
+# upserts, identity retrieval and row loading strategies.
+class DBBackend:
+    name = "base"
+    # Parameter limit per statement, used to size multi-row VALUES batches
+    max_params_per_statement = 2000
+    max_rows_per_statement = 1000
+    # Steps per second a DATETIME value is rounded to; None when stored exactly
+    datetime_ticks = None
+
+    def connect(self, autocommit: bool = False):
+        raise NotImplementedError
+
+    def temp_table_name(self, name: str) -> str:
+        raise NotImplementedError
+
+    def create_temp_table_statements(self, name: str, columns: List[Tuple[str, str]],
+                                     indexes: Dict[str, str] = None) -> List[str]:
+        raise NotImplementedError
+
+    def processing_log_statements(self, name: str) -> List[str]:
+        raise NotImplementedError
+
+    def upsert_from_select_sql(self, target: str, key: str, columns: List[str], select_sql: str,
+                               change_column: str = None) -> str:
+        # With change_column, matched rows are only updated when that column
+        # (a content hash) differs from the target's
+        raise NotImplementedError
+
+    def upsert_from_select(self, cursor, target: str, key: str, columns: List[str], select_sql: str,
+                           change_column: str = None) -> Tuple[int, int]:
+        # Runs upsert_from_select_sql and returns (rows inserted, rows updated),
+        # as reported by the statement itself
+        raise NotImplementedError
+
+    def accumulate_from_select_sql(self, target: str, keys: List[str], measures: List[str], select_sql: str) -> str:
+        # Adds the selected measures to the target row with the same keys,
+        # inserting rows for keys not seen before
+        raise NotImplementedError
+
+    def date_sql(self, expr: str) -> str:
+        # The date part of a DATETIME expression, comparable across rows
+        raise NotImplementedError
+
+    def insert_and_get_id(self, cursor, sql: str, params: tuple) -> int:
+        raise NotImplementedError
+
+    def claim_one_sql(self, table: str, key: str, where: str, order_by: str, set_clause: str,
+                      returning: List[str]) -> str:
+        # One statement that picks the first row matching where (in order_by
+        # order), updates it with set_clause and returns the given columns.
+        # Concurrent callers never get the same row and do not block each other.
+        raise NotImplementedError
+
+    def table_exists(self, cursor, table_name: str) -> bool:
+        raise NotImplementedError
+
+    def column_exists(self, cursor, table_name: str, column_name: str) -> bool:
+        raise NotImplementedError
+
+    def add_column_sql(self, table_name: str, column_name: str, column_type: str) -> str:
+        return f"ALTER TABLE {table_name} ADD {column_name} {column_type}"
+
+    def split_script(self, script: str) -> List[str]:
+        # Splits a .sql file into statements/batches that can be executed one by one
+        raise NotImplementedError
+
+    # ---- initial load mode (fedpipeline.initial_load) -----------------------
+
+    # Load strategy used while the mode is on
+    bulk_load_strategy = "executemany"
+
+    def begin_bulk_load(self, conn, tables: List[str]):
+        # Turns off what slows down loading into the empty tables
+        pass
+
+    def end_bulk_load(self, conn, tables: List[str]) -> List[str]:
+        # Restores what begin_bulk_load turned off and validates the loaded
+        # rows; returns a description of each problem found
+        return []
+
+    def bulk_insert_sql(self, query: str) -> str:
+        # The INSERT statement as used while the mode is on
+        return query
+
+    # ---- row loading --------------------------------------------------------
+
+    def set_input_sizes(self, cursor, column_types: Sequence[str]):
+        # Declares the parameter types (SQL column types such as "NVARCHAR(255)")
+        # for the statements the cursor executes next
+        pass
+
+    def load_rows(self, conn, query: str, rows: List[Tuple], entity_name: str,
+                  strategy: str = "per_row", batch_size: int = 1000, fallback_per_row: bool = True,
+                  input_types: Sequence[str] = None) -> int:
+        # Loads rows and commits per batch. Returns the number of rows that failed.
+        # Without fallback_per_row a failing batch raises instead of being retried.
+        # input_types are the column types of pre-converted rows (see typed_batches).
+        if strategy not in LOAD_STRATEGIES:
+            raise ValueError(f"Unknown load strategy: {strategy}")
+        cursor = conn.cursor()
+        if input_types and strategy != "bulk":
+            # Multi-row statements bind a varying number of parameters
+            self.set_input_sizes(cursor, input_types)
+        if strategy == "per_row":
+            with span("db.batch", "db", table=entity_name, strategy=strategy, rows=len(rows)) as batch_span:
+                failed = self._load_per_row(cursor, query, rows, entity_name)
+                conn.commit()
+                batch_span.set(failed=failed)
+            return failed
+
+        failed = 0
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            with span("db.batch", "db", table=entity_name, strategy=strategy, rows=len(batch)) as batch_span:
+                try:
+                    if strategy == "bulk":
+                        self._load_multi_row(cursor, query, batch)
+                    elif strategy == "fast_executemany":
+                        self._load_fast_executemany(cursor, query, batch)
+                    else:
+                        cursor.executemany(query, batch)
+                    conn.commit()
+                except Exception as batch_err:
+                    if not fallback_per_row:
+                        raise
+                    # Undo the partial batch and retry row by row so one bad record
+                    # does not take the whole batch down with it
+                    logging.warning(f"Batch {i // batch_size + 1} of {entity_name} failed ({batch_err}); "
+                                    f"retrying row by row")
+                    conn.rollback()
+                    batch_failed = self._load_per_row(cursor, query, batch, entity_name)
+                    conn.commit()
+                    failed += batch_failed
+                    batch_span.set(retried_per_row=True, failed=batch_failed)
+        return failed
+
+    def _load_per_row(self, cursor, query: str, rows: List[Tuple], entity_name: str) -> int:
+        # Logging every record costs about as much as inserting it, so records
+        # and failures are sampled and summarised instead
+        sampler = RecordLogSampler(entity_name, len(rows))
+        for index, record in enumerate(rows):
+            try:
+                sampler.record(index, record)
+                cursor.execute(query, record)
+            except Exception as rec_err:
+                sampler.failure(record, rec_err)
+        sampler.summary()
+        return sampler.failures
+
+    def _load_fast_executemany(self, cursor, query: str, rows: List[Tuple]):
+        cursor.executemany(query, rows)
+
+    def _load_multi_row(self, cursor, query: str, rows: List[Tuple]):
+        match = _INSERT_VALUES_RE.match(query)
+        if not match:
+            # Not a plain INSERT ... VALUES (?, ...), e.g. the fedcode UPDATE
+            cursor.executemany(query, rows)
+            return
+        width = match.group("params").count("?")
+        placeholder = "(" + ", ".join("?" * width) + ")"
+        per_statement = max(1, min(self.max_rows_per_statement, self.max_params_per_statement // width))
+        for i in range(0, len(rows), per_statement):
+            chunk = rows[i:i + per_statement]
+            sql = f"{match.group('prefix')} " + ", ".join([placeholder] * len(chunk))
+            cursor.execute(sql, [value for row in chunk for value in row])
+
+
+class SqlServerBackend(DBBackend):
+    name = "sqlserver"
+    max_params_per_statement = 2099
+    max_rows_per_statement = 1000
+    bulk_load_strategy = "fast_executemany"
+    # DATETIME keeps 1/300 s: .125 is stored, and read back, as .127
+    datetime_ticks = 300
+
+    def __init__(self, config: dict = None):
+        config = config or DB_CONFIG
+        self.conn_str = (
+            f"DRIVER={{{config['DRIVER']}}};"
+            f"SERVER={config['SERVER']};"
+            f"DATABASE={config['DATABASE']};"
+            f"UID={config['UID']};"
+            f"PWD={config['PWD']}"
+        )
+
+    def connect(self, autocommit: bool = False):
+        # Imported here so the SQLite backend works without an ODBC driver
+        import pyodbc
+        conn = pyodbc.connect(self.conn_str)
+        conn.autocommit = autocommit
+        return conn
+
+    def temp_table_name(self, name: str) -> str:
+        return f"#{name}"
+
+    def create_temp_table_statements(self, name, columns, indexes=None):
+        column_sql = ",\n    ".join(f"{col} {col_type}" for col, col_type in columns)
+        statements = [f"CREATE TABLE #{name} (\n    {column_sql}\n)"]
+        for index_name, index_column in (indexes or {}).items():
+            statements.append(f"CREATE INDEX {index_name} ON #{name}({index_column})")
+        return statements
+
+    def processing_log_statements(self, name):
+        return [f"""
+            CREATE TABLE #{name} (
+                log_id INT IDENTITY(1,1) PRIMARY KEY,
+                batch_id VARCHAR(50),
+                table_name VARCHAR(100),
+                operation VARCHAR(50),
+                record_count INT,
+                execution_time_ms INT,
+                created_at DATETIME DEFAULT GETDATE()
+            )
+        """]
+
+    def upsert_from_select_sql(self, target, key, columns, select_sql, change_column=None):
+        update_columns = [col for col in columns if col != key]
+        set_clause = ",\n                ".join(f"{col} = source.{col}" for col in update_columns)
+        matched = "WHEN MATCHED"
+        if change_column:
+            matched += (f" AND (target.{change_column} IS NULL"
+                        f" OR target.{change_column} <> source.{change_column})")
+        return f"""
+            MERGE {target} AS target
+            USING ({select_sql}) AS source
+            ON target.{key} = source.{key}
+            {matched} THEN
+                UPDATE SET
+                {set_clause}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT ({", ".join(columns)})
+                VALUES ({", ".join(f"source.{col}" for col in columns)});
+        """
+
+    def upsert_from_select(self, cursor, target, key, columns, select_sql, change_column=None):
+        merge = self.upsert_from_select_sql(target, key, columns, select_sql, change_column).rstrip().rstrip(";")
+        # NOCOUNT keeps the DECLARE and MERGE from adding row count results ahead of the SELECT
+        cursor.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @merge_actions TABLE (merge_action NVARCHAR(10));
+            {merge}
+            OUTPUT $action INTO @merge_actions;
+            SELECT COALESCE(SUM(CASE WHEN merge_action = 'INSERT' THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN merge_action = 'UPDATE' THEN 1 ELSE 0 END), 0)
+            FROM @merge_actions;
+            SET NOCOUNT OFF;
+        """)
+        inserted, updated = cursor.fetchone()
+        return inserted, updated
+
+    def accumulate_from_select_sql(self, target, keys, measures, select_sql):
+        columns = list(keys) + list(measures)
+        return f"""
+            MERGE {target} AS target
+            USING ({select_sql}) AS source
+            ON {" AND ".join(f"target.{key} = source.{key}" for key in keys)}
+            WHEN MATCHED THEN
+                UPDATE SET
+                {", ".join(f"{col} = target.{col} + source.{col}" for col in measures)}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT ({", ".join(columns)})
+                VALUES ({", ".join(f"source.{col}" for col in columns)});
+        """
+
+    def date_sql(self, expr):
+        return f"CAST({expr} AS DATE)"
+
+    def insert_and_get_id(self, cursor, sql, params):
+        cursor.execute(sql, params)
+        cursor.execute("SELECT @@IDENTITY")
+        return int(cursor.fetchone()[0])
+
+    def claim_one_sql(self, table, key, where, order_by, set_clause, returning):
+        # READPAST skips rows other sessions have locked, UPDLOCK keeps the
+        # picked row from being claimed twice
+        return f"""
+            WITH next_row AS (
+                SELECT TOP (1) * FROM {table} WITH (ROWLOCK, READPAST, UPDLOCK)
+                WHERE {where}
+                ORDER BY {order_by}
+            )
+            UPDATE next_row SET {set_clause}
+            OUTPUT {", ".join(f"inserted.{col}" for col in returning)}
+        """
+
+    def table_exists(self, cursor, table_name):
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_NAME = ?
+        """, (table_name,))
+        return cursor.fetchone()[0] > 0
+
+    def column_exists(self, cursor, table_name, column_name):
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_NAME = ? AND COLUMN_NAME = ?
+        """, (table_name, column_name))
+        return cursor.fetchone()[0] > 0
+
+    def split_script(self, script):
+        # Batches are separated by GO lines, as in sqlcmd and SSMS
+        batches = re.split(r"^\s*GO\s*;?\s*$", script, flags=re.IGNORECASE | re.MULTILINE)
+        return [batch.strip() for batch in batches if _strip_sql_comments(batch).strip()]
+
+    def set_input_sizes(self, cursor, column_types):
+        import pyodbc
+        parameter_types = {
+            "INT": (pyodbc.SQL_INTEGER, False), "BIGINT": (pyodbc.SQL_BIGINT, False), "BIT": (pyodbc.SQL_BIT, False),
+            "DATETIME": (pyodbc.SQL_TYPE_TIMESTAMP, False), "DATE": (pyodbc.SQL_TYPE_DATE, False),
+            "NVARCHAR": (pyodbc.SQL_WVARCHAR, True), "VARCHAR": (pyodbc.SQL_VARCHAR, True),
+        }
+        sizes = []
+        for column_type in column_types:
+            name, size = base_type(column_type)
+            if name not in parameter_types:
+                return
+            sql_type, sized = parameter_types[name]
+            if name == "DATETIME":
+                # DATETIME holds milliseconds (precision 23, scale 3)
+                sizes.append((sql_type, 23, 3))
+            else:
+                sizes.append((sql_type, (size or 0) if sized else 0, 0))
+        cursor.setinputsizes(sizes)
+
+    def begin_bulk_load(self, conn, tables):
+        cursor = conn.cursor()
+        for table in tables:
+            if not self.table_exists(cursor, table):
+                continue
+            # Unique indexes stay: they back the keys and the foreign keys
+            cursor.execute(f"""
+                DECLARE @sql NVARCHAR(MAX) = N'';
+                SELECT @sql += N'ALTER INDEX ' + QUOTENAME(name) + N' ON {table} DISABLE; '
+                FROM sys.indexes
+                WHERE object_id = OBJECT_ID('{table}') AND type = 2
+                  AND is_unique = 0 AND is_primary_key = 0 AND is_disabled = 0;
+                EXEC sp_executesql @sql;
+            """)
+            cursor.execute(f"ALTER TABLE {table} NOCHECK CONSTRAINT ALL")
+            conn.commit()
+
+    def end_bulk_load(self, conn, tables):
+        cursor = conn.cursor()
+        problems = []
+        for table in tables:
+            if not self.table_exists(cursor, table):
+                continue
+            try:
+                cursor.execute(f"""
+                    DECLARE @sql NVARCHAR(MAX) = N'';
+                    SELECT @sql += N'ALTER INDEX ' + QUOTENAME(name) + N' ON {table} REBUILD; '
+                    FROM sys.indexes
+                    WHERE object_id = OBJECT_ID('{table}') AND is_disabled = 1;
+                    EXEC sp_executesql @sql;
+                """)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                problems.append(f"{table}: index rebuild failed: {e}")
+            try:
+                # WITH CHECK validates the loaded rows, so the constraints are trusted again
+                cursor.execute(f"ALTER TABLE {table} WITH CHECK CHECK CONSTRAINT ALL")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                problems.append(f"{table}: constraint check failed: {e}")
+        return problems
+
+    def bulk_insert_sql(self, query):
+        # One table lock per statement instead of a lock per row
+        return re.sub(r"^(\s*INSERT\s+INTO\s+\w+)", r"\1 WITH (TABLOCK)", query, count=1, flags=re.IGNORECASE)
+
+    def _load_fast_executemany(self, cursor, query, rows):
+        cursor.fast_executemany = True
+        try:
+            cursor.executemany(query, rows)
+        finally:
+            cursor.fast_executemany = False
+
+
+class SQLiteBackend(DBBackend):
+    name = "sqlite"
+    max_params_per_statement = 32766
+    max_rows_per_statement = 500
+
+    SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sql", "sqlite", "db.sql")
+
+    def __init__(self, path: str = None):
+        self.path = path or DB_CONFIG.get("SQLITE_PATH", "eReserveData.sqlite3")
+        self._schema_checked = False
+        # Off during the initial load (begin_bulk_load); checked at the end instead
+        self.enforce_foreign_keys = True
+
+    def connect(self, autocommit: bool = False):
+        # Writers from other worker processes wait for the lock instead of failing
+        conn = sqlite3.connect(self.path, isolation_level=None if autocommit else "DEFERRED",
+                               timeout=DB_CONFIG.get("SQLITE_BUSY_TIMEOUT", 60))
+        conn.execute(f"PRAGMA foreign_keys = {'ON' if self.enforce_foreign_keys else 'OFF'}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        if not self._schema_checked:
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        exists = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'PipelineRunHistory'"
+        ).fetchone()[0]
+        if not exists:
+            logging.info(f"Creating eReserveData schema in SQLite database {self.path}")
+            with open(self.SCHEMA_PATH, encoding="utf-8") as f:
+                conn.executescript(f.read())
+        self._schema_checked = True
+
+    def temp_table_name(self, name):
+        return f"temp.{name}"
+
+    def create_temp_table_statements(self, name, columns, indexes=None):
+        column_sql = ",\n    ".join(f"{col} {col_type}" for col, col_type in columns)
+        statements = [f"CREATE TEMP TABLE {name} (\n    {column_sql}\n)"]
+        for index_name, index_column in (indexes or {}).items():
+            # Index names are schema-wide in SQLite, so make them unique per table
+            statements.append(f"CREATE INDEX temp.{index_name}_{name} ON {name}({index_column})")
+        return statements
+
+    def processing_log_statements(self, name):
+        return [f"""
+            CREATE TEMP TABLE {name} (
+                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id VARCHAR(50),
+                table_name VARCHAR(100),
+                operation VARCHAR(50),
+                record_count INT,
+                execution_time_ms INT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """]
+
+    def upsert_from_select_sql(self, target, key, columns, select_sql, change_column=None):
+        update_columns = [col for col in columns if col != key]
+        set_clause = ",\n                ".join(f"{col} = excluded.{col}" for col in update_columns)
+        # "IS NOT" is SQLite's null-safe inequality, so rows without a hash yet are updated
+        where_clause = f"\n            WHERE {target}.{change_column} IS NOT excluded.{change_column}" if change_column else ""
+        # "WHERE true" keeps the parser from reading ON CONFLICT as a join clause
+        return f"""
+            INSERT INTO {target} ({", ".join(columns)})
+            SELECT {", ".join(columns)} FROM ({select_sql}) AS source WHERE true
+            ON CONFLICT({key}) DO UPDATE SET
+                {set_clause}{where_clause}
+        """
+
+    def upsert_from_select(self, cursor, target, key, columns, select_sql, change_column=None):
+        # New rows get a rowid above the largest one before the statement, so
+        # of the rows it changed, those past that rowid were inserted
+        cursor.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {target}")
+        top = cursor.fetchone()[0]
+        cursor.execute(self.upsert_from_select_sql(target, key, columns, select_sql, change_column))
+        cursor.execute("SELECT changes()")
+        written = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {target} WHERE rowid > ?", (top,))
+        inserted = cursor.fetchone()[0]
+        return inserted, written - inserted
+
+    def accumulate_from_select_sql(self, target, keys, measures, select_sql):
+        columns = list(keys) + list(measures)
+        return f"""
+            INSERT INTO {target} ({", ".join(columns)})
+            SELECT {", ".join(columns)} FROM ({select_sql}) AS source WHERE true
+            ON CONFLICT({", ".join(keys)}) DO UPDATE SET
+                {", ".join(f"{col} = {target}.{col} + excluded.{col}" for col in measures)}
+        """
+
+    def date_sql(self, expr):
+        # Dates are stored as ISO text; DATE() gives 'YYYY-MM-DD' (in UTC for 'Z' values)
+        return f"DATE({expr})"
+
+    def insert_and_get_id(self, cursor, sql, params):
+        cursor.execute(sql, params)
+        return int(cursor.lastrowid)
+
+    def claim_one_sql(self, table, key, where, order_by, set_clause, returning):
+        # A single UPDATE holds SQLite's write lock throughout, so the pick is atomic
+        return f"""
+            UPDATE {table} SET {set_clause}
+            WHERE {key} = (SELECT {key} FROM {table} WHERE {where} ORDER BY {order_by} LIMIT 1)
+            RETURNING {", ".join(returning)}
+        """
+
+    def table_exists(self, cursor, table_name):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        return cursor.fetchone()[0] > 0
+
+    def column_exists(self, cursor, table_name, column_name):
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        return any(row[1] == column_name for row in cursor.fetchall())
+
+    def add_column_sql(self, table_name, column_name, column_type):
+        return f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
+
+    def begin_bulk_load(self, conn, tables):
+        # Applies to connections opened from now on
+        self.enforce_foreign_keys = False
+
+    def end_bulk_load(self, conn, tables):
+        self.enforce_foreign_keys = True
+        cursor = conn.cursor()
+        problems = []
+        for table in tables:
+            if not self.table_exists(cursor, table):
+                continue
+            cursor.execute(f"PRAGMA foreign_key_check({table})")
+            violations: Dict[str, int] = {}
+            for _, _, parent, _ in cursor.fetchall():
+                violations[parent] = violations.get(parent, 0) + 1
+            problems += [f"{table}: {count} rows reference a missing {parent}" for parent, count in violations.items()]
+        return problems
+
+    def split_script(self, script):
+        statements, current = [], ""
+        for line in script.splitlines(keepends=True):
+            current += line
+            if sqlite3.complete_statement(current):
+                statements.append(current.strip())
+                current = ""
+        if _strip_sql_comments(current).strip():
+            statements.append(current.strip())
+        return [statement for statement in statements if _strip_sql_comments(statement).strip()]
+
+
+# Store datetimes the way SQL Server renders them instead of relying on the
+# deprecated default adapters
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+BACKENDS = {
+    "sqlserver": SqlServerBackend,
+    "sqlite": SQLiteBackend,
+}
+
+_backend: Optional[DBBackend] = None
+
+
+def get_backend() -> DBBackend:
+    global _backend
+    if _backend is None:
+        name = DB_CONFIG.get("BACKEND", "sqlserver")
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown DB backend '{name}'. Expected one of: {', '.join(BACKENDS)}")
+        _backend = BACKENDS[name]()
+        logging.info(f"Using {name} database backend")
+    return _backend
+
+
+def set_backend(backend: DBBackend):
+    global _backend
+    _backend = backend
@@ -1,30 +1,91 @@
-import pyodbc
 import logging
-from fedpipeline.config import DB_CONFIG
+from fedpipeline.config import DB_LOAD_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.initial_load import active_session
+from fedpipeline.log_config import RecordLogSampler
+from fedpipeline.run_planner import planned_load
+from fedpipeline.typed_batches import TABLE_COLUMN_TYPES, TypedBatch, bound_columns
 
-conn_str = (
-    f"DRIVER={{{DB_CONFIG['DRIVER']}}};"
-    f"SERVER={DB_CONFIG['SERVER']};"
-    f"DATABASE={DB_CONFIG['DATABASE']};"
-    f"UID={DB_CONFIG['UID']};"
-    f"PWD={DB_CONFIG['PWD']}"
-)
-
-def insert_records(query, records, entity_name):
+def insert_records(query, records, entity_name, strategy=None):
     logging.info(f"Inserting {len(records)} {entity_name} records to DB.")
     if not records:
         logging.warning(f"No {entity_name} records to insert.")
         return
+    batch_size = DB_LOAD_CONFIG.get("BATCH_SIZE", 1000)
+    if strategy is None and planned_load(entity_name):
+        # The run plan loads big tables in bulk on the first run
+        strategy, batch_size = planned_load(entity_name)
+    strategy = strategy or DB_LOAD_CONFIG.get("STRATEGY", "per_row")
     try:
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            for record in records:
-                try:
-                    logging.info(record)
-                    cursor.execute(query, record)
-                except Exception as rec_err:
-                    logging.error(f"Failed to insert record into {entity_name}: {record} | Error: {rec_err}")
-            conn.commit()                
+        rows, input_types, rejected = records, None, 0
+        batch = TypedBatch.for_query(entity_name, query, records) if DB_LOAD_CONFIG.get("TYPED_BATCHES", True) else None
+        if batch:
+            # Values that do not fit their column fail here, before any round trip
+            rows, input_types, rejected = batch.rows, batch.types, len(batch.rejected)
+            sampler = RecordLogSampler(entity_name, len(records))
+            for record, reason in batch.rejected:
+                sampler.failure(record, ValueError(reason))
+            sampler.summary()
+        session = active_session()
+        if session:
+            # Initial load: no FK checks, so orphans are dropped here; bigger commits
+            query, kept = session.prepare(entity_name, query, rows)
+            rejected, rows = rejected + len(rows) - len(kept), kept
+            strategy, batch_size = session.strategy, session.batch_size
+        with get_backend().connect() as conn:
+            failed = rejected + get_backend().load_rows(
+                conn, query, rows, entity_name,
+                strategy=strategy, batch_size=batch_size, input_types=input_types
+            )
+        if session:
+            session.loaded(entity_name)
+        if failed:
+            logging.warning(f"{failed} of {len(records)} {entity_name} records failed to insert.")
         logging.info(f"{len(records)} {entity_name} records insertion ended.")
     except Exception as e:
         logging.error(f"Failed to insert {entity_name} records: {e}")
+
+
+def upsert_records(query, records, entity_name, key="ereserve_id", strategy=None):
+    # insert_records for rows that may already exist: they are loaded into a
+    # temp table and merged on key, so existing rows are updated in place.
+    # Keys must be unique within records.
+    logging.info(f"Upserting {len(records)} {entity_name} records to DB.")
+    if not records:
+        logging.warning(f"No {entity_name} records to upsert.")
+        return
+    columns = bound_columns(query)
+    column_types = TABLE_COLUMN_TYPES.get(entity_name, {})
+    if not columns or key not in columns or any(column not in column_types for column in columns):
+        raise ValueError(f"Cannot upsert {entity_name} rows bound by {query!r}")
+    types = [column_types[column] for column in columns]
+    batch = TypedBatch(entity_name, columns, types, records)
+    sampler = RecordLogSampler(entity_name, len(records))
+    for record, reason in batch.rejected:
+        sampler.failure(record, ValueError(reason))
+    sampler.summary()
+
+    batch_size = DB_LOAD_CONFIG.get("BATCH_SIZE", 1000)
+    if strategy is None and planned_load(entity_name, upsert=True):
+        # The temp table is empty, so the run plan's bulk load is safe on any run
+        strategy, batch_size = planned_load(entity_name, upsert=True)
+    backend = get_backend()
+    staging = backend.temp_table_name("UpsertRows")
+    staging_query = f"INSERT INTO {staging} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    with backend.connect() as conn:
+        cursor = conn.cursor()
+        for statement in backend.create_temp_table_statements("UpsertRows", list(zip(columns, types))):
+            cursor.execute(statement)
+        failed = len(batch.rejected) + backend.load_rows(
+            conn, staging_query, batch.rows, entity_name,
+            strategy=strategy or DB_LOAD_CONFIG.get("STAGING_STRATEGY", "executemany"),
+            batch_size=batch_size, input_types=types
+        )
+        inserted, updated = backend.upsert_from_select(
+            cursor, entity_name, key, columns, f"SELECT {', '.join(columns)} FROM {staging}"
+        )
+        cursor.execute(f"DROP TABLE {staging}")
+        conn.commit()
+    if failed:
+        logging.warning(f"{failed} of {len(records)} {entity_name} records failed to upsert.")
+    logging.info(f"{entity_name}: {inserted} records inserted, {updated} updated.")
@@ -0,0 +1,414 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Local entity state store for change detection.
+
+    For each tracked table, ENTITY_STATE_CONFIG["PATH"]/<table>.state holds
+    the table's rows as sorted (ereserve_id, updated_at, row_hash) records,
+    memory-mapped for reading: a lookup is a binary search, and the file is
+    paged in by the OS rather than read into memory. Fetched records whose
+    updated_at matches the store are dropped before they are formatted and
+    loaded, so unchanged rows are neither re-sent to the database nor
+    compared there.
+
+    Only what a load committed goes into the store (read back from the
+    table), so a row the database rejected is fetched and tried again next
+    run. Stamps are rounded to the database's DATETIME precision, so an API
+    value and the value the table stored for it compare equal. A state file
+    that is missing or damaged, or whose record count or sum of ids no
+    longer matches its table, is rebuilt from the database.
+
+    Usage:
+        python -m fedpipeline.entity_state                   # show each table's state
+        python -m fedpipeline.entity_state --rebuild         # rebuild every state file from the database
+        python -m fedpipeline.entity_state --rebuild Reading
+-------------------------------------------------------------------------------
+"""
+import argparse
+import array
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from fedpipeline.config import ENTITY_STATE_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.parent_keys import as_key
+from fedpipeline.typed_batches import to_datetime
+
+# Tables with an updated_at column. School and Unit have none (and are small),
+# so they are not tracked. The usage tables also keep the staging row_hash.
+TRACKED_TABLES = (
+    "IntegrationUser", "Reading", "TeachingSession", "ReadingList", "ReadingListItem", "UnitOffering",
+    "ReadingListUsage", "ReadingListItemUsage", "ReadingUtilisation",
+)
+HASHED_TABLES = ("ReadingListUsage", "ReadingListItemUsage", "ReadingUtilisation")
+
+# File layout: header (magic, version, record count, sum of the ids), then
+# records of three native-order int64s (ereserve_id, updated_at in
+# microseconds, row_hash)
+MAGIC = b"FPES"
+VERSION = 2
+HEADER = struct.Struct("<4sIQq")
+FIELDS = 3
+RECORD_BYTES = FIELDS * 8
+# updated_at or row_hash unknown (NULL in the table)
+MISSING = -(1 << 63)
+EPOCH = datetime(1970, 1, 1)
+WRITE_CHUNK = 65536
+
+
+def is_entity_state_enabled() -> bool:
+    return ENTITY_STATE_CONFIG.get("ENABLED", True)
+
+
+def stamp(value, ticks: int = None) -> int:
+    # updated_at as microseconds since the epoch, from an API string or a
+    # database value. With ticks, rounded (half up) to 1/ticks s the way the
+    # database rounds what it stores, so both sides of a comparison agree.
+    try:
+        moment = to_datetime(value)
+    except (AttributeError, TypeError, ValueError):
+        return MISSING
+    if moment is None:
+        return MISSING
+    delta = moment - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    if ticks:
+        micros = (micros * ticks + 500_000) // 1_000_000 * 1_000_000 // ticks
+    return micros
+
+
+class EntityState:
+    # The state file of one table: sorted records in a read-only memory map,
+    # plus the records changed since the file was last written
+
+    def __init__(self, table: str, directory: Optional[str] = None, ticks: int = None):
+        self.table = table
+        self.path = os.path.join(directory or ENTITY_STATE_CONFIG.get("PATH", "state"), f"{table}.state")
+        # DATETIME precision of the table's database (see stamp)
+        self.ticks = ticks
+        self.count = 0
+        # Sum of the ids, compared with the table's
+        self.key_sum = 0
+        self._file = None
+        self._map = None
+        self._records = None
+        self._changes: Dict[int, Tuple[int, int]] = {}
+
+    def open(self) -> bool:
+        # Maps the file; False when it is missing or damaged
+        self.close()
+        try:
+            handle = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        size = os.fstat(handle.fileno()).st_size
+        header = handle.read(HEADER.size)
+        if len(header) < HEADER.size:
+            handle.close()
+            return False
+        magic, version, count, key_sum = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or size != HEADER.size + count * RECORD_BYTES:
+            handle.close()
+            return False
+        self._file = handle
+        self.count = count
+        self.key_sum = key_sum
+        if count:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._records = memoryview(self._map)[HEADER.size:].cast("q")
+        return True
+
+    def close(self):
+        if self._records is not None:
+            self._records.release()
+            self._records = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.count = 0
+        self.key_sum = 0
+
+    def _find(self, key: int) -> int:
+        # Position of the first record whose id is >= key
+        records = self._records
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if records[middle * FIELDS] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, key: int) -> Optional[Tuple[int, int]]:
+        # (updated_at, row_hash) of the row, or None if the table does not have it
+        if key is None:
+            return None
+        if key in self._changes:
+            return self._changes[key]
+        if not self.count:
+            return None
+        position = self._find(key)
+        if position < self.count and self._records[position * FIELDS] == key:
+            offset = position * FIELDS
+            return self._records[offset + 1], self._records[offset + 2]
+        return None
+
+    def update(self, entries: Iterable[Tuple[int, int, int]]):
+        # entries: (ereserve_id, updated_at, row_hash) of rows now in the table
+        for key, updated_at, row_hash in entries:
+            self._changes[key] = (updated_at, row_hash)
+
+    def _merged(self) -> Iterator[Tuple[int, int, int]]:
+        # The file's records with the changes applied, in id order
+        changes = sorted(self._changes.items())
+        records = self._records
+        position = 0
+        for key, (updated_at, row_hash) in changes:
+            while position < self.count and records[position * FIELDS] < key:
+                offset = position * FIELDS
+                yield records[offset], records[offset + 1], records[offset + 2]
+                position += 1
+            if position < self.count and records[position * FIELDS] == key:
+                position += 1
+            yield key, updated_at, row_hash
+        while position < self.count:
+            offset = position * FIELDS
+            yield records[offset], records[offset + 1], records[offset + 2]
+            position += 1
+
+    def write(self, entries: Iterable[Tuple[int, int, int]]):
+        # Replaces the file with entries (sorted by id) and maps the new one.
+        # Written to a temporary file first, so a crash leaves the old one
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        count = key_sum = 0
+        with open(temporary, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+            buffer = array.array("q")
+            for entry in entries:
+                buffer.extend(entry)
+                count += 1
+                key_sum += entry[0]
+                if len(buffer) >= WRITE_CHUNK * FIELDS:
+                    buffer.tofile(handle)
+                    buffer = array.array("q")
+            buffer.tofile(handle)
+            handle.seek(0)
+            handle.write(HEADER.pack(MAGIC, VERSION, count, key_sum))
+            handle.flush()
+            os.fsync(handle.fileno())
+        # A mapped file cannot be replaced on Windows
+        self.close()
+        os.replace(temporary, self.path)
+        self._changes.clear()
+        self.open()
+
+    def flush(self):
+        # Writes the changes into the file
+        if self._changes:
+            # The old file stays mapped until the new one is complete
+            self.write(self._merged())
+
+    def rebuild(self, conn):
+        start_time = time.time()
+        hash_column = "row_hash" if self.table in HASHED_TABLES else "NULL"
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT ereserve_id, updated_at, {hash_column} FROM {self.table} ORDER BY ereserve_id")
+
+        def entries():
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for key, updated_at, row_hash in rows:
+                    yield key, stamp(updated_at, self.ticks), MISSING if row_hash is None else row_hash
+
+        self._changes.clear()
+        self.write(entries())
+        logging.info(f"Entity state for {self.table} rebuilt from the database: {self.count} rows "
+                     f"in {time.time() - start_time:.1f}s")
+
+
+def table_summary(conn, table: str) -> Tuple[int, int]:
+    # (row count, sum of the ids), to compare with a state file's header. The
+    # sum catches deletes and inserts that leave the count as it was.
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*), SUM(CAST(ereserve_id AS BIGINT)) FROM {table}")
+    count, key_sum = cursor.fetchone()
+    return count, key_sum or 0
+
+
+def out_of_step(state: EntityState, summary: Tuple[int, int]) -> Optional[str]:
+    # Why the state file no longer matches its table, or None
+    count, key_sum = summary
+    if state.count != count:
+        return f"has {state.count} rows, the table {count}"
+    if state.key_sum != key_sum:
+        return "has other ids than the table"
+    return None
+
+
+class ChangeTracker:
+    # Change detection for one table's load: changed() drops fetched records
+    # the table already has with the same updated_at (or, with COMPARE =
+    # "row_hash", changed_rows() drops formatted rows with the same hash), and
+    # committed() adds what the load wrote. Inert when the store is off or
+    # the table is not tracked. Use as a context manager; the state file is
+    # written when the block ends.
+
+    def __init__(self, table: str, conn=None):
+        self.table = table
+        self.enabled = is_entity_state_enabled() and table in TRACKED_TABLES
+        self.compare = ENTITY_STATE_CONFIG.get("COMPARE", "updated_at")
+        if self.compare == "row_hash" and table not in HASHED_TABLES:
+            self.compare = "updated_at"
+        self.conn = conn
+        self.ticks = get_backend().datetime_ticks if self.enabled else None
+        self.state: Optional[EntityState] = None
+        self.dropped = 0
+
+    def __enter__(self) -> "ChangeTracker":
+        if self.enabled:
+            try:
+                self.state = self._open_state()
+            except Exception as e:
+                # The store only saves work; without it every record is loaded
+                logging.warning(f"Entity state for {self.table} unavailable, loading every record: {e}")
+                self.enabled = False
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.state is not None:
+            try:
+                self.state.flush()
+            finally:
+                self.state.close()
+            if self.dropped:
+                logging.info(f"{self.table}: {self.dropped} unchanged records dropped before loading (entity state)")
+        return False
+
+    def _connection(self):
+        # The caller's connection, or one of our own for the duration of the block
+        return self.conn if self.conn is not None else get_backend().connect()
+
+    def _open_state(self) -> EntityState:
+        state = EntityState(self.table, ticks=self.ticks)
+        conn = self._connection()
+        try:
+            if not state.open():
+                logging.info(f"No usable entity state file for {self.table}; rebuilding it")
+                state.rebuild(conn)
+            else:
+                reason = out_of_step(state, table_summary(conn, self.table))
+                if reason:
+                    logging.info(f"Entity state for {self.table} {reason}; rebuilding it")
+                    state.rebuild(conn)
+        finally:
+            if conn is not self.conn:
+                conn.close()
+        return state
+
+    def changed(self, items: Iterable[Dict]) -> Iterator[Dict]:
+        # Fetched records that are new or whose updated_at differs, in order
+        state = self.state
+        if state is None or self.compare != "updated_at":
+            yield from items
+            return
+        for item in items:
+            if self._unchanged(item.get("id"), (item.get("attributes") or {}).get("updated-at")):
+                self.dropped += 1
+                continue
+            yield item
+
+    def changed_stamped(self, rows: List[Tuple], updated: List) -> List[Tuple]:
+        # changed() for rows formatted in a worker process (see transform_pool):
+        # updated holds the updated-at of each row's record, the row its id first
+        state = self.state
+        if state is None or self.compare != "updated_at":
+            return rows
+        kept = []
+        for row, updated_at in zip(rows, updated):
+            if self._unchanged(row[0], updated_at):
+                self.dropped += 1
+                continue
+            kept.append(row)
+        return kept
+
+    def _unchanged(self, record_id, updated_at) -> bool:
+        known = self.state.get(as_key(record_id))
+        return known is not None and known[0] != MISSING and known[0] == stamp(updated_at, self.ticks)
+
+    def changed_rows(self, rows: List[Tuple]) -> List[Tuple]:
+        # With COMPARE = "row_hash": formatted rows (row_hash last) whose hash differs
+        state = self.state
+        if state is None or self.compare != "row_hash":
+            return rows
+        kept = []
+        for row in rows:
+            known = state.get(as_key(row[0]))
+            if known is not None and known[1] != MISSING and known[1] == row[-1]:
+                self.dropped += 1
+                continue
+            kept.append(row)
+        return kept
+
+    def record(self, rows: Iterable[Tuple]):
+        # rows: (ereserve_id, updated_at, row_hash) as read from the table after a commit
+        if self.state is not None:
+            self.state.update((key, stamp(updated_at, self.ticks), MISSING if row_hash is None else row_hash)
+                              for key, updated_at, row_hash in rows)
+
+    def committed(self, rows: List[Tuple]):
+        # After a load of formatted rows (ereserve_id first): reads back which
+        # of them the table now has, with the values it has
+        if self.state is None or not rows:
+            return
+        keys = sorted({key for key in (as_key(row[0]) for row in rows) if key is not None})
+        conn = self._connection()
+        try:
+            if len(keys) > max(self.state.count, 1) // 2:
+                # Most of the table: one scan beats reading it back by id
+                self.state.rebuild(conn)
+                return
+            hash_column = "row_hash" if self.table in HASHED_TABLES else "NULL"
+            batch = ENTITY_STATE_CONFIG.get("READBACK_BATCH", 500)
+            cursor = conn.cursor()
+            for i in range(0, len(keys), batch):
+                chunk = keys[i:i + batch]
+                cursor.execute(f"SELECT ereserve_id, updated_at, {hash_column} FROM {self.table} "
+                               f"WHERE ereserve_id IN ({', '.join('?' * len(chunk))})", chunk)
+                self.record(cursor.fetchall())
+        finally:
+            if conn is not self.conn:
+                conn.close()
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Local entity state store")
+    parser.add_argument("--rebuild", nargs="*", metavar="TABLE",
+                        help="Rebuild the state files of these tables (default: all) from the database")
+    args = parser.parse_args()
+
+    tables = args.rebuild or list(TRACKED_TABLES)
+    backend = get_backend()
+    with backend.connect() as conn:
+        for table in tables:
+            state = EntityState(table, ticks=backend.datetime_ticks)
+            if args.rebuild is not None:
+                state.rebuild(conn)
+            usable = state.open()
+            summary = table_summary(conn, table)
+            status = "missing or damaged" if not usable else (out_of_step(state, summary) or "ok")
+            print(f"{table:22} {state.count:>10} state rows {summary[0]:>10} table rows  {status}")
+            state.close()
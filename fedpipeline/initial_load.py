@@ -0,0 +1,180 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Bulk-load mode for the initial load, when every table starts out empty.
+
+    While the mode is on, for each loaded table:
+    - SQL Server: non-unique nonclustered indexes are disabled and foreign
+      key / check constraints set to NOCHECK. Inserts take a table lock
+      (WITH (TABLOCK)) and go out with fast_executemany, committing every
+      INITIAL_LOAD_CONFIG["BATCH_SIZE"] rows. At the end the indexes are
+      rebuilt and the constraints re-enabled WITH CHECK, so the optimizer
+      trusts them again.
+    - SQLite: foreign key enforcement is off during the load and checked with
+      PRAGMA foreign_key_check at the end. Indexes stay: SQLite cannot disable
+      one, and an index dropped for the load would be lost if the run died.
+
+    With the constraints off the database no longer rejects rows whose parent
+    is missing, so those are dropped in process (fedpipeline.parent_keys)
+    before they are inserted, as the constraints would have done.
+
+    If the final rebuild or check finds problems, the run fails rather than
+    being recorded as a SUCCESS with untrusted constraints. If a run dies
+    before the end, or its check failed, --finish rebuilds and re-checks
+    everything once the cause is fixed.
+
+    Usage:
+        python -m fedpipeline.initial_load --finish   # restore indexes and constraints after an interrupted load
+-------------------------------------------------------------------------------
+"""
+import argparse
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from fedpipeline.config import INITIAL_LOAD_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.parent_keys import ParentKeyIndex
+from fedpipeline.typed_batches import bound_columns
+
+# Loaded tables in load order, with the foreign keys of sql/db.sql
+# (column -> parent table)
+TABLE_FOREIGN_KEYS = {
+    "School": {},
+    "IntegrationUser": {},
+    "Reading": {},
+    "Unit": {"school_id": "School"},
+    "FedUnit": {"unit_id": "Unit"},
+    "TeachingSession": {},
+    "ReadingList": {"unit_id": "Unit", "teaching_session_id": "TeachingSession"},
+    "ReadingListItem": {"list_id": "ReadingList", "reading_id": "Reading"},
+    "UnitOffering": {"unit_id": "Unit", "reading_list_id": "ReadingList"},
+    "ReadingListUsage": {"list_id": "ReadingList", "integration_user_id": "IntegrationUser"},
+    "ReadingListItemUsage": {
+        "item_id": "ReadingListItem", "list_usage_id": "ReadingListUsage", "integration_user_id": "IntegrationUser",
+    },
+    "ReadingUtilisation": {
+        "item_id": "ReadingListItem", "item_usage_id": "ReadingListItemUsage", "integration_user_id": "IntegrationUser",
+    },
+}
+
+LOAD_TABLES = list(TABLE_FOREIGN_KEYS)
+
+_active: Optional["InitialLoadSession"] = None
+
+
+class InitialLoadCheckFailed(Exception):
+    pass
+
+
+def is_initial_load_mode_enabled() -> bool:
+    return INITIAL_LOAD_CONFIG.get("ENABLED", True)
+
+
+def active_session() -> Optional["InitialLoadSession"]:
+    return _active
+
+
+class InitialLoadSession:
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+        self.strategy = INITIAL_LOAD_CONFIG.get("STRATEGY") or self.backend.bulk_load_strategy
+        self.batch_size = INITIAL_LOAD_CONFIG.get("BATCH_SIZE", 50000)
+        self._conn = None
+        self._parent_keys: Optional[ParentKeyIndex] = None
+        self.dropped: Dict[str, int] = {}
+
+    def begin(self):
+        start_time = time.time()
+        with self.backend.connect() as conn:
+            self.backend.begin_bulk_load(conn, LOAD_TABLES)
+        # Parent ids are read on a connection of their own, once per table
+        self._conn = self.backend.connect()
+        self._parent_keys = ParentKeyIndex(self._conn)
+        logging.info(f"Initial load mode on ({self.strategy}, {self.batch_size} rows per commit) "
+                     f"in {time.time() - start_time:.1f}s")
+
+    def prepare(self, table: str, query: str, rows: List[Tuple]) -> Tuple[str, List[Tuple]]:
+        # The statement with the table lock hint, and the rows whose parents exist
+        columns = bound_columns(query)
+        if columns is None:
+            # Not a plain INSERT (the fedcode UPDATE): constraints are not involved
+            return query, rows
+        foreign_keys = TABLE_FOREIGN_KEYS.get(table, {})
+        checks = [(position, foreign_keys[column], column, True)
+                  for position, column in enumerate(columns) if column in foreign_keys]
+        if checks and rows:
+            kept, missing = self._parent_keys.filter_rows(rows, checks)
+            if len(kept) < len(rows):
+                self.dropped[table] = self.dropped.get(table, 0) + len(rows) - len(kept)
+                breakdown = ", ".join(f"{count} missing {column}" for column, count in missing.items() if count)
+                logging.warning(f"{table}: dropped {len(rows) - len(kept)} of {len(rows)} rows without a parent "
+                                f"({breakdown})")
+                rows = kept
+        return self.backend.bulk_insert_sql(query), rows
+
+    def loaded(self, table: str):
+        # Children of this table are checked against what was actually inserted
+        self._parent_keys.forget(table)
+
+    def finish(self) -> List[str]:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        return finish_initial_load(self.backend)
+
+
+def finish_initial_load(backend=None) -> List[str]:
+    # Rebuilds indexes and re-checks constraints; returns the problems found
+    backend = backend or get_backend()
+    start_time = time.time()
+    with backend.connect() as conn:
+        problems = backend.end_bulk_load(conn, LOAD_TABLES)
+    for problem in problems:
+        logging.error(f"Initial load check: {problem}")
+    logging.info(f"Initial load indexes and constraints restored in {time.time() - start_time:.1f}s"
+                 f"{f' with {len(problems)} problems' if problems else ''}")
+    return problems
+
+
+@contextmanager
+def initial_load_mode(active: bool = True):
+    # Bulk-load mode for the block when active and enabled; the indexes and
+    # constraints are restored on the way out, also when the block fails.
+    # Problems found then fail a block that had succeeded.
+    global _active
+    if not (active and is_initial_load_mode_enabled()):
+        yield None
+        return
+    session = InitialLoadSession()
+    session.begin()
+    _active = session
+    try:
+        yield session
+    except BaseException:
+        # The load's own error is the one to report; problems are logged
+        _active = None
+        session.finish()
+        raise
+    _active = None
+    problems = session.finish()
+    if problems:
+        raise InitialLoadCheckFailed(
+            f"{len(problems)} index or constraint problems after the initial load; fix them and run "
+            f"python -m fedpipeline.initial_load --finish"
+        )
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Initial load bulk mode maintenance")
+    parser.add_argument("--finish", action="store_true",
+                        help="Rebuild disabled indexes and re-check constraints after an interrupted initial load")
+    args = parser.parse_args()
+    if not args.finish:
+        parser.error("nothing to do: pass --finish")
+
+    problems = finish_initial_load()
+    print("ok" if not problems else "\n".join(problems))
+    if problems:
+        raise SystemExit(1)
@@ -1,76 +1,171 @@
 import logging
-import schedule
 import time
 import traceback
+from datetime import datetime
+from fedpipeline.config import RECONCILIATION_CONFIG, SCHEDULE_CONFIG
+from fedpipeline.cron_scheduler import LeaseKeeper, ScheduleStore, cadences
+from fedpipeline.profiler import profile_stage, begin_run
+from fedpipeline import landing_zone, tracing
+from fedpipeline.initial_load import initial_load_mode
+from fedpipeline.reconciliation import is_reconciliation_enabled, reconcile_deletes
+from fedpipeline.run_planner import STAGE_ENTITIES, finish_plan, is_planner_enabled, plan_run, plan_stage
+from fedpipeline.usage_rollups import ROLLUP_SOURCE_TABLES, rebuild_usage_rollups
+from fedpipeline.work_queue import coordinate_run, is_work_queue_enabled
 
-def job():
-    logging.info("Starting scheduled job...")
+# Stage groups, each with its own cadence in SCHEDULE_CONFIG["CADENCES"].
+# Groups run in this order when several are due together; "usage" is handled
+# by the first-run / staging logic in job() rather than a list of stages.
+STAGE_GROUPS = {
+    "schools": ("process_schools",),
+    "catalogue": (
+        "process_integration_users", "process_readings", "process_units", "process_teaching_sessions",
+        "process_reading_lists", "process_reading_list_items", "process_unit_offerings"
+    ),
+    "usage": (),
+}
 
-    from fedpipeline.jobs import (
-        process_integration_users, process_schools, process_readings,
-        process_units, process_teaching_sessions, process_reading_lists,
-        process_reading_list_items, process_unit_offerings
-    )
+# API entities loaded by each group, for delete reconciliation
+GROUP_ENTITIES = {
+    "schools": ["schools"],
+    "catalogue": [
+        "integration-users", "readings", "units", "teaching-sessions",
+        "reading-lists", "reading-list-items", "unit-offerings"
+    ],
+    "usage": ["reading-list-usages", "reading-list-item-usages", "reading-utilisations"],
+}
+
+# Usage stages of the first run; later runs merge usage with process_usage_data
+FIRST_RUN_USAGE_STAGES = (
+    "process_reading_list_usage", "process_reading_list_item_usage", "process_reading_utilisation"
+)
+
+def refresh_usage_rollups():
+    # The staging MERGE keeps the rollups current; usage loaded any other way
+    # (first run, fallback, hard deletes) needs a rebuild
+    try:
+        with profile_stage("rebuild_usage_rollups"):
+            rebuild_usage_rollups()
+    except Exception as e:
+        logging.error(f"Usage rollup rebuild failed: {e}")
+
+def planned_stages(groups, is_first_run):
+    # (stage, entities) of a run in the order job() runs them, for the run planner
+    if is_work_queue_enabled():
+        return [("work_queue", [entity for group in groups for entity in GROUP_ENTITIES[group]])]
+    names = [stage_name for group in groups for stage_name in STAGE_GROUPS[group]]
+    if "usage" in groups:
+        names += FIRST_RUN_USAGE_STAGES if is_first_run else ("process_usage_data",)
+    return [(name, STAGE_ENTITIES[name]) for name in names]
+
+def job(groups=None, on_run_started=None):
+    groups = [group for group in STAGE_GROUPS if groups is None or group in groups]
+    logging.info(f"Starting scheduled job ({', '.join(groups)})...")
+
+    from fedpipeline import jobs
     from fedpipeline.usage_staging_processor import process_usage_data
     from fedpipeline.pipeline_run_manager import PipelineRunHistoryManager
     
     run_manager = PipelineRunHistoryManager()
-    is_first_run = run_manager.is_first_run()   
+    is_first_run = run_manager.is_first_run()
+    if is_first_run and len(groups) < len(STAGE_GROUPS):
+        # The initial load fills every table, parents before children
+        logging.info("No successful run yet; running all stage groups")
+        groups = list(STAGE_GROUPS)
     run_id = run_manager.start_run(is_initial_load=is_first_run)
+    begin_run(run_id)
+    tracing.begin_run(run_id)
+    landing_zone.begin_run(run_id)
+    jobs.reset_fallbacks()
+    if on_run_started:
+        on_run_started(run_id)
+    if is_planner_enabled():
+        try:
+            with profile_stage("plan_run"):
+                plan_run(run_id, planned_stages(groups, is_first_run), windowed=not is_first_run)
+        except Exception as e:
+            logging.error(f"Run planning failed; using the configured page sizes and loads: {e}")
     
     try:
-        process_integration_users()
-        process_schools()
-        process_readings()
-        process_units()
-        process_teaching_sessions()
-        process_reading_lists()
-        process_reading_list_items()
-        process_unit_offerings()
-        
-        # Process usage tables
-        if is_first_run:
-            logging.info("FIRST RUN DETECTED - Fetching ALL usage data")
-            
-            from fedpipeline.jobs import (
-                process_reading_list_usage, process_reading_list_item_usage,
-                process_reading_utilisation
-            )
-            
-            process_reading_list_usage()
-            process_reading_list_item_usage()
-            process_reading_utilisation()
-
+        if is_work_queue_enabled():
+            entities = [entity for group in groups for entity in GROUP_ENTITIES[group]]
+            # After the first run, usage goes through the staging MERGE as one item
+            with profile_stage("work_queue"), plan_stage("work_queue"):
+                coordinate_run(run_id, entities, usage_staging=not is_first_run)
+            if is_first_run and "usage" in groups:
+                refresh_usage_rollups()
             if run_id:
                 run_manager.end_run_success(run_id)
+        else:
+            # The first run loads into empty tables with indexes and FK checks
+            # off; they are rebuilt and validated when the block ends
+            with initial_load_mode(is_first_run):
+                for group in groups:
+                    for stage_name in STAGE_GROUPS[group]:
+                        with profile_stage(stage_name), plan_stage(stage_name):
+                            getattr(jobs, stage_name)()
+
+                if is_first_run and "usage" in groups:
+                    logging.info("FIRST RUN DETECTED - Fetching ALL usage data")
+
+                    from fedpipeline.jobs import (
+                        process_reading_list_usage, process_reading_list_item_usage,
+                        process_reading_utilisation
+                    )
+
+                    for stage in (process_reading_list_usage, process_reading_list_item_usage, process_reading_utilisation):
+                        with profile_stage(stage.__name__), plan_stage(stage.__name__):
+                            stage()
+        
+            # Process usage tables
+            if "usage" not in groups:
+                if run_id:
+                    run_manager.end_run_success(run_id)
+            elif is_first_run:
+                refresh_usage_rollups()
 
-            logging.info("FIRST RUN COMPLETED - Next run will use date filtering")
+                if run_id:
+                    run_manager.end_run_success(run_id)
+
+                logging.info("FIRST RUN COMPLETED - Next run will use date filtering")
             
-        else:
-            logging.info("SUBSEQUENT RUN DETECTED - Using date filtering for usage data")
-            try:
-                metrics = process_usage_data()
+            else:
+                logging.info("SUBSEQUENT RUN DETECTED - Using date filtering for usage data")
+                try:
+                    with profile_stage("process_usage_data"), plan_stage("process_usage_data"):
+                        metrics = process_usage_data()
                 
-                if run_id:
-                    run_manager.end_run_success(run_id, metrics)
+                    if run_id:
+                        run_manager.end_run_success(run_id, metrics)
                 
-                logging.info(f"Usage data processing completed: {metrics}")
+                    logging.info(f"Usage data processing completed: {metrics}")
                 
-            except Exception as e:
-                logging.error(f"Usage data processing failed: {e}")
-                logging.error(f"Stack trace: {traceback.format_exc()}")
+                except Exception as e:
+                    logging.error(f"Usage data processing failed: {e}")
+                    logging.error(f"Stack trace: {traceback.format_exc()}")
 
-                if run_id:
-                    run_manager.end_run_failure(run_id, str(e), traceback.format_exc())
+                    if run_id:
+                        run_manager.end_run_failure(run_id, str(e), traceback.format_exc())
                 
-                logging.info("Falling back to normal method")
-                from fedpipeline.jobs import (
-                    process_reading_list_usage, process_reading_list_item_usage,
-                    process_reading_utilisation
-                )
-                process_reading_list_usage()
-                process_reading_list_item_usage()
-                process_reading_utilisation()
+                    logging.info("Falling back to normal method")
+                    from fedpipeline.jobs import (
+                        process_reading_list_usage, process_reading_list_item_usage,
+                        process_reading_utilisation
+                    )
+                    for stage in (process_reading_list_usage, process_reading_list_item_usage, process_reading_utilisation):
+                        with profile_stage(stage.__name__), plan_stage(stage.__name__):
+                            stage()
+                    refresh_usage_rollups()
+        
+        if is_reconciliation_enabled():
+            try:
+                with profile_stage("reconcile_deletes"):
+                    summary = reconcile_deletes([entity for group in groups for entity in GROUP_ENTITIES[group]])
+                if RECONCILIATION_CONFIG.get("MODE") == "hard" and any(
+                        result["removed"] for result in summary.values() if result["table"] in ROLLUP_SOURCE_TABLES):
+                    refresh_usage_rollups()
+            except Exception as e:
+                logging.error(f"Delete reconciliation failed: {e}")
+                logging.error(f"Stack trace: {traceback.format_exc()}")
         
         # Display run stats
         stats = run_manager.get_run_statistics()
@@ -88,12 +183,99 @@ def job():
             run_manager.end_run_failure(run_id, str(e), traceback.format_exc())
         
         raise
+    finally:
+        finish_plan()
+        landing_zone.end_run()
+        tracing.end_run()
+
+def due_groups(schedules, last_runs, now, catch_up=True):
+    # A group is due once the first cron time after its last run has passed.
+    # However many slots were missed, the group runs once; without catch-up
+    # a run missed by more than the poll interval is skipped.
+    due = []
+    for group, schedule in schedules.items():
+        last_run = last_runs.get(group)
+        if last_run is None:
+            due.append(group)
+            continue
+        next_run = schedule.next_after(last_run)
+        if next_run <= now:
+            if catch_up or (now - next_run).total_seconds() <= SCHEDULE_CONFIG.get("POLL_SECONDS", 60):
+                due.append(group)
+            else:
+                logging.info(f"Skipping missed {group} run due at {next_run:%Y-%m-%d %H:%M} (catch-up disabled)")
+    return due
+
+def next_due_time(schedules, last_runs, now):
+    times = [schedule.next_after(last_runs[group]) if last_runs.get(group) else now
+             for group, schedule in schedules.items()]
+    return min(times) if times else None
+
+def run_due_groups(store, schedules) -> bool:
+    # Runs every due group this instance can lease, as one pipeline run.
+    # Returns False when nothing was run.
+    from fedpipeline.pipeline_run_manager import PipelineRunHistoryManager
+
+    now = datetime.now()
+    catch_up = SCHEDULE_CONFIG.get("CATCH_UP", True)
+    due = due_groups(schedules, store.last_runs(schedules), now, catch_up)
+    if not due:
+        return False
+    first_run = PipelineRunHistoryManager().is_first_run()
+    if first_run:
+        # The initial load fills every table, parents before children
+        due = list(schedules)
+
+    leased = [group for group in due if store.acquire(group)]
+    if len(leased) < len(due):
+        logging.info("Stage groups leased by another instance: "
+                     + ", ".join(group for group in due if group not in leased))
+    if leased and not first_run:
+        # Another instance may have finished a group between our check and taking its lease
+        still_due = due_groups(schedules, store.last_runs(schedules), now, catch_up)
+        store.release([group for group in leased if group not in still_due])
+        leased = [group for group in leased if group in still_due]
+    if not leased or (first_run and len(leased) < len(due)):
+        store.release(leased)
+        return False
+
+    run = {"id": None}
+    def attach(run_id):
+        run["id"] = run_id
+        store.attach_run(leased, run_id)
+
+    status = "FAILED"
+    try:
+        with LeaseKeeper(store, leased):
+            job(leased, on_run_started=attach)
+        status = "SUCCESS"
+    except Exception as e:
+        logging.error(f"Scheduled run of {', '.join(leased)} failed: {e}")
+    finally:
+        # The start time anchors the next slot, so a failed run waits for the next one
+        store.release(leased, run_time=now, status=status, run_id=run["id"])
+    return True
 
 def start_scheduler():
-    job()  # Run immediately at startup
-    # Monthly run. Need to change this to use APScheduler
-    schedule.every(1296000).minutes.do(job)
-    logging.info("Scheduler started. Waiting for job trigger...")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    schedules = cadences()
+    store = ScheduleStore()
+    poll_seconds = SCHEDULE_CONFIG.get("POLL_SECONDS", 60)
+    logging.info("Scheduler started ("
+                 + ", ".join(f"{group}: {schedule.expression}" for group, schedule in schedules.items())
+                 + f"); lease owner {store.owner}")
+    try:
+        while True:
+            if run_due_groups(store, schedules):
+                # Groups that fell due during the run go next, without waiting
+                continue
+            now = datetime.now()
+            next_run = next_due_time(schedules, store.last_runs(schedules), now)
+            # Sleep until the next slot, but wake every poll interval to notice
+            # runs finished by other instances or leases that have expired
+            wait = poll_seconds
+            if next_run is not None and next_run > now:
+                wait = min(max((next_run - now).total_seconds(), 1), poll_seconds)
+                logging.debug(f"Next scheduled run at {next_run:%Y-%m-%d %H:%M}")
+            time.sleep(wait)
+    finally:
+        store.release(schedules)
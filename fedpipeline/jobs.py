@@ -1,87 +1,391 @@
+import hashlib
 import logging
 import re
-from fedpipeline.api_handler import fetch_data_from_api
+from itertools import islice
+from fedpipeline.api_handler import fetch_with_retry, last_request_rejected
 from fedpipeline.db_handler import insert_records
+from fedpipeline.entity_state import ChangeTracker
 from fedpipeline.config import API_CONFIG
 from fedpipeline.config import PAGE_SIZE
 from fedpipeline.config import KNOWN_PREFIXES
+from fedpipeline.config import PAGINATION_CONFIG
+from fedpipeline.config import SPARSE_FIELDSETS_CONFIG
+from fedpipeline.config import SPILL_CONFIG
+from fedpipeline.config import STREAMING_CONFIG
+from fedpipeline.json_stream import PageStream
+from fedpipeline.keyset_paging import KeysetCursor, SeenIds, reset_keyset_fallbacks
+from fedpipeline.run_planner import planned_page_size
+from fedpipeline.sideloading import load_sideloads, new_sideloads, reset_include_fallbacks
+from fedpipeline.spill_buffer import SpillBuffer
+from fedpipeline.tracing import activate, span, start_span, traced
+from fedpipeline.transform_pool import is_transform_pool_enabled, submit_page
 
-def fetch_all_pages(url):
-    all_items = []
-    while url:
-        response = fetch_data_from_api(url)
+# Column mapping: the attributes each entity's formatter reads, in column order
+# (ereserve_id comes from the resource id). Requests ask for exactly these via
+# a fields[<type>] sparse fieldset.
+ENTITY_ATTRIBUTES = {
+    "integration-users": ("identifier", "roles", "first-name", "last-name", "email",
+                          "lti-consumer-user-id", "lti-lis-person-sourcedid", "created-at", "updated-at"),
+    "schools": ("name",),
+    "readings": ("reading-title", "genre", "source-document-title", "article-number", "created-at", "updated-at"),
+    "units": ("code", "name"),
+    "unit-offerings": ("unit-id", "reading-list-id", "source-unit-code", "source-unit-name",
+                       "source-unit-offering", "result", "created-at", "updated-at"),
+    "teaching-sessions": ("name", "start-date", "end-date", "archived", "created-at", "updated-at"),
+    "reading-lists": ("unit-id", "teaching-session-id", "name", "duration", "start-date", "end-date", "hidden",
+                      "usage-count", "item-count", "approved-item-count", "deleted", "created-at", "updated-at"),
+    "reading-list-items": ("list-id", "reading-id", "status", "hidden", "reading-utilisations-count",
+                           "reading-importance", "usage-count", "created-at", "updated-at"),
+    "reading-list-usages": ("list-id", "integration-user-id", "item-usage-count", "created-at", "updated-at"),
+    "reading-list-item-usages": ("item-id", "list-usage-id", "integration-user-id", "utilisation-count",
+                                 "created-at", "updated-at"),
+    "reading-utilisations": ("integration-user-id", "item-id", "item-usage-id", "created-at", "updated-at"),
+}
+
+# Entities whose server rejected or ignored fields[<type>]; they are fetched in
+# full until the next run
+_fieldsets_unsupported = set()
+
+def mapped_row(item, entity):
+    return (item.get("id"),) + tuple(map(item["attributes"].get, ENTITY_ATTRIBUTES[entity]))
+
+def sparse_fields_active(entity):
+    return SPARSE_FIELDSETS_CONFIG.get("ENABLED", True) and entity not in _fieldsets_unsupported
+
+def with_sparse_fields(url, entity):
+    if not sparse_fields_active(entity):
+        return url
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}fields[{entity}]={','.join(ENTITY_ATTRIBUTES[entity])}"
+
+def sparse_fields_fallback(url, entity):
+    # Called when a request failed: if the server refused it (400/422), returns
+    # the same URL without the fieldset (and stops sending it for this entity
+    # this run). None if it had none or the failure was transient.
+    marker = f"fields[{entity}]="
+    if not entity or marker not in url or not last_request_rejected():
+        return None
+    _fieldsets_unsupported.add(entity)
+    base, _, query = url.partition("?")
+    query = "&".join(part for part in query.split("&") if not part.startswith(marker))
+    logging.warning(f"Request with fields[{entity}] refused; retrying without a sparse fieldset")
+    return f"{base}?{query}" if query else base
+
+def with_include(url, entity, sideloads):
+    # include= for the relationships sideloads collects, with the included
+    # types limited to their mapped attributes (see sideloading)
+    if not sideloads or not sideloads.relationships:
+        return url
+    names = ",".join(sideloads.relationships)
+    if sparse_fields_active(entity):
+        # A relationship left out of the fieldset would not be included either
+        url = url.replace(f"fields[{entity}]=", f"fields[{entity}]={names},", 1)
+    parts = [f"include={names}"] + [
+        f"fields[{included_type}]={','.join(ENTITY_ATTRIBUTES[included_type])}"
+        for included_type in sorted(set(sideloads.relationships.values())) if sparse_fields_active(included_type)
+    ]
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}{'&'.join(parts)}"
+
+def check_sparse_fields(entity, items, sideloads=None):
+    # A server that ignores fieldsets returns other attributes or relationships
+    if not entity or not items or not sparse_fields_active(entity):
+        return
+    wanted = set(ENTITY_ATTRIBUTES[entity])
+    requested = set(sideloads.relationships) if sideloads else set()
+    item = items[0]
+    if set(item.get("relationships") or {}) - requested or set(item.get("attributes", {})) - wanted:
+        _fieldsets_unsupported.add(entity)
+        logging.info(f"Server ignores fields[{entity}]; fetching full resources from now on")
+
+def iter_pages(url, entity=None, max_pages=None, sideloads=None, record=True):
+    # Yields the items of each page in turn, in id order with keyset paging
+    # where the server supports it (see keyset_paging), else following links.next.
+    # Items already served earlier in the listing are dropped.
+    # With entity, only the mapped attributes are requested (see ENTITY_ATTRIBUTES).
+    # With max_pages, stops after that many pages (a work queue page range).
+    # With sideloads, referenced parents are requested with include= and collected there.
+    # record=False keeps the pages out of the landing zone (not a listing, e.g. filter[id] lookups).
+    if entity:
+        url = with_include(with_sparse_fields(url, entity), entity, sideloads)
+    cursor = KeysetCursor(url, entity, max_pages)
+    seen = SeenIds(entity)
+    url = cursor.first_url()
+    first_page = True
+    pages = 0
+    while url and (max_pages is None or pages < max_pages):
+        # The page span ends before its items are yielded to the caller
+        with span("page", "page", entity=entity, number=pages + 1) as page_span:
+            response = fetch_with_retry(url, record=record)
+            if response:
+                with span("json.decode", "decode"):
+                    document = response.json()
+                page_span.set(items=len(document.get("data", [])))
         if not response:
+            fallback_url = first_request_fallback(cursor, url, entity, sideloads) if first_page else None
+            if fallback_url:
+                url = fallback_url
+                continue
             break
-        data = response.json().get("data", [])
-        links = response.json().get("links", {})
+        data = document.get("data", [])
+        links = document.get("links", {})
         logging.info(f"Fetched {len(data)} items from {url}")
         if not data:
             break
+        if first_page:
+            check_sparse_fields(entity, data, sideloads)
+            first_page = False
+        if sideloads:
+            sideloads.add(data, document.get("included"))
+        pages += 1
+        url = cursor.next_url([item.get("id") for item in data], links)
+        yield seen.fresh(data)
+    seen.summary()
+
+def fetch_all_pages(url, entity=None, max_pages=None, sideloads=None):
+    all_items = []
+    for data in iter_pages(url, entity, max_pages, sideloads):
         all_items.extend(data)
-        url = links.get("next")
     return all_items
 
+def iter_all_pages(url, entity=None, max_pages=None, sideloads=None):
+    # Streaming counterpart of fetch_all_pages: decodes each page incrementally
+    # and yields its items one at a time, paging as iter_pages does
+    if entity:
+        url = with_include(with_sparse_fields(url, entity), entity, sideloads)
+    cursor = KeysetCursor(url, entity, max_pages)
+    seen = SeenIds(entity)
+    dedup = PAGINATION_CONFIG.get("DEDUP", True)
+    url = cursor.first_url()
+    first_page = True
+    pages = 0
+    while url and (max_pages is None or pages < max_pages):
+        # Items are yielded while the page decodes, so the page and decode
+        # spans are not made current around the caller's work
+        page_span = start_span("page", "page", entity=entity, number=pages + 1, streaming=True)
+        with activate(page_span):
+            response = fetch_with_retry(url, stream=True)
+        if not response:
+            page_span.end()
+            fallback_url = first_request_fallback(cursor, url, entity, sideloads) if first_page else None
+            if fallback_url:
+                url = fallback_url
+                continue
+            break
+        page = PageStream(response.iter_content(STREAMING_CONFIG.get("CHUNK_SIZE", 65536)))
+        decode_span = start_span("json.decode", "decode", parent=page_span, streaming=True)
+        ids = []
+        first_item = None
+        try:
+            for item in page.items():
+                if first_page:
+                    check_sparse_fields(entity, [item], sideloads)
+                    first_page = False
+                if first_item is None:
+                    first_item = item
+                ids.append(item.get("id"))
+                if not dedup or seen.is_new(item):
+                    yield item
+        finally:
+            response.close()
+            decode_span.end(items=page.item_count, bytes=page.bytes_read)
+            page_span.end(items=page.item_count)
+        logging.info(f"Fetched {page.item_count} items ({page.bytes_read} bytes) from {url}")
+        if not page.item_count:
+            break
+        if sideloads:
+            # "included" is complete once the page has been read
+            sideloads.add([first_item], page.included)
+        pages += 1
+        url = cursor.next_url(ids, page.links)
+    seen.summary()
+
+def iter_pooled_pages(url, entity, formatter, args=(), max_pages=None, sideloads=None, tracker=None):
+    # iter_pages for the transform pool: yields each page's rows, formatted
+    # with formatter(items, *args) in a worker process. The next page is
+    # fetched once the worker has decoded the last one, while its rows are
+    # still being built. With tracker, rows of unchanged records are dropped.
+    if entity:
+        url = with_include(with_sparse_fields(url, entity), entity, sideloads)
+    cursor = KeysetCursor(url, entity, max_pages)
+    seen = SeenIds(entity)
+    url = cursor.first_url()
+    first_page = True
+    pages = 0
+    previous = None
+    while url and (max_pages is None or pages < max_pages):
+        with span("page", "page", entity=entity, number=pages + 1) as page_span:
+            response = fetch_with_retry(url)
+            if response:
+                page = submit_page(response.content, formatter, args, included=bool(sideloads),
+                                   stamps=tracker is not None)
+                with span("json.decode", "decode", pooled=True):
+                    ids = page.ids
+                page_span.set(items=len(ids))
+        if not response:
+            fallback_url = first_request_fallback(cursor, url, entity, sideloads) if first_page else None
+            if fallback_url:
+                url = fallback_url
+                continue
+            break
+        logging.info(f"Fetched {len(ids)} items from {url}")
+        if not ids:
+            break
+        if first_page:
+            check_sparse_fields(entity, [page.first], sideloads)
+            first_page = False
+        if sideloads:
+            sideloads.add([page.first], page.included)
+        pages += 1
+        url = cursor.next_url(ids, page.links)
+        if previous:
+            yield pooled_rows(*previous, tracker)
+        previous = (page, seen.fresh_mask(ids))
+    if previous:
+        yield pooled_rows(*previous, tracker)
+    seen.summary()
+
+def pooled_rows(page, keep, tracker):
+    with span("transform.wait", "rows") as wait_span:
+        rows, updated = page.rows(keep)
+        wait_span.set(rows=len(rows))
+    return tracker.changed_stamped(rows, updated) if tracker else rows
+
+def reset_fallbacks():
+    # At the start of a run: optional parameters a server refused in an
+    # earlier run are sent again, so one bad response does not last the process
+    _fieldsets_unsupported.clear()
+    reset_keyset_fallbacks()
+    reset_include_fallbacks()
+
+def first_request_fallback(cursor, url, entity, sideloads):
+    # The first request failed after its retries: if the server refused it,
+    # drop the optional parameters one kind at a time
+    return (cursor.fallback(url) or (sideloads.fallback(url) if sideloads else None)
+            or sparse_fields_fallback(url, entity))
+
+def fetch_items(url, entity=None, max_pages=None, sideloads=None):
+    # Items for the formatters: a generator when streaming is enabled, else a list
+    if STREAMING_CONFIG.get("ENABLED", False):
+        return iter_all_pages(url, entity, max_pages, sideloads)
+    return fetch_all_pages(url, entity, max_pages, sideloads)
+
+def fetch_rows(url, entity, formatter, *args, max_pages=None, sideloads=None, tracker=None):
+    # The listing's rows, formatter(items, *args); with the transform pool on
+    # they are built in worker processes (see iter_pooled_pages)
+    if is_transform_pool_enabled():
+        rows = []
+        for page_rows in iter_pooled_pages(url, entity, formatter, args, max_pages, sideloads, tracker):
+            rows.extend(page_rows)
+        return rows
+    items = fetch_items(url, entity, max_pages, sideloads)
+    return formatter(tracker.changed(items) if tracker else items, *args)
+
+def fetch_page_batches(url, entity=None):
+    # Items in page-sized lists, without holding more than one page
+    if not STREAMING_CONFIG.get("ENABLED", False):
+        yield from iter_pages(url, entity)
+        return
+    items = iter_all_pages(url, entity)
+    while True:
+        batch = list(islice(items, PAGE_SIZE))
+        if not batch:
+            break
+        yield batch
+
+def load_full_history(url, entity, formatter, query, table):
+    # For loads without a date filter: rows are buffered within
+    # SPILL_CONFIG's memory budget (spilling to disk past it) and inserted
+    # chunk by chunk, so memory does not grow with the history
+    if not SPILL_CONFIG.get("ENABLED", True):
+        insert_records(query, fetch_rows(url, entity, formatter), table)
+        return
+    with SpillBuffer(table) as buffer:
+        if is_transform_pool_enabled():
+            for rows in iter_pooled_pages(url, entity, formatter):
+                buffer.extend(rows)
+        else:
+            for items in fetch_page_batches(url, entity):
+                buffer.extend(formatter(items))
+        if buffer.spilled_rows:
+            logging.info(f"{table}: {buffer.spilled_rows} of {len(buffer)} rows spilled to disk "
+                         f"({buffer.spilled_bytes // (1024 * 1024)}MB)")
+        if not len(buffer):
+            insert_records(query, [], table)
+        for chunk in buffer.chunks():
+            insert_records(query, chunk, table)
+
+
+def row_hash(row):
+    # 64-bit content hash of a formatted row, stored alongside it so the
+    # staging MERGE can skip rows that have not changed
+    content = "\x1f".join("" if value is None else str(value) for value in row)
+    digest = hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+@traced("with_row_hash", "rows")
+def with_row_hash(rows):
+    return [row + (row_hash(row),) for row in rows]
+
+
+INTEGRATION_USERS_QUERY = """
+    INSERT INTO IntegrationUser (
+        ereserve_id, identifier, roles, first_name, last_name, email,
+        lti_consumer_user_id, lti_lis_person_sourcedid, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_integration_users", "rows")
+def format_integration_users(items):
+    return [mapped_row(item, "integration-users") for item in items]
 
 def process_integration_users():
-    url = f"{API_CONFIG['INTEGRATION_USERS_URL']}?page[size]={PAGE_SIZE}"
-    all_users = fetch_all_pages(url)
-
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("identifier"),
-            item["attributes"].get("roles"),
-            item["attributes"].get("first-name"),
-            item["attributes"].get("last-name"),
-            item["attributes"].get("email"),
-            item["attributes"].get("lti-consumer-user-id"),
-            item["attributes"].get("lti-lis-person-sourcedid"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at"),
-        )
-        for item in all_users
-    ]
-    query = """
-        INSERT INTO IntegrationUser (
-            ereserve_id, identifier, roles, first_name, last_name, email,
-            lti_consumer_user_id, lti_lis_person_sourcedid, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "IntegrationUser")
+    url = f"{API_CONFIG['INTEGRATION_USERS_URL']}?page[size]={planned_page_size('integration-users')}"
+    with ChangeTracker("IntegrationUser") as tracker:
+        all_users = fetch_rows(url, "integration-users", format_integration_users, tracker=tracker)
+        insert_records(INTEGRATION_USERS_QUERY, all_users, "IntegrationUser")
+        tracker.committed(all_users)
+
+
+SCHOOLS_QUERY = "INSERT INTO School (ereserve_id, name) VALUES (?, ?)"
+
+@traced("format_schools", "rows")
+def format_schools(items):
+    return [mapped_row(item, "schools") for item in items]
 
 def process_schools():
-    url = f"{API_CONFIG['SCHOOLS_URL']}?page[size]={PAGE_SIZE}"
-    schools = fetch_all_pages(url)
-    formatted = [(item.get("id"), item["attributes"].get("name")) for item in schools]
-    query = "INSERT INTO School (ereserve_id, name) VALUES (?, ?)"
-    insert_records(query, formatted, "School")
+    url = f"{API_CONFIG['SCHOOLS_URL']}?page[size]={planned_page_size('schools')}"
+    insert_records(SCHOOLS_QUERY, fetch_rows(url, "schools", format_schools), "School")
+
+
+READINGS_QUERY = """
+    INSERT INTO Reading (
+        ereserve_id, reading_title, genre, source_document_title,
+        article_number, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_readings", "rows")
+def format_readings(items):
+    return [mapped_row(item, "readings") for item in items]
 
 def process_readings():
-    url = f"{API_CONFIG['READINGS_URL']}?page[size]={PAGE_SIZE}"
-    readings = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("reading-title"),
-            item["attributes"].get("genre"),
-            item["attributes"].get("source-document-title"),
-            item["attributes"].get("article-number"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in readings
-    ]
-    query = """
-        INSERT INTO Reading (
-            ereserve_id, reading_title, genre, source_document_title,
-            article_number, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "Reading")
+    url = f"{API_CONFIG['READINGS_URL']}?page[size]={planned_page_size('readings')}"
+    with ChangeTracker("Reading") as tracker:
+        readings = fetch_rows(url, "readings", format_readings, tracker=tracker)
+        insert_records(READINGS_QUERY, readings, "Reading")
+        tracker.committed(readings)
+
+
+UNITS_QUERY = "INSERT INTO Unit (ereserve_id, code, name, school_id, fedcode) VALUES (?, ?, ?, ?, NULL)"
+
+@traced("format_units", "rows")
+def format_units(items, school_id):
+    return [mapped_row(item, "units") + (school_id,) for item in items]
 
 def process_units():
-    school_url = f"{API_CONFIG['SCHOOLS_URL']}?page[size]={PAGE_SIZE}"
-    school_ids = [item.get("id") for item in fetch_all_pages(school_url)]
+    school_url = f"{API_CONFIG['SCHOOLS_URL']}?page[size]={planned_page_size('schools')}"
+    school_ids = [item.get("id") for item in fetch_items(school_url, "schools")]
     all_units = []
 
     # Note: The 'school_id' is not included in the unit data returned by the API.
@@ -89,15 +393,10 @@ def process_units():
     # and manually associate the 'school_id' with each unit record during insertion.
     for school_id in school_ids:
         logging.info(f"Getting values for school ID: {school_id}")
-        url = f"{API_CONFIG['UNITS_URL']}?filter[school_id]={school_id}&page[size]={PAGE_SIZE}"
-        units = fetch_all_pages(url)
-        all_units.extend([
-            (item.get("id"), item["attributes"].get("code"), item["attributes"].get("name"), school_id)
-            for item in units
-        ])
+        url = f"{API_CONFIG['UNITS_URL']}?filter[school_id]={school_id}&page[size]={planned_page_size('units')}"
+        all_units.extend(fetch_rows(url, "units", format_units, school_id))
     if all_units:
-        query = "INSERT INTO Unit (ereserve_id, code, name, school_id, fedcode) VALUES (?, ?, ?, ?, NULL)"
-        insert_records(query, all_units, "Unit")
+        insert_records(UNITS_QUERY, all_units, "Unit")
 
     process_fedunits(all_units)
 
@@ -136,186 +435,154 @@ def uc_extraction(input_str: str, use_whitelist: bool = False) -> list[str]:
 
     return codes
 
+
+UNIT_OFFERINGS_QUERY = """
+    INSERT INTO UnitOffering (
+        ereserve_id, unit_id, reading_list_id, source_unit_code,
+        source_unit_name, source_unit_offering, result, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_unit_offerings", "rows")
+def format_unit_offerings(items):
+    return [mapped_row(item, "unit-offerings") for item in items]
+
 def process_unit_offerings():
-    url = f"{API_CONFIG['UNIT_OFFERINGS_URL']}?page[size]={PAGE_SIZE}"
-    offerings = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("unit-id"),
-            item["attributes"].get("reading-list-id"),
-            item["attributes"].get("source-unit-code"),
-            item["attributes"].get("source-unit-name"),
-            item["attributes"].get("source-unit-offering"),
-            item["attributes"].get("result"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in offerings
-    ]
-    query = """
-        INSERT INTO UnitOffering (
-            ereserve_id, unit_id, reading_list_id, source_unit_code,
-            source_unit_name, source_unit_offering, result, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "UnitOffering")
+    url = f"{API_CONFIG['UNIT_OFFERINGS_URL']}?page[size]={planned_page_size('unit-offerings')}"
+    sideloads = new_sideloads("unit-offerings")
+    with ChangeTracker("UnitOffering") as tracker:
+        offerings = fetch_rows(url, "unit-offerings", format_unit_offerings, sideloads=sideloads, tracker=tracker)
+        load_sideloads(sideloads)
+        insert_records(UNIT_OFFERINGS_QUERY, offerings, "UnitOffering")
+        tracker.committed(offerings)
 
-def process_teaching_sessions():
-    url = f"{API_CONFIG['TEACHING_SESSIONS_URL']}?page[size]={PAGE_SIZE}"
-    sessions = fetch_all_pages(url)
-
-    # precompile regex once
-    four_digits = re.compile(r'^(\d{4})')
-
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("name"),
-            item["attributes"].get("start-date"),
-            item["attributes"].get("end-date"),
-            item["attributes"].get("archived"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at"),
+
+TEACHING_SESSIONS_QUERY = """
+    INSERT INTO TeachingSession (
+        ereserve_id, name, start_date, end_date,
+        archived, created_at, updated_at, code
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# precompile regex once
+FOUR_DIGITS = re.compile(r'^(\d{4})')
+
+@traced("format_teaching_sessions", "rows")
+def format_teaching_sessions(items):
+    return [
+        mapped_row(item, "teaching-sessions") + (
             # extract 4 leading digits (or None if not present)
-            (m.group(1) if (m := four_digits.match(item["attributes"].get("name") or "")) else None),
+            (m.group(1) if (m := FOUR_DIGITS.match(item["attributes"].get("name") or "")) else None),
         )
-        for item in sessions
+        for item in items
     ]
-    query = """
-        INSERT INTO TeachingSession (
-            ereserve_id, name, start_date, end_date,
-            archived, created_at, updated_at, code
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "TeachingSession")
+
+def process_teaching_sessions():
+    url = f"{API_CONFIG['TEACHING_SESSIONS_URL']}?page[size]={planned_page_size('teaching-sessions')}"
+    with ChangeTracker("TeachingSession") as tracker:
+        sessions = fetch_rows(url, "teaching-sessions", format_teaching_sessions, tracker=tracker)
+        insert_records(TEACHING_SESSIONS_QUERY, sessions, "TeachingSession")
+        tracker.committed(sessions)
+
+
+READING_LISTS_QUERY = """
+    INSERT INTO ReadingList (
+        ereserve_id, unit_id, teaching_session_id, name, duration,
+        start_date, end_date, hidden, usage_count, item_count,
+        approved_item_count, deleted, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_reading_lists", "rows")
+def format_reading_lists(items):
+    return [mapped_row(item, "reading-lists") for item in items]
 
 def process_reading_lists():
-    url = f"{API_CONFIG['READING_LISTS_URL']}?page[size]={PAGE_SIZE}"
-    lists = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("unit-id"),
-            item["attributes"].get("teaching-session-id"),
-            item["attributes"].get("name"),
-            item["attributes"].get("duration"),
-            item["attributes"].get("start-date"),
-            item["attributes"].get("end-date"),
-            item["attributes"].get("hidden"),
-            item["attributes"].get("usage-count"),
-            item["attributes"].get("item-count"),
-            item["attributes"].get("approved-item-count"),
-            item["attributes"].get("deleted"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in lists
-    ]
-    query = """
-        INSERT INTO ReadingList (
-            ereserve_id, unit_id, teaching_session_id, name, duration,
-            start_date, end_date, hidden, usage_count, item_count,
-            approved_item_count, deleted, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "ReadingList")
+    url = f"{API_CONFIG['READING_LISTS_URL']}?page[size]={planned_page_size('reading-lists')}"
+    sideloads = new_sideloads("reading-lists")
+    with ChangeTracker("ReadingList") as tracker:
+        lists = fetch_rows(url, "reading-lists", format_reading_lists, sideloads=sideloads, tracker=tracker)
+        load_sideloads(sideloads)
+        insert_records(READING_LISTS_QUERY, lists, "ReadingList")
+        tracker.committed(lists)
 
-def process_reading_list_items():
-    url = f"{API_CONFIG['READING_LIST_ITEMS_URL']}?page[size]={PAGE_SIZE}"
-    items = fetch_all_pages(url)
 
+READING_LIST_ITEMS_QUERY = """
+    INSERT INTO ReadingListItem (
+        ereserve_id, list_id, reading_id, deleted, hidden,
+        reading_utilisations_count, reading_importance,
+        usage_count, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_reading_list_items", "rows")
+def format_reading_list_items(items):
     formatted = []
     for item in items:
-        status = item["attributes"].get("status")
+        row = mapped_row(item, "reading-list-items")
+        # The status column becomes deleted
+        status = row[3]
         deleted = 0 if status and status.lower() == "available" else 1
+        formatted.append(row[:3] + (deleted,) + row[4:])
+    return formatted
+
+def process_reading_list_items():
+    url = f"{API_CONFIG['READING_LIST_ITEMS_URL']}?page[size]={planned_page_size('reading-list-items')}"
+    sideloads = new_sideloads("reading-list-items")
+    with ChangeTracker("ReadingListItem") as tracker:
+        items = fetch_rows(url, "reading-list-items", format_reading_list_items, sideloads=sideloads, tracker=tracker)
+        load_sideloads(sideloads)
+        insert_records(READING_LIST_ITEMS_QUERY, items, "ReadingListItem")
+        tracker.committed(items)
+
+
+READING_LIST_USAGE_QUERY = """
+    INSERT INTO ReadingListUsage (
+        ereserve_id, list_id, integration_user_id,
+        item_usage_count, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?)
+"""
 
-        formatted.append((
-            item.get("id"),
-            item["attributes"].get("list-id"),
-            item["attributes"].get("reading-id"),
-            deleted,  
-            item["attributes"].get("hidden"),
-            item["attributes"].get("reading-utilisations-count"),
-            item["attributes"].get("reading-importance"),
-            item["attributes"].get("usage-count"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        ))
-
-    query = """
-        INSERT INTO ReadingListItem (
-            ereserve_id, list_id, reading_id, deleted, hidden,
-            reading_utilisations_count, reading_importance,
-            usage_count, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "ReadingListItem")
+@traced("format_reading_list_usage", "rows")
+def format_reading_list_usage(items):
+    return [mapped_row(item, "reading-list-usages") for item in items]
 
 def process_reading_list_usage():
-    url = f"{API_CONFIG['READING_LIST_USAGE_URL']}?page[size]={PAGE_SIZE}"
-    usages = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("list-id"),
-            item["attributes"].get("integration-user-id"),
-            item["attributes"].get("item-usage-count"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in usages
-    ]
-    query = """
-        INSERT INTO ReadingListUsage (
-            ereserve_id, list_id, integration_user_id,
-            item_usage_count, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "ReadingListUsage")
+    url = f"{API_CONFIG['READING_LIST_USAGE_URL']}?page[size]={planned_page_size('reading-list-usages')}"
+    load_full_history(url, "reading-list-usages", format_reading_list_usage,
+                      READING_LIST_USAGE_QUERY, "ReadingListUsage")
+
+
+READING_LIST_ITEM_USAGE_QUERY = """
+    INSERT INTO ReadingListItemUsage (
+        ereserve_id, item_id, list_usage_id,
+        integration_user_id, utilisation_count,
+        created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_reading_list_item_usage", "rows")
+def format_reading_list_item_usage(items):
+    return [mapped_row(item, "reading-list-item-usages") for item in items]
 
 def process_reading_list_item_usage():
-    url = f"{API_CONFIG['READING_LIST_ITEM_USAGE_URL']}?page[size]={PAGE_SIZE}"
-    usages = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("item-id"),
-            item["attributes"].get("list-usage-id"),
-            item["attributes"].get("integration-user-id"),
-            item["attributes"].get("utilisation-count"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in usages
-    ]
-    query = """
-        INSERT INTO ReadingListItemUsage (
-            ereserve_id, item_id, list_usage_id,
-            integration_user_id, utilisation_count,
-            created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "ReadingListItemUsage")
+    url = f"{API_CONFIG['READING_LIST_ITEM_USAGE_URL']}?page[size]={planned_page_size('reading-list-item-usages')}"
+    load_full_history(url, "reading-list-item-usages", format_reading_list_item_usage,
+                      READING_LIST_ITEM_USAGE_QUERY, "ReadingListItemUsage")
+
+
+READING_UTILISATION_QUERY = """
+    INSERT INTO ReadingUtilisation (
+        ereserve_id, integration_user_id, item_id,
+        item_usage_id, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+@traced("format_reading_utilisation", "rows")
+def format_reading_utilisation(items):
+    return [mapped_row(item, "reading-utilisations") for item in items]
 
 def process_reading_utilisation():
-    url = f"{API_CONFIG['READING_UTILISATION_URL']}?page[size]={PAGE_SIZE}"
-    utilisations = fetch_all_pages(url)
-    formatted = [
-        (
-            item.get("id"),
-            item["attributes"].get("integration-user-id"),
-            item["attributes"].get("item-id"),
-            item["attributes"].get("item-usage-id"),
-            item["attributes"].get("created-at"),
-            item["attributes"].get("updated-at")
-        )
-        for item in utilisations
-    ]
-    query = """
-        INSERT INTO ReadingUtilisation (
-            ereserve_id, integration_user_id, item_id,
-            item_usage_id, created_at, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?)
-    """
-    insert_records(query, formatted, "ReadingUtilisation")
+    url = f"{API_CONFIG['READING_UTILISATION_URL']}?page[size]={planned_page_size('reading-utilisations')}"
+    load_full_history(url, "reading-utilisations", format_reading_utilisation,
+                      READING_UTILISATION_QUERY, "ReadingUtilisation")
@@ -0,0 +1,113 @@
+import codecs
+import json
+from typing import Dict, Iterable, Iterator, List, Optional
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class PageStream:
+    # Incrementally decodes one JSON:API page from an iterable of byte chunks
+    # (e.g. response.iter_content()). items() yields the entries of "data" one
+    # at a time; "links", "meta" and "included" are captured on the way and are complete
+    # once items() is exhausted. Only the unread part of the body and the item
+    # being decoded are held in memory.
+
+    def __init__(self, chunks: Iterable[bytes], chunk_size: int = 65536):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.links: Dict = {}
+        self.meta: Dict = {}
+        # None when the document has no "included" member
+        self.included: Optional[List[Dict]] = None
+        self.item_count = 0
+        self.bytes_read = 0
+
+    def _fill(self, min_chars: int = 1) -> bool:
+        # Appends at least min_chars of new text; False once the input is exhausted
+        if self._eof:
+            return False
+        if self._pos >= self._chunk_size:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        added = 0
+        for chunk in self._chunks:
+            self.bytes_read += len(chunk)
+            text = self._text.decode(chunk)
+            self._buf += text
+            added += len(text)
+            if added >= min_chars:
+                return True
+        self._buf += self._text.decode(b"", final=True)
+        self._eof = True
+        return added > 0
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Malformed JSON:API page: expected one of {chars!r}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # Incomplete value: read at least as much again as is buffered,
+                # so a large value costs linear rather than quadratic time
+                if self._fill(max(len(self._buf) - self._pos, self._chunk_size)):
+                    continue
+                raise
+            # A number or literal ending exactly at the buffer edge may continue
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def items(self) -> Iterator[Dict]:
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "data" and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        item = self._value()
+                        self.item_count += 1
+                        yield item
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                value = self._value()
+                if key == "data" and isinstance(value, dict):
+                    self.item_count += 1
+                    yield value
+                elif key == "links":
+                    self.links = value or {}
+                elif key == "meta":
+                    self.meta = value or {}
+                elif key == "included":
+                    self.included = value or []
+            if self._expect(",}") == "}":
+                return
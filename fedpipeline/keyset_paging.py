@@ -0,0 +1,144 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from fedpipeline.api_handler import last_request_rejected
+from fedpipeline.config import PAGINATION_CONFIG
+from fedpipeline.parent_keys import KeySet, as_key
+
+# Entities whose server rejected or ignored the keyset parameters; they are
+# paged with links.next until the next run
+_keyset_unsupported = set()
+
+
+def reset_keyset_fallbacks():
+    # At the start of a run: servers that refused keyset paging are asked again
+    _keyset_unsupported.clear()
+
+
+def _after_filter() -> str:
+    return PAGINATION_CONFIG.get("AFTER_FILTER", "filter[id][gt]")
+
+
+def _upto_filter() -> str:
+    return PAGINATION_CONFIG.get("UPTO_FILTER", "filter[id][lte]")
+
+
+def keyset_active(url: str, entity: Optional[str], max_pages: Optional[int] = None) -> bool:
+    # Not for page ranges (page[number], max_pages); id ranges are fine
+    return (PAGINATION_CONFIG.get("KEYSET", True) and bool(entity) and entity not in _keyset_unsupported
+            and max_pages is None and "page[number]=" not in url)
+
+
+def keyset_url(url: str, last_id: Optional[int] = None) -> str:
+    # url ordered by id, starting after last_id
+    base, _, query = url.partition("?")
+    parts = [part for part in query.split("&")
+             if part and not part.startswith(("sort=", "page[number]=", f"{_after_filter()}="))]
+    parts.append(f"sort={PAGINATION_CONFIG.get('SORT', 'id')}")
+    if last_id is not None:
+        parts.append(f"{_after_filter()}={last_id}")
+    return f"{base}?{'&'.join(parts)}"
+
+
+def id_range_url(url: str, after: Optional[int], upto: Optional[int]) -> str:
+    # url limited to the ids after `after` up to and including `upto` (either open), in id order
+    url = keyset_url(url, after)
+    return f"{url}&{_upto_filter()}={upto}" if upto is not None else url
+
+
+def id_range(url: str) -> Tuple[Optional[int], Optional[int]]:
+    # The (after, upto) id bounds of an id_range_url
+    params = dict(part.split("=", 1) for part in url.partition("?")[2].split("&") if "=" in part)
+    return as_key(params.get(_after_filter())), as_key(params.get(_upto_filter()))
+
+
+def keyset_fallback(url: str, entity: Optional[str]) -> Optional[str]:
+    # Called when the first request failed: if the server refused it (400/422),
+    # returns the URL without the keyset parameters (and stops sending them for
+    # this entity this run). None if it had none or the failure was transient.
+    if not entity or "sort=" not in url or not last_request_rejected():
+        return None
+    _keyset_unsupported.add(entity)
+    base, _, query = url.partition("?")
+    query = "&".join(part for part in query.split("&") if not part.startswith(("sort=", f"{_after_filter()}=")))
+    logging.warning(f"Keyset request for {entity} refused; paging with links.next instead")
+    return f"{base}?{query}" if query else base
+
+
+class KeysetCursor:
+    # Pages through one listing in id order: each next page is requested as
+    # "id > last id seen", so rows inserted or deleted mid-run cannot shift
+    # later pages the way page[number] offsets do. A server that ignores the
+    # parameters is detected from the ids it returns, and the listing carries
+    # on with links.next. A url with id bounds (id_range_url) is read from
+    # its lower bound and stops at its upper one.
+
+    def __init__(self, url: str, entity: Optional[str], max_pages: Optional[int] = None):
+        self.entity = entity
+        self.base_url = url
+        self.active = keyset_active(url, entity, max_pages)
+        self.last_id, self.upto = id_range(url)
+
+    def first_url(self) -> str:
+        return keyset_url(self.base_url, self.last_id) if self.active else self.base_url
+
+    def fallback(self, url: str) -> Optional[str]:
+        fallback_url = keyset_fallback(url, self.entity) if self.active else None
+        if fallback_url:
+            self.active = False
+        return fallback_url
+
+    def next_url(self, ids: List, links: Dict) -> Optional[str]:
+        # ids: the resource ids of the page just read, in order
+        if not self.active:
+            return links.get("next")
+        keys = [as_key(value) for value in ids]
+        if (None in keys or keys != sorted(keys)
+                or (self.last_id is not None and keys and keys[0] <= self.last_id)):
+            _keyset_unsupported.add(self.entity)
+            self.active = False
+            logging.warning(f"Server ignores sort/{_after_filter()} for {self.entity}; paging with links.next instead")
+            return links.get("next")
+        if not links.get("next") or not keys or (self.upto is not None and keys[-1] >= self.upto):
+            return None
+        self.last_id = keys[-1]
+        return keyset_url(self.base_url, self.last_id)
+
+
+class SeenIds:
+    # The resource ids one listing has produced so far. Offset paging over
+    # changing data can serve a row twice; repeats are dropped here so they
+    # never reach a primary key.
+
+    def __init__(self, entity: Optional[str] = None):
+        self.entity = entity
+        self.keys = KeySet()
+        self.duplicates = 0
+
+    def is_new(self, item: Dict) -> bool:
+        return self.is_new_id(item.get("id"))
+
+    def is_new_id(self, value) -> bool:
+        key = as_key(value)
+        if key is None:
+            return True
+        if key in self.keys:
+            self.duplicates += 1
+            return False
+        self.keys.add(key)
+        return True
+
+    def fresh(self, items: List[Dict]) -> List[Dict]:
+        if not PAGINATION_CONFIG.get("DEDUP", True):
+            return items
+        return [item for item in items if self.is_new(item)]
+
+    def fresh_mask(self, ids: List) -> Optional[List[bool]]:
+        # fresh() for pages decoded elsewhere: which of the ids are new, or
+        # None when every record is kept
+        if not PAGINATION_CONFIG.get("DEDUP", True):
+            return None
+        return [self.is_new_id(value) for value in ids]
+
+    def summary(self):
+        if self.duplicates:
+            logging.warning(f"{self.entity or 'listing'}: skipped {self.duplicates} records served more than once")
@@ -0,0 +1,179 @@
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlsplit
+from fedpipeline.config import LANDING_ZONE_CONFIG
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+_enabled = LANDING_ZONE_CONFIG.get("ENABLED", False)
+_writer = None
+_lock = threading.Lock()
+
+
+def enable_landing_zone():
+    global _enabled
+    _enabled = True
+    logging.info(f"Landing zone enabled: raw pages will be written under {LANDING_ZONE_CONFIG.get('PATH', 'landing')}")
+
+
+def is_landing_zone_enabled() -> bool:
+    return _enabled
+
+
+def entity_from_url(url: str) -> str:
+    # e.g. https://.../public/v1/reading-utilisations?page[size]=1000 -> reading-utilisations
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+def _compression() -> str:
+    compression = LANDING_ZONE_CONFIG.get("COMPRESSION", "gzip")
+    if compression == "zstd" and zstandard is None:
+        logging.warning("zstandard is not installed; landing zone falls back to gzip")
+        return "gzip"
+    return compression
+
+
+class LandingZoneWriter:
+    # One open part file per entity, rotated every PAGES_PER_FILE pages.
+    # Each line is {"url": ..., "fetched_at": ..., "page": <raw response body>}.
+
+    def __init__(self, root: str, run_key: str, compression: str = "gzip", pages_per_file: int = 100):
+        self.root = root
+        self.run_key = run_key
+        self.compression = compression
+        self.pages_per_file = max(1, pages_per_file)
+        self.files = {}
+        self.pages_written = {}
+        self.part_numbers = {}
+
+    def _open_part(self, entity: str):
+        part = self.part_numbers.get(entity, 0) + 1
+        self.part_numbers[entity] = part
+        directory = os.path.join(self.root, entity, self.run_key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{os.getpid()}-{part:05d}{EXTENSIONS[self.compression]}")
+        if self.compression == "zstd":
+            raw = open(path, "ab")
+            return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return gzip.open(path, "ab", compresslevel=6)
+
+    def write_page(self, url: str, body: bytes):
+        entity = entity_from_url(url)
+        handle = self.files.get(entity)
+        if handle is None or self.pages_written.get(entity, 0) >= self.pages_per_file:
+            if handle is not None:
+                handle.close()
+            handle = self.files[entity] = self._open_part(entity)
+            self.pages_written[entity] = 0
+
+        # JSON only allows raw newlines as whitespace, so flattening them keeps
+        # the body valid and one page per line without re-encoding it
+        body = body.replace(b"\r", b" ").replace(b"\n", b" ")
+        header = json.dumps({"url": url, "fetched_at": datetime.now().isoformat()})
+        handle.write(header[:-1].encode("utf-8") + b', "page": ' + body + b"}\n")
+        self.pages_written[entity] += 1
+
+    def close(self):
+        for handle in self.files.values():
+            handle.close()
+        self.files = {}
+
+
+def begin_run(run_id=None):
+    global _writer
+    if not _enabled:
+        return
+    end_run()
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_key = f"{stamp}_run{run_id}" if run_id else stamp
+    with _lock:
+        _writer = LandingZoneWriter(
+            LANDING_ZONE_CONFIG.get("PATH", "landing"), run_key, _compression(),
+            LANDING_ZONE_CONFIG.get("PAGES_PER_FILE", 100)
+        )
+    logging.info(f"Landing zone run {run_key} started")
+
+
+def record_page(url: str, body: bytes):
+    if not _enabled:
+        return
+    if _writer is None:
+        begin_run()
+    try:
+        with _lock:
+            _writer.write_page(url, body)
+    except Exception as e:
+        # Never let the landing zone break a live fetch
+        logging.error(f"Failed to write page from {url} to landing zone: {e}")
+
+
+def end_run():
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+# ---- reading -----------------------------------------------------------------
+
+def list_runs(root: str = None) -> List[str]:
+    # Run keys start with a timestamp, so sorting them is chronological
+    root = root or LANDING_ZONE_CONFIG.get("PATH", "landing")
+    runs = set()
+    if os.path.isdir(root):
+        for entity in os.listdir(root):
+            entity_dir = os.path.join(root, entity)
+            if os.path.isdir(entity_dir):
+                runs.update(d for d in os.listdir(entity_dir) if os.path.isdir(os.path.join(entity_dir, d)))
+    return sorted(runs)
+
+
+def part_files(entity: str, runs: List[str], root: str = None) -> List[Tuple[str, str]]:
+    # Returns (run_key, path) pairs in run order
+    root = root or LANDING_ZONE_CONFIG.get("PATH", "landing")
+    files = []
+    for run_key in runs:
+        directory = os.path.join(root, entity, run_key)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("part-") and name.endswith(tuple(EXTENSIONS.values())):
+                files.append((run_key, os.path.join(directory, name)))
+    return files
+
+
+def _open_for_read(path: str):
+    if path.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        raw = open(path, "rb")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True))
+    return gzip.open(path, "rb")
+
+
+def read_pages(path: str) -> Iterator[Dict]:
+    # Yields {"url", "fetched_at", "page"} records; a torn last line from an
+    # interrupted run is skipped
+    with _open_for_read(path) as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping truncated landing zone record in {path}")
+        except EOFError:
+            logging.warning(f"Landing zone file {path} ends mid-stream; using the pages before it")
@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from collections import Counter
+from typing import Dict, Optional
+from fedpipeline.config import LOGGING_CONFIG
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)-8s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_log_file: Optional[str] = None
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line. Values passed as extra={"fields": {...}} are
+    # added as top-level keys.
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "module": record.module,
+            "func": record.funcName,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ModuleLevelFilter(logging.Filter):
+    # The pipeline logs through the root logger, so per-module verbosity is
+    # keyed on the record's source module (file name without .py), falling
+    # back to the logger name for libraries such as urllib3
+
+    def __init__(self, default_level: int, module_levels: Dict[str, int]):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        level = self.module_levels.get(record.module)
+        if level is None:
+            level = self.module_levels.get(record.name.split(".", 1)[0], self.default_level)
+        return record.levelno >= level
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats every record and copies it in the calling
+    # thread. Only the message needs resolving there (args may change later);
+    # the listener thread does the formatting.
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _level(value) -> int:
+    return value if isinstance(value, int) else logging.getLevelName(str(value).upper())
+
+
+def configure_logging(filename: str = None, level=None, fmt: str = None, use_async: bool = None,
+                      module_levels: Dict[str, str] = None):
+    # Like logging.basicConfig: does nothing if the root logger already has handlers
+    global _listener, _log_file
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    filename = filename or LOGGING_CONFIG.get("FILE", "pipeline.log")
+    default_level = _level(level or LOGGING_CONFIG.get("LEVEL", "INFO"))
+    levels = {name: _level(value) for name, value in
+              (module_levels if module_levels is not None else LOGGING_CONFIG.get("MODULE_LEVELS", {})).items()}
+    fmt = fmt or LOGGING_CONFIG.get("FORMAT", "text")
+    use_async = LOGGING_CONFIG.get("ASYNC", True) if use_async is None else use_async
+
+    file_handler = logging.FileHandler(filename, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+    level_filter = ModuleLevelFilter(default_level, levels)
+
+    if use_async:
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        # Filter before enqueueing so dropped records cost nothing downstream
+        queue_handler.addFilter(level_filter)
+        _listener = logging.handlers.QueueListener(log_queue, file_handler)
+        _listener.start()
+        atexit.register(stop_logging)
+        root.addHandler(queue_handler)
+    else:
+        file_handler.addFilter(level_filter)
+        root.addHandler(file_handler)
+
+    # The root level has to let through the most verbose module; the filter does the rest
+    root.setLevel(min([default_level, *levels.values()]))
+    _log_file = os.path.abspath(filename)
+
+
+def stop_logging():
+    # Flushes queued records; registered with atexit when logging is async
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_file() -> Optional[str]:
+    return _log_file
+
+
+class RecordLogSampler:
+    # Per-record logging for bulk loads: one sample record every `every` rows,
+    # the first `max_errors` failures in full, then a summary of the remaining
+    # failures grouped by error message. Records are attributed to the caller,
+    # so MODULE_LEVELS applies to the module doing the load.
+
+    def __init__(self, entity_name: str, total: int, every: int = None, max_errors: int = None):
+        self.entity_name = entity_name
+        self.total = total
+        self.every = LOGGING_CONFIG.get("RECORD_LOG_EVERY", 1000) if every is None else every
+        self.max_errors = LOGGING_CONFIG.get("MAX_RECORD_ERRORS", 20) if max_errors is None else max_errors
+        self.failures = 0
+        self.error_kinds = Counter()
+
+    def record(self, index: int, record):
+        if self.every and index % self.every == 0:
+            logging.info(f"{self.entity_name} record {index + 1}/{self.total}: {record}", stacklevel=2)
+
+    def failure(self, record, error: Exception):
+        self.failures += 1
+        self.error_kinds[f"{type(error).__name__}: {str(error)[:200]}"] += 1
+        if self.failures <= self.max_errors:
+            logging.error(f"Failed to insert record into {self.entity_name}: {record} | Error: {error}", stacklevel=2)
+
+    def summary(self):
+        if self.failures > self.max_errors:
+            logging.error(f"{self.failures - self.max_errors} more {self.entity_name} records failed "
+                          f"({self.failures}/{self.total} in total); most common errors:", stacklevel=2)
+            for kind, count in self.error_kinds.most_common(5):
+                logging.error(f"  {count} x {kind}", stacklevel=2)
@@ -7,15 +7,88 @@ Description:
 
     This script initializes logging and starts the job scheduler that periodically
     fetches data from the eReserve API and inserts it into the SQL Server database.
+
+    Usage:
+        python -m fedpipeline.main                      # run due stage groups, then on schedule
+        python -m fedpipeline.main --once --groups usage # run one stage group now
+        python -m fedpipeline.main --once --profile     # single profiled run
+        python -m fedpipeline.main --once --tracemalloc # ...with memory tracking
+        python -m fedpipeline.main --once --trace       # write a span trace of the run (see fedpipeline.tracing)
+        python -m fedpipeline.main --once --transform-pool  # decode pages and build rows in worker processes
+        python -m fedpipeline.main --landing-zone       # also keep raw pages for replay
+        python -m fedpipeline.main --once --reconcile   # also remove records deleted upstream
+        python -m fedpipeline.main --queue --workers 4  # split runs into work items for 4 local workers
+
+    Pending schema migrations (fedpipeline.migrations) are applied at startup.
+    With MIGRATIONS_CONFIG["AUTO_APPLY"] off the pipeline refuses to start
+    while any are pending, and a failed migration stops it either way.
 -------------------------------------------------------------------------------
 """
+import argparse
 import logging
 import logger
-from fedpipeline.job_scheduler import start_scheduler
+from fedpipeline.job_scheduler import STAGE_GROUPS, job, start_scheduler
+from fedpipeline.profiler import enable_profiling
+from fedpipeline.tracing import enable_tracing
+from fedpipeline.transform_pool import enable_transform_pool
+from fedpipeline.landing_zone import enable_landing_zone
+from fedpipeline.reconciliation import enable_reconciliation
+from fedpipeline.work_queue import enable_work_queue
+from fedpipeline.migrations import prepare_schema
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="eReserve Data Pipeline")
+    parser.add_argument("--once", action="store_true",
+                        help="Run the pipeline a single time and exit instead of starting the scheduler")
+    parser.add_argument("--groups", nargs="+", choices=list(STAGE_GROUPS),
+                        help="With --once, only run these stage groups (default: all)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile each stage with cProfile and write a report per stage next to pipeline.log")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also record peak memory and allocation hot spots per stage (implies --profile)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Write a Chrome trace-event file of each run's spans (stages, pages, requests, "
+                             "decoding, row building, DB batches) next to pipeline.log")
+    parser.add_argument("--transform-pool", action="store_true",
+                        help="Decode API pages and build rows in worker processes (TRANSFORM_POOL_CONFIG) "
+                             "while fetching and loading stay in this one")
+    parser.add_argument("--landing-zone", action="store_true",
+                        help="Also write every raw API page to the compressed landing zone for offline replay")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="After loading, compare ID lists with the API and flag or delete records removed upstream")
+    parser.add_argument("--queue", action="store_true",
+                        help="Split each run into work items in PipelineWorkQueue for worker processes "
+                             "(python -m fedpipeline.work_queue) to claim")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="With --queue, number of local worker processes to start per run")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     logging.info("Pipeline starting...")
-    start_scheduler()
+    if args.profile or args.tracemalloc:
+        enable_profiling(trace_memory=args.tracemalloc)
+    if args.trace:
+        enable_tracing()
+    if args.transform_pool:
+        enable_transform_pool()
+    if args.landing_zone:
+        enable_landing_zone()
+    if args.reconcile:
+        enable_reconciliation()
+    if args.queue:
+        enable_work_queue(args.workers)
+    try:
+        prepare_schema()
+    except Exception as e:
+        # Stages need the tables and columns the migrations add, so a schema
+        # that is behind stops the pipeline instead of failing runs later
+        logging.error(f"Schema migration failed: {e}")
+        raise SystemExit(1)
+    if args.once:
+        job(args.groups)
+    else:
+        start_scheduler()
 
 
@@ -0,0 +1,208 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Versioned schema migrations on top of sql/db.sql.
+
+    Migrations are .sql files in sql/migrations/<backend>/ named
+    NNNN_description.sql. Pending ones are applied in version order, each in its
+    own transaction, and recorded in the SchemaMigrations table with a checksum.
+    A recorded migration whose file has changed since is reported but not
+    re-run. SQL Server files are split into batches on GO lines.
+
+    Optional migrations live in sql/migrations/<backend>/optional/ and are only
+    applied when named, either in MIGRATIONS_CONFIG["OPTIONAL"] or with
+    --optional. Examples are clustered columnstore or updated_at partitioning
+    for the usage tables.
+
+    Usage:
+        python -m fedpipeline.migrations                                # apply pending migrations
+        python -m fedpipeline.migrations --list                         # show applied and pending
+        python -m fedpipeline.migrations --optional usage_columnstore   # also apply an optional one
+-------------------------------------------------------------------------------
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+from fedpipeline.config import MIGRATIONS_CONFIG
+from fedpipeline.db_backend import get_backend
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sql", "migrations")
+
+# Optional migration -> the ones it cannot be combined with
+OPTIONAL_CONFLICTS = {
+    "usage_columnstore": ("usage_partitioning",),
+    "usage_partitioning": ("usage_columnstore",),
+}
+
+_VERSION_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+SCHEMA_MIGRATIONS_DDL = """
+    CREATE TABLE SchemaMigrations(
+        version VARCHAR(100) NOT NULL PRIMARY KEY,
+        description VARCHAR(255) NULL,
+        checksum VARCHAR(64) NOT NULL,
+        applied_at DATETIME NOT NULL,
+        duration_ms INT NULL
+    )
+"""
+
+
+def _checksum(script: str) -> str:
+    return hashlib.sha256(script.encode("utf-8")).hexdigest()
+
+
+def available_migrations(backend_name: str, optional: List[str] = ()) -> List[Tuple[str, str, str]]:
+    # (version, description, path) in the order they are applied: numbered
+    # files first, then the requested optional ones under their own names
+    directory = os.path.join(MIGRATIONS_DIR, backend_name)
+    migrations = []
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            match = _VERSION_FILE_RE.match(filename)
+            if match:
+                migrations.append((match.group(1), match.group(2), os.path.join(directory, filename)))
+    migrations.sort(key=lambda migration: int(migration[0]))
+
+    for name in optional:
+        path = os.path.join(directory, "optional", f"{name}.sql")
+        if not os.path.isfile(path):
+            raise ValueError(f"No optional migration {name!r} for the {backend_name} backend")
+        migrations.append((name, name, path))
+    return migrations
+
+
+def available_optional(backend_name: str) -> List[str]:
+    directory = os.path.join(MIGRATIONS_DIR, backend_name, "optional")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(filename[:-4] for filename in os.listdir(directory) if filename.endswith(".sql"))
+
+
+class MigrationRunner:
+    def __init__(self):
+        self.backend = get_backend()
+
+    def ensure_table(self, conn):
+        cursor = conn.cursor()
+        if not self.backend.table_exists(cursor, "SchemaMigrations"):
+            logging.info("Creating SchemaMigrations table")
+            cursor.execute(SCHEMA_MIGRATIONS_DDL)
+            conn.commit()
+
+    def applied(self, conn) -> Dict[str, str]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, checksum FROM SchemaMigrations")
+        return {version: checksum for version, checksum in cursor.fetchall()}
+
+    def check_conflicts(self, applied: Dict[str, str], optional: List[str]):
+        for name in optional:
+            for other in OPTIONAL_CONFLICTS.get(name, ()):
+                if other in applied or other in optional:
+                    raise ValueError(f"Optional migration {name} cannot be combined with {other}")
+
+    def apply_one(self, conn, version: str, description: str, script: str):
+        cursor = conn.cursor()
+        start_time = time.time()
+        try:
+            for statement in self.backend.split_script(script):
+                cursor.execute(statement)
+            cursor.execute("""
+                INSERT INTO SchemaMigrations (version, description, checksum, applied_at, duration_ms)
+                VALUES (?, ?, ?, ?, ?)
+            """, (version, description, _checksum(script), datetime.now(), int((time.time() - start_time) * 1000)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Applied migration {version} ({description}) in {time.time() - start_time:.1f}s")
+
+    def run(self, optional: List[str] = None, dry_run: bool = False) -> List[str]:
+        # Applies every pending migration; returns the versions applied (or due, with dry_run)
+        optional = list(MIGRATIONS_CONFIG.get("OPTIONAL", []) if optional is None else optional)
+        with self.backend.connect() as conn:
+            self.ensure_table(conn)
+            applied = self.applied(conn)
+            self.check_conflicts(applied, optional)
+
+            done = []
+            for version, description, path in available_migrations(self.backend.name, optional):
+                with open(path, encoding="utf-8") as f:
+                    script = f.read()
+                if version in applied:
+                    if applied[version] != _checksum(script):
+                        logging.warning(f"Migration {version} ({description}) changed after it was applied; "
+                                        f"write a new migration instead of editing it")
+                    continue
+                if dry_run:
+                    logging.info(f"Pending migration {version} ({description})")
+                else:
+                    self.apply_one(conn, version, description, script)
+                done.append(version)
+        if not done:
+            logging.info("Schema is up to date")
+        return done
+
+    def status(self) -> List[Tuple[str, str, str]]:
+        # (version, description, applied_at or "pending"), optional migrations included
+        with self.backend.connect() as conn:
+            self.ensure_table(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT version, description, applied_at FROM SchemaMigrations")
+            applied = {version: (description, applied_at) for version, description, applied_at in cursor.fetchall()}
+        rows = []
+        for version, description, _ in available_migrations(self.backend.name):
+            rows.append((version, description, str(applied[version][1]) if version in applied else "pending"))
+        for name in available_optional(self.backend.name):
+            rows.append((name, "optional", str(applied[name][1]) if name in applied else "not applied"))
+        return rows
+
+
+def apply_migrations(optional: List[str] = None, dry_run: bool = False) -> List[str]:
+    return MigrationRunner().run(optional, dry_run)
+
+
+def prepare_schema(auto_apply: bool = None) -> List[str]:
+    # Run at startup: applies the pending migrations, or with AUTO_APPLY off
+    # refuses to go on while any are pending. Later stages rely on the tables
+    # and columns the migrations add, so a failure here must stop the pipeline.
+    if auto_apply is None:
+        auto_apply = MIGRATIONS_CONFIG.get("AUTO_APPLY", True)
+    if auto_apply:
+        return apply_migrations()
+    pending = apply_migrations(dry_run=True)
+    if pending:
+        raise RuntimeError(f"Pending schema migrations {', '.join(pending)}; apply them with "
+                           f"python -m fedpipeline.migrations or set FEDPIPELINE_AUTO_MIGRATE=1")
+    return []
+
+
+def require_table(backend, conn, table: str, migration: str):
+    # For tables created by a migration: a clear error when it has not been applied
+    if not backend.table_exists(conn.cursor(), table):
+        raise RuntimeError(f"{table} does not exist; apply migration {migration} "
+                           f"with python -m fedpipeline.migrations")
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("--list", action="store_true", help="Show applied and pending migrations and exit")
+    parser.add_argument("--optional", nargs="+", default=None,
+                        help="Optional migrations to apply as well (default: MIGRATIONS_CONFIG['OPTIONAL'])")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be applied")
+    args = parser.parse_args()
+
+    if args.list:
+        for version, description, applied_at in MigrationRunner().status():
+            print(f"{version:<22} {description:<28} {applied_at}")
+    else:
+        try:
+            result = apply_migrations(args.optional, args.dry_run)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{'Pending' if args.dry_run else 'Applied'}: {', '.join(result) or 'none'}")
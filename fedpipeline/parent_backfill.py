@@ -0,0 +1,161 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple
+from fedpipeline import jobs
+from fedpipeline.config import API_CONFIG, DB_LOAD_CONFIG, PAGE_SIZE, PARENT_BACKFILL_CONFIG
+from fedpipeline.initial_load import active_session
+from fedpipeline.parent_keys import ParentKeyIndex, as_key
+from fedpipeline.tracing import in_current_span
+from fedpipeline.typed_batches import TypedBatch, bound_columns
+
+# Catalogue tables whose missing rows can be fetched by id, parents first:
+# API entity, URL key in API_CONFIG, formatter and insert statement (from
+# jobs). Units are not here: the API only gives a unit's school through the
+# per-school listing, so a ReadingList whose unit is missing stays an orphan.
+BACKFILL_TABLES = {
+    "IntegrationUser": ("integration-users", "INTEGRATION_USERS_URL",
+                        jobs.format_integration_users, jobs.INTEGRATION_USERS_QUERY),
+    "Reading": ("readings", "READINGS_URL", jobs.format_readings, jobs.READINGS_QUERY),
+    "TeachingSession": ("teaching-sessions", "TEACHING_SESSIONS_URL",
+                        jobs.format_teaching_sessions, jobs.TEACHING_SESSIONS_QUERY),
+    "ReadingList": ("reading-lists", "READING_LISTS_URL", jobs.format_reading_lists, jobs.READING_LISTS_QUERY),
+    "ReadingListItem": ("reading-list-items", "READING_LIST_ITEMS_URL",
+                        jobs.format_reading_list_items, jobs.READING_LIST_ITEMS_QUERY),
+}
+
+# Parents of the backfilled tables themselves (column -> parent table)
+BACKFILL_PARENTS = {
+    "ReadingList": {"unit_id": "Unit", "teaching_session_id": "TeachingSession"},
+    "ReadingListItem": {"list_id": "ReadingList", "reading_id": "Reading"},
+}
+
+# Entities whose server ignored filter[id]; not backfilled again this process
+_filter_unsupported = set()
+
+
+def is_backfill_enabled() -> bool:
+    return PARENT_BACKFILL_CONFIG.get("ENABLED", True)
+
+
+class ParentBackfill:
+    # Fetches catalogue rows that usage rows reference but the database does
+    # not have, by id (filter[id]=1,2,3 in parallel batches), and inserts them
+    # so the usage rows are no longer orphans. Rows it fetches can reference
+    # missing parents of their own (an item's list), which are fetched too.
+    # Also loads the parents a listing sideloaded with include= (see sideloading).
+
+    def __init__(self, conn, parent_keys: ParentKeyIndex, backend):
+        self.conn = conn
+        self.parent_keys = parent_keys
+        self.backend = backend
+        self.inserted: Dict[str, int] = {}
+        # Ids asked for already this run, found or not
+        self._requested: Dict[str, Set[int]] = {}
+
+    def missing_ids(self, table: str, ids: Iterable) -> Set[int]:
+        keys = self.parent_keys.keys(table)
+        requested = self._requested.get(table, set())
+        return {key for key in map(as_key, ids) if key is not None and key not in keys and key not in requested}
+
+    def fetch(self, table: str, ids: Set[int]) -> List[Dict]:
+        entity, url_key, _, _ = BACKFILL_TABLES[table]
+        if entity in _filter_unsupported:
+            return []
+        self._requested.setdefault(table, set()).update(ids)
+        per_request = PARENT_BACKFILL_CONFIG.get("IDS_PER_REQUEST", 100)
+        ordered = sorted(ids)
+        batches = [ordered[i:i + per_request] for i in range(0, len(ordered), per_request)]
+
+        def fetch_batch(batch: List[int]) -> List[Dict]:
+            wanted = {str(key) for key in batch}
+            url = f"{API_CONFIG[url_key]}?filter[id]={','.join(map(str, batch))}&page[size]={PAGE_SIZE}"
+            items = []
+            for page in jobs.iter_pages(url, entity, record=False):
+                if any(item.get("id") not in wanted for item in page):
+                    # The server ignored the filter and is listing everything
+                    _filter_unsupported.add(entity)
+                    return []
+                items.extend(page)
+            return items
+
+        with ThreadPoolExecutor(max_workers=PARENT_BACKFILL_CONFIG.get("WORKERS", 4)) as pool:
+            results = list(pool.map(in_current_span(fetch_batch), batches))
+        if entity in _filter_unsupported:
+            logging.warning(f"Server ignores filter[id] for {entity}; its missing parents cannot be backfilled")
+            return []
+        return [item for items in results for item in items]
+
+    def insert(self, table: str, rows: List[Tuple]):
+        _, _, _, query = BACKFILL_TABLES[table]
+        input_types = None
+        batch = TypedBatch.for_query(table, query, rows)
+        if batch:
+            rows, input_types = batch.rows, batch.types
+            for record, reason in batch.rejected:
+                logging.warning(f"Backfilled {table} {record[0]} not inserted: {reason}")
+        failed = self.backend.load_rows(self.conn, query, rows, table,
+                                        strategy=DB_LOAD_CONFIG.get("STAGING_STRATEGY", "executemany"),
+                                        input_types=input_types)
+        self.inserted[table] = self.inserted.get(table, 0) + len(rows) - failed
+        # Re-read so the filter sees exactly what was inserted
+        self.parent_keys.forget(table)
+        session = active_session()
+        if session:
+            session.loaded(table)
+
+    def backfill(self, missing: Dict[str, Iterable], included: Dict[str, List[Dict]] = None) -> Dict[str, int]:
+        # missing: table -> referenced ids. Fetches the ones the database does
+        # not have (and their missing parents) and inserts them, parents first.
+        # included: table -> resources already at hand (include= sideloads);
+        # the ones the database does not have are inserted the same way, and
+        # their missing parents fetched when backfill is enabled.
+        # Returns table -> rows inserted.
+        start_time = time.time()
+        included = included or {}
+        pending = {table: self.missing_ids(table, ids) for table, ids in missing.items() if table in BACKFILL_TABLES}
+        fetched: Dict[str, List[Tuple]] = {}
+        # Children before parents, so their references are known when the parents are fetched
+        for table in reversed(list(BACKFILL_TABLES)):
+            _, _, formatter, query = BACKFILL_TABLES[table]
+            resources = []
+            if included.get(table):
+                keys = self.parent_keys.keys(table)
+                resources = [item for item in included[table] if as_key(item.get("id")) not in keys]
+            ids = pending.get(table, set()) - {as_key(item.get("id")) for item in resources}
+            if ids and (not included or is_backfill_enabled()):
+                found = self.fetch(table, ids)
+                logging.info(f"Backfill: fetched {len(found)} of {len(ids)} missing {table} records")
+                resources.extend(found)
+            rows = formatter(resources)
+            if not rows:
+                continue
+            fetched[table] = rows
+            columns = bound_columns(query)
+            for column, parent in BACKFILL_PARENTS.get(table, {}).items():
+                if parent in BACKFILL_TABLES:
+                    position = columns.index(column)
+                    pending.setdefault(parent, set()).update(
+                        self.missing_ids(parent, (row[position] for row in rows if row[position] is not None)))
+
+        before = dict(self.inserted)
+        for table in BACKFILL_TABLES:
+            if table not in fetched:
+                continue
+            rows = fetched[table]
+            columns = bound_columns(BACKFILL_TABLES[table][3])
+            checks = [(columns.index(column), parent, column, True)
+                      for column, parent in BACKFILL_PARENTS.get(table, {}).items()]
+            if checks:
+                rows, missing_parents = self.parent_keys.filter_rows(rows, checks)
+                if len(rows) < len(fetched[table]):
+                    logging.warning(f"Backfill: {len(fetched[table]) - len(rows)} {table} records left out, "
+                                    f"their own parents are missing ({missing_parents})")
+            if rows:
+                self.insert(table, rows)
+        added = {table: self.inserted[table] - before.get(table, 0)
+                 for table in self.inserted if self.inserted[table] - before.get(table, 0)}
+        if added:
+            logging.info(f"Backfilled missing parents in {time.time() - start_time:.1f}s: "
+                         f"{', '.join(f'{count} {table}' for table, count in added.items())}")
+        return added
@@ -0,0 +1,108 @@
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Ids up to this are kept in a bitmap (one bit each, ~6MB at the limit);
+# larger or negative ids go into a set
+BITMAP_MAX_ID = 50_000_000
+
+
+def as_key(value) -> Optional[int]:
+    # Formatted rows carry ids as strings (resource ids) or ints (attributes)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KeySet:
+    # Membership set for integer ids: a growable bitmap for the dense
+    # ereserve_id range plus a set for anything outside it
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self._bits = bytearray()
+        self._outliers = set()
+        self.count = 0
+        self.update(ids)
+
+    def add(self, key: int):
+        if 0 <= key <= BITMAP_MAX_ID:
+            byte, bit = key >> 3, 1 << (key & 7)
+            if byte >= len(self._bits):
+                # Grow geometrically so adding ascending ids stays linear
+                self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                self.count += 1
+        elif key not in self._outliers:
+            self._outliers.add(key)
+            self.count += 1
+
+    def update(self, keys: Iterable[int]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key) -> bool:
+        if key is None:
+            return False
+        if 0 <= key <= BITMAP_MAX_ID:
+            byte = key >> 3
+            return byte < len(self._bits) and bool(self._bits[byte] & (1 << (key & 7)))
+        return key in self._outliers
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ParentKeyIndex:
+    # The ereserve_ids of parent tables, read from the database on first use
+    # and extended with the rows a run is about to merge, so usage rows can be
+    # checked for orphans in process instead of with EXISTS probes
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._tables: Dict[str, KeySet] = {}
+
+    def keys(self, table: str) -> KeySet:
+        if table not in self._tables:
+            start_time = time.time()
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT ereserve_id FROM {table}")
+            keys = KeySet()
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                keys.update(row[0] for row in rows)
+            self._tables[table] = keys
+            logging.info(f"Loaded {len(keys)} {table} ids for the parent key filter in {time.time() - start_time:.1f}s")
+        return self._tables[table]
+
+    def add(self, table: str, ids: Iterable[int]):
+        self.keys(table).update(ids)
+
+    def forget(self, table: str):
+        # The table changed in the database; re-read it on next use
+        self._tables.pop(table, None)
+
+    def filter_rows(self, rows: List[Tuple], checks: List[Tuple[int, str, str, bool]]) -> Tuple[List[Tuple], Dict[str, int]]:
+        # checks: (column position, parent table, breakdown name, nullable).
+        # Returns the rows whose parents all exist, and per check the number
+        # of distinct parent ids that were missing
+        parents = [(position, self.keys(table), name, nullable) for position, table, name, nullable in checks]
+        missing = {name: set() for _, _, name, _ in checks}
+        kept = []
+        for row in rows:
+            orphan = False
+            for position, keys, name, nullable in parents:
+                value = row[position]
+                if value is None and nullable:
+                    continue
+                if as_key(value) not in keys:
+                    missing[name].add(value)
+                    orphan = True
+            if not orphan:
+                kept.append(row)
+        return kept, {name: len(values) for name, values in missing.items()}
@@ -1,32 +1,20 @@
 import logging
-import pyodbc
 from datetime import datetime
 from typing import Optional, Dict
-from fedpipeline.config import DB_CONFIG
+from fedpipeline.db_backend import get_backend
 
 class PipelineRunHistoryManager:
     
     def __init__(self):
-        self.conn_str = (
-            f"DRIVER={{{DB_CONFIG['DRIVER']}}};"
-            f"SERVER={DB_CONFIG['SERVER']};"
-            f"DATABASE={DB_CONFIG['DATABASE']};"
-            f"UID={DB_CONFIG['UID']};"
-            f"PWD={DB_CONFIG['PWD']}"
-        )
+        self.backend = get_backend()
         self.current_run_id = None
     
     def is_first_run(self) -> bool:
         try:
-            with pyodbc.connect(self.conn_str) as conn:
+            with self.backend.connect() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_NAME = 'PipelineRunHistory'
-                """)
-                table_exists = cursor.fetchone()[0] > 0
+                table_exists = self.backend.table_exists(cursor, 'PipelineRunHistory')
                 if not table_exists:
                     logging.warning("PipelineRunHistory table does not exist. Assuming first run.")
                     return True
@@ -53,17 +41,13 @@ class PipelineRunHistoryManager:
     
     def start_run(self, is_initial_load: bool = False) -> Optional[int]:
         try:
-            with pyodbc.connect(self.conn_str) as conn:
+            with self.backend.connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
+                run_id = self.backend.insert_and_get_id(cursor, """
                     INSERT INTO PipelineRunHistory 
                     (run_start_time, status, is_initial_load)
                     VALUES (?, 'IN_PROGRESS', ?)
                 """, (datetime.now(), 1 if is_initial_load else 0))
-                
-                # Get inserted run_id
-                cursor.execute("SELECT @@IDENTITY")
-                run_id = int(cursor.fetchone()[0])
                 conn.commit()
                 self.current_run_id = run_id
                 logging.info(f"Pipeline run started with run_id: {run_id} (initial_load: {is_initial_load})")
@@ -75,7 +59,7 @@ class PipelineRunHistoryManager:
     
     def end_run_success(self, run_id: int, metrics: Dict = None) -> bool:
         try:
-            with pyodbc.connect(self.conn_str) as conn:
+            with self.backend.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE PipelineRunHistory
@@ -97,7 +81,7 @@ class PipelineRunHistoryManager:
     
     def end_run_failure(self, run_id: int, error_message: str, error_details: str = None) -> bool:
         try:
-            with pyodbc.connect(self.conn_str) as conn:
+            with self.backend.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE PipelineRunHistory
@@ -120,7 +104,7 @@ class PipelineRunHistoryManager:
     
     def get_run_statistics(self) -> Dict:
         try:
-            with pyodbc.connect(self.conn_str) as conn:
+            with self.backend.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT 
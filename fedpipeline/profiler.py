@@ -0,0 +1,150 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from fedpipeline.config import PROFILING_CONFIG
+from fedpipeline.log_config import log_file
+from fedpipeline.tracing import span
+
+_enabled = PROFILING_CONFIG.get("ENABLED", False) or os.environ.get("FEDPIPELINE_PROFILE") == "1"
+_trace_memory = PROFILING_CONFIG.get("TRACEMALLOC", False) or os.environ.get("FEDPIPELINE_TRACEMALLOC") == "1"
+_run_dir = None
+_stage_counter = 0
+_active_stages = []
+
+
+def enable_profiling(trace_memory: bool = False):
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = _trace_memory or trace_memory
+    logging.info(f"Profiling enabled (tracemalloc: {_trace_memory})")
+
+
+def is_profiling_enabled() -> bool:
+    return _enabled
+
+
+def begin_run(run_id=None):
+    # Every job() gets its own report directory next to pipeline.log
+    global _run_dir, _stage_counter
+    if not _enabled:
+        return
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"run_{run_id}_{stamp}" if run_id else f"run_{stamp}"
+    _run_dir = os.path.join(_log_dir(), PROFILING_CONFIG.get("OUTPUT_DIR", "profiles"), name)
+    _stage_counter = 0
+    logging.info(f"Profiling reports for this run will be written to {_run_dir}")
+
+
+def _log_dir() -> str:
+    if log_file():
+        return os.path.dirname(log_file())
+    for handler in logging.getLogger().handlers:
+        filename = getattr(handler, "baseFilename", None)
+        if filename:
+            return os.path.dirname(os.path.abspath(filename))
+    return os.getcwd()
+
+
+@contextmanager
+def profile_stage(name: str):
+    # Every stage is also a tracing span, profiled or not
+    with span(name, "stage"):
+        if not _enabled:
+            yield
+            return
+        with _profiled_stage(name):
+            yield
+
+
+@contextmanager
+def _profiled_stage(name: str):
+    global _stage_counter
+    if _run_dir is None:
+        begin_run()
+    _stage_counter += 1
+
+    # cProfile can only have one active profiler, so an outer stage is paused
+    # while a nested stage runs and its report excludes the nested time.
+    parent = _active_stages[-1] if _active_stages else None
+    if parent:
+        parent["profiler"].disable()
+
+    stage = {"name": name, "index": _stage_counter, "profiler": cProfile.Profile(), "child_peak": 0, "overhead": 0.0}
+    started_tracemalloc = False
+    if _trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        tracemalloc.reset_peak()
+
+    _active_stages.append(stage)
+    start_time = time.perf_counter()
+    stage["profiler"].enable()
+    try:
+        yield
+    finally:
+        stage["profiler"].disable()
+        elapsed = time.perf_counter() - start_time - stage["overhead"]
+        _active_stages.pop()
+        report_start = time.perf_counter()
+
+        peak_memory = None
+        snapshot = None
+        if _trace_memory and tracemalloc.is_tracing():
+            peak_memory = max(tracemalloc.get_traced_memory()[1], stage["child_peak"])
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        try:
+            report_path = _write_report(stage, elapsed, peak_memory, snapshot)
+            peak_str = f", peak memory {peak_memory / (1024 * 1024):.1f} MB" if peak_memory is not None else ""
+            logging.info(f"Profiled stage {name}: {elapsed:.2f}s{peak_str} -> {report_path}")
+        except Exception as e:
+            logging.error(f"Failed to write profiling report for {name}: {e}")
+
+        if parent:
+            # Snapshot and report writing are not part of the parent's work
+            parent["overhead"] += stage["overhead"] + (time.perf_counter() - report_start)
+            if peak_memory is not None:
+                parent["child_peak"] = max(parent["child_peak"], peak_memory)
+            parent["profiler"].enable()
+
+
+def _write_report(stage: dict, elapsed: float, peak_memory, snapshot) -> str:
+    os.makedirs(_run_dir, exist_ok=True)
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", stage["name"])
+    report_path = os.path.join(_run_dir, f"{stage['index']:02d}_{safe_name}.txt")
+
+    top_functions = PROFILING_CONFIG.get("TOP_FUNCTIONS", 30)
+    stats_stream = io.StringIO()
+    stats = pstats.Stats(stage["profiler"], stream=stats_stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_functions)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top_functions)
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f"Stage: {stage['name']}\n")
+        f.write(f"Wall time: {elapsed:.3f}s\n")
+        if peak_memory is not None:
+            f.write(f"Peak traced memory: {peak_memory / (1024 * 1024):.2f} MB\n")
+        f.write("\n==== Top functions (cumulative, then internal time) ====\n")
+        f.write(stats_stream.getvalue())
+
+        if snapshot is not None:
+            top_allocations = PROFILING_CONFIG.get("TOP_ALLOCATIONS", 20)
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            f.write("\n==== Allocation hot spots (live at end of stage) ====\n")
+            for stat in snapshot.statistics("lineno")[:top_allocations]:
+                f.write(f"{stat}\n")
+
+    return report_path
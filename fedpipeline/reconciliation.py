@@ -0,0 +1,323 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Delete detection by ID-only reconciliation.
+
+    For each entity the API is scanned with an empty sparse fieldset
+    (fields[<type>]=) so pages carry little more than ids. The ids are then
+    compared with the table's ereserve_id set. The scan pages by id (sort=id,
+    filter[id][gt]) so rows changing mid-scan cannot shift it; when the server
+    only offers offset paging, every candidate is looked up again by
+    filter[id] first, and hard mode is refused if that is not possible either.
+    Rows that no longer exist upstream are flagged (soft mode: is_deleted/deleted_at) or deleted (hard
+    mode, children before parents). Soft-deleted rows that reappear upstream are
+    restored. The soft mode columns come from migration 0003. An entity is skipped when its ID scan is incomplete or would
+    remove more than MAX_DELETE_RATIO of the table.
+
+    Usage:
+        python -m fedpipeline.reconciliation
+        python -m fedpipeline.reconciliation --mode hard --entities reading-lists reading-list-items
+        python -m fedpipeline.reconciliation --dry-run
+-------------------------------------------------------------------------------
+"""
+import argparse
+import logging
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from fedpipeline.api_handler import fetch_with_retry, last_request_rejected
+from fedpipeline.config import API_CONFIG, PAGE_SIZE, RECONCILIATION_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.keyset_paging import KeysetCursor, SeenIds
+from fedpipeline.profiler import profile_stage
+
+# API entity -> (table, API_CONFIG url key), parents before children
+RECONCILE_ENTITIES = {
+    "integration-users": ("IntegrationUser", "INTEGRATION_USERS_URL"),
+    "schools": ("School", "SCHOOLS_URL"),
+    "readings": ("Reading", "READINGS_URL"),
+    "units": ("Unit", "UNITS_URL"),
+    "teaching-sessions": ("TeachingSession", "TEACHING_SESSIONS_URL"),
+    "reading-lists": ("ReadingList", "READING_LISTS_URL"),
+    "reading-list-items": ("ReadingListItem", "READING_LIST_ITEMS_URL"),
+    "unit-offerings": ("UnitOffering", "UNIT_OFFERINGS_URL"),
+    "reading-list-usages": ("ReadingListUsage", "READING_LIST_USAGE_URL"),
+    "reading-list-item-usages": ("ReadingListItemUsage", "READING_LIST_ITEM_USAGE_URL"),
+    "reading-utilisations": ("ReadingUtilisation", "READING_UTILISATION_URL"),
+}
+
+# Tables outside the API that reference an entity and must be cleared before a hard delete
+DEPENDENT_ROWS = {
+    "Unit": [("FedUnit", "unit_id")],
+}
+
+_enabled = RECONCILIATION_CONFIG.get("ENABLED", False)
+
+
+def enable_reconciliation():
+    global _enabled
+    _enabled = True
+
+
+def is_reconciliation_enabled() -> bool:
+    return _enabled
+
+
+# Largest ereserve_id compared with a byte-per-id bitmap (~50MB); above that
+# both id lists are sorted and merged instead
+BITMAP_MAX_ID = 50_000_000
+
+
+def find_missing(local_ids, remote_ids) -> List[int]:
+    # Returns the local ids that are absent from remote_ids, in local order
+    if not local_ids:
+        return []
+    top = max(local_ids)
+    if top <= BITMAP_MAX_ID:
+        seen = bytearray(top + 1)
+        for record_id in remote_ids:
+            if 0 <= record_id <= top:
+                seen[record_id] = 1
+        return [record_id for record_id in local_ids if record_id < 0 or not seen[record_id]]
+
+    local, remote = sorted(local_ids), sorted(remote_ids)
+    missing, j, remote_count = [], 0, len(remote)
+    for record_id in local:
+        while j < remote_count and remote[j] < record_id:
+            j += 1
+        if j == remote_count or remote[j] != record_id:
+            missing.append(record_id)
+    return missing
+
+
+def id_scan_url(entity: str, fieldset: str = None) -> str:
+    url = f"{API_CONFIG[RECONCILE_ENTITIES[entity][1]]}?page[size]={PAGE_SIZE}"
+    if fieldset is not None:
+        url += f"&fields[{entity}]={quote(fieldset, safe=',')}"
+    return url
+
+
+def fieldset_fallback(url: str, entity: str) -> Optional[str]:
+    # The scan URL without fields[<type>] if the server refused it (400/422)
+    marker = f"fields[{entity}]="
+    if marker not in url or not last_request_rejected():
+        return None
+    base, _, query = url.partition("?")
+    logging.warning(f"ID-only scan of {entity} refused; retrying without a sparse fieldset")
+    return f"{base}?{'&'.join(part for part in query.split('&') if not part.startswith(marker))}"
+
+
+def fetch_remote_ids(entity: str, fieldset: Optional[str]) -> Tuple[Optional[array], bool]:
+    # Returns every id the API has for the entity, or None if any page failed,
+    # because reconciling against a partial scan would delete live rows. The
+    # flag is True when the whole scan was paged by id: offset pages over
+    # changing data can skip a live row, which would then look deleted.
+    cursor = KeysetCursor(id_scan_url(entity, fieldset), entity)
+    seen = SeenIds(entity)
+    url = cursor.first_url()
+    ids = array("q")
+    first_page = True
+    while url:
+        response = fetch_with_retry(url, record=False)
+        if not response:
+            fallback_url = (cursor.fallback(url) or fieldset_fallback(url, entity)) if first_page else None
+            if fallback_url:
+                url = fallback_url
+                continue
+            return None, False
+        body = response.json()
+        data = body.get("data", [])
+        if not data:
+            break
+        first_page = False
+        page_ids = [item.get("id") for item in data]
+        ids.extend(int(value) for value in page_ids if seen.is_new_id(value))
+        url = cursor.next_url(page_ids, body.get("links", {}))
+    seen.summary()
+    return ids, cursor.active
+
+
+def confirm_missing(entity: str, candidates: List[int], fieldset: Optional[str]) -> Optional[List[int]]:
+    # Looks the candidates up again by filter[id] and returns those the API
+    # still does not have; None if a lookup failed or the filter was ignored
+    per_request = RECONCILIATION_CONFIG.get("RECHECK_IDS_PER_REQUEST", 100)
+    found = set()
+    for i in range(0, len(candidates), per_request):
+        batch = candidates[i:i + per_request]
+        wanted = {str(record_id) for record_id in batch}
+        url = f"{id_scan_url(entity, fieldset)}&filter[id]={','.join(map(str, batch))}"
+        while url:
+            response = fetch_with_retry(url, record=False)
+            if not response:
+                return None
+            body = response.json()
+            page_ids = [str(item.get("id")) for item in body.get("data", [])]
+            if any(value not in wanted for value in page_ids):
+                logging.warning(f"Server ignores filter[id] for {entity}; deletions cannot be re-checked")
+                return None
+            found.update(int(value) for value in page_ids)
+            url = body.get("links", {}).get("next") if page_ids else None
+    return [record_id for record_id in candidates if record_id not in found]
+
+
+def fetch_local_ids(cursor, table: str, deleted: bool = False, soft: bool = True) -> array:
+    sql = f"SELECT ereserve_id FROM {table}"
+    if soft:
+        sql += f" WHERE is_deleted = {1 if deleted else 0}"
+    cursor.execute(sql)
+    ids = array("q")
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        ids.extend(row[0] for row in rows)
+    return ids
+
+
+class Reconciler:
+    def __init__(self, mode: str = None, dry_run: bool = False):
+        self.backend = get_backend()
+        self.mode = mode or RECONCILIATION_CONFIG.get("MODE", "soft")
+        if self.mode not in ("soft", "hard"):
+            raise ValueError(f"Unknown reconciliation mode: {self.mode}")
+        self.dry_run = dry_run
+        self.fieldset = RECONCILIATION_CONFIG.get("ID_FIELDSET", "")
+        self.batch_size = RECONCILIATION_CONFIG.get("BATCH_SIZE", 500)
+        self.max_delete_ratio = RECONCILIATION_CONFIG.get("MAX_DELETE_RATIO", 0.2)
+
+    def _execute_in_batches(self, conn, sql_template: str, ids: List[int], params: tuple = ()) -> int:
+        # sql_template has a single {placeholders} slot for the IN list
+        cursor = conn.cursor()
+        affected = 0
+        for i in range(0, len(ids), self.batch_size):
+            batch = list(ids[i:i + self.batch_size])
+            cursor.execute(sql_template.format(placeholders=", ".join("?" * len(batch))), params + tuple(batch))
+            affected += max(cursor.rowcount, 0)
+        return affected
+
+    def remove(self, conn, table: str, ids: List[int]) -> int:
+        if self.mode == "soft":
+            return self._execute_in_batches(
+                conn,
+                f"UPDATE {table} SET is_deleted = 1, deleted_at = ? WHERE ereserve_id IN ({{placeholders}})",
+                ids, (datetime.now(),)
+            )
+        for child_table, column in DEPENDENT_ROWS.get(table, []):
+            self._execute_in_batches(conn, f"DELETE FROM {child_table} WHERE {column} IN ({{placeholders}})", ids)
+        return self._execute_in_batches(conn, f"DELETE FROM {table} WHERE ereserve_id IN ({{placeholders}})", ids)
+
+    def restore(self, conn, table: str, ids: List[int]) -> int:
+        return self._execute_in_batches(
+            conn, f"UPDATE {table} SET is_deleted = 0, deleted_at = NULL WHERE ereserve_id IN ({{placeholders}})", ids
+        )
+
+    def reconcile_entity(self, conn, entity: str) -> Dict:
+        table = RECONCILE_ENTITIES[entity][0]
+        result = {"table": table, "local": 0, "remote": 0, "missing": 0, "removed": 0, "restored": 0, "status": "ok"}
+        start_time = time.time()
+        soft = self.mode == "soft"
+        cursor = conn.cursor()
+        soft_columns = soft and self.backend.column_exists(cursor, table, "is_deleted")
+        if soft and not soft_columns and not self.dry_run:
+            # is_deleted/deleted_at come from migration 0003
+            logging.error(f"{table} has no is_deleted/deleted_at columns; apply the schema migrations "
+                          f"(python -m fedpipeline.migrations) before running soft mode")
+            result["status"] = "not_migrated"
+            return result
+
+        remote_ids, id_ordered = fetch_remote_ids(entity, self.fieldset)
+        if remote_ids is None:
+            logging.error(f"Could not fetch the complete id list for {entity}; skipping reconciliation")
+            result["status"] = "scan_failed"
+            return result
+
+        local_ids = fetch_local_ids(cursor, table, soft=soft_columns)
+        missing = find_missing(local_ids, remote_ids)
+        result.update(local=len(local_ids), remote=len(remote_ids), missing=len(missing))
+
+        if local_ids and len(missing) > self.max_delete_ratio * len(local_ids):
+            logging.error(f"{table}: {len(missing)}/{len(local_ids)} rows missing upstream exceeds "
+                          f"MAX_DELETE_RATIO {self.max_delete_ratio}; skipping (raise it if this is expected)")
+            result["status"] = "over_threshold"
+            return result
+
+        if missing and not id_ordered:
+            # The scan was offset-paged, so a live row can have been skipped
+            # when others were added or removed mid-scan; ask for each by id
+            confirmed = confirm_missing(entity, missing, self.fieldset)
+            if confirmed is not None:
+                if len(confirmed) < len(missing):
+                    logging.info(f"{table}: {len(missing) - len(confirmed)} rows missing from the scan "
+                                 f"still exist upstream")
+                missing = confirmed
+                result["missing"] = len(missing)
+            elif not soft:
+                logging.error(f"{table}: the server supports neither keyset paging nor filter[id], so "
+                              f"missing rows cannot be confirmed; refusing hard deletes")
+                result["status"] = "unverified"
+                return result
+            else:
+                logging.warning(f"{table}: missing rows could not be confirmed by id; flagging them anyway "
+                                f"(they are restored if they show up in a later scan)")
+
+        if self.dry_run:
+            result["status"] = "dry_run"
+        else:
+            try:
+                if missing:
+                    result["removed"] = self.remove(conn, table, missing)
+                if soft_columns:
+                    deleted_ids = fetch_local_ids(cursor, table, deleted=True)
+                    still_gone = set(find_missing(deleted_ids, remote_ids))
+                    returned = [record_id for record_id in deleted_ids if record_id not in still_gone]
+                    if returned:
+                        result["restored"] = self.restore(conn, table, returned)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Failed to reconcile {table}: {e}")
+                result["status"] = "failed"
+                return result
+
+        action = "flagged deleted" if soft else "deleted"
+        logging.info(f"Reconciled {table} in {time.time() - start_time:.1f}s: {len(remote_ids)} upstream, "
+                     f"{len(local_ids)} local, {len(missing)} missing, {result['removed']} {action}, "
+                     f"{result['restored']} restored{' (dry run)' if self.dry_run else ''}")
+        return result
+
+    def run(self, entities: List[str] = None) -> Dict[str, Dict]:
+        entities = entities or RECONCILIATION_CONFIG.get("ENTITIES") or list(RECONCILE_ENTITIES)
+        ordered = [e for e in RECONCILE_ENTITIES if e in entities]
+        if self.mode == "hard":
+            # Children go first so their foreign keys do not block the parents
+            ordered.reverse()
+
+        summary = {}
+        conn = self.backend.connect()
+        try:
+            for entity in ordered:
+                with profile_stage(f"reconcile.{entity}"):
+                    summary[entity] = self.reconcile_entity(conn, entity)
+        finally:
+            conn.close()
+        return summary
+
+
+def reconcile_deletes(entities: List[str] = None, mode: str = None, dry_run: bool = False) -> Dict[str, Dict]:
+    return Reconciler(mode, dry_run).run(entities)
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Detect records deleted upstream by comparing ID lists")
+    parser.add_argument("--entities", nargs="+", choices=list(RECONCILE_ENTITIES), help="Only reconcile these entities")
+    parser.add_argument("--mode", choices=["soft", "hard"], default=None,
+                        help="soft flags rows with is_deleted, hard deletes them (default: RECONCILIATION_CONFIG)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    args = parser.parse_args()
+
+    logging.info("Reconciliation starting...")
+    result = reconcile_deletes(args.entities, args.mode, args.dry_run)
+    logging.info(f"Reconciliation finished: {result}")
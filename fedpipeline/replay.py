@@ -0,0 +1,164 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Rebuilds tables from the raw landing zone without touching the eReserve API.
+
+    Part files are decoded and transformed in parallel worker processes while the
+    main process loads entities into the database in dependency order. Only a
+    few part files are decoded ahead of the load, and each one's rows are loaded
+    and released before the next, so memory does not grow with the landing zone.
+    Parts are read newest first and a record already loaded from a newer copy is
+    skipped, so the most recent copy wins.
+
+    By default rows are inserted, so the tables should be empty (see
+    sql/delete_data.sql). With --upsert rows are merged on ereserve_id instead,
+    updating the ones already there, e.g. to re-run a fixed transform over
+    loaded tables.
+
+    Usage:
+        python -m fedpipeline.replay                          # every run on disk
+        python -m fedpipeline.replay --runs 20250601_020000_run42
+        python -m fedpipeline.replay --entities reading-lists reading-list-items --workers 8
+        python -m fedpipeline.replay --entities readings --upsert
+-------------------------------------------------------------------------------
+"""
+import argparse
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+from urllib.parse import urlsplit, parse_qs
+from fedpipeline import jobs
+from fedpipeline.db_backend import LOAD_STRATEGIES, get_backend
+from fedpipeline.db_handler import insert_records, upsert_records
+from fedpipeline.keyset_paging import SeenIds
+from fedpipeline.landing_zone import list_runs, part_files, read_pages
+from fedpipeline.profiler import profile_stage
+from fedpipeline.usage_rollups import rebuild_usage_rollups
+
+# Landing zone entity -> (table, insert query, formatter), in the order job() loads them
+REPLAY_ENTITIES = {
+    "integration-users": ("IntegrationUser", jobs.INTEGRATION_USERS_QUERY, jobs.format_integration_users),
+    "schools": ("School", jobs.SCHOOLS_QUERY, jobs.format_schools),
+    "readings": ("Reading", jobs.READINGS_QUERY, jobs.format_readings),
+    "units": ("Unit", jobs.UNITS_QUERY, None),
+    "teaching-sessions": ("TeachingSession", jobs.TEACHING_SESSIONS_QUERY, jobs.format_teaching_sessions),
+    "reading-lists": ("ReadingList", jobs.READING_LISTS_QUERY, jobs.format_reading_lists),
+    "reading-list-items": ("ReadingListItem", jobs.READING_LIST_ITEMS_QUERY, jobs.format_reading_list_items),
+    "unit-offerings": ("UnitOffering", jobs.UNIT_OFFERINGS_QUERY, jobs.format_unit_offerings),
+    "reading-list-usages": ("ReadingListUsage", jobs.READING_LIST_USAGE_QUERY, jobs.format_reading_list_usage),
+    "reading-list-item-usages": ("ReadingListItemUsage", jobs.READING_LIST_ITEM_USAGE_QUERY, jobs.format_reading_list_item_usage),
+    "reading-utilisations": ("ReadingUtilisation", jobs.READING_UTILISATION_QUERY, jobs.format_reading_utilisation),
+}
+
+
+def decode_part(entity: str, path: str) -> list:
+    # Runs in a worker process: decompress, parse and format one part file
+    formatter = REPLAY_ENTITIES[entity][2]
+    rows = []
+    for record in read_pages(path):
+        items = record["page"].get("data", [])
+        if entity == "units":
+            # Units only know their school through the filter used to fetch them
+            school_id = parse_qs(urlsplit(record["url"]).query).get("filter[school_id]", [None])[0]
+            rows.extend(jobs.format_units(items, school_id))
+        else:
+            rows.extend(formatter(items))
+    return rows
+
+
+def decoded_parts(executor, parts: List[Tuple[str, str]], ahead: int) -> Iterator[Tuple[str, list]]:
+    # (entity, rows) for each (entity, path) in order, with at most `ahead`
+    # part files being decoded or waiting at a time
+    parts = iter(parts)
+    pending = deque((entity, executor.submit(decode_part, entity, path))
+                    for entity, path in itertools.islice(parts, ahead))
+    while pending:
+        entity, future = pending.popleft()
+        following = next(parts, None)
+        if following:
+            pending.append((following[0], executor.submit(decode_part, *following)))
+        yield entity, future.result()
+
+
+def clear_fedunits(rows: list):
+    # Upserted units get their FedUnit rows rebuilt by process_fedunits
+    backend = get_backend()
+    unit_ids = [row[0] for row in rows]
+    with backend.connect() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(unit_ids), 500):
+            batch = unit_ids[i:i + 500]
+            cursor.execute(f"DELETE FROM FedUnit WHERE unit_id IN ({', '.join('?' * len(batch))})", batch)
+        conn.commit()
+
+
+def replay(runs: list = None, entities: list = None, workers: int = None, strategy: str = "bulk",
+           upsert: bool = False) -> dict:
+    runs = runs or list_runs()
+    entities = [e for e in REPLAY_ENTITIES if not entities or e in entities]
+    if not runs:
+        logging.warning("No landing zone runs found - nothing to replay")
+        return {}
+    logging.info(f"Replaying {len(entities)} entities from {len(runs)} landing zone run(s): {runs[0]} .. {runs[-1]}"
+                 f"{' (upsert)' if upsert else ''}")
+
+    workers = workers or os.cpu_count()
+    # Newest part first, so the first copy of a record seen is the one kept
+    parts = [(entity, path) for entity in entities for _, path in reversed(part_files(entity, runs))]
+    summary = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Decoding the next parts overlaps with loading this one, across entities too
+        decoded = decoded_parts(executor, parts, workers * 2)
+        for entity, entity_parts in itertools.groupby(decoded, key=lambda part: part[0]):
+            table, query, _ = REPLAY_ENTITIES[entity]
+            start_time = time.time()
+            seen = SeenIds(entity)
+            files = loaded = 0
+            with profile_stage(f"replay.{entity}"):
+                for _, rows in entity_parts:
+                    files += 1
+                    # Within a part, later pages hold the newer copies
+                    rows = [row for row in reversed(rows) if seen.is_new_id(row[0])]
+                    if not rows:
+                        continue
+                    if upsert:
+                        upsert_records(query, rows, table, strategy=strategy)
+                    else:
+                        insert_records(query, rows, table, strategy=strategy)
+                    if entity == "units":
+                        if upsert:
+                            clear_fedunits(rows)
+                        jobs.process_fedunits(rows)
+                    loaded += len(rows)
+
+            summary[table] = loaded
+            logging.info(f"Replayed {loaded} {table} rows from {files} part file(s) "
+                         f"in {time.time() - start_time:.1f}s")
+
+    if summary.keys() & {"ReadingListUsage", "ReadingListItemUsage", "ReadingUtilisation"}:
+        # Replayed usage rows bypass the staging merge that keeps the rollups current
+        rebuild_usage_rollups()
+    return summary
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Rebuild tables from the raw landing zone (no network)")
+    parser.add_argument("--runs", nargs="+", help="Landing zone run keys to replay (default: all, oldest first)")
+    parser.add_argument("--entities", nargs="+", choices=list(REPLAY_ENTITIES), help="Only replay these entities")
+    parser.add_argument("--workers", type=int, default=None, help="Decoder processes (default: CPU count)")
+    parser.add_argument("--strategy", default="bulk",
+                        choices=LOAD_STRATEGIES,
+                        help="DB load strategy (default: bulk)")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Update rows that already exist instead of inserting into empty tables")
+    args = parser.parse_args()
+
+    logging.info("Replay starting...")
+    result = replay(sorted(args.runs) if args.runs else None, args.entities, args.workers, args.strategy,
+                    args.upsert)
+    logging.info(f"Replay finished: {result}")
@@ -0,0 +1,388 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Cost-based run planning.
+
+    Before a run, every endpoint the run reads is probed once for ids only
+    (fields[<type>]=, page[size]=MAX_PAGE_SIZE). The probe gives the row
+    count (meta record-count, or the page number of links.last), the largest
+    page the server serves and the round trip time. With the stage timings of
+    earlier runs (PipelineStageStats), each stage gets a predicted run time,
+    and each entity:
+    - a page size: as few requests as the server allows, up to MAX_PAGE_SIZE
+    - a load strategy: per-row inserts for small tables, the backend's bulk
+      strategy with BULK_BATCH_SIZE batches from BULK_ROWS rows on. Plain
+      inserts only get it on the first run, into empty tables; staging and
+      upsert loads get it on every run.
+    - in queue mode, a number of work items for workers to share: one per
+      MIN_PAGES_PER_WORKER pages, at most MAX_WORKERS
+
+    At the end of the run each stage's predicted time is logged next to the
+    actual one, and both are stored in PipelineStageStats (migration 0007)
+    for the next run's predictions. Planning is off unless
+    FEDPIPELINE_RUN_PLANNER=1.
+
+    Usage:
+        python -m fedpipeline.run_planner                   # probe and print a plan for every group
+        python -m fedpipeline.run_planner --groups usage --windowed
+        python -m fedpipeline.run_planner --history         # predicted and actual times of recent runs
+-------------------------------------------------------------------------------
+"""
+import argparse
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from statistics import median
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+from fedpipeline.api_handler import fetch_data_from_api
+from fedpipeline.config import API_CONFIG, DB_LOAD_CONFIG, PAGE_SIZE, PLANNER_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.migrations import require_table
+from fedpipeline.tracing import in_current_span
+
+# API entity -> (API_CONFIG url key, table)
+ENTITY_SOURCES = {
+    "integration-users": ("INTEGRATION_USERS_URL", "IntegrationUser"),
+    "schools": ("SCHOOLS_URL", "School"),
+    "readings": ("READINGS_URL", "Reading"),
+    "units": ("UNITS_URL", "Unit"),
+    "teaching-sessions": ("TEACHING_SESSIONS_URL", "TeachingSession"),
+    "reading-lists": ("READING_LISTS_URL", "ReadingList"),
+    "reading-list-items": ("READING_LIST_ITEMS_URL", "ReadingListItem"),
+    "unit-offerings": ("UNIT_OFFERINGS_URL", "UnitOffering"),
+    "reading-list-usages": ("READING_LIST_USAGE_URL", "ReadingListUsage"),
+    "reading-list-item-usages": ("READING_LIST_ITEM_USAGE_URL", "ReadingListItemUsage"),
+    "reading-utilisations": ("READING_UTILISATION_URL", "ReadingUtilisation"),
+}
+
+USAGE_ENTITIES = ("reading-list-usages", "reading-list-item-usages", "reading-utilisations")
+
+# job() stage -> the entities it reads. Units are listed per school.
+STAGE_ENTITIES = {
+    "process_schools": ("schools",),
+    "process_integration_users": ("integration-users",),
+    "process_readings": ("readings",),
+    "process_units": ("schools", "units"),
+    "process_teaching_sessions": ("teaching-sessions",),
+    "process_reading_lists": ("reading-lists",),
+    "process_reading_list_items": ("reading-list-items",),
+    "process_unit_offerings": ("unit-offerings",),
+    "process_reading_list_usage": ("reading-list-usages",),
+    "process_reading_list_item_usage": ("reading-list-item-usages",),
+    "process_reading_utilisation": ("reading-utilisations",),
+    "process_usage_data": USAGE_ENTITIES,
+}
+
+# The plan of the run in progress, None when planning is off
+_plan = None
+
+
+def is_planner_enabled() -> bool:
+    return PLANNER_CONFIG.get("ENABLED", False)
+
+
+def _with_params(url: str, **params) -> str:
+    parts = [part for part in url.partition("?")[2].split("&")
+             if part and part.partition("=")[0] not in params]
+    parts.extend(f"{key}={value}" for key, value in params.items())
+    return f"{url.partition('?')[0]}?{'&'.join(parts)}"
+
+
+class Probe:
+    # One endpoint's size and speed, from a single ids-only request
+    def __init__(self, entity: str, rows: Optional[int], max_page_size: int, seconds: float):
+        self.entity = entity
+        self.rows = rows
+        self.max_page_size = max_page_size
+        self.seconds = seconds
+
+
+def probe(entity: str, url: str) -> Optional[Probe]:
+    # Asks for the largest page allowed, ids only. Servers that reject the size
+    # or the empty fieldset are asked again without it.
+    max_page_size = max(PLANNER_CONFIG.get("MAX_PAGE_SIZE", PAGE_SIZE), PAGE_SIZE)
+    attempts = [(max_page_size, True), (PAGE_SIZE, True), (PAGE_SIZE, False)]
+    for page_size, sparse in attempts if max_page_size > PAGE_SIZE else attempts[1:]:
+        params = {"page[size]": page_size}
+        if sparse:
+            params[f"fields[{entity}]"] = ""
+        start_time = time.perf_counter()
+        response = fetch_data_from_api(_with_params(url, **params), record=False)
+        seconds = time.perf_counter() - start_time
+        if response:
+            break
+    else:
+        logging.warning(f"Planner: could not probe {entity}")
+        return None
+
+    body = response.json()
+    served = len(body.get("data") or [])
+    links = body.get("links") or {}
+    meta = body.get("meta") or {}
+    rows = None
+    if meta.get("record-count") is not None:
+        rows = int(meta["record-count"])
+    elif not links.get("next"):
+        rows = served
+    else:
+        last_page = parse_qs(urlsplit(links.get("last") or "").query).get("page[number]")
+        if last_page:
+            rows = int(last_page[0]) * served
+    if rows is not None and served < min(rows, page_size):
+        # The server caps the page size below what was asked for
+        page_size = max(served, 1)
+    return Probe(entity, rows, page_size, seconds)
+
+
+class StagePlan:
+    def __init__(self, name: str, entities: Sequence[str]):
+        self.name = name
+        self.entities = tuple(entities)
+        self.rows: Optional[int] = None
+        self.pages: Optional[int] = None
+        self.request_seconds: Optional[float] = None
+        self.predicted_seconds: Optional[float] = None
+        self.actual_seconds = 0.0
+        self.ran = False
+
+
+class RunPlan:
+    # Per entity: page size, load (strategy, batch size) and, in queue mode,
+    # pages per work item; per stage: size and predicted time
+    def __init__(self, run_id: Optional[int], stages: List[StagePlan], probes: Dict[str, Probe],
+                 first_run: bool = True):
+        self.run_id = run_id
+        self.stages = {stage.name: stage for stage in stages}
+        self.probes = probes
+        # After the first run plain inserts mostly hit rows the table has
+        self.first_run = first_run
+        self.page_sizes: Dict[str, int] = {}
+        self.loads: Dict[str, Tuple[str, int]] = {}
+        self.pages_per_item: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self._assign()
+
+    def _assign(self):
+        bulk_rows = PLANNER_CONFIG.get("BULK_ROWS", 20000)
+        bulk_strategy = get_backend().bulk_load_strategy
+        max_workers = PLANNER_CONFIG.get("MAX_WORKERS", 8)
+        min_pages = PLANNER_CONFIG.get("MIN_PAGES_PER_WORKER", 5)
+        for entity, found in self.probes.items():
+            if found.rows is None:
+                continue
+            # A listing that fits in one page is read with one request; rows
+            # added since the probe just make a short second page
+            page_size = min(found.max_page_size, max(found.rows, PAGE_SIZE))
+            self.page_sizes[entity] = page_size
+            pages = max(1, math.ceil(found.rows / page_size))
+            workers = max(1, min(max_workers, pages // min_pages))
+            self.pages_per_item[entity] = math.ceil(pages / workers)
+            if found.rows >= bulk_rows:
+                self.loads[ENTITY_SOURCES[entity][1]] = (bulk_strategy, PLANNER_CONFIG.get("BULK_BATCH_SIZE", 10000))
+
+    def predict(self, history: Dict[str, List[Tuple]]):
+        # Time per row is the median of the stage's earlier runs, after their
+        # request time is taken out
+        default_row_seconds = PLANNER_CONFIG.get("DEFAULT_ROW_SECONDS", 0.0001)
+        for stage in self.stages.values():
+            probes = [self.probes.get(entity) for entity in stage.entities]
+            if not probes or any(found is None or found.rows is None for found in probes):
+                continue
+            stage.rows = sum(found.rows for found in probes)
+            stage.pages = sum(max(1, math.ceil(found.rows / self.page_sizes[found.entity])) for found in probes)
+            stage.request_seconds = max(found.seconds for found in probes)
+            row_seconds = [max(actual - (pages or 0) * (request or 0), 0.0) / rows
+                           for rows, pages, request, actual in history.get(stage.name, []) if rows]
+            per_row = median(row_seconds) if row_seconds else default_row_seconds
+            stage.predicted_seconds = stage.pages * stage.request_seconds + stage.rows * per_row
+
+    @property
+    def predicted_seconds(self) -> Optional[float]:
+        predictions = [stage.predicted_seconds for stage in self.stages.values()]
+        return sum(predictions) if predictions and None not in predictions else None
+
+    def summary(self) -> List[str]:
+        lines = []
+        for entity, found in self.probes.items():
+            if found.rows is None:
+                lines.append(f"  {entity}: size unknown, page size {PAGE_SIZE}")
+                continue
+            table = ENTITY_SOURCES[entity][1]
+            strategy, batch_size = self.loads.get(table, (DB_LOAD_CONFIG.get("STRATEGY", "per_row"),
+                                                         DB_LOAD_CONFIG.get("BATCH_SIZE", 1000)))
+            lines.append(f"  {entity}: {found.rows} rows, page size {self.page_sizes[entity]}, "
+                         f"{strategy} load (batches of {batch_size}), "
+                         f"{self.pages_per_item[entity]} pages per work item, probe {found.seconds:.2f}s")
+        for stage in self.stages.values():
+            if stage.predicted_seconds is None:
+                lines.append(f"  {stage.name}: no prediction")
+            else:
+                lines.append(f"  {stage.name}: {stage.rows} rows in {stage.pages} pages, "
+                             f"predicted {stage.predicted_seconds:.1f}s")
+        return lines
+
+
+def stage_urls(stages: Sequence[Tuple[str, Sequence[str]]], windowed: bool) -> Dict[str, str]:
+    # entity -> the URL its stage lists (usage in its staging date window when windowed)
+    urls = {}
+    window = None
+    for _, entities in stages:
+        for entity in entities:
+            url = API_CONFIG[ENTITY_SOURCES[entity][0]]
+            if windowed and entity in USAGE_ENTITIES:
+                # The staging processor imports jobs, which looks up planned page sizes here
+                from fedpipeline.usage_staging_processor import UsageStagingProcessor
+                processor = UsageStagingProcessor()
+                window = window or processor.calculate_date_range()
+                url = processor.build_filtered_url(url, *window)
+            urls[entity] = url
+    return urls
+
+
+def load_history(conn, stages: Sequence[str]) -> Dict[str, List[Tuple]]:
+    # stage -> (rows, pages, request seconds, actual seconds) of recent runs
+    since = datetime.now() - timedelta(days=PLANNER_CONFIG.get("HISTORY_DAYS", 30))
+    placeholders = ", ".join("?" * len(stages))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT stage, row_count, page_count, request_seconds, actual_seconds
+        FROM PipelineStageStats
+        WHERE stage IN ({placeholders}) AND recorded_at >= ?
+    """, list(stages) + [since])
+    history: Dict[str, List[Tuple]] = {}
+    for stage, rows, pages, request, actual in cursor.fetchall():
+        history.setdefault(stage, []).append((rows, pages, request, actual))
+    return history
+
+
+def plan_run(run_id: Optional[int], stages: Sequence[Tuple[str, Sequence[str]]], windowed: bool = False) -> RunPlan:
+    # stages: (name, entities) in run order. Probes the entities in parallel
+    # and makes the plan the one page sizes and loads are looked up in.
+    global _plan
+    start_time = time.time()
+    urls = stage_urls(stages, windowed)
+    with ThreadPoolExecutor(max_workers=PLANNER_CONFIG.get("PROBE_WORKERS", 4)) as pool:
+        results = list(pool.map(in_current_span(lambda entity: probe(entity, urls[entity])), urls))
+    probes = {found.entity: found for found in results if found}
+    plan = RunPlan(run_id, [StagePlan(name, entities) for name, entities in stages], probes, first_run=not windowed)
+    backend = get_backend()
+    with backend.connect() as conn:
+        require_table(backend, conn, "PipelineStageStats", "0007_stage_stats")
+        plan.predict(load_history(conn, list(plan.stages)))
+    predicted = plan.predicted_seconds
+    logging.info(f"Run plan ({len(probes)} endpoints probed in {time.time() - start_time:.1f}s, predicted run time "
+                 f"{f'{predicted:.1f}s' if predicted is not None else 'unknown'}):")
+    for line in plan.summary():
+        logging.info(line)
+    _plan = plan
+    return plan
+
+
+def planned_page_size(entity: str) -> int:
+    return _plan.page_sizes.get(entity, PAGE_SIZE) if _plan else PAGE_SIZE
+
+
+def planned_load(table: str, upsert: bool = False) -> Optional[Tuple[str, int]]:
+    # (strategy, batch size) for a table the plan loads in bulk, else None.
+    # upsert: the rows go to a staging or temp table first, so none of them
+    # can hit an existing key. Plain inserts into a table that already has
+    # rows would, and a bulk batch that does is retried row by row.
+    if not _plan or not (upsert or _plan.first_run):
+        return None
+    return _plan.loads.get(table)
+
+
+def planned_pages_per_item(entity: str) -> Optional[int]:
+    return _plan.pages_per_item.get(entity) if _plan else None
+
+
+@contextmanager
+def plan_stage(name: str):
+    # Times a stage of the planned run
+    stage = _plan.stages.get(name) if _plan else None
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stage:
+            stage.actual_seconds += time.perf_counter() - start_time
+            stage.ran = True
+
+
+def finish_plan():
+    # Logs predicted against actual time per stage and stores both
+    global _plan
+    plan, _plan = _plan, None
+    if not plan:
+        return
+    ran = [stage for stage in plan.stages.values() if stage.ran]
+    logging.info("Run plan vs actual:")
+    for stage in ran:
+        predicted = f"{stage.predicted_seconds:.1f}s" if stage.predicted_seconds is not None else "-"
+        logging.info(f"  {stage.name}: predicted {predicted}, actual {stage.actual_seconds:.1f}s")
+    predicted = plan.predicted_seconds
+    logging.info(f"  run: predicted {f'{predicted:.1f}s' if predicted is not None else '-'}, "
+                 f"actual {time.perf_counter() - plan.started:.1f}s")
+    if plan.run_id is None or not ran:
+        return
+    try:
+        with get_backend().connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO PipelineStageStats
+                (run_id, stage, row_count, page_count, request_seconds, predicted_seconds, actual_seconds, recorded_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(plan.run_id, stage.name, stage.rows, stage.pages, stage.request_seconds,
+                   stage.predicted_seconds, stage.actual_seconds, datetime.now()) for stage in ran])
+            conn.commit()
+    except Exception as e:
+        logging.error(f"Could not store stage timings: {e}")
+
+
+def print_history(limit: int):
+    backend = get_backend()
+    with backend.connect() as conn:
+        require_table(backend, conn, "PipelineStageStats", "0007_stage_stats")
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT run_id, stage, row_count, page_count, predicted_seconds, actual_seconds
+            FROM PipelineStageStats ORDER BY run_id DESC, stat_id
+        """)
+        runs = []
+        for run_id, stage, rows, pages, predicted, actual in cursor.fetchall():
+            if not runs or runs[-1][0] != run_id:
+                if len(runs) == limit:
+                    break
+                runs.append((run_id, []))
+            runs[-1][1].append((stage, rows, pages, predicted, actual))
+    for run_id, stages in runs:
+        print(f"Run {run_id}")
+        for stage, rows, pages, predicted, actual in stages:
+            rows = rows if rows is not None else "-"
+            pages = pages if pages is not None else "-"
+            predicted = f"{predicted:.1f}s" if predicted is not None else "-"
+            print(f"  {stage:34} {rows:>9} rows {pages:>6} pages  predicted {predicted:>8}  actual {actual:.1f}s")
+
+
+if __name__ == "__main__":
+    import logger
+    from fedpipeline.job_scheduler import STAGE_GROUPS, planned_stages
+    parser = argparse.ArgumentParser(description="Cost-based run planner")
+    parser.add_argument("--groups", nargs="+", choices=list(STAGE_GROUPS), help="Stage groups to plan (default: all)")
+    parser.add_argument("--windowed", action="store_true",
+                        help="Plan usage as the staging MERGE over its date window (runs after the first)")
+    parser.add_argument("--history", type=int, nargs="?", const=5, metavar="RUNS",
+                        help="Print predicted and actual stage times of the last RUNS runs instead")
+    args = parser.parse_args()
+
+    if args.history:
+        print_history(args.history)
+    else:
+        groups = [group for group in STAGE_GROUPS if not args.groups or group in args.groups]
+        plan = plan_run(None, planned_stages(groups, is_first_run=not args.windowed), args.windowed)
+        for line in plan.summary():
+            print(line)
@@ -0,0 +1,150 @@
+import logging
+from typing import Dict, List, Optional
+from fedpipeline.api_handler import last_request_rejected
+from fedpipeline.config import SIDELOAD_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.keyset_paging import SeenIds
+from fedpipeline.parent_keys import ParentKeyIndex
+
+# Relationships a listing asks for with include= (relationship -> type of the
+# included resources). Units are not sideloaded: the API only gives a unit's
+# school through the per-school listing.
+SIDELOAD_RELATIONSHIPS = {
+    "reading-lists": {"teaching-session": "teaching-sessions"},
+    "reading-list-items": {"list": "reading-lists", "reading": "readings"},
+    "unit-offerings": {"reading-list": "reading-lists"},
+}
+
+# Table the included resources of each type are loaded into
+SIDELOAD_TABLES = {
+    "readings": "Reading",
+    "teaching-sessions": "TeachingSession",
+    "reading-lists": "ReadingList",
+}
+
+# Entities whose server rejected or ignored include=; they are listed without
+# it until the next run
+_include_unsupported = set()
+
+
+def reset_include_fallbacks():
+    # At the start of a run: servers that refused include= are asked again
+    _include_unsupported.clear()
+
+
+def sideloading_active(entity: Optional[str]) -> bool:
+    return (SIDELOAD_CONFIG.get("ENABLED", True) and entity in SIDELOAD_RELATIONSHIPS
+            and entity not in _include_unsupported)
+
+
+class Sideloads:
+    # The included resources of one listing, each once per type. They are
+    # inserted FLUSH_ROWS at a time as pages arrive and then let go, so a
+    # long crawl only holds their ids. A server that ignores include= is
+    # detected from the first page (linkage in the data but no "included"
+    # member) and the listing carries on without it.
+
+    def __init__(self, entity: str):
+        self.entity = entity
+        self.relationships: Dict[str, str] = dict(SIDELOAD_RELATIONSHIPS[entity]) if sideloading_active(entity) else {}
+        self.items: Dict[str, List[Dict]] = {}
+        self.flush_rows = SIDELOAD_CONFIG.get("FLUSH_ROWS", 5000)
+        # Included resources collected and table -> rows inserted, over every flush
+        self.collected = 0
+        self.added: Dict[str, int] = {}
+        self._seen: Dict[str, SeenIds] = {}
+        self._checked = False
+
+    @property
+    def count(self) -> int:
+        return sum(len(items) for items in self.items.values())
+
+    def _linked(self, item: Dict) -> bool:
+        relationships = item.get("relationships") or {}
+        return any((relationships.get(name) or {}).get("data") for name in self.relationships)
+
+    def _unsupported(self, reason: str):
+        _include_unsupported.add(self.entity)
+        self.relationships = {}
+        logging.warning(f"{reason} for {self.entity}; listing it without sideloaded parents")
+
+    def add(self, data: List[Dict], included: Optional[List[Dict]]):
+        # data: (the start of) a page's primary data; included: its "included"
+        # member, None if the document had none
+        if not self.relationships:
+            return
+        if included is None:
+            if not self._checked and any(self._linked(item) for item in data):
+                self._unsupported("Server ignores include=")
+            self._checked = self._checked or bool(data)
+            return
+        self._checked = True
+        for resource in included:
+            resource_type = resource.get("type")
+            if resource_type not in SIDELOAD_TABLES:
+                continue
+            seen = self._seen.setdefault(resource_type, SeenIds(resource_type))
+            if seen.is_new(resource):
+                self.items.setdefault(resource_type, []).append(resource)
+        if self.flush_rows and self.count >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        # Inserts the resources collected since the last flush that the
+        # database does not have yet (and, with parent backfill on, their own
+        # missing parents), then drops them
+        if not self.count:
+            return
+        # parent_backfill uses the jobs formatters, and jobs uses this module
+        from fedpipeline.parent_backfill import ParentBackfill
+        backend = get_backend()
+        with backend.connect() as conn:
+            added = ParentBackfill(conn, ParentKeyIndex(conn), backend).backfill({}, self.by_table())
+        for table, count in added.items():
+            self.added[table] = self.added.get(table, 0) + count
+        self.collected += self.count
+        self.items = {}
+
+    def fallback(self, url: str) -> Optional[str]:
+        # Called when the first request failed: if the server refused it
+        # (400/422), returns the URL without include= and the included types'
+        # fieldsets. None if it had none or the failure was transient.
+        if not self.relationships or "include=" not in url or not last_request_rejected():
+            return None
+        names = set(self.relationships)
+        dropped = {"include"} | {f"fields[{included_type}]" for included_type in self.relationships.values()}
+        base, _, query = url.partition("?")
+        parts = []
+        for part in query.split("&"):
+            key, _, value = part.partition("=")
+            if key in dropped:
+                continue
+            if key == f"fields[{self.entity}]":
+                part = f"{key}={','.join(name for name in value.split(',') if name not in names)}"
+            parts.append(part)
+        self._unsupported("Request with include= refused")
+        return f"{base}?{'&'.join(parts)}" if parts else base
+
+    def by_table(self) -> Dict[str, List[Dict]]:
+        return {SIDELOAD_TABLES[resource_type]: items for resource_type, items in self.items.items()}
+
+
+def new_sideloads(entity: str) -> Optional[Sideloads]:
+    # A collector for the listing, or None when it has nothing to sideload
+    return Sideloads(entity) if sideloading_active(entity) else None
+
+
+def load_sideloads(sideloads: Optional[Sideloads]) -> Dict[str, int]:
+    # Called once the listing is fetched: inserts what is left since the last
+    # flush, so the listing's rows that reference the included resources are
+    # not orphans. Returns table -> rows inserted over the whole listing.
+    if not sideloads:
+        return {}
+    sideloads.flush()
+    if not sideloads.collected:
+        return {}
+    added = sideloads.added
+    breakdown = ", ".join(f"{count} {table}" for table, count in added.items())
+    logging.info(f"{sideloads.entity}: {sideloads.collected} sideloaded parents, "
+                 f"{sum(added.values())} of them new{f' ({breakdown})' if added else ''}")
+    return dict(added)
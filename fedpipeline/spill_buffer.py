@@ -0,0 +1,85 @@
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from typing import Iterable, Iterator, List, Tuple
+from fedpipeline.config import SPILL_CONFIG
+
+
+def estimate_row_bytes(row: Tuple) -> int:
+    # Rough in-memory size of a formatted row: the tuple plus its values
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class SpillBuffer:
+    # Collects formatted rows for one load within a memory budget. Past the
+    # budget the buffered rows are pickled, chunk by chunk, to a temporary
+    # file. chunks() streams everything back in the order it was added:
+    # first the spilled chunks, then the rows still in memory. Peak memory
+    # is the budget plus one chunk, however many rows go through.
+
+    def __init__(self, name: str, budget_bytes: int = None, chunk_rows: int = None, directory: str = None):
+        self.name = name
+        self.budget_bytes = budget_bytes or SPILL_CONFIG.get("MEMORY_BUDGET_MB", 256) * 1024 * 1024
+        self.chunk_rows = chunk_rows or SPILL_CONFIG.get("CHUNK_ROWS", 50000)
+        self.directory = directory or SPILL_CONFIG.get("DIRECTORY") or None
+        self._rows: List[Tuple] = []
+        self._bytes = 0
+        self._file = None
+        self.spilled_rows = 0
+        self.spilled_bytes = 0
+        self.count = 0
+
+    def extend(self, rows: Iterable[Tuple]):
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return
+        self._rows.extend(rows)
+        self.count += len(rows)
+        # One row per batch is sized; rows of a page are much alike
+        self._bytes += estimate_row_bytes(rows[0]) * len(rows)
+        if self._bytes >= self.budget_bytes:
+            self._spill()
+
+    def _spill(self):
+        if self._file is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            # Removed by the OS when closed, even if the process dies
+            self._file = tempfile.TemporaryFile(prefix=f"spill_{self.name}_", dir=self.directory)
+            logging.info(f"{self.name}: over the {self.budget_bytes // (1024 * 1024)}MB buffer budget; "
+                         f"spilling rows to disk")
+        for i in range(0, len(self._rows), self.chunk_rows):
+            pickle.dump(self._rows[i:i + self.chunk_rows], self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled_rows += len(self._rows)
+        self.spilled_bytes = self._file.tell()
+        self._rows = []
+        self._bytes = 0
+
+    def chunks(self) -> Iterator[List[Tuple]]:
+        if self._file is not None:
+            self._file.flush()
+            self._file.seek(0)
+            while True:
+                try:
+                    yield pickle.load(self._file)
+                except EOFError:
+                    break
+        for i in range(0, len(self._rows), self.chunk_rows):
+            yield self._rows[i:i + self.chunk_rows]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._rows = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
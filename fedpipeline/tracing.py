@@ -0,0 +1,261 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Span tracing of a run: run -> stage -> page -> HTTP request / JSON decode,
+    with row building and DB batches under their stages.
+
+    A span is the name, start, duration and attributes of one piece of work,
+    and it knows the span it ran under. The current span is held in a context
+    variable, so nested spans find their parent by themselves. Work handed to
+    a thread pool keeps its parent when the function is wrapped with
+    in_current_span(). Finished spans are kept in memory. At the end of the run
+    they are written as a Chrome trace-event file,
+    <log dir>/<OUTPUT_DIR>/run_<id>_<stamp>.json, which chrome://tracing and
+    https://ui.perfetto.dev open with one row per thread. Queue mode workers
+    write their own file per process. --merge combines the files of one run.
+
+    Usage:
+        python -m fedpipeline.main --once --trace
+        FEDPIPELINE_TRACE=1 python -m fedpipeline.work_queue
+        python -m fedpipeline.tracing --merge traces/run_42_*.json -o run_42.json
+-------------------------------------------------------------------------------
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+from fedpipeline.config import TRACING_CONFIG
+from fedpipeline.log_config import log_file
+
+_enabled = TRACING_CONFIG.get("ENABLED", False)
+_current: ContextVar[Optional["Span"]] = ContextVar("fedpipeline_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_events: List[Dict] = []
+_thread_names: Dict[int, str] = {}
+_dropped = 0
+_run_span: Optional["Span"] = None
+_run_token = None
+_run_path: Optional[str] = None
+
+
+def enable_tracing():
+    global _enabled
+    _enabled = True
+    logging.info("Tracing enabled")
+
+
+def is_tracing_enabled() -> bool:
+    return _enabled
+
+
+class Span:
+    def __init__(self, name: str, category: str, parent: Optional["Span"], args: Dict):
+        self.name = name
+        self.category = category
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.start_us = time.time_ns() // 1000
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def end(self, **args):
+        global _dropped
+        if self._ended:
+            return
+        self._ended = True
+        self.args.update(args)
+        event = {
+            "name": self.name, "cat": self.category, "ph": "X",
+            "ts": self.start_us, "dur": round((time.perf_counter() - self._start) * 1e6),
+            "pid": os.getpid(), "tid": self.thread_id,
+            "args": dict(self.args, span_id=self.span_id, parent_id=self.parent_id),
+        }
+        with _lock:
+            if len(_events) < TRACING_CONFIG.get("MAX_EVENTS", 500000):
+                _events.append(event)
+                _thread_names.setdefault(self.thread_id, threading.current_thread().name)
+            else:
+                _dropped += 1
+
+
+class _NoSpan:
+    # Stands in for a span while tracing is off
+    def set(self, **args):
+        pass
+
+    def end(self, **args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def start_span(name: str, category: str = "", parent: Optional[Span] = None, **args):
+    # A span that is not made current: for work that is interleaved with
+    # other spans, such as a streamed page that yields items as it decodes.
+    # The caller ends it with .end().
+    if not _enabled:
+        return _NO_SPAN
+    return Span(name, category, parent or _current.get(), args)
+
+
+@contextmanager
+def activate(current):
+    # Makes a span from start_span current for the block
+    if current is _NO_SPAN:
+        yield
+        return
+    token = _current.set(current)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, category: str = "", **args):
+    # The block's span, current within it. Yields the span so attributes
+    # known only at the end (rows, status) can be set on it.
+    if not _enabled:
+        yield _NO_SPAN
+        return
+    current = Span(name, category, _current.get(), args)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def traced(name: str, category: str = ""):
+    # Decorator: the function call as a span, with the length of a list result as rows
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with span(name, category) as current:
+                result = function(*args, **kwargs)
+                if isinstance(result, list):
+                    current.set(rows=len(result))
+                return result
+        return wrapper
+    return decorate
+
+
+def in_current_span(function):
+    # For thread pools: function runs under the span current where it was
+    # wrapped. Each call sets the span itself, so one wrapper can be mapped
+    # over many threads at once.
+    parent = _current.get()
+
+    @wraps(function)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def _trace_dir() -> str:
+    base = os.path.dirname(log_file()) if log_file() else os.getcwd()
+    return os.path.join(base, TRACING_CONFIG.get("OUTPUT_DIR", "traces"))
+
+
+def begin_run(run_id=None, name: str = "run"):
+    # Starts the root span of a run; spans until end_run() go to its file
+    global _run_span, _run_token, _run_path
+    if not _enabled:
+        return
+    end_run()
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_name = f"run_{run_id}_{stamp}" if run_id else f"run_{stamp}"
+    if name != "run":
+        # Queue workers add their process id, so a run's files do not collide
+        file_name += f"_pid{os.getpid()}"
+    _run_path = os.path.join(_trace_dir(), f"{file_name}.json")
+    _run_span = Span(name, "run", None, {"run_id": run_id} if run_id else {})
+    _run_token = _current.set(_run_span)
+    logging.info(f"Trace of this run will be written to {_run_path}")
+
+
+def end_run():
+    # Ends the root span and writes every span finished since begin_run()
+    global _run_span, _run_token, _run_path, _dropped
+    if _run_span is None:
+        return
+    _run_span.end()
+    try:
+        _current.reset(_run_token)
+    except ValueError:
+        # Ended from another context than the one that began the run
+        _current.set(None)
+    with _lock:
+        events, thread_names, dropped = list(_events), dict(_thread_names), _dropped
+        _events.clear()
+        _dropped = 0
+    path, _run_span, _run_token, _run_path = _run_path, None, None, None
+    try:
+        write_trace(path, events, thread_names)
+        logging.info(f"Wrote {len(events)} spans to {path}"
+                     + (f" ({dropped} more dropped past MAX_EVENTS)" if dropped else ""))
+    except Exception as e:
+        logging.error(f"Failed to write trace {path}: {e}")
+
+
+def write_trace(path: str, events: List[Dict], thread_names: Dict[int, str]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Process and thread names, so the viewer labels each row
+    pid = os.getpid()
+    metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"fedpipeline {pid}"}}]
+    metadata += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in thread_names.items()]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + sorted(events, key=lambda event: event["ts"]),
+                   "displayTimeUnit": "ms"}, f)
+    os.replace(tmp_path, path)
+
+
+def merge_traces(paths: List[str], output: str) -> int:
+    # One file from the per-process files of a run; returns the span count
+    events = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            events.extend(json.load(f).get("traceEvents", []))
+    metadata = [event for event in events if event.get("ph") == "M"]
+    spans = sorted((event for event in events if event.get("ph") != "M"), key=lambda event: event["ts"])
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + spans, "displayTimeUnit": "ms"}, f)
+    return len(spans)
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Run traces")
+    parser.add_argument("--merge", nargs="+", metavar="FILE", required=True,
+                        help="Trace files to combine, e.g. a queue run's coordinator and workers")
+    parser.add_argument("-o", "--output", required=True, help="Combined trace file")
+    args = parser.parse_args()
+    print(f"{merge_traces(args.merge, args.output)} spans written to {args.output}")
@@ -0,0 +1,213 @@
+import atexit
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from fedpipeline.config import TRANSFORM_POOL_CONFIG
+
+# Decoding a page and building its rows are CPU work that holds the GIL, so
+# with the pool on they run in worker processes. A page's raw body goes to a
+# worker, which sends back what paging needs as soon as the page is decoded
+# (ids, links, the first item and "included") and then the page's rows,
+# formatted by a jobs formatter, as one pickled list. The caller can fetch
+# the next page while the rows are still being built. The workers are
+# started on first use and serve every listing until the process exits.
+
+_enabled = TRANSFORM_POOL_CONFIG.get("ENABLED", False)
+_workers = TRANSFORM_POOL_CONFIG.get("WORKERS", 0)
+_pool: Optional["TransformPool"] = None
+_pool_lock = threading.Lock()
+
+
+def enable_transform_pool(workers: int = None):
+    global _enabled, _workers
+    _enabled = True
+    if workers:
+        _workers = workers
+    logging.info("Transform pool enabled")
+
+
+def is_transform_pool_enabled() -> bool:
+    return _enabled
+
+
+def worker_count() -> int:
+    # One per CPU, leaving one for the pipeline process's fetching and loading
+    return _workers or max(1, (os.cpu_count() or 2) - 1)
+
+
+class PageTransform:
+    # One page handed to the pool. ids, links, first and included wait for
+    # the worker to decode the page; rows() waits for its rows as well.
+
+    def __init__(self):
+        self._paging: Future = Future()
+        self._rows: Future = Future()
+
+    @property
+    def ids(self) -> List:
+        return self._paging.result()[0]
+
+    @property
+    def links(self) -> Dict:
+        return self._paging.result()[1]
+
+    @property
+    def first(self) -> Optional[Dict]:
+        return self._paging.result()[2]
+
+    @property
+    def included(self) -> Optional[List[Dict]]:
+        # None when the document has no "included" member or it was not asked for
+        return self._paging.result()[3]
+
+    def rows(self, keep: Optional[List[bool]] = None) -> Tuple[List[tuple], Optional[List]]:
+        # The page's rows and, when asked for, each record's updated-at; with
+        # keep (one flag per item, see SeenIds.fresh_mask) only those flagged
+        rows, updated = self._rows.result()
+        if keep is not None and not all(keep):
+            rows = list(itertools.compress(rows, keep))
+            updated = list(itertools.compress(updated, keep)) if updated is not None else None
+        return rows, updated
+
+    def _fail(self, error: Exception):
+        for future in (self._paging, self._rows):
+            if not future.done():
+                future.set_exception(error)
+
+
+def _work(tasks, results):
+    # Worker process loop: decode, report paging, format, report rows
+    from fedpipeline import jobs
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, body, formatter, args, included, stamps, hashed = task
+        try:
+            document = json.loads(body)
+            data = document.get("data") or []
+            results.put(("paging", task_id, (
+                [item.get("id") for item in data], document.get("links") or {},
+                data[0] if data else None, document.get("included") if included else None,
+            )))
+            rows = getattr(jobs, formatter)(data, *args)
+            if hashed:
+                rows = jobs.with_row_hash(rows)
+            updated = [(item.get("attributes") or {}).get("updated-at") for item in data] if stamps else None
+            results.put(("rows", task_id, (rows, updated)))
+        except Exception as e:
+            results.put(("error", task_id, f"{type(e).__name__}: {e}"))
+
+
+class TransformPool:
+    # Worker processes sharing one task queue. A reader thread hands each
+    # result to the PageTransform it belongs to, so any thread can submit.
+
+    def __init__(self, workers: int):
+        method = TRANSFORM_POOL_CONFIG.get("START_METHOD") or None
+        context = multiprocessing.get_context(method)
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending: Dict[int, PageTransform] = {}
+        self.broken: Optional[str] = None
+        self._closing = False
+        self._processes = [
+            context.Process(target=_work, args=(self._tasks, self._results), name=f"transform-{n}", daemon=True)
+            for n in range(1, workers + 1)
+        ]
+        for process in self._processes:
+            process.start()
+        self._reader = threading.Thread(target=self._read, name="transform-results", daemon=True)
+        self._reader.start()
+        logging.info(f"Started {workers} transform worker processes")
+
+    def submit(self, body: bytes, formatter: str, args: tuple = (), included: bool = False,
+               stamps: bool = False, hashed: bool = False) -> PageTransform:
+        # formatter: name of a jobs formatter, called as formatter(items, *args)
+        page = PageTransform()
+        with self._lock:
+            if self.broken:
+                raise RuntimeError(f"Transform pool unavailable: {self.broken}")
+            task_id = next(self._ids)
+            self._pending[task_id] = page
+        self._tasks.put((task_id, body, formatter, tuple(args), included, stamps, hashed))
+        return page
+
+    def _read(self):
+        while True:
+            try:
+                kind, task_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                if self._closing:
+                    return
+                dead = next((process for process in self._processes if not process.is_alive()), None)
+                if dead is not None:
+                    self._break(f"worker {dead.name} exited with code {dead.exitcode}")
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                page = self._pending.get(task_id) if kind == "paging" else self._pending.pop(task_id, None)
+            if page is None:
+                continue
+            if kind == "paging":
+                page._paging.set_result(payload)
+            elif kind == "rows":
+                page._rows.set_result(payload)
+            else:
+                page._fail(RuntimeError(f"Transform worker failed: {payload}"))
+
+    def _break(self, reason: str):
+        # A worker died: whatever it held is lost, so every waiting page fails
+        logging.error(f"Transform pool stopped: {reason}")
+        with self._lock:
+            self.broken = reason
+            pending, self._pending = list(self._pending.values()), {}
+        for page in pending:
+            page._fail(RuntimeError(f"Transform pool stopped: {reason}"))
+
+    def close(self):
+        self._closing = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._reader.join(timeout=5)
+
+
+def _get_pool() -> TransformPool:
+    # The pool, started on first use; a broken one is replaced
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.broken:
+            if _pool is not None:
+                _pool.close()
+            _pool = TransformPool(worker_count())
+        return _pool
+
+
+def submit_page(body: bytes, formatter, args: tuple = (), **options) -> PageTransform:
+    # Hands a page body to the pool; options as for TransformPool.submit
+    return _get_pool().submit(body, formatter.__name__, args, **options)
+
+
+def shutdown_transform_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(shutdown_transform_pool)
@@ -0,0 +1,230 @@
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Column types of the loaded tables, as declared in sql/db.sql. Rows are
+# converted to these before they are bound, so the driver gets native values
+# (and SQL Server input sizes) instead of JSON strings to convert per row.
+TABLE_COLUMN_TYPES = {
+    "IntegrationUser": {
+        "ereserve_id": "INT", "identifier": "NVARCHAR(255)", "roles": "NVARCHAR(255)",
+        "first_name": "NVARCHAR(255)", "last_name": "NVARCHAR(255)", "email": "NVARCHAR(100)",
+        "lti_consumer_user_id": "NVARCHAR(255)", "lti_lis_person_sourcedid": "NVARCHAR(255)",
+        "created_at": "DATETIME", "updated_at": "DATETIME",
+    },
+    "School": {"ereserve_id": "INT", "name": "NVARCHAR(255)"},
+    "Unit": {
+        "ereserve_id": "INT", "code": "NVARCHAR(100)", "name": "NVARCHAR(255)", "school_id": "INT",
+        "fedcode": "NVARCHAR(500)",
+    },
+    "FedUnit": {"unit_id": "INT", "unit_code": "VARCHAR(50)", "is_false": "BIT", "num_extracted": "INT"},
+    "TeachingSession": {
+        "ereserve_id": "INT", "name": "NVARCHAR(255)", "start_date": "DATE", "end_date": "DATE",
+        "archived": "BIT", "created_at": "DATETIME", "updated_at": "DATETIME", "code": "VARCHAR(10)",
+    },
+    "Reading": {
+        "ereserve_id": "INT", "reading_title": "NVARCHAR(1000)", "genre": "NVARCHAR(100)",
+        "source_document_title": "NVARCHAR(500)", "article_number": "NVARCHAR(100)",
+        "created_at": "DATETIME", "updated_at": "DATETIME",
+    },
+    "ReadingList": {
+        "ereserve_id": "INT", "unit_id": "INT", "teaching_session_id": "INT", "name": "NVARCHAR(255)",
+        "duration": "NVARCHAR(50)", "start_date": "DATE", "end_date": "DATE", "hidden": "BIT",
+        "usage_count": "BIGINT", "item_count": "BIGINT", "approved_item_count": "BIGINT", "deleted": "BIT",
+        "created_at": "DATETIME", "updated_at": "DATETIME",
+    },
+    "ReadingListItem": {
+        "ereserve_id": "INT", "list_id": "INT", "reading_id": "INT", "deleted": "BIT", "hidden": "BIT",
+        "reading_utilisations_count": "BIGINT", "reading_importance": "NVARCHAR(100)", "usage_count": "BIGINT",
+        "created_at": "DATETIME", "updated_at": "DATETIME",
+    },
+    "UnitOffering": {
+        "ereserve_id": "INT", "unit_id": "INT", "reading_list_id": "INT", "source_unit_code": "NVARCHAR(100)",
+        "source_unit_name": "NVARCHAR(255)", "source_unit_offering": "NVARCHAR(100)", "result": "NVARCHAR(255)",
+        "created_at": "DATETIME", "updated_at": "DATETIME",
+    },
+    "ReadingListUsage": {
+        "ereserve_id": "INT", "list_id": "INT", "integration_user_id": "INT", "item_usage_count": "BIGINT",
+        "created_at": "DATETIME", "updated_at": "DATETIME", "row_hash": "BIGINT",
+    },
+    "ReadingListItemUsage": {
+        "ereserve_id": "INT", "item_id": "INT", "list_usage_id": "INT", "integration_user_id": "INT",
+        "utilisation_count": "BIGINT", "created_at": "DATETIME", "updated_at": "DATETIME", "row_hash": "BIGINT",
+    },
+    "ReadingUtilisation": {
+        "ereserve_id": "INT", "integration_user_id": "INT", "item_id": "INT", "item_usage_id": "INT",
+        "created_at": "DATETIME", "updated_at": "DATETIME", "row_hash": "BIGINT",
+    },
+}
+
+_INSERT_COLUMNS_RE = re.compile(r"^\s*INSERT\s+INTO\s+\w+\s*\((?P<columns>[^)]*)\)\s*VALUES\s*\((?P<values>[^)]*)\)\s*$",
+                                re.IGNORECASE | re.DOTALL)
+
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n"}
+
+
+def bound_columns(query: str) -> Optional[List[str]]:
+    # The columns bound to ? placeholders in a plain INSERT ... VALUES, in
+    # parameter order; None for anything else (e.g. an UPDATE)
+    match = _INSERT_COLUMNS_RE.match(query)
+    if not match:
+        return None
+    columns = [column.strip() for column in match.group("columns").split(",")]
+    values = [value.strip() for value in match.group("values").split(",")]
+    if len(columns) != len(values):
+        return None
+    return [column for column, value in zip(columns, values) if value == "?"]
+
+
+def base_type(column_type: str) -> Tuple[str, Optional[int]]:
+    # "NVARCHAR(255) NOT NULL" -> ("NVARCHAR", 255)
+    match = re.match(r"\s*(\w+)\s*(?:\(\s*(\d+)\s*\))?", column_type)
+    name, size = match.group(1).upper(), match.group(2)
+    return name, int(size) if size else None
+
+
+def to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    if value == "":
+        # An empty attribute has no value; it is not 0
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"not an integer: {value!r}")
+    return int(value)
+
+
+def to_bool(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if not text:
+            # An empty attribute has no value; it is not False
+            return None
+        if text in _TRUE:
+            return True
+        if text in _FALSE:
+            return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime(text: str) -> datetime:
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    # DATETIME has no offset. The clock time is kept as written, as it was
+    # when the strings were bound as-is; converting to UTC would shift new
+    # rows against every timestamp already stored.
+    return datetime.fromisoformat(text).replace(tzinfo=None)
+
+
+def to_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = value.strip()
+    return _parse_datetime(text) if text else None
+
+
+@lru_cache(maxsize=65536)
+def _parse_date(text: str) -> date:
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return _parse_datetime(text).date()
+
+
+def to_date(value):
+    if value is None:
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = value.strip()
+    return _parse_date(text) if text else None
+
+
+def string_converter(size: Optional[int]):
+    def to_str(value):
+        if value is None:
+            return value
+        text = value if isinstance(value, str) else str(value)
+        if size is not None and len(text) > size:
+            raise ValueError(f"longer than {size} characters: {text[:40]!r}...")
+        return text
+    return to_str
+
+
+def converter(column_type: str):
+    name, size = base_type(column_type)
+    if name in ("INT", "BIGINT", "SMALLINT", "TINYINT", "INTEGER"):
+        return to_int
+    if name == "BIT":
+        return to_bool
+    if name in ("DATETIME", "DATETIME2"):
+        return to_datetime
+    if name == "DATE":
+        return to_date
+    return string_converter(size)
+
+
+class TypedBatch:
+    # A batch of rows converted column by column to the target column types.
+    # Rows with a value that does not convert are set aside in `rejected`
+    # (with the reason) instead of failing at the database.
+
+    __slots__ = ("table", "columns", "types", "rows", "rejected")
+
+    def __init__(self, table: str, columns: Sequence[str], types: Sequence[str], rows: List[Tuple]):
+        self.table = table
+        self.columns = list(columns)
+        self.types = list(types)
+        self.rows: List[Tuple] = []
+        self.rejected: List[Tuple[Tuple, str]] = []
+        self._convert(rows)
+
+    def _convert(self, rows: List[Tuple]):
+        if not rows:
+            return
+        width = len(self.columns)
+        if any(len(row) != width for row in rows):
+            raise ValueError(f"{self.table}: rows do not match the {width} bound columns {self.columns}")
+        bad: Dict[int, str] = {}
+        converted = []
+        for position, (column, values) in enumerate(zip(self.columns, zip(*rows))):
+            convert = converter(self.types[position])
+            try:
+                converted.append(list(map(convert, values)))
+                continue
+            except (TypeError, ValueError, AttributeError):
+                pass
+            # Slow path only for a column that has a bad value somewhere
+            column_values = []
+            for index, value in enumerate(values):
+                try:
+                    column_values.append(convert(value))
+                except (TypeError, ValueError, AttributeError) as e:
+                    bad.setdefault(index, f"{column} ({self.types[position]}): {e}")
+                    column_values.append(None)
+            converted.append(column_values)
+        for index, row in enumerate(zip(*converted)):
+            if index in bad:
+                self.rejected.append((rows[index], bad[index]))
+            else:
+                self.rows.append(row)
+
+    @classmethod
+    def for_query(cls, table: str, query: str, rows: List[Tuple]) -> Optional["TypedBatch"]:
+        # None when the table or statement is not one we know the types for
+        column_types = TABLE_COLUMN_TYPES.get(table)
+        columns = bound_columns(query)
+        if not column_types or not columns or any(column not in column_types for column in columns):
+            return None
+        return cls(table, columns, [column_types[column] for column in columns], rows)
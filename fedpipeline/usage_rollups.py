@@ -0,0 +1,251 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    Usage rollup tables, maintained incrementally by the staging MERGE.
+
+    UsageDailyByUnitSession counts usage rows per unit, teaching session and
+    day (the created_at date), UsageDailyByReading per reading and day. Each
+    usage table feeds one measure: ReadingListUsage -> list_usages,
+    ReadingListItemUsage -> item_usages, ReadingUtilisation -> utilisations.
+
+    Just before a usage table is merged, the rows the MERGE is about to write
+    become signed deltas: +1 under the rollup key of each new or changed row,
+    -1 under the key of the version it replaces. After the merges the deltas
+    are added to the rollups in the same transaction, so a run only touches
+    the keys of the rows it merged.
+
+    Rollups are rebuilt from scratch when they are empty, after usage was
+    loaded without the staging MERGE (first run, fallback) and after hard
+    deletes of usage rows by reconciliation. Soft-deleted rows still count.
+    Units, sessions and readings are resolved when a row is merged; if the
+    catalogue later moves an item or list, --rebuild re-attributes old usage.
+
+    Usage:
+        python -m fedpipeline.usage_rollups --rebuild   # recompute from the usage tables
+        python -m fedpipeline.usage_rollups --verify    # compare with a full recompute
+-------------------------------------------------------------------------------
+"""
+import argparse
+import logging
+import time
+from typing import Dict, List
+from fedpipeline.config import USAGE_ROLLUP_CONFIG
+from fedpipeline.db_backend import get_backend
+
+_ITEM_JOIN = "JOIN ReadingListItem rli ON rli.ereserve_id = u.item_id"
+_LIST_VIA_ITEM_JOIN = f"{_ITEM_JOIN} JOIN ReadingList rl ON rl.ereserve_id = rli.list_id"
+
+# Rollup table -> key expressions over the joined ReadingList rl / ReadingListItem rli
+# (usage_date is always the last key) and, per usage table u, the measure it
+# counts and the joins from u to those tables
+ROLLUPS = {
+    "UsageDailyByUnitSession": {
+        "keys": {
+            "unit_id": "COALESCE(rl.unit_id, 0)",
+            "teaching_session_id": "COALESCE(rl.teaching_session_id, 0)",
+        },
+        "sources": {
+            "ReadingListUsage": ("list_usages", "JOIN ReadingList rl ON rl.ereserve_id = u.list_id"),
+            "ReadingListItemUsage": ("item_usages", _LIST_VIA_ITEM_JOIN),
+            "ReadingUtilisation": ("utilisations", _LIST_VIA_ITEM_JOIN),
+        },
+    },
+    "UsageDailyByReading": {
+        "keys": {
+            "reading_id": "COALESCE(rli.reading_id, 0)",
+        },
+        "sources": {
+            "ReadingListItemUsage": ("item_usages", _ITEM_JOIN),
+            "ReadingUtilisation": ("utilisations", _ITEM_JOIN),
+        },
+    },
+}
+
+ROLLUP_SOURCE_TABLES = ("ReadingListUsage", "ReadingListItemUsage", "ReadingUtilisation")
+
+
+def rollup_keys(rollup: str) -> List[str]:
+    return list(ROLLUPS[rollup]["keys"]) + ["usage_date"]
+
+
+def rollup_measures(rollup: str) -> List[str]:
+    return [measure for measure, _ in ROLLUPS[rollup]["sources"].values()]
+
+
+def is_rollups_enabled() -> bool:
+    return USAGE_ROLLUP_CONFIG.get("ENABLED", True)
+
+
+class UsageRollups:
+    # Works on the caller's connection and leaves committing to it, so the
+    # rollups change in the same transaction as the usage rows
+
+    def __init__(self, conn, batch_id: str = "rollup", backend=None):
+        self.conn = conn
+        self.batch_id = batch_id
+        self.backend = backend or get_backend()
+        self.mode = None
+
+    def delta_table(self, rollup: str) -> str:
+        return self.backend.temp_table_name(f"RollupDelta_{rollup}_{self.batch_id}")
+
+    def _rows_sql(self, rollup: str, source_table: str, rows: str, sign: int) -> str:
+        # One row per usage row in `rows` (a table or a parenthesised query):
+        # its rollup key and `sign` in the measure that source counts
+        measure, joins = ROLLUPS[rollup]["sources"][source_table]
+        usage_date = self.backend.date_sql("u.created_at")
+        columns = [f"{expr} AS {key}" for key, expr in ROLLUPS[rollup]["keys"].items()]
+        columns.append(f"{usage_date} AS usage_date")
+        columns += [f"{sign if col == measure else 0} AS {col}" for col in rollup_measures(rollup)]
+        return f"SELECT {', '.join(columns)} FROM {rows} u {joins} WHERE {usage_date} IS NOT NULL"
+
+    def _grouped_sql(self, rollup: str, union_sql: str) -> str:
+        keys = ", ".join(rollup_keys(rollup))
+        sums = ", ".join(f"SUM({col}) AS {col}" for col in rollup_measures(rollup))
+        return f"SELECT {keys}, {sums} FROM ({union_sql}) d GROUP BY {keys}"
+
+    def full_sql(self, rollup: str) -> str:
+        parts = [self._rows_sql(rollup, table, table, 1) for table in ROLLUPS[rollup]["sources"]]
+        return self._grouped_sql(rollup, " UNION ALL ".join(parts))
+
+    def available(self) -> bool:
+        cursor = self.conn.cursor()
+        return is_rollups_enabled() and all(self.backend.table_exists(cursor, rollup) for rollup in ROLLUPS)
+
+    def prepare(self) -> str:
+        # off: disabled or tables missing, rebuild: a rollup is empty,
+        # incremental: deltas are captured around each merge
+        if not self.available():
+            self.mode = "off"
+            return self.mode
+        cursor = self.conn.cursor()
+        self.mode = "incremental"
+        for rollup in ROLLUPS:
+            cursor.execute(f"SELECT CASE WHEN EXISTS (SELECT 1 FROM {rollup}) THEN 1 ELSE 0 END")
+            if not cursor.fetchone()[0]:
+                self.mode = "rebuild"
+        if self.mode == "incremental":
+            for rollup in ROLLUPS:
+                keys = rollup_keys(rollup)
+                columns = [(key, "DATE" if key == "usage_date" else "INT") for key in keys]
+                columns += [(measure, "BIGINT") for measure in rollup_measures(rollup)]
+                statements = self.backend.create_temp_table_statements(
+                    f"RollupDelta_{rollup}_{self.batch_id}", columns, {f"IX_RollupDelta_{rollup}": ", ".join(keys)}
+                )
+                for statement in statements:
+                    cursor.execute(statement)
+        return self.mode
+
+    def capture(self, source_table: str, source_query: str):
+        # Call before source_table is merged from source_query (which must
+        # yield ereserve_id, row_hash and the usage columns)
+        if self.mode != "incremental":
+            return
+        # The same rows the MERGE writes: new ones, and existing ones whose hash differs
+        written = f"""(SELECT s.* FROM ({source_query}) s
+            WHERE NOT EXISTS (SELECT 1 FROM {source_table} r
+                              WHERE r.ereserve_id = s.ereserve_id AND r.row_hash = s.row_hash))"""
+        replaced = f"""(SELECT r.* FROM {source_table} r
+            JOIN ({source_query}) s ON r.ereserve_id = s.ereserve_id
+            WHERE r.row_hash IS NULL OR r.row_hash <> s.row_hash)"""
+        cursor = self.conn.cursor()
+        for rollup, spec in ROLLUPS.items():
+            if source_table not in spec["sources"]:
+                continue
+            union_sql = (f"{self._rows_sql(rollup, source_table, written, 1)} UNION ALL "
+                         f"{self._rows_sql(rollup, source_table, replaced, -1)}")
+            columns = ", ".join(rollup_keys(rollup) + rollup_measures(rollup))
+            cursor.execute(f"INSERT INTO {self.delta_table(rollup)} ({columns}) {self._grouped_sql(rollup, union_sql)}")
+
+    def apply(self) -> Dict[str, int]:
+        # Adds the captured deltas (or rebuilds); returns rollup -> keys written
+        if self.mode == "rebuild":
+            return self.rebuild()
+        written = {}
+        if self.mode != "incremental":
+            return written
+        cursor = self.conn.cursor()
+        for rollup in ROLLUPS:
+            keys, measures = rollup_keys(rollup), rollup_measures(rollup)
+            delta_sql = (f"SELECT * FROM ({self._grouped_sql(rollup, f'SELECT * FROM {self.delta_table(rollup)}')}) g "
+                         f"WHERE {' OR '.join(f'{col} <> 0' for col in measures)}")
+            cursor.execute(self.backend.accumulate_from_select_sql(rollup, keys, measures, delta_sql))
+            written[rollup] = max(cursor.rowcount, 0)
+            # Keys whose rows all moved elsewhere drop to zero
+            cursor.execute(f"""
+                DELETE FROM {rollup}
+                WHERE {' AND '.join(f'{col} = 0' for col in measures)}
+                  AND EXISTS (SELECT 1 FROM {self.delta_table(rollup)} d
+                              WHERE {' AND '.join(f'd.{key} = {rollup}.{key}' for key in keys)})
+            """)
+        logging.info(f"Usage rollups updated: {', '.join(f'{rollup} {count} keys' for rollup, count in written.items())}")
+        return written
+
+    def clear(self):
+        # Empties the delta tables once apply() has added them, for the next transaction
+        if self.mode != "incremental":
+            return
+        cursor = self.conn.cursor()
+        for rollup in ROLLUPS:
+            cursor.execute(f"DELETE FROM {self.delta_table(rollup)}")
+
+    def rebuild(self) -> Dict[str, int]:
+        cursor = self.conn.cursor()
+        written = {}
+        for rollup in ROLLUPS:
+            start_time = time.time()
+            columns = ", ".join(rollup_keys(rollup) + rollup_measures(rollup))
+            cursor.execute(f"DELETE FROM {rollup}")
+            cursor.execute(f"INSERT INTO {rollup} ({columns}) {self.full_sql(rollup)}")
+            written[rollup] = max(cursor.rowcount, 0)
+            logging.info(f"Rebuilt {rollup}: {written[rollup]} keys in {time.time() - start_time:.1f}s")
+        return written
+
+    def verify(self) -> Dict[str, int]:
+        # rollup -> number of keys that differ from a full recompute
+        cursor = self.conn.cursor()
+        differences = {}
+        for rollup in ROLLUPS:
+            current = f"SELECT {', '.join(rollup_keys(rollup) + rollup_measures(rollup))} FROM {rollup}"
+            full = self.full_sql(rollup)
+            count = 0
+            for left, right in ((full, current), (current, full)):
+                cursor.execute(f"SELECT COUNT(*) FROM ({left} EXCEPT {right}) x")
+                count += cursor.fetchone()[0]
+            differences[rollup] = count
+        return differences
+
+
+def rebuild_usage_rollups() -> Dict[str, int]:
+    backend = get_backend()
+    with backend.connect() as conn:
+        rollups = UsageRollups(conn, backend=backend)
+        if not rollups.available():
+            logging.info("Usage rollups are disabled or not created yet (migration 0002); skipping rebuild")
+            return {}
+        written = rollups.rebuild()
+        conn.commit()
+    return written
+
+
+def verify_usage_rollups() -> Dict[str, int]:
+    backend = get_backend()
+    with backend.connect() as conn:
+        return UsageRollups(conn, backend=backend).verify()
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Rebuild or check the usage rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every rollup from the usage tables")
+    parser.add_argument("--verify", action="store_true", help="Count rollup keys that differ from a full recompute")
+    args = parser.parse_args()
+    if not (args.rebuild or args.verify):
+        parser.error("nothing to do: pass --rebuild and/or --verify")
+
+    if args.rebuild:
+        for rollup, count in rebuild_usage_rollups().items():
+            print(f"{rollup:<26} {count} keys")
+    if args.verify:
+        for rollup, count in verify_usage_rollups().items():
+            print(f"{rollup:<26} {'ok' if count == 0 else f'{count} keys differ'}")
@@ -1,33 +1,131 @@
 import logging
-import pyodbc
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
-from contextlib import contextmanager
-from fedpipeline.api_handler import fetch_data_from_api
-from fedpipeline.config import API_CONFIG, PAGE_SIZE, DATE_FILTER_CONFIG, DB_CONFIG
+from contextlib import ExitStack, contextmanager
+from fedpipeline.api_handler import fetch_data_from_api, last_request_rejected
+from fedpipeline.config import API_CONFIG, DATE_FILTER_CONFIG, DB_LOAD_CONFIG, STREAMING_CONFIG
+from fedpipeline.db_backend import get_backend
+from fedpipeline.entity_state import ChangeTracker
+from fedpipeline.jobs import (
+    format_reading_list_usage, format_reading_list_item_usage, format_reading_utilisation, with_row_hash,
+    with_sparse_fields, sparse_fields_fallback, check_sparse_fields
+)
+from fedpipeline.json_stream import PageStream
+from fedpipeline.keyset_paging import KeysetCursor, SeenIds
+from fedpipeline.parent_backfill import BACKFILL_TABLES, ParentBackfill, is_backfill_enabled
+from fedpipeline.parent_keys import ParentKeyIndex, as_key
+from fedpipeline.profiler import profile_stage
+from fedpipeline.run_planner import planned_load, planned_page_size
+from fedpipeline.tracing import span
+from fedpipeline.transform_pool import is_transform_pool_enabled, submit_page
+from fedpipeline.typed_batches import TypedBatch
+from fedpipeline.usage_rollups import UsageRollups
+
+# Staging table layouts for the usage tables, in load order. row_hash is a
+# content hash of the other columns (see jobs.row_hash) used to skip no-op updates
+STAGING_TABLES = {
+    'ReadingListUsage': {
+        'columns': [
+            ('ereserve_id', 'INT PRIMARY KEY'),
+            ('list_id', 'INT'),
+            ('integration_user_id', 'INT'),
+            ('item_usage_count', 'BIGINT'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+            ('row_hash', 'BIGINT'),
+        ],
+        'indexes': {
+            'IX_Stage_RLU_ListId': 'list_id',
+            'IX_Stage_RLU_UserId': 'integration_user_id',
+        },
+    },
+    'ReadingListItemUsage': {
+        'columns': [
+            ('ereserve_id', 'INT PRIMARY KEY'),
+            ('item_id', 'INT'),
+            ('list_usage_id', 'INT'),
+            ('integration_user_id', 'INT'),
+            ('utilisation_count', 'BIGINT'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+            ('row_hash', 'BIGINT'),
+        ],
+        'indexes': {
+            'IX_Stage_RLIU_ItemId': 'item_id',
+            'IX_Stage_RLIU_ListUsageId': 'list_usage_id',
+        },
+    },
+    'ReadingUtilisation': {
+        'columns': [
+            ('ereserve_id', 'INT PRIMARY KEY'),
+            ('integration_user_id', 'INT'),
+            ('item_id', 'INT'),
+            ('item_usage_id', 'INT'),
+            ('created_at', 'DATETIME'),
+            ('updated_at', 'DATETIME'),
+            ('row_hash', 'BIGINT'),
+        ],
+        'indexes': {
+            'IX_Stage_RU_ItemUsageId': 'item_usage_id',
+            'IX_Stage_RU_ItemId': 'item_id',
+        },
+    },
+}
+
+# Parent references the MERGE requires, per usage table: (column, parent table,
+# missing-dependency breakdown name, NULL allowed). Used by the in-process
+# parent key filter; the database checks are in validate_dependencies_from_db
+# and finalize_staging_to_main
+PARENT_CHECKS = {
+    'ReadingListUsage': [
+        ('list_id', 'ReadingList', 'ReadingListUsage_missing_lists', False),
+        ('integration_user_id', 'IntegrationUser', 'ReadingListUsage_missing_users', False),
+    ],
+    'ReadingListItemUsage': [
+        ('item_id', 'ReadingListItem', 'ReadingListItemUsage_missing_items', False),
+        ('list_usage_id', 'ReadingListUsage', 'ReadingListItemUsage_missing_list_usage', False),
+        ('integration_user_id', 'IntegrationUser', 'ReadingListItemUsage_missing_users', False),
+    ],
+    'ReadingUtilisation': [
+        ('item_id', 'ReadingListItem', 'ReadingUtilisation_missing_items', False),
+        ('item_usage_id', 'ReadingListItemUsage', 'ReadingUtilisation_missing_item_usage', False),
+        ('integration_user_id', 'IntegrationUser', 'ReadingUtilisation_missing_users', True),
+    ],
+}
+
+def staging_columns(table_name: str) -> List[str]:
+    return [col for col, _ in STAGING_TABLES[table_name]['columns']]
 
 class UsageStagingProcessor:
     def __init__(self):
-        self.conn_str = (
-            f"DRIVER={{{DB_CONFIG['DRIVER']}}};"
-            f"SERVER={DB_CONFIG['SERVER']};"
-            f"DATABASE={DB_CONFIG['DATABASE']};"
-            f"UID={DB_CONFIG['UID']};"
-            f"PWD={DB_CONFIG['PWD']}"
-        )
+        self.backend = get_backend()
         self.batch_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Finalisation state kept across a retry within this run (not across
+        # processes): with MERGE_CHUNK_ROWS each table's last committed
+        # ereserve_id and the tables already finished
+        self.rollups: Optional[UsageRollups] = None
+        self.merge_counts: Dict[str, Tuple[int, int]] = {}
+        self.merged_ranges: Dict[str, int] = {}
+        self.merged_tables = set()
+        # Per usage table, the entity state that committed merges are added to
+        self.trackers: Dict[str, ChangeTracker] = {}
+        # True once orphans have been dropped in process, before staging
+        self.parents_filtered = False
         self.metrics = {
             'start_time': None,
             'end_time': None,
             'records_processed': 0,
             'records_inserted': 0,
             'records_updated': 0,
+            'records_unchanged': 0,
             'records_skipped': 0,
             'duplicates_skipped': 0,
+            'unchanged_dropped': 0,
             'orphaned_records': 0,
             'total_missing_dependencies': 0,
             'missing_dependency_breakdown': {},
+            'parents_backfilled': {},
             'errors': []
         }
     
@@ -55,8 +153,7 @@ class UsageStagingProcessor:
     def get_connection(self):
         conn = None
         try:
-            conn = pyodbc.connect(self.conn_str)
-            conn.autocommit = False
+            conn = self.backend.connect(autocommit=False)
             yield conn
         except Exception as e:
             if conn:
@@ -67,71 +164,32 @@ class UsageStagingProcessor:
             if conn:
                 conn.close()
     
+    def stage_table(self, table_name: str) -> str:
+        return self.backend.temp_table_name(f"STAGE_{table_name}_{self.batch_id}")
+    
+    @property
+    def log_table(self) -> str:
+        return self.backend.temp_table_name(f"ProcessingLog_{self.batch_id}")
+    
     def create_staging_tables(self, conn) -> bool:
-        staging_ddl = {
-            'ProcessingLog': f"""
-                CREATE TABLE #ProcessingLog_{self.batch_id} (
-                    log_id INT IDENTITY(1,1) PRIMARY KEY,
-                    batch_id VARCHAR(50),
-                    table_name VARCHAR(100),
-                    operation VARCHAR(50),
-                    record_count INT,
-                    execution_time_ms INT,
-                    created_at DATETIME DEFAULT GETDATE()
-                )
-            """,
-            'ReadingListUsage': f"""
-                CREATE TABLE #STAGE_ReadingListUsage_{self.batch_id} (
-                    ereserve_id INT PRIMARY KEY,
-                    list_id INT,
-                    integration_user_id INT,
-                    item_usage_count BIGINT,
-                    created_at DATETIME,
-                    updated_at DATETIME
-                );
-                CREATE INDEX IX_Stage_RLU_ListId ON #STAGE_ReadingListUsage_{self.batch_id}(list_id);
-                CREATE INDEX IX_Stage_RLU_UserId ON #STAGE_ReadingListUsage_{self.batch_id}(integration_user_id);
-            """,
-            'ReadingListItemUsage': f"""
-                CREATE TABLE #STAGE_ReadingListItemUsage_{self.batch_id} (
-                    ereserve_id INT PRIMARY KEY,
-                    item_id INT,
-                    list_usage_id INT,
-                    integration_user_id INT,
-                    utilisation_count BIGINT,
-                    created_at DATETIME,
-                    updated_at DATETIME
-                );
-                CREATE INDEX IX_Stage_RLIU_ItemId ON #STAGE_ReadingListItemUsage_{self.batch_id}(item_id);
-                CREATE INDEX IX_Stage_RLIU_ListUsageId ON #STAGE_ReadingListItemUsage_{self.batch_id}(list_usage_id);
-            """,
-            'ReadingUtilisation': f"""
-                CREATE TABLE #STAGE_ReadingUtilisation_{self.batch_id} (
-                    ereserve_id INT PRIMARY KEY,
-                    integration_user_id INT,
-                    item_id INT,
-                    item_usage_id INT,
-                    created_at DATETIME,
-                    updated_at DATETIME
-                );
-                CREATE INDEX IX_Stage_RU_ItemUsageId ON #STAGE_ReadingUtilisation_{self.batch_id}(item_usage_id);
-                CREATE INDEX IX_Stage_RU_ItemId ON #STAGE_ReadingUtilisation_{self.batch_id}(item_id);
-            """
-        }
+        staging_ddl = {'ProcessingLog': self.backend.processing_log_statements(f"ProcessingLog_{self.batch_id}")}
+        for table_name, spec in STAGING_TABLES.items():
+            staging_ddl[table_name] = self.backend.create_temp_table_statements(
+                f"STAGE_{table_name}_{self.batch_id}", spec['columns'], spec['indexes']
+            )
         
         try:
             cursor = conn.cursor()
-            for table_name, ddl in staging_ddl.items():
+            for table_name, statements in staging_ddl.items():
                 start_time = time.time()
-                for statement in ddl.split(';'):
-                    if statement.strip():
-                        cursor.execute(statement.strip())
+                for statement in statements:
+                    cursor.execute(statement)
                 
                 execution_time = int((time.time() - start_time) * 1000)
                 logging.info(f"Created staging table: {table_name} in {execution_time}ms")
                 
                 cursor.execute(f"""
-                    INSERT INTO #ProcessingLog_{self.batch_id} 
+                    INSERT INTO {self.log_table} 
                     (batch_id, table_name, operation, record_count, execution_time_ms)
                     VALUES (?, ?, ?, ?, ?)
                 """, (self.batch_id, table_name, 'CREATE_STAGING', 0, execution_time))
@@ -144,14 +202,57 @@ class UsageStagingProcessor:
             self.metrics['errors'].append(f"Staging table creation: {e}")
             return False
     
-    def fetch_all_pages_with_retry(self, url: str, max_retries: int = 3) -> List[Dict]:
+    def fetch_all_pages_with_retry(self, url: str, max_retries: int = 3, entity: str = None,
+                                   formatter=None, tracker: ChangeTracker = None) -> List:
+        # With entity, only the mapped attributes are requested (see jobs.ENTITY_ATTRIBUTES).
+        # With formatter, pages are decoded and formatted in the transform pool
+        # and the hashed rows of records tracker finds changed are returned
+        # instead of the items.
+        if entity:
+            url = with_sparse_fields(url, entity)
+        # Keyset pages where the server supports it, and no record twice either way
+        cursor = KeysetCursor(url, entity)
+        seen = SeenIds(entity)
+        url = cursor.first_url()
         all_items = []
+        pooled_pages = []
+        fetched = 0
         retry_count = 0
+        streaming = STREAMING_CONFIG.get("ENABLED", False) and not formatter
         
+        pages = 0
         while url and retry_count <= max_retries:
             try:
-                response = fetch_data_from_api(url)
+                with span("page", "page", entity=entity, number=pages + 1) as page_span:
+                    response = fetch_data_from_api(url, stream=streaming)
+                    if response:
+                        with span("json.decode", "decode", streaming=streaming, pooled=bool(formatter)):
+                            if formatter:
+                                # The worker reports what paging needs before it builds the rows
+                                page = submit_page(response.content, formatter, stamps=True, hashed=True)
+                                ids, links, first = page.ids, page.links, page.first
+                            elif streaming:
+                                # Whole pages are still collected so a failed page can be
+                                # retried, but without building the page dict first
+                                page = PageStream(response.iter_content(STREAMING_CONFIG.get("CHUNK_SIZE", 65536)))
+                                data = list(page.items())
+                                links = page.links
+                            else:
+                                body = response.json()
+                                data = body.get("data", [])
+                                links = body.get("links", {})
+                            if not formatter:
+                                ids = [item.get("id") for item in data]
+                                first = data[0] if data else None
+                        page_span.set(items=len(ids))
                 if not response:
+                    # A refused first request (400/422) is retried without the optional
+                    # parameters; anything else goes through the retries below as it is
+                    fallback_url = ((cursor.fallback(url) or sparse_fields_fallback(url, entity))
+                                    if not pages and last_request_rejected() else None)
+                    if fallback_url:
+                        url = fallback_url
+                        continue
                     retry_count += 1
                     if retry_count <= max_retries:
                         wait_time = 2 ** retry_count
@@ -160,17 +261,21 @@ class UsageStagingProcessor:
                         continue
                     else:
                         break
+                pages += 1
                 
-                data = response.json().get("data", [])
-                links = response.json().get("links", {})
-                
-                if not data:
+                if not ids:
                     break
-                    
-                all_items.extend(data)
-                url = links.get("next")
+                
+                if pages == 1:
+                    check_sparse_fields(entity, [first])
+                url = cursor.next_url(ids, links)
+                if formatter:
+                    pooled_pages.append((page, seen.fresh_mask(ids)))
+                else:
+                    all_items.extend(seen.fresh(data))
+                fetched += len(ids)
                 retry_count = 0
-                logging.info(f"Fetched {len(data)} items, total: {len(all_items)}")
+                logging.info(f"Fetched {len(ids)} items, total: {fetched}")
                 
             except Exception as e:
                 retry_count += 1
@@ -183,10 +288,31 @@ class UsageStagingProcessor:
                     self.metrics['errors'].append(f"API fetch error: {e}")
                     break
         
+        for page, keep in pooled_pages:
+            rows, updated = page.rows(keep)
+            all_items.extend(tracker.changed_stamped(rows, updated) if tracker else rows)
+        seen.summary()
+        self.metrics['duplicates_skipped'] += seen.duplicates
         return all_items
     
-    def build_filtered_url(self, base_url: str, start_date: str = None, end_date: str = None) -> str:
-        url = f"{base_url}?page[size]={PAGE_SIZE}"
+    def fetch_rows(self, table_name: str, url: str, entity: str, formatter) -> List[Tuple]:
+        # Fetch and transform of one usage table: hashed rows of the records
+        # that changed. With the transform pool on, pages are formatted in
+        # worker processes while later ones are fetched.
+        tracker = self.trackers[table_name]
+        if is_transform_pool_enabled():
+            with profile_stage(f"staging.fetch_{table_name}"):
+                rows = self.fetch_all_pages_with_retry(url, entity=entity, formatter=formatter, tracker=tracker)
+            with profile_stage(f"staging.transform_{table_name}"):
+                return tracker.changed_rows(rows)
+        with profile_stage(f"staging.fetch_{table_name}"):
+            data = self.fetch_all_pages_with_retry(url, entity=entity)
+        with profile_stage(f"staging.transform_{table_name}"):
+            return tracker.changed_rows(with_row_hash(formatter(tracker.changed(data))))
+    
+    def build_filtered_url(self, base_url: str, start_date: str = None, end_date: str = None,
+                           entity: str = None) -> str:
+        url = f"{base_url}?page[size]={planned_page_size(entity)}"
         
         if start_date and end_date:
             date_filter = f"BETWEEN {start_date} AND {end_date}"
@@ -203,34 +329,47 @@ class UsageStagingProcessor:
         
         return url
     
-    def bulk_load_to_staging(self, table_name: str, data: List[Tuple], conn, batch_size: int = 1000) -> bool:
+    def bulk_load_to_staging(self, table_name: str, data: List[Tuple], conn, batch_size: int = None) -> bool:
         if not data:
             logging.warning(f"No data to load into {table_name}")
             return True
         
-        table_queries = {
-            'ReadingListUsage': f"INSERT INTO #STAGE_ReadingListUsage_{self.batch_id} (ereserve_id, list_id, integration_user_id, item_usage_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-            'ReadingListItemUsage': f"INSERT INTO #STAGE_ReadingListItemUsage_{self.batch_id} (ereserve_id, item_id, list_usage_id, integration_user_id, utilisation_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            'ReadingUtilisation': f"INSERT INTO #STAGE_ReadingUtilisation_{self.batch_id} (ereserve_id, integration_user_id, item_id, item_usage_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)"
-        }
-        
-        query = table_queries.get(table_name)
-        if not query:
+        if table_name not in STAGING_TABLES:
             logging.error(f"Unknown table name: {table_name}")
             return False
         
+        columns = staging_columns(table_name)
+        query = (
+            f"INSERT INTO {self.stage_table(table_name)} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        strategy = DB_LOAD_CONFIG.get("STAGING_STRATEGY", "executemany")
+        if batch_size is None:
+            # Tables the run plan loads in bulk get its bigger batches
+            planned = planned_load(table_name, upsert=True)
+            batch_size = planned[1] if planned else 1000
+        input_types = None
+        if DB_LOAD_CONFIG.get("TYPED_BATCHES", True):
+            # Bad values are dropped here; in the database they would fail the whole batch
+            column_types = [col_type.split()[0] for _, col_type in STAGING_TABLES[table_name]['columns']]
+            batch = TypedBatch(table_name, columns, column_types, data)
+            for record, reason in batch.rejected[:20]:
+                logging.error(f"Invalid {table_name} record skipped: {record} | {reason}")
+            if batch.rejected:
+                logging.error(f"{len(batch.rejected)} {table_name} records skipped (invalid values)")
+                self.metrics['records_skipped'] += len(batch.rejected)
+            data, input_types = batch.rows, batch.types
+        
         try:
-            cursor = conn.cursor()
             start_time = time.time()
+            self.backend.load_rows(conn, query, data, table_name, strategy=strategy,
+                                   batch_size=batch_size, fallback_per_row=False, input_types=input_types)
+            logging.info(f"Loaded {(len(data) + batch_size - 1) // batch_size} batches ({len(data)} records) into {table_name} using {strategy}")
             
-            for i in range(0, len(data), batch_size):
-                batch = data[i:i + batch_size]
-                cursor.executemany(query, batch)
-                logging.info(f"Loaded batch {i//batch_size + 1} ({len(batch)} records) into {table_name}")
-            
+            cursor = conn.cursor()
             execution_time = int((time.time() - start_time) * 1000)
             cursor.execute(f"""
-                INSERT INTO #ProcessingLog_{self.batch_id} 
+                INSERT INTO {self.log_table} 
                 (batch_id, table_name, operation, record_count, execution_time_ms)
                 VALUES (?, ?, ?, ?, ?)
             """, (self.batch_id, table_name, 'BULK_LOAD', len(data), execution_time))
@@ -244,32 +383,66 @@ class UsageStagingProcessor:
             self.metrics['errors'].append(f"Bulk load {table_name}: {e}")
             return False
     
+    def filter_orphans(self, parent_keys: ParentKeyIndex, table_name: str, rows: List[Tuple]) -> List[Tuple]:
+        # Drops rows whose parents are neither in the database nor among the
+        # rows kept earlier in this run, before they are sent to staging
+        columns = staging_columns(table_name)
+        checks = [(columns.index(column), parent, name, nullable)
+                  for column, parent, name, nullable in PARENT_CHECKS[table_name]]
+        kept, missing = parent_keys.filter_rows(rows, checks)
+        if any(parent == table_name for table_checks in PARENT_CHECKS.values() for _, parent, _, _ in table_checks):
+            # Kept rows will be merged before their children, so they count as parents
+            parent_keys.add(table_name, (key for key in map(as_key, (row[0] for row in kept)) if key is not None))
+        
+        skipped = len(rows) - len(kept)
+        self.metrics['records_skipped'] += skipped
+        self.metrics['orphaned_records'] += skipped
+        for check_name, count in missing.items():
+            self.metrics['missing_dependency_breakdown'][check_name] = count
+            self.metrics['total_missing_dependencies'] += count
+            if count > 0:
+                logging.warning(f"{check_name}: {count} missing parent IDs")
+        if skipped > 0:
+            logging.warning(f"{skipped}/{len(rows)} {table_name} records skipped before staging (missing parent records)")
+        return kept
+    
+    def backfill_parents(self, backfill: ParentBackfill, table_name: str, rows: List[Tuple]):
+        # Fetches the catalogue parents these rows reference that are not in the database
+        columns = staging_columns(table_name)
+        referenced = {}
+        for column, parent, _, _ in PARENT_CHECKS[table_name]:
+            if parent in BACKFILL_TABLES:
+                position = columns.index(column)
+                referenced.setdefault(parent, set()).update(row[position] for row in rows if row[position] is not None)
+        for parent, count in backfill.backfill(referenced).items():
+            self.metrics['parents_backfilled'][parent] = self.metrics['parents_backfilled'].get(parent, 0) + count
+    
     def validate_dependencies_from_db(self, conn) -> Dict[str, int]:
         # Check if required parent records exist in database
         validation_queries = {
             'ReadingListUsage_missing_lists': f"""
                 SELECT COUNT(DISTINCT s.list_id)
-                FROM #STAGE_ReadingListUsage_{self.batch_id} s
+                FROM {self.stage_table('ReadingListUsage')} s
                 WHERE NOT EXISTS (SELECT 1 FROM ReadingList WHERE ereserve_id = s.list_id)
             """,
             'ReadingListUsage_missing_users': f"""
                 SELECT COUNT(DISTINCT s.integration_user_id)
-                FROM #STAGE_ReadingListUsage_{self.batch_id} s
+                FROM {self.stage_table('ReadingListUsage')} s
                 WHERE NOT EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id)
             """,
             'ReadingListItemUsage_missing_items': f"""
                 SELECT COUNT(DISTINCT s.item_id)
-                FROM #STAGE_ReadingListItemUsage_{self.batch_id} s
+                FROM {self.stage_table('ReadingListItemUsage')} s
                 WHERE NOT EXISTS (SELECT 1 FROM ReadingListItem WHERE ereserve_id = s.item_id)
             """,
             'ReadingListItemUsage_missing_list_usage': f"""
                 SELECT COUNT(DISTINCT s.list_usage_id)
-                FROM #STAGE_ReadingListItemUsage_{self.batch_id} s
+                FROM {self.stage_table('ReadingListItemUsage')} s
                 WHERE NOT EXISTS (SELECT 1 FROM ReadingListUsage WHERE ereserve_id = s.list_usage_id)
             """,
             'ReadingUtilisation_missing_item_usage': f"""
                 SELECT COUNT(DISTINCT s.item_usage_id)
-                FROM #STAGE_ReadingUtilisation_{self.batch_id} s
+                FROM {self.stage_table('ReadingUtilisation')} s
                 WHERE NOT EXISTS (SELECT 1 FROM ReadingListItemUsage WHERE ereserve_id = s.item_usage_id)
             """
         }
@@ -297,179 +470,191 @@ class UsageStagingProcessor:
     
     def finalize_staging_to_main(self, conn) -> bool:
         # Transfer data from staging to main tables
-        transfer_queries = [
-            {
-                'name': 'ReadingListUsage',
-                'merge_query': f"""
-                MERGE ReadingListUsage AS target
-                USING (
-                    SELECT s.ereserve_id, s.list_id, s.integration_user_id, 
-                           s.item_usage_count, s.created_at, s.updated_at
-                    FROM #STAGE_ReadingListUsage_{self.batch_id} s
-                    -- Only merge if parent records exist in DB
-                    WHERE EXISTS (SELECT 1 FROM ReadingList WHERE ereserve_id = s.list_id)
-                      AND EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id)
-                ) AS source
-                ON target.ereserve_id = source.ereserve_id
-                WHEN MATCHED THEN
-                    UPDATE SET 
-                        list_id = source.list_id,
-                        integration_user_id = source.integration_user_id,
-                        item_usage_count = source.item_usage_count,
-                        created_at = source.created_at,
-                        updated_at = source.updated_at
-                WHEN NOT MATCHED BY TARGET THEN
-                    INSERT (ereserve_id, list_id, integration_user_id, 
-                            item_usage_count, created_at, updated_at)
-                    VALUES (source.ereserve_id, source.list_id, source.integration_user_id,
-                            source.item_usage_count, source.created_at, source.updated_at);
-                """,
-                'count_existing_query': f"""
-                SELECT COUNT(*)
-                FROM #STAGE_ReadingListUsage_{self.batch_id} s
-                WHERE EXISTS (
-                    SELECT 1 FROM ReadingListUsage r 
-                    WHERE r.ereserve_id = s.ereserve_id
-                )
-                """
-            },
-            {
-                'name': 'ReadingListItemUsage',
-                'merge_query': f"""
-                MERGE ReadingListItemUsage AS target
-                USING (
-                    SELECT s.ereserve_id, s.item_id, s.list_usage_id, 
-                           s.integration_user_id, s.utilisation_count, s.created_at, s.updated_at
-                    FROM #STAGE_ReadingListItemUsage_{self.batch_id} s
-                    WHERE EXISTS (SELECT 1 FROM ReadingListItem WHERE ereserve_id = s.item_id)
-                      AND EXISTS (SELECT 1 FROM ReadingListUsage WHERE ereserve_id = s.list_usage_id)
-                      AND EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id)
-                ) AS source
-                ON target.ereserve_id = source.ereserve_id
-                WHEN MATCHED THEN
-                    UPDATE SET 
-                        item_id = source.item_id,
-                        list_usage_id = source.list_usage_id,
-                        integration_user_id = source.integration_user_id,
-                        utilisation_count = source.utilisation_count,
-                        created_at = source.created_at,
-                        updated_at = source.updated_at
-                WHEN NOT MATCHED BY TARGET THEN
-                    INSERT (ereserve_id, item_id, list_usage_id, 
-                            integration_user_id, utilisation_count, created_at, updated_at)
-                    VALUES (source.ereserve_id, source.item_id, source.list_usage_id,
-                            source.integration_user_id, source.utilisation_count, source.created_at, source.updated_at);
-                """,
-                'count_existing_query': f"""
-                SELECT COUNT(*)
-                FROM #STAGE_ReadingListItemUsage_{self.batch_id} s
-                WHERE EXISTS (
-                    SELECT 1 FROM ReadingListItemUsage r 
-                    WHERE r.ereserve_id = s.ereserve_id
-                )
-                """
-            },
-            {
-                'name': 'ReadingUtilisation',
-                'merge_query': f"""
-                MERGE ReadingUtilisation AS target
-                USING (
-                    SELECT s.ereserve_id, s.integration_user_id, s.item_id, 
-                           s.item_usage_id, s.created_at, s.updated_at
-                    FROM #STAGE_ReadingUtilisation_{self.batch_id} s
-                    WHERE EXISTS (SELECT 1 FROM ReadingListItem WHERE ereserve_id = s.item_id)
-                      AND EXISTS (SELECT 1 FROM ReadingListItemUsage WHERE ereserve_id = s.item_usage_id)
-                      AND (s.integration_user_id IS NULL 
-                           OR EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id))
-                ) AS source
-                ON target.ereserve_id = source.ereserve_id
-                WHEN MATCHED THEN
-                    UPDATE SET 
-                        integration_user_id = source.integration_user_id,
-                        item_id = source.item_id,
-                        item_usage_id = source.item_usage_id,
-                        created_at = source.created_at,
-                        updated_at = source.updated_at
-                WHEN NOT MATCHED BY TARGET THEN
-                    INSERT (ereserve_id, integration_user_id, item_id, 
-                            item_usage_id, created_at, updated_at)
-                    VALUES (source.ereserve_id, source.integration_user_id, source.item_id,
-                            source.item_usage_id, source.created_at, source.updated_at);
-                """,
-                'count_existing_query': f"""
-                SELECT COUNT(*)
-                FROM #STAGE_ReadingUtilisation_{self.batch_id} s
-                WHERE EXISTS (
-                    SELECT 1 FROM ReadingUtilisation r 
-                    WHERE r.ereserve_id = s.ereserve_id
-                )
-                """
-            }
-        ]
+        # Only merge rows whose parent records exist in DB
+        source_queries = {
+            'ReadingListUsage': f"""
+                SELECT s.ereserve_id, s.list_id, s.integration_user_id, 
+                       s.item_usage_count, s.created_at, s.updated_at, s.row_hash
+                FROM {self.stage_table('ReadingListUsage')} s
+                WHERE EXISTS (SELECT 1 FROM ReadingList WHERE ereserve_id = s.list_id)
+                  AND EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id)
+            """,
+            'ReadingListItemUsage': f"""
+                SELECT s.ereserve_id, s.item_id, s.list_usage_id, 
+                       s.integration_user_id, s.utilisation_count, s.created_at, s.updated_at, s.row_hash
+                FROM {self.stage_table('ReadingListItemUsage')} s
+                WHERE EXISTS (SELECT 1 FROM ReadingListItem WHERE ereserve_id = s.item_id)
+                  AND EXISTS (SELECT 1 FROM ReadingListUsage WHERE ereserve_id = s.list_usage_id)
+                  AND EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id)
+            """,
+            'ReadingUtilisation': f"""
+                SELECT s.ereserve_id, s.integration_user_id, s.item_id, 
+                       s.item_usage_id, s.created_at, s.updated_at, s.row_hash
+                FROM {self.stage_table('ReadingUtilisation')} s
+                WHERE EXISTS (SELECT 1 FROM ReadingListItem WHERE ereserve_id = s.item_id)
+                  AND EXISTS (SELECT 1 FROM ReadingListItemUsage WHERE ereserve_id = s.item_usage_id)
+                  AND (s.integration_user_id IS NULL 
+                       OR EXISTS (SELECT 1 FROM IntegrationUser WHERE ereserve_id = s.integration_user_id))
+            """,
+        }
         
+        chunk_rows = DB_LOAD_CONFIG.get("MERGE_CHUNK_ROWS", 0)
         try:
             cursor = conn.cursor()
+            if self.rollups is None:
+                # Rollups are updated from the rows each merge writes, in the same transaction
+                self.rollups = UsageRollups(conn, self.batch_id, self.backend)
+                self.rollups.prepare()
+                if chunk_rows:
+                    conn.commit()  # Keep the delta tables through a retry
+            rollups = self.rollups
             
-            for transfer_info in transfer_queries:
-                table_name = transfer_info['name']
-                merge_query = transfer_info['merge_query']
-                count_existing_query = transfer_info['count_existing_query']
+            for table_name, source_query in source_queries.items():
+                if table_name in self.merged_tables:
+                    continue  # Finished before a retry
                 start_time = time.time()
                 
-                # Count records in staging
-                cursor.execute(f"SELECT COUNT(*) FROM #STAGE_{table_name}_{self.batch_id}")
+                # Count records in staging, and of them those the merge can take
+                cursor.execute(f"SELECT COUNT(*) FROM {self.stage_table(table_name)}")
                 staging_count = cursor.fetchone()[0]
+                mergeable_count = self.source_count(cursor, table_name, source_query, staging_count)
                 
-                # Count existing records (will be updated)
-                cursor.execute(count_existing_query)
-                existing_count = cursor.fetchone()[0]
+                if chunk_rows:
+                    # One transaction per ereserve_id range; a retry in this run resumes after the last committed one
+                    for low, high in self.key_ranges(cursor, table_name, chunk_rows):
+                        if table_name in self.merged_ranges and high <= self.merged_ranges[table_name]:
+                            continue
+                        counts = self.merge_table(cursor, rollups, table_name,
+                                                  f"{source_query} AND s.ereserve_id BETWEEN {low} AND {high}")
+                        rollup_keys = rollups.apply() if rollups.mode == "incremental" else {}
+                        rollups.clear()
+                        conn.commit()
+                        self.merged_ranges[table_name] = high
+                        self.count_merge(table_name, counts, rollup_keys)
+                        self.record_merged(cursor, table_name, low, high)
+                else:
+                    self.count_merge(table_name, self.merge_table(cursor, rollups, table_name, source_query))
                 
-                cursor.execute(merge_query)
-                rows_affected = cursor.rowcount
-                rows_inserted = max(0, rows_affected - existing_count)
-                rows_updated = min(rows_affected, existing_count)
-                rows_skipped = staging_count - rows_affected  # Records with missing parent FKs
+                rows_inserted, rows_updated = self.merge_counts.get(table_name, (0, 0))
+                written = rows_inserted + rows_updated
+                # The source rows the merge left alone had the same row_hash
+                unchanged_count = max(0, mergeable_count - written)
+                rows_skipped = staging_count - mergeable_count  # Records with missing parent FKs
                 
                 execution_time = int((time.time() - start_time) * 1000)
                 
                 self.metrics['records_inserted'] += rows_inserted
+                self.metrics['records_unchanged'] += unchanged_count
                 self.metrics['records_skipped'] += rows_skipped
                 self.metrics['orphaned_records'] += rows_skipped
 
                 if 'records_updated' not in self.metrics:
                     self.metrics['records_updated'] = 0
                 self.metrics['records_updated'] += rows_updated
-                logging.info(f"Merged {rows_affected}/{staging_count} records to {table_name} in {execution_time}ms")
+                logging.info(f"Merged {written}/{staging_count} records to {table_name} in {execution_time}ms")
                 
                 if rows_inserted > 0:
                     logging.info(f"  - {rows_inserted} new records inserted")
                 if rows_updated > 0:
                     logging.info(f"  - {rows_updated} existing records updated")
+                if unchanged_count > 0:
+                    logging.info(f"  - {unchanged_count} existing records unchanged")
                 if rows_skipped > 0:
                     logging.warning(f"  - {rows_skipped} records skipped (missing parent records)")
                 
                 cursor.execute(f"""
-                    INSERT INTO #ProcessingLog_{self.batch_id} 
+                    INSERT INTO {self.log_table} 
                     (batch_id, table_name, operation, record_count, execution_time_ms)
                     VALUES (?, ?, ?, ?, ?)
-                """, (self.batch_id, table_name, 'UPSERT_MERGE', rows_affected, execution_time))
+                """, (self.batch_id, table_name, 'UPSERT_MERGE', written, execution_time))
+                if chunk_rows:
+                    conn.commit()
+                    self.merged_tables.add(table_name)
+            
+            if not chunk_rows or rollups.mode == "rebuild":
+                # Chunks add their own deltas; a rebuild covers everything at the end
+                with profile_stage("staging.update_usage_rollups"):
+                    self.metrics['rollup_keys_written'] = rollups.apply()
             
             conn.commit()
-            logging.info(f"Staging transfer complete: {self.metrics['records_inserted']} inserted, {self.metrics.get('records_updated', 0)} updated, {self.metrics['records_skipped']} skipped")
+            if not chunk_rows:
+                for table_name in source_queries:
+                    self.record_merged(cursor, table_name)
+            logging.info(f"Staging transfer complete: {self.metrics['records_inserted']} inserted, {self.metrics.get('records_updated', 0)} updated, {self.metrics['records_unchanged']} unchanged, {self.metrics['records_skipped']} skipped")
             return True
                 
         except Exception as e:
+            conn.rollback()
             logging.error(f"Failed to transfer staging data to main tables: {e}")
             self.metrics['errors'].append(f"Staging transfer: {e}")
             return False
     
+    def key_ranges(self, cursor, table_name: str, chunk_rows: int) -> List[Tuple[int, int]]:
+        # Consecutive ereserve_id ranges covering chunk_rows staging rows each
+        cursor.execute(f"SELECT ereserve_id FROM {self.stage_table(table_name)} ORDER BY ereserve_id")
+        ids = [row[0] for row in cursor.fetchall()]
+        return [(ids[i], ids[min(i + chunk_rows, len(ids)) - 1]) for i in range(0, len(ids), chunk_rows)]
+    
+    def merge_table(self, cursor, rollups: UsageRollups, table_name: str, source_query: str) -> Tuple[int, int]:
+        # Merges the rows of source_query; returns (rows inserted, existing rows
+        # updated) as the merge reports them
+        rollups.capture(table_name, source_query)
+        return self.backend.upsert_from_select(
+            cursor, table_name, 'ereserve_id', staging_columns(table_name), source_query, change_column='row_hash'
+        )
+    
+    def source_count(self, cursor, table_name: str, source_query: str, staging_count: int) -> int:
+        # Staged rows the merge can take, i.e. those whose parents exist
+        if self.parents_filtered:
+            # Orphans were dropped before staging
+            return staging_count
+        cursor.execute(f"SELECT COUNT(*) FROM ({source_query}) s")
+        return cursor.fetchone()[0]
+    
+    def record_merged(self, cursor, table_name: str, low: int = None, high: int = None):
+        # Adds the committed rows of a merge (one chunk, or the whole table) to the entity state
+        tracker = self.trackers.get(table_name)
+        if tracker is None or tracker.state is None:
+            return
+        key_range = f"WHERE s.ereserve_id BETWEEN {low} AND {high}" if low is not None else ""
+        cursor.execute(f"""
+            SELECT r.ereserve_id, r.updated_at, r.row_hash
+            FROM {table_name} r
+            JOIN {self.stage_table(table_name)} s ON s.ereserve_id = r.ereserve_id
+            {key_range}
+        """)
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            tracker.record(rows)
+    
+    def count_merge(self, table_name: str, counts: Tuple[int, int], rollup_keys: Dict[str, int] = None):
+        # Adds up the counts of a table's merges (one per chunk when chunked)
+        totals = self.merge_counts.get(table_name, (0, 0))
+        self.merge_counts[table_name] = tuple(total + count for total, count in zip(totals, counts))
+        written = self.metrics.setdefault('rollup_keys_written', {})
+        for rollup, count in (rollup_keys or {}).items():
+            written[rollup] = written.get(rollup, 0) + count
+    
     def process_with_staging(self) -> Dict:
         self.metrics['start_time'] = datetime.now()
         
         try:
-            with self.get_connection() as conn:
-                if not self.create_staging_tables(conn):
+            with self.get_connection() as conn, ExitStack() as trackers:
+                with profile_stage("staging.create_staging_tables"):
+                    created = self.create_staging_tables(conn)
+                if not created:
                     raise Exception("Failed to create staging tables")
+                # Records unchanged since they were last merged are dropped before formatting
+                with profile_stage("staging.open_entity_state"):
+                    self.trackers = {table: trackers.enter_context(ChangeTracker(table, conn)) for table in STAGING_TABLES}
+                # Orphans are dropped in process before staging unless the filter is off
+                parent_keys = ParentKeyIndex(conn) if DB_LOAD_CONFIG.get("PARENT_KEY_FILTER", True) else None
+                self.parents_filtered = parent_keys is not None
+                # Missing catalogue parents are fetched by id before the rows are filtered or validated
+                backfill = (ParentBackfill(conn, parent_keys or ParentKeyIndex(conn), self.backend)
+                            if is_backfill_enabled() else None)
                 
                 start_date, end_date = self.calculate_date_range()
                 self.metrics['date_range'] = {'start': start_date, 'end': end_date}
@@ -478,57 +663,79 @@ class UsageStagingProcessor:
                 rlu_url = self.build_filtered_url(
                     API_CONFIG['READING_LIST_USAGE_URL'], 
                     start_date, 
-                    end_date
+                    end_date,
+                    entity='reading-list-usages'
                 )
                 
-                rlu_data = self.fetch_all_pages_with_retry(rlu_url)
-                rlu_formatted = [(
-                    item.get("id"), item["attributes"].get("list-id"),
-                    item["attributes"].get("integration-user-id"), item["attributes"].get("item-usage-count"),
-                    item["attributes"].get("created-at"), item["attributes"].get("updated-at")
-                ) for item in rlu_data]
+                rlu_formatted = self.fetch_rows('ReadingListUsage', rlu_url, 'reading-list-usages', format_reading_list_usage)
+                
+                self.metrics['records_processed'] += len(rlu_formatted)
+                if backfill:
+                    with profile_stage("staging.backfill_parents_ReadingListUsage"):
+                        self.backfill_parents(backfill, 'ReadingListUsage', rlu_formatted)
+                if parent_keys:
+                    with profile_stage("staging.filter_ReadingListUsage"):
+                        rlu_formatted = self.filter_orphans(parent_keys, 'ReadingListUsage', rlu_formatted)
                 
-                if not self.bulk_load_to_staging('ReadingListUsage', rlu_formatted, conn):
+                with profile_stage("staging.load_ReadingListUsage"):
+                    loaded = self.bulk_load_to_staging('ReadingListUsage', rlu_formatted, conn)
+                if not loaded:
                     raise Exception("Failed to load ReadingListUsage data")
                 
                 # Fetch ReadingListItemUsage
                 rliu_url = self.build_filtered_url(
                     API_CONFIG['READING_LIST_ITEM_USAGE_URL'], 
                     start_date, 
-                    end_date
+                    end_date,
+                    entity='reading-list-item-usages'
                 )
                 
-                rliu_data = self.fetch_all_pages_with_retry(rliu_url)
-                rliu_formatted = [(
-                    item.get("id"), item["attributes"].get("item-id"), item["attributes"].get("list-usage-id"),
-                    item["attributes"].get("integration-user-id"), item["attributes"].get("utilisation-count"),
-                    item["attributes"].get("created-at"), item["attributes"].get("updated-at")
-                ) for item in rliu_data]
+                rliu_formatted = self.fetch_rows('ReadingListItemUsage', rliu_url, 'reading-list-item-usages', format_reading_list_item_usage)
+                
+                self.metrics['records_processed'] += len(rliu_formatted)
+                if backfill:
+                    with profile_stage("staging.backfill_parents_ReadingListItemUsage"):
+                        self.backfill_parents(backfill, 'ReadingListItemUsage', rliu_formatted)
+                if parent_keys:
+                    with profile_stage("staging.filter_ReadingListItemUsage"):
+                        rliu_formatted = self.filter_orphans(parent_keys, 'ReadingListItemUsage', rliu_formatted)
                 
-                if not self.bulk_load_to_staging('ReadingListItemUsage', rliu_formatted, conn):
+                with profile_stage("staging.load_ReadingListItemUsage"):
+                    loaded = self.bulk_load_to_staging('ReadingListItemUsage', rliu_formatted, conn)
+                if not loaded:
                     raise Exception("Failed to load ReadingListItemUsage data")
                 
                 # Fetch ReadingUtilisation
                 ru_url = self.build_filtered_url(
                     API_CONFIG['READING_UTILISATION_URL'], 
                     start_date, 
-                    end_date
+                    end_date,
+                    entity='reading-utilisations'
                 )
                 
-                ru_data = self.fetch_all_pages_with_retry(ru_url)
-                ru_formatted = [(
-                    item.get("id"), item["attributes"].get("integration-user-id"), item["attributes"].get("item-id"),
-                    item["attributes"].get("item-usage-id"), item["attributes"].get("created-at"), item["attributes"].get("updated-at")
-                ) for item in ru_data]
+                ru_formatted = self.fetch_rows('ReadingUtilisation', ru_url, 'reading-utilisations', format_reading_utilisation)
                 
-                if not self.bulk_load_to_staging('ReadingUtilisation', ru_formatted, conn):
-                    raise Exception("Failed to load ReadingUtilisation data")
+                self.metrics['records_processed'] += len(ru_formatted)
+                if backfill:
+                    with profile_stage("staging.backfill_parents_ReadingUtilisation"):
+                        self.backfill_parents(backfill, 'ReadingUtilisation', ru_formatted)
+                if parent_keys:
+                    with profile_stage("staging.filter_ReadingUtilisation"):
+                        ru_formatted = self.filter_orphans(parent_keys, 'ReadingUtilisation', ru_formatted)
                 
-                self.metrics['records_processed'] = len(rlu_formatted) + len(rliu_formatted) + len(ru_formatted)
+                with profile_stage("staging.load_ReadingUtilisation"):
+                    loaded = self.bulk_load_to_staging('ReadingUtilisation', ru_formatted, conn)
+                if not loaded:
+                    raise Exception("Failed to load ReadingUtilisation data")
                 
                 # Validate dependencies exist in database
-                logging.info("Validating parent records exist in database...")
-                missing_deps = self.validate_dependencies_from_db(conn)
+                if parent_keys:
+                    missing_deps = None
+                    logging.info("Parent records were checked before staging; skipping database validation")
+                else:
+                    logging.info("Validating parent records exist in database...")
+                    with profile_stage("staging.validate_dependencies_from_db"):
+                        missing_deps = self.validate_dependencies_from_db(conn)
                 
                 # Store validation for monitoring
                 if missing_deps:
@@ -536,9 +743,19 @@ class UsageStagingProcessor:
                     self.metrics['total_missing_dependencies'] = total_missing
                     self.metrics['missing_dependency_breakdown'] = missing_deps
                 
-                # Transfer to main tables
-                if not self.finalize_staging_to_main(conn):
+                # Transfer to main tables. Chunked, a failed attempt keeps the
+                # chunks it committed and the next one carries on from there
+                attempts = 1 + (DB_LOAD_CONFIG.get("MERGE_CHUNK_RETRIES", 2) if DB_LOAD_CONFIG.get("MERGE_CHUNK_ROWS", 0) else 0)
+                with profile_stage("staging.finalize_staging_to_main"):
+                    for attempt in range(attempts):
+                        if attempt:
+                            logging.warning(f"Retrying staging transfer ({attempt}/{attempts - 1}) after the last committed chunk")
+                        finalized = self.finalize_staging_to_main(conn)
+                        if finalized:
+                            break
+                if not finalized:
                     raise Exception("Failed to transfer staging data to main tables")
+                self.metrics['unchanged_dropped'] = sum(tracker.dropped for tracker in self.trackers.values())
             
             self.metrics['end_time'] = datetime.now()
             
@@ -547,9 +764,12 @@ class UsageStagingProcessor:
             logging.info(f"  - Records processed: {self.metrics['records_processed']}")
             logging.info(f"  - Records inserted: {self.metrics['records_inserted']}")
             logging.info(f"  - Records updated: {self.metrics['records_updated']}")
+            logging.info(f"  - Records unchanged: {self.metrics['records_unchanged']}")
             logging.info(f"  - Records skipped: {self.metrics['records_skipped']}")
+            if self.metrics['unchanged_dropped'] > 0:
+                logging.info(f"  - Unchanged (dropped before staging, entity state): {self.metrics['unchanged_dropped']}")
             if self.metrics['duplicates_skipped'] > 0:
-                logging.info(f"  - Duplicates (already exist): {self.metrics['duplicates_skipped']}")
+                logging.info(f"  - Duplicates (served more than once by the API): {self.metrics['duplicates_skipped']}")
             if self.metrics['orphaned_records'] > 0:
                 logging.info(f"  - Orphaned (missing parents): {self.metrics['orphaned_records']}")
             logging.info(f"  - Duration: {self.metrics['end_time'] - self.metrics['start_time']}")
@@ -0,0 +1,475 @@
+"""
+-------------------------------------------------------------------------------
+Description:
+    DB-backed work queue for running one pipeline run across many processes.
+
+    In queue mode the run's coordinator (job_scheduler.job) does not load the
+    entities itself. It splits each entity into work items, ranges of ids of
+    about PAGES_PER_ITEM pages each (per school for units), and writes them to
+    the PipelineWorkQueue table. Id bounds are found by reading single-record
+    pages at every item boundary. Unlike page[number] ranges, an id range
+    neither skips nor repeats rows that are added or removed while the run
+    is going; servers that cannot page by id get page ranges, which can.
+    Worker processes on any host that reaches the database claim items one at
+    a time. The claim uses READPAST/UPDLOCK on SQL Server and a single
+    UPDATE ... RETURNING on SQLite. Each worker fetches and
+    loads its item and then marks it DONE or FAILED.
+
+    Items carry a phase. No item of a phase is handed out until every earlier
+    phase of the run has finished, so parents are loaded before the rows that
+    reference them. A claim that is not finished within CLAIM_TIMEOUT_SECONDS,
+    for example because its worker died, goes back to PENDING. After
+    MAX_ATTEMPTS it is marked FAILED, and a FAILED item stops the run at its
+    phase: later phases are not handed out and the coordinator fails the run.
+    The coordinator works items as well, waits until none are left and then
+    finishes the PipelineRunHistory row. PipelineWorkQueue is created by
+    migration 0006.
+
+    Usage:
+        python -m fedpipeline.main --once --queue --workers 4    # coordinator + 4 local workers
+        python -m fedpipeline.work_queue                          # extra worker, e.g. on another host
+        python -m fedpipeline.work_queue --run-id 42 --until-done
+-------------------------------------------------------------------------------
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+from fedpipeline import jobs, tracing
+from fedpipeline.api_handler import fetch_data_from_api, fetch_with_retry
+from fedpipeline.config import API_CONFIG, PAGE_SIZE, WORK_QUEUE_CONFIG
+from fedpipeline.cron_scheduler import default_owner
+from fedpipeline.db_backend import get_backend
+from fedpipeline.db_handler import insert_records
+from fedpipeline.keyset_paging import id_range, id_range_url, keyset_active, keyset_url
+from fedpipeline.migrations import require_table
+from fedpipeline.parent_keys import as_key
+from fedpipeline.run_planner import planned_page_size, planned_pages_per_item
+from fedpipeline.transform_pool import is_transform_pool_enabled
+
+# API entity -> (phase, API_CONFIG url key, jobs formatter, jobs insert query, table).
+# Entities in the same phase have no foreign keys between them and run in parallel.
+QUEUE_ENTITIES = {
+    "integration-users": (0, "INTEGRATION_USERS_URL", "format_integration_users", "INTEGRATION_USERS_QUERY",
+                          "IntegrationUser"),
+    "schools": (0, "SCHOOLS_URL", "format_schools", "SCHOOLS_QUERY", "School"),
+    "readings": (0, "READINGS_URL", "format_readings", "READINGS_QUERY", "Reading"),
+    "teaching-sessions": (0, "TEACHING_SESSIONS_URL", "format_teaching_sessions", "TEACHING_SESSIONS_QUERY",
+                          "TeachingSession"),
+    "units": (1, "UNITS_URL", "format_units", "UNITS_QUERY", "Unit"),
+    "reading-lists": (2, "READING_LISTS_URL", "format_reading_lists", "READING_LISTS_QUERY", "ReadingList"),
+    "reading-list-items": (3, "READING_LIST_ITEMS_URL", "format_reading_list_items", "READING_LIST_ITEMS_QUERY",
+                           "ReadingListItem"),
+    "unit-offerings": (3, "UNIT_OFFERINGS_URL", "format_unit_offerings", "UNIT_OFFERINGS_QUERY", "UnitOffering"),
+    "reading-list-usages": (4, "READING_LIST_USAGE_URL", "format_reading_list_usage", "READING_LIST_USAGE_QUERY",
+                            "ReadingListUsage"),
+    "reading-list-item-usages": (5, "READING_LIST_ITEM_USAGE_URL", "format_reading_list_item_usage",
+                                 "READING_LIST_ITEM_USAGE_QUERY", "ReadingListItemUsage"),
+    "reading-utilisations": (6, "READING_UTILISATION_URL", "format_reading_utilisation",
+                             "READING_UTILISATION_QUERY", "ReadingUtilisation"),
+}
+
+# After the first run the three usage tables are merged together through the
+# staging tables (dependency validation spans all three), as one work item
+USAGE_STAGING_ITEM = "usage-staging"
+USAGE_STAGING_PHASE = 4
+
+CLAIM_COLUMNS = ["item_id", "run_id", "entity", "url", "page_count", "params"]
+
+_enabled = WORK_QUEUE_CONFIG.get("ENABLED", False)
+_local_workers = WORK_QUEUE_CONFIG.get("LOCAL_WORKERS", 0)
+# Run of the last item this process claimed
+_item_run = None
+
+
+def enable_work_queue(local_workers: int = None):
+    global _enabled, _local_workers
+    _enabled = True
+    if local_workers is not None:
+        _local_workers = local_workers
+
+
+def is_work_queue_enabled() -> bool:
+    return _enabled
+
+
+def _page_number(url: str) -> Optional[int]:
+    values = parse_qs(urlsplit(url).query).get("page[number]")
+    return int(values[0]) if values else None
+
+
+def _page_size(url: str) -> int:
+    return int(parse_qs(urlsplit(url).query).get("page[size]", [PAGE_SIZE])[0])
+
+
+def _with_page_size(url: str, page_size: int) -> str:
+    base, _, query = url.partition("?")
+    parts = [part for part in query.split("&") if part and not part.startswith("page[size]=")]
+    return f"{base}?{'&'.join(parts + [f'page[size]={page_size}'])}"
+
+
+def _page_count(body: Dict, url: str) -> Optional[int]:
+    # Page count at url's page size from a page's links.last or meta, or None
+    # when the server reports neither
+    last = (body.get("links") or {}).get("last")
+    if last and _page_number(last):
+        return _page_number(last)
+    meta = body.get("meta") or {}
+    if meta.get("page-count"):
+        return int(meta["page-count"])
+    if meta.get("record-count") is not None:
+        return max(1, -(-int(meta["record-count"]) // _page_size(url)))
+    return None
+
+
+def count_pages(url: str, entity: str) -> Optional[int]:
+    # Page count at url's page size, or None when unknown. The probe asks for ids only.
+    separator = "&" if "?" in url else "?"
+    response = fetch_data_from_api(f"{url}{separator}fields[{entity}]=", record=False)
+    if not response:
+        # Some servers reject sparse fieldsets
+        response = fetch_data_from_api(url, record=False)
+    if not response:
+        return None
+    return _page_count(response.json(), url)
+
+
+def _probe(url: str) -> Optional[Dict]:
+    response = fetch_with_retry(url, record=False)
+    return response.json() if response else None
+
+
+def id_bounds(entity: str, url: str, rows_per_item: int) -> Optional[List[int]]:
+    # Ids that split url's listing into items of about rows_per_item rows: in
+    # id order, the id at every rows_per_item-th position, each read as a
+    # one-record page. None when the server cannot page by id, does not
+    # report its size, or ignores the id bounds.
+    if not keyset_active(url, entity):
+        return None
+    probe_url = f"{keyset_url(_with_page_size(url, 1))}&fields[{entity}]="
+    first = _probe(probe_url)
+    if first is None:
+        return None
+    total = _page_count(first, probe_url)
+    if total is None:
+        return None
+    positions = list(range(rows_per_item, total, rows_per_item))
+    if not positions:
+        return []
+    with ThreadPoolExecutor(max_workers=WORK_QUEUE_CONFIG.get("PROBE_WORKERS", 4)) as pool:
+        pages = list(pool.map(_probe, [f"{probe_url}&page[number]={position}" for position in positions]))
+    if any(not page or not page.get("data") for page in pages):
+        return None
+    bounds = [as_key(page["data"][0].get("id")) for page in pages]
+    if None in bounds or bounds != sorted(set(bounds)):
+        # Not in id order: sort=id is ignored
+        return None
+    # The server must honour both bounds, or items would overlap
+    below = _probe(id_range_url(probe_url, None, bounds[0]))
+    above = _probe(id_range_url(probe_url, bounds[0], None))
+    if (not below or (_page_count(below, probe_url) or total) >= total
+            or not above or not above.get("data") or (as_key(above["data"][0].get("id")) or 0) <= bounds[0]):
+        return None
+    return bounds
+
+
+def plan_entity(entity: str, url: str, params: Dict = None) -> List[tuple]:
+    # (entity, url, page_count, params) items covering every row of url. The
+    # first and last items are open-ended, so rows added since are read too.
+    # The run plan, if any, sizes the items from the entity's page count.
+    pages_per_item = planned_pages_per_item(entity) or WORK_QUEUE_CONFIG.get("PAGES_PER_ITEM", 5)
+    params_json = json.dumps(params) if params else None
+    bounds = id_bounds(entity, url, pages_per_item * _page_size(url))
+    if bounds is not None:
+        edges = [None] + bounds + [None]
+        return [(entity, id_range_url(url, after, upto), None, params_json) for after, upto in zip(edges, edges[1:])]
+
+    logging.warning(f"{entity}: the server cannot page by id, so it is queued as page ranges; rows added or "
+                    f"removed during the run can be skipped or read twice at item boundaries")
+    total = count_pages(url, entity)
+    if total is None:
+        logging.info(f"{entity}: page count unknown; queuing it as a single item")
+        return [(entity, url, None, params_json)]
+    # The last page range follows links.next to the end, in case pages were added since
+    return [
+        (entity, f"{url}&page[number]={first}", pages_per_item if first + pages_per_item <= total else None,
+         params_json)
+        for first in range(1, total + 1, pages_per_item)
+    ]
+
+
+def plan_run(entities: List[str], usage_staging: bool) -> List[tuple]:
+    # (phase, entity, url, page_count, params) for every item of a run
+    items = []
+    for entity in entities:
+        phase, url_key = QUEUE_ENTITIES[entity][:2]
+        if usage_staging and phase >= USAGE_STAGING_PHASE:
+            continue
+        page_size = planned_page_size(entity)
+        url = f"{API_CONFIG[url_key]}?page[size]={page_size}"
+        if entity == "units":
+            # Units are only linked to their school through filter[school_id]
+            school_url = f"{API_CONFIG['SCHOOLS_URL']}?page[size]={planned_page_size('schools')}"
+            for school in jobs.fetch_items(school_url, "schools"):
+                school_id = school.get("id")
+                items.extend((phase,) + item for item in plan_entity(
+                    entity, f"{API_CONFIG[url_key]}?filter[school_id]={school_id}&page[size]={page_size}",
+                    {"school_id": school_id}
+                ))
+        else:
+            items.extend((phase,) + item for item in plan_entity(entity, url))
+    if usage_staging and any(QUEUE_ENTITIES[entity][0] >= USAGE_STAGING_PHASE for entity in entities):
+        items.append((USAGE_STAGING_PHASE, USAGE_STAGING_ITEM, None, None, None))
+    return items
+
+
+class WorkQueue:
+    def __init__(self, worker: str = None):
+        self.backend = get_backend()
+        self.worker = worker or default_owner()
+        self.claim_timeout = WORK_QUEUE_CONFIG.get("CLAIM_TIMEOUT_SECONDS", 1800)
+        self.max_attempts = WORK_QUEUE_CONFIG.get("MAX_ATTEMPTS", 3)
+        with self.backend.connect() as conn:
+            require_table(self.backend, conn, "PipelineWorkQueue", "0006_work_queue")
+
+    def enqueue(self, run_id: int, items: List[tuple]) -> int:
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO PipelineWorkQueue (run_id, phase, entity, url, page_count, params)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(run_id,) + item for item in items])
+            conn.commit()
+        return len(items)
+
+    def claim(self, run_id: int = None) -> Optional[Dict]:
+        # Next PENDING item in the lowest unfinished phase of its run (of any
+        # run in progress when run_id is None). A FAILED item holds its phase
+        # open, so nothing after it runs against missing parents.
+        where = """status = 'PENDING' AND phase = (
+                    SELECT MIN(q.phase) FROM PipelineWorkQueue q
+                    WHERE q.run_id = PipelineWorkQueue.run_id AND q.status IN ('PENDING', 'CLAIMED', 'FAILED'))"""
+        if run_id is not None:
+            # Inlined so the only parameters are the SET ones, whose position
+            # relative to the WHERE clause differs between the dialects
+            where += f" AND run_id = {int(run_id)}"
+        sql = self.backend.claim_one_sql(
+            "PipelineWorkQueue", "item_id", where, "run_id, item_id",
+            "status = 'CLAIMED', worker = ?, claimed_at = ?, attempts = attempts + 1", CLAIM_COLUMNS
+        )
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, (self.worker, datetime.now()))
+            row = cursor.fetchone()
+            conn.commit()
+        return dict(zip(CLAIM_COLUMNS, row)) if row else None
+
+    def finish(self, item_id: int, record_count: int):
+        with self.backend.connect() as conn:
+            conn.cursor().execute("""
+                UPDATE PipelineWorkQueue
+                SET status = 'DONE', finished_at = ?, record_count = ?
+                WHERE item_id = ? AND worker = ?
+            """, (datetime.now(), record_count, item_id, self.worker))
+            conn.commit()
+
+    def fail(self, item_id: int, error: str):
+        # Back to PENDING for another attempt, FAILED once MAX_ATTEMPTS is reached
+        with self.backend.connect() as conn:
+            conn.cursor().execute("""
+                UPDATE PipelineWorkQueue
+                SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'PENDING' END,
+                    finished_at = ?, error = ?, worker = NULL
+                WHERE item_id = ? AND worker = ?
+            """, (self.max_attempts, datetime.now(), error[:2000], item_id, self.worker))
+            conn.commit()
+
+    def requeue_stale(self, run_id: int = None) -> int:
+        # Claims older than CLAIM_TIMEOUT_SECONDS belong to workers that died or hung
+        cutoff = datetime.now() - timedelta(seconds=self.claim_timeout)
+        sql = """
+            UPDATE PipelineWorkQueue
+            SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'PENDING' END,
+                error = 'Claim timed out', worker = NULL
+            WHERE status = 'CLAIMED' AND claimed_at < ?
+        """
+        params = [self.max_attempts, cutoff]
+        if run_id is not None:
+            sql += " AND run_id = ?"
+            params.append(run_id)
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            requeued = max(cursor.rowcount, 0)
+            conn.commit()
+        if requeued:
+            logging.warning(f"Re-queued {requeued} work item(s) whose claim timed out")
+        return requeued
+
+    def counts(self, run_id: int) -> Dict[str, int]:
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT status, COUNT(*) FROM PipelineWorkQueue WHERE run_id = ? GROUP BY status", (run_id,)
+            )
+            return {status: count for status, count in cursor.fetchall()}
+
+    def finished(self, run_id: int) -> bool:
+        # No item of the run is claimed or can still be claimed: every item is
+        # done, or the pending ones wait behind an item that failed for good
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*) FROM PipelineWorkQueue
+                WHERE run_id = ? AND (status = 'CLAIMED' OR (status = 'PENDING' AND phase <= COALESCE(
+                    (SELECT MIN(f.phase) FROM PipelineWorkQueue f WHERE f.run_id = ? AND f.status = 'FAILED'),
+                    phase)))
+            """, (run_id, run_id))
+            return cursor.fetchone()[0] == 0
+
+    def failures(self, run_id: int) -> List[tuple]:
+        with self.backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT entity, url, error FROM PipelineWorkQueue
+                WHERE run_id = ? AND status = 'FAILED' ORDER BY item_id
+            """, (run_id,))
+            return cursor.fetchall()
+
+
+def process_item(item: Dict) -> int:
+    # Fetches and loads one work item; returns the number of rows loaded
+    entity = item["entity"]
+    if entity == USAGE_STAGING_ITEM:
+        from fedpipeline.usage_staging_processor import process_usage_data
+        metrics = process_usage_data()
+        return metrics.get("records_processed", 0)
+
+    _, _, formatter, query, table = QUEUE_ENTITIES[entity]
+    params = json.loads(item["params"]) if item["params"] else {}
+    sideloads = jobs.new_sideloads(entity)
+    # Units only know their school through the filter used to fetch them
+    args = (params["school_id"],) if entity == "units" else ()
+    rows = jobs.fetch_rows(item["url"], entity, getattr(jobs, formatter), *args,
+                           max_pages=item["page_count"], sideloads=sideloads)
+    after, upto = id_range(item["url"])
+    if after is not None or upto is not None:
+        # Rows of neighbouring items, if the server dropped a bound (keyset fallback)
+        rows = [row for row in rows if (key := as_key(row[0])) is None
+                or ((after is None or key > after) and (upto is None or key <= upto))]
+    jobs.load_sideloads(sideloads)
+    if rows:
+        insert_records(getattr(jobs, query), rows, table)
+    if entity == "units":
+        jobs.process_fedunits(rows)
+    return len(rows)
+
+
+def work(queue: WorkQueue, run_id: int = None) -> bool:
+    # Claims and processes one item; False when there was nothing to claim
+    global _item_run
+    item = queue.claim(run_id)
+    if not item:
+        return False
+    if item["run_id"] != _item_run:
+        # A new run: parameters a server refused in an earlier one are tried again
+        jobs.reset_fallbacks()
+        _item_run = item["run_id"]
+    label = f"{item['entity']} item {item['item_id']} (run {item['run_id']})"
+    start_time = time.time()
+    try:
+        with tracing.span("work_item", "stage", entity=item["entity"], item_id=item["item_id"]) as item_span:
+            record_count = process_item(item)
+            item_span.set(rows=record_count)
+    except Exception as e:
+        logging.error(f"Work item {label} failed: {e}")
+        logging.error(f"Stack trace: {traceback.format_exc()}")
+        queue.fail(item["item_id"], str(e))
+        return True
+    queue.finish(item["item_id"], record_count)
+    logging.info(f"Finished {label}: {record_count} records in {time.time() - start_time:.1f}s")
+    return True
+
+
+def start_local_workers(run_id: int, count: int) -> List[subprocess.Popen]:
+    command = [sys.executable, "-m", "fedpipeline.work_queue", "--run-id", str(run_id), "--until-done"]
+    env = dict(os.environ)
+    if tracing.is_tracing_enabled():
+        # Workers trace the run too, each into its own file
+        env["FEDPIPELINE_TRACE"] = "1"
+    if is_transform_pool_enabled():
+        env["FEDPIPELINE_TRANSFORM_POOL"] = "1"
+    return [subprocess.Popen(command, env=env) for _ in range(count)]
+
+
+def coordinate_run(run_id: int, entities: List[str], usage_staging: bool, local_workers: int = None) -> Dict:
+    # Queues the run's items and works on them alongside any workers until
+    # none are left or one has failed for good, in which case it raises
+    if run_id is None:
+        raise RuntimeError("Queue mode needs a PipelineRunHistory run_id")
+    queue = WorkQueue()
+    items = plan_run(entities, usage_staging)
+    queue.enqueue(run_id, items)
+    logging.info(f"Queued {len(items)} work items for run {run_id}")
+
+    local_workers = _local_workers if local_workers is None else local_workers
+    processes = start_local_workers(run_id, local_workers) if local_workers else []
+    poll_seconds = WORK_QUEUE_CONFIG.get("POLL_SECONDS", 0.5)
+    try:
+        while True:
+            if work(queue, run_id):
+                continue
+            queue.requeue_stale(run_id)
+            if queue.finished(run_id):
+                break
+            # Waiting for other workers to finish the current phase
+            time.sleep(poll_seconds)
+    finally:
+        for process in processes:
+            process.wait()
+
+    counts = queue.counts(run_id)
+    logging.info(f"Work queue for run {run_id} finished: {counts}")
+    if counts.get("FAILED"):
+        for entity, url, error in queue.failures(run_id):
+            logging.error(f"  Failed item {entity} {url or ''}: {error}")
+        skipped = f"; {counts['PENDING']} were not run" if counts.get("PENDING") else ""
+        raise RuntimeError(f"{counts['FAILED']} of {len(items)} work items failed{skipped}")
+    return counts
+
+
+def run_worker(run_id: int = None, until_done: bool = False):
+    # Worker loop: with until_done, returns once run_id has no items left
+    queue = WorkQueue()
+    poll_seconds = WORK_QUEUE_CONFIG.get("POLL_SECONDS", 0.5)
+    logging.info(f"Worker {queue.worker} started" + (f" for run {run_id}" if run_id else ""))
+    tracing.begin_run(run_id, "worker")
+    try:
+        while True:
+            if work(queue, run_id):
+                continue
+            queue.requeue_stale(run_id)
+            if until_done and run_id is not None and queue.finished(run_id):
+                break
+            time.sleep(poll_seconds)
+    finally:
+        tracing.end_run()
+    logging.info(f"Worker {queue.worker} finished")
+
+
+if __name__ == "__main__":
+    import logger
+    parser = argparse.ArgumentParser(description="Claim and process pipeline work items from the database queue")
+    parser.add_argument("--run-id", type=int, help="Only work on items of this run (default: any run)")
+    parser.add_argument("--until-done", action="store_true",
+                        help="With --run-id, exit once the run has no pending or claimed items left")
+    args = parser.parse_args()
+    run_worker(args.run_id, args.until_done)
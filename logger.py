@@ -1,10 +1,7 @@
 # logger.py
 
-import logging
+from fedpipeline.log_config import configure_logging
 
-logging.basicConfig(
-    filename="pipeline.log",
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)-8s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+# Writes pipeline.log through a background queue listener; format, levels and
+# per-module verbosity come from LOGGING_CONFIG
+configure_logging()
@@ -227,4 +227,18 @@ CREATE TABLE PipelineRunHistory(
     INDEX IX_PipelineRunHistory_Status (status),
     INDEX IX_PipelineRunHistory_StartTime (run_start_time DESC)
 );
-GO
\ No newline at end of file
+GO
+
+-- ----------------------------------------
+-- Table: SchemaMigrations
+-- ----------------------------------------
+-- Versions applied from sql/migrations/ (see fedpipeline/migrations.py)
+
+CREATE TABLE SchemaMigrations(
+    version VARCHAR(100) NOT NULL PRIMARY KEY,
+    description VARCHAR(255) NULL,
+    checksum VARCHAR(64) NOT NULL,
+    applied_at DATETIME NOT NULL,
+    duration_ms INT NULL
+);
+GO
@@ -0,0 +1,22 @@
+-- ----------------------------------------
+-- Migration 0001: indexes on foreign key columns
+-- ----------------------------------------
+-- Every foreign key column gets an index, so parent/child joins,
+-- EXISTS probes and FK checks on parent deletes seek instead of scanning.
+
+CREATE INDEX IF NOT EXISTS IX_Unit_SchoolId ON Unit (school_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingList_UnitId ON ReadingList (unit_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingList_TeachingSessionId ON ReadingList (teaching_session_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListUsage_ListId ON ReadingListUsage (list_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListUsage_IntegrationUserId ON ReadingListUsage (integration_user_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListItem_ListId ON ReadingListItem (list_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListItem_ReadingId ON ReadingListItem (reading_id);
+CREATE INDEX IF NOT EXISTS IX_UnitOffering_UnitId ON UnitOffering (unit_id);
+CREATE INDEX IF NOT EXISTS IX_UnitOffering_ReadingListId ON UnitOffering (reading_list_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListItemUsage_ItemId ON ReadingListItemUsage (item_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListItemUsage_ListUsageId ON ReadingListItemUsage (list_usage_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingListItemUsage_IntegrationUserId ON ReadingListItemUsage (integration_user_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingUtilisation_ItemId ON ReadingUtilisation (item_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingUtilisation_ItemUsageId ON ReadingUtilisation (item_usage_id);
+CREATE INDEX IF NOT EXISTS IX_ReadingUtilisation_IntegrationUserId ON ReadingUtilisation (integration_user_id);
+CREATE INDEX IF NOT EXISTS IX_FedUnit_UnitId ON FedUnit (unit_id);
@@ -0,0 +1,28 @@
+-- ----------------------------------------
+-- Migration 0002: usage rollup tables
+-- ----------------------------------------
+-- Daily usage counts per unit/teaching session and per reading, maintained
+-- incrementally by the staging MERGE (see fedpipeline/usage_rollups.py).
+-- 0 in a key column stands for a list without a unit or teaching session.
+
+CREATE TABLE IF NOT EXISTS UsageDailyByUnitSession (
+    unit_id INT NOT NULL,
+    teaching_session_id INT NOT NULL,
+    usage_date DATE NOT NULL,
+    list_usages BIGINT NOT NULL DEFAULT 0,
+    item_usages BIGINT NOT NULL DEFAULT 0,
+    utilisations BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (unit_id, teaching_session_id, usage_date)
+);
+
+CREATE INDEX IF NOT EXISTS IX_UsageDailyByUnitSession_UsageDate ON UsageDailyByUnitSession (usage_date);
+
+CREATE TABLE IF NOT EXISTS UsageDailyByReading (
+    reading_id INT NOT NULL,
+    usage_date DATE NOT NULL,
+    item_usages BIGINT NOT NULL DEFAULT 0,
+    utilisations BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (reading_id, usage_date)
+);
+
+CREATE INDEX IF NOT EXISTS IX_UsageDailyByReading_UsageDate ON UsageDailyByReading (usage_date);
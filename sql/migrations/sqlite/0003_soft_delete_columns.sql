@@ -0,0 +1,39 @@
+-- ----------------------------------------
+-- Migration 0003: soft delete columns
+-- ----------------------------------------
+-- is_deleted/deleted_at on every table checked by delete detection
+-- (fedpipeline/reconciliation.py). Soft mode sets them on rows that no longer
+-- exist upstream and clears them when the rows come back.
+
+ALTER TABLE IntegrationUser ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE IntegrationUser ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE School ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE School ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE Reading ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE Reading ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE Unit ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE Unit ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE TeachingSession ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE TeachingSession ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE ReadingList ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE ReadingList ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE ReadingListItem ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE ReadingListItem ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE UnitOffering ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE UnitOffering ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE ReadingListUsage ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE ReadingListUsage ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE ReadingListItemUsage ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE ReadingListItemUsage ADD COLUMN deleted_at DATETIME;
+
+ALTER TABLE ReadingUtilisation ADD COLUMN is_deleted BIT NOT NULL DEFAULT 0;
+ALTER TABLE ReadingUtilisation ADD COLUMN deleted_at DATETIME;
@@ -0,0 +1,11 @@
+-- ----------------------------------------
+-- Migration 0004: usage row hashes
+-- ----------------------------------------
+-- row_hash on the usage tables: a hash of the row's content, written by the
+-- staging MERGE so rows whose content has not changed are not updated (see
+-- fedpipeline/jobs.py row_hash). Existing rows get theirs the next time a
+-- merge sees them.
+
+ALTER TABLE ReadingListUsage ADD COLUMN row_hash BIGINT;
+ALTER TABLE ReadingListItemUsage ADD COLUMN row_hash BIGINT;
+ALTER TABLE ReadingUtilisation ADD COLUMN row_hash BIGINT;
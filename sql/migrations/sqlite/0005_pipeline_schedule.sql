@@ -0,0 +1,15 @@
+-- ----------------------------------------
+-- Migration 0005: pipeline schedule
+-- ----------------------------------------
+-- Last run and lease of each stage group for the cron scheduler (see
+-- fedpipeline/cron_scheduler.py).
+
+CREATE TABLE IF NOT EXISTS PipelineSchedule (
+    group_name VARCHAR(50) NOT NULL PRIMARY KEY,
+    last_run_time DATETIME NULL,
+    last_status VARCHAR(20) NULL,
+    last_run_id INT NULL,
+    lease_owner VARCHAR(200) NULL,
+    lease_expires_at DATETIME NULL,
+    lease_run_id INT NULL
+);
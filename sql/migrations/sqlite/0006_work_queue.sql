@@ -0,0 +1,24 @@
+-- ----------------------------------------
+-- Migration 0006: work queue
+-- ----------------------------------------
+-- Work items of queue-mode runs, claimed by the coordinator and any workers
+-- (see fedpipeline/work_queue.py).
+
+CREATE TABLE IF NOT EXISTS PipelineWorkQueue (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INT NOT NULL,
+    phase INT NOT NULL,
+    entity VARCHAR(50) NOT NULL,
+    url VARCHAR(2000) NULL,
+    page_count INT NULL,
+    params VARCHAR(500) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (status IN ('PENDING', 'CLAIMED', 'DONE', 'FAILED')),
+    attempts INT NOT NULL DEFAULT 0,
+    worker VARCHAR(200) NULL,
+    claimed_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    record_count INT NULL,
+    error VARCHAR(2000) NULL
+);
+
+CREATE INDEX IF NOT EXISTS IX_PipelineWorkQueue_Claim ON PipelineWorkQueue (run_id, status, phase);
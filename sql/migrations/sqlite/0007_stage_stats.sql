@@ -0,0 +1,19 @@
+-- ----------------------------------------
+-- Migration 0007: stage stats
+-- ----------------------------------------
+-- Predicted and actual time of each run's stages, for the run planner's
+-- predictions (see fedpipeline/run_planner.py).
+
+CREATE TABLE IF NOT EXISTS PipelineStageStats (
+    stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INT NOT NULL,
+    stage VARCHAR(100) NOT NULL,
+    row_count INT NULL,
+    page_count INT NULL,
+    request_seconds FLOAT NULL,
+    predicted_seconds FLOAT NULL,
+    actual_seconds FLOAT NOT NULL,
+    recorded_at DATETIME NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS IX_PipelineStageStats_Stage ON PipelineStageStats (stage, recorded_at);
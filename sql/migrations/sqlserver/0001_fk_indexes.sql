@@ -0,0 +1,69 @@
+-- ----------------------------------------
+-- Migration 0001: indexes on foreign key columns
+-- ----------------------------------------
+-- Every foreign key column gets a nonclustered index, so parent/child joins,
+-- EXISTS probes and FK checks on parent deletes seek instead of scanning.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Unit_SchoolId' AND object_id = OBJECT_ID('Unit'))
+    CREATE NONCLUSTERED INDEX IX_Unit_SchoolId ON Unit (school_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingList_UnitId' AND object_id = OBJECT_ID('ReadingList'))
+    CREATE NONCLUSTERED INDEX IX_ReadingList_UnitId ON ReadingList (unit_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingList_TeachingSessionId' AND object_id = OBJECT_ID('ReadingList'))
+    CREATE NONCLUSTERED INDEX IX_ReadingList_TeachingSessionId ON ReadingList (teaching_session_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListUsage_ListId' AND object_id = OBJECT_ID('ReadingListUsage'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListUsage_ListId ON ReadingListUsage (list_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListUsage_IntegrationUserId' AND object_id = OBJECT_ID('ReadingListUsage'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListUsage_IntegrationUserId ON ReadingListUsage (integration_user_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListItem_ListId' AND object_id = OBJECT_ID('ReadingListItem'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListItem_ListId ON ReadingListItem (list_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListItem_ReadingId' AND object_id = OBJECT_ID('ReadingListItem'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListItem_ReadingId ON ReadingListItem (reading_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_UnitOffering_UnitId' AND object_id = OBJECT_ID('UnitOffering'))
+    CREATE NONCLUSTERED INDEX IX_UnitOffering_UnitId ON UnitOffering (unit_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_UnitOffering_ReadingListId' AND object_id = OBJECT_ID('UnitOffering'))
+    CREATE NONCLUSTERED INDEX IX_UnitOffering_ReadingListId ON UnitOffering (reading_list_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListItemUsage_ItemId' AND object_id = OBJECT_ID('ReadingListItemUsage'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListItemUsage_ItemId ON ReadingListItemUsage (item_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListItemUsage_ListUsageId' AND object_id = OBJECT_ID('ReadingListItemUsage'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListItemUsage_ListUsageId ON ReadingListItemUsage (list_usage_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingListItemUsage_IntegrationUserId' AND object_id = OBJECT_ID('ReadingListItemUsage'))
+    CREATE NONCLUSTERED INDEX IX_ReadingListItemUsage_IntegrationUserId ON ReadingListItemUsage (integration_user_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingUtilisation_ItemId' AND object_id = OBJECT_ID('ReadingUtilisation'))
+    CREATE NONCLUSTERED INDEX IX_ReadingUtilisation_ItemId ON ReadingUtilisation (item_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingUtilisation_ItemUsageId' AND object_id = OBJECT_ID('ReadingUtilisation'))
+    CREATE NONCLUSTERED INDEX IX_ReadingUtilisation_ItemUsageId ON ReadingUtilisation (item_usage_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ReadingUtilisation_IntegrationUserId' AND object_id = OBJECT_ID('ReadingUtilisation'))
+    CREATE NONCLUSTERED INDEX IX_ReadingUtilisation_IntegrationUserId ON ReadingUtilisation (integration_user_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_FedUnit_UnitId' AND object_id = OBJECT_ID('FedUnit'))
+    CREATE NONCLUSTERED INDEX IX_FedUnit_UnitId ON FedUnit (unit_id);
+GO
@@ -0,0 +1,36 @@
+-- ----------------------------------------
+-- Migration 0002: usage rollup tables
+-- ----------------------------------------
+-- Daily usage counts per unit/teaching session and per reading, maintained
+-- incrementally by the staging MERGE (see fedpipeline/usage_rollups.py).
+-- 0 in a key column stands for a list without a unit or teaching session.
+
+IF OBJECT_ID('UsageDailyByUnitSession', 'U') IS NULL
+    CREATE TABLE UsageDailyByUnitSession (
+        unit_id INT NOT NULL,
+        teaching_session_id INT NOT NULL,
+        usage_date DATE NOT NULL,
+        list_usages BIGINT NOT NULL DEFAULT 0,
+        item_usages BIGINT NOT NULL DEFAULT 0,
+        utilisations BIGINT NOT NULL DEFAULT 0,
+        CONSTRAINT PK_UsageDailyByUnitSession PRIMARY KEY (unit_id, teaching_session_id, usage_date)
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_UsageDailyByUnitSession_UsageDate' AND object_id = OBJECT_ID('UsageDailyByUnitSession'))
+    CREATE NONCLUSTERED INDEX IX_UsageDailyByUnitSession_UsageDate ON UsageDailyByUnitSession (usage_date);
+GO
+
+IF OBJECT_ID('UsageDailyByReading', 'U') IS NULL
+    CREATE TABLE UsageDailyByReading (
+        reading_id INT NOT NULL,
+        usage_date DATE NOT NULL,
+        item_usages BIGINT NOT NULL DEFAULT 0,
+        utilisations BIGINT NOT NULL DEFAULT 0,
+        CONSTRAINT PK_UsageDailyByReading PRIMARY KEY (reading_id, usage_date)
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_UsageDailyByReading_UsageDate' AND object_id = OBJECT_ID('UsageDailyByReading'))
+    CREATE NONCLUSTERED INDEX IX_UsageDailyByReading_UsageDate ON UsageDailyByReading (usage_date);
+GO
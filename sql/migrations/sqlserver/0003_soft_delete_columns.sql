@@ -0,0 +1,72 @@
+-- ----------------------------------------
+-- Migration 0003: soft delete columns
+-- ----------------------------------------
+-- is_deleted/deleted_at on every table checked by delete detection
+-- (fedpipeline/reconciliation.py). Soft mode sets them on rows that no longer
+-- exist upstream and clears them when the rows come back.
+
+IF COL_LENGTH('IntegrationUser', 'is_deleted') IS NULL
+    ALTER TABLE IntegrationUser ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_IntegrationUser_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('School', 'is_deleted') IS NULL
+    ALTER TABLE School ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_School_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('Reading', 'is_deleted') IS NULL
+    ALTER TABLE Reading ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_Reading_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('Unit', 'is_deleted') IS NULL
+    ALTER TABLE Unit ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_Unit_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('TeachingSession', 'is_deleted') IS NULL
+    ALTER TABLE TeachingSession ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_TeachingSession_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('ReadingList', 'is_deleted') IS NULL
+    ALTER TABLE ReadingList ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_ReadingList_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('ReadingListItem', 'is_deleted') IS NULL
+    ALTER TABLE ReadingListItem ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_ReadingListItem_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('UnitOffering', 'is_deleted') IS NULL
+    ALTER TABLE UnitOffering ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_UnitOffering_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('ReadingListUsage', 'is_deleted') IS NULL
+    ALTER TABLE ReadingListUsage ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_ReadingListUsage_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('ReadingListItemUsage', 'is_deleted') IS NULL
+    ALTER TABLE ReadingListItemUsage ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_ReadingListItemUsage_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
+
+IF COL_LENGTH('ReadingUtilisation', 'is_deleted') IS NULL
+    ALTER TABLE ReadingUtilisation ADD
+        is_deleted BIT NOT NULL CONSTRAINT DF_ReadingUtilisation_is_deleted DEFAULT 0,
+        deleted_at DATETIME NULL;
+GO
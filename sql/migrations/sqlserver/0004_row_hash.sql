@@ -0,0 +1,19 @@
+-- ----------------------------------------
+-- Migration 0004: usage row hashes
+-- ----------------------------------------
+-- row_hash on the usage tables: a hash of the row's content, written by the
+-- staging MERGE so rows whose content has not changed are not updated (see
+-- fedpipeline/jobs.py row_hash). Existing rows get theirs the next time a
+-- merge sees them.
+
+IF COL_LENGTH('ReadingListUsage', 'row_hash') IS NULL
+    ALTER TABLE ReadingListUsage ADD row_hash BIGINT NULL;
+GO
+
+IF COL_LENGTH('ReadingListItemUsage', 'row_hash') IS NULL
+    ALTER TABLE ReadingListItemUsage ADD row_hash BIGINT NULL;
+GO
+
+IF COL_LENGTH('ReadingUtilisation', 'row_hash') IS NULL
+    ALTER TABLE ReadingUtilisation ADD row_hash BIGINT NULL;
+GO
@@ -0,0 +1,28 @@
+-- ----------------------------------------
+-- Migration 0006: work queue
+-- ----------------------------------------
+-- Work items of queue-mode runs, claimed by the coordinator and any workers
+-- (see fedpipeline/work_queue.py).
+
+IF OBJECT_ID('PipelineWorkQueue', 'U') IS NULL
+    CREATE TABLE PipelineWorkQueue (
+        item_id INT IDENTITY(1,1) PRIMARY KEY,
+        run_id INT NOT NULL,
+        phase INT NOT NULL,
+        entity VARCHAR(50) NOT NULL,
+        url VARCHAR(2000) NULL,
+        page_count INT NULL,
+        params VARCHAR(500) NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (status IN ('PENDING', 'CLAIMED', 'DONE', 'FAILED')),
+        attempts INT NOT NULL DEFAULT 0,
+        worker VARCHAR(200) NULL,
+        claimed_at DATETIME NULL,
+        finished_at DATETIME NULL,
+        record_count INT NULL,
+        error VARCHAR(2000) NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PipelineWorkQueue_Claim' AND object_id = OBJECT_ID('PipelineWorkQueue'))
+    CREATE NONCLUSTERED INDEX IX_PipelineWorkQueue_Claim ON PipelineWorkQueue (run_id, status, phase);
+GO
@@ -0,0 +1,23 @@
+-- ----------------------------------------
+-- Migration 0007: stage stats
+-- ----------------------------------------
+-- Predicted and actual time of each run's stages, for the run planner's
+-- predictions (see fedpipeline/run_planner.py).
+
+IF OBJECT_ID('PipelineStageStats', 'U') IS NULL
+    CREATE TABLE PipelineStageStats (
+        stat_id INT IDENTITY(1,1) PRIMARY KEY,
+        run_id INT NOT NULL,
+        stage VARCHAR(100) NOT NULL,
+        row_count INT NULL,
+        page_count INT NULL,
+        request_seconds FLOAT NULL,
+        predicted_seconds FLOAT NULL,
+        actual_seconds FLOAT NOT NULL,
+        recorded_at DATETIME NOT NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PipelineStageStats_Stage' AND object_id = OBJECT_ID('PipelineStageStats'))
+    CREATE NONCLUSTERED INDEX IX_PipelineStageStats_Stage ON PipelineStageStats (stage, recorded_at);
+GO
@@ -0,0 +1,45 @@
+-- ----------------------------------------
+-- Optional migration: usage_columnstore
+-- ----------------------------------------
+-- Stores ReadingListItemUsage and ReadingUtilisation as clustered columnstore
+-- indexes (SQL Server 2016+). Aggregating reports then read compressed column
+-- segments instead of every row. The primary keys become nonclustered B-trees,
+-- so MERGE lookups by ereserve_id still seek. The foreign key that references
+-- ReadingListItemUsage is dropped while its primary key is rebuilt.
+-- Conflicts with usage_partitioning; apply one or the other.
+
+IF OBJECT_ID('FK_ReadingUtilisation_ListItemUsage') IS NOT NULL
+    ALTER TABLE ReadingUtilisation DROP CONSTRAINT FK_ReadingUtilisation_ListItemUsage;
+GO
+
+DECLARE @table SYSNAME, @pk SYSNAME;
+DECLARE tables CURSOR LOCAL FOR SELECT name FROM (VALUES ('ReadingListItemUsage'), ('ReadingUtilisation')) AS t(name);
+OPEN tables;
+FETCH NEXT FROM tables INTO @table;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    SELECT @pk = name FROM sys.key_constraints WHERE type = 'PK' AND parent_object_id = OBJECT_ID(@table);
+    IF @pk IS NOT NULL
+        EXEC('ALTER TABLE ' + @table + ' DROP CONSTRAINT ' + @pk);
+    SET @pk = NULL;
+    FETCH NEXT FROM tables INTO @table;
+END
+CLOSE tables;
+DEALLOCATE tables;
+GO
+
+CREATE CLUSTERED COLUMNSTORE INDEX CCI_ReadingListItemUsage ON ReadingListItemUsage;
+GO
+
+ALTER TABLE ReadingListItemUsage ADD CONSTRAINT PK_ReadingListItemUsage PRIMARY KEY NONCLUSTERED (ereserve_id);
+GO
+
+CREATE CLUSTERED COLUMNSTORE INDEX CCI_ReadingUtilisation ON ReadingUtilisation;
+GO
+
+ALTER TABLE ReadingUtilisation ADD CONSTRAINT PK_ReadingUtilisation PRIMARY KEY NONCLUSTERED (ereserve_id);
+GO
+
+ALTER TABLE ReadingUtilisation WITH CHECK ADD CONSTRAINT FK_ReadingUtilisation_ListItemUsage
+    FOREIGN KEY (item_usage_id) REFERENCES ReadingListItemUsage (ereserve_id);
+GO
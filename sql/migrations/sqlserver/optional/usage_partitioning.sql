@@ -0,0 +1,68 @@
+-- ----------------------------------------
+-- Optional migration: usage_partitioning
+-- ----------------------------------------
+-- Partitions ReadingListItemUsage and ReadingUtilisation by month of updated_at.
+-- The clustered index becomes (updated_at, ereserve_id) on the partition scheme,
+-- so the date-windowed staging MERGE and date-bounded reports only touch the
+-- partitions in range, and old months can be switched out or compressed one at
+-- a time. The primary keys stay unique as nonclustered, non-aligned indexes.
+-- Boundaries run monthly from 2015-01 to 2040-12 (rows with a NULL updated_at
+-- land in the first partition), so no monthly SPLIT is needed.
+-- Conflicts with usage_columnstore; apply one or the other.
+
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'PF_UsageUpdatedAt')
+BEGIN
+    DECLARE @boundaries NVARCHAR(MAX) = N'', @month DATE = '2015-01-01';
+    WHILE @month <= '2040-12-01'
+    BEGIN
+        SET @boundaries += CASE WHEN @boundaries = N'' THEN N'' ELSE N', ' END
+                         + N'''' + CONVERT(NVARCHAR(10), @month, 120) + N'''';
+        SET @month = DATEADD(MONTH, 1, @month);
+    END
+    EXEC(N'CREATE PARTITION FUNCTION PF_UsageUpdatedAt (DATETIME) AS RANGE RIGHT FOR VALUES (' + @boundaries + N')');
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'PS_UsageUpdatedAt')
+    CREATE PARTITION SCHEME PS_UsageUpdatedAt AS PARTITION PF_UsageUpdatedAt ALL TO ([PRIMARY]);
+GO
+
+IF OBJECT_ID('FK_ReadingUtilisation_ListItemUsage') IS NOT NULL
+    ALTER TABLE ReadingUtilisation DROP CONSTRAINT FK_ReadingUtilisation_ListItemUsage;
+GO
+
+DECLARE @table SYSNAME, @pk SYSNAME;
+DECLARE tables CURSOR LOCAL FOR SELECT name FROM (VALUES ('ReadingListItemUsage'), ('ReadingUtilisation')) AS t(name);
+OPEN tables;
+FETCH NEXT FROM tables INTO @table;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    SELECT @pk = name FROM sys.key_constraints WHERE type = 'PK' AND parent_object_id = OBJECT_ID(@table);
+    IF @pk IS NOT NULL
+        EXEC('ALTER TABLE ' + @table + ' DROP CONSTRAINT ' + @pk);
+    SET @pk = NULL;
+    FETCH NEXT FROM tables INTO @table;
+END
+CLOSE tables;
+DEALLOCATE tables;
+GO
+
+CREATE CLUSTERED INDEX CIX_ReadingListItemUsage_UpdatedAt
+    ON ReadingListItemUsage (updated_at, ereserve_id) ON PS_UsageUpdatedAt (updated_at);
+GO
+
+ALTER TABLE ReadingListItemUsage ADD CONSTRAINT PK_ReadingListItemUsage
+    PRIMARY KEY NONCLUSTERED (ereserve_id) ON [PRIMARY];
+GO
+
+CREATE CLUSTERED INDEX CIX_ReadingUtilisation_UpdatedAt
+    ON ReadingUtilisation (updated_at, ereserve_id) ON PS_UsageUpdatedAt (updated_at);
+GO
+
+ALTER TABLE ReadingUtilisation ADD CONSTRAINT PK_ReadingUtilisation
+    PRIMARY KEY NONCLUSTERED (ereserve_id) ON [PRIMARY];
+GO
+
+ALTER TABLE ReadingUtilisation WITH CHECK ADD CONSTRAINT FK_ReadingUtilisation_ListItemUsage
+    FOREIGN KEY (item_usage_id) REFERENCES ReadingListItemUsage (ereserve_id);
+GO
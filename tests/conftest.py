@@ -0,0 +1,40 @@
+import pytest
+from fedpipeline.db_backend import SQLiteBackend, set_backend
+from fedpipeline.migrations import apply_migrations
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    # A fresh SQLite database with sql/sqlite/db.sql and every migration applied.
+    # Foreign keys are off so tests only need the rows they are about.
+    backend = SQLiteBackend(str(tmp_path / "test.sqlite3"))
+    backend.enforce_foreign_keys = False
+    set_backend(backend)
+    apply_migrations(optional=[])
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def conn(sqlite_backend):
+    connection = sqlite_backend.connect()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    # The tiny mock eReserve API on a free port, with API_CONFIG pointing at it
+    from benchmarks.mock_api import create_server, start_in_thread
+    from fedpipeline import api_handler
+    from fedpipeline.config import API_BASE_URL, API_CONFIG
+    server = create_server("tiny")
+    start_in_thread(server)
+    for key, value in list(API_CONFIG.items()):
+        if key.endswith("_URL"):
+            monkeypatch.setitem(API_CONFIG, key, value.replace(API_BASE_URL, server.base_url))
+    monkeypatch.setitem(API_CONFIG, "RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(api_handler, "current_token", None)
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+from fedpipeline.cron_scheduler import CronSchedule, ScheduleStore
+
+
+def fires(expression, start, count):
+    schedule = CronSchedule(expression)
+    moments = []
+    for _ in range(count):
+        start = schedule.next_after(start)
+        moments.append(start)
+    return moments
+
+
+def test_every_n_minutes():
+    assert fires("*/15 * * * *", datetime(2024, 1, 1, 10, 7), 3) == [
+        datetime(2024, 1, 1, 10, 15), datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 10, 45),
+    ]
+
+
+def test_next_is_strictly_after():
+    assert CronSchedule("30 2 * * *").next_after(datetime(2024, 1, 1, 2, 30)) == datetime(2024, 1, 2, 2, 30)
+
+
+def test_macros():
+    assert CronSchedule("@daily").next_after(datetime(2024, 1, 1, 12, 0)) == datetime(2024, 1, 2, 0, 0)
+    assert CronSchedule("@hourly").next_after(datetime(2024, 1, 1, 12, 0)) == datetime(2024, 1, 1, 13, 0)
+
+
+def test_day_of_month_or_day_of_week():
+    # Both restricted: the 13th of the month or any Friday, as in cron
+    moments = fires("0 0 13 * 5", datetime(2024, 9, 1), 4)
+    assert moments == [
+        datetime(2024, 9, 6), datetime(2024, 9, 13), datetime(2024, 9, 20), datetime(2024, 9, 27),
+    ]
+    assert datetime(2024, 9, 13).weekday() == 4
+
+
+def test_restricted_day_with_any_weekday_is_and():
+    assert fires("0 0 1 * *", datetime(2024, 1, 15), 2) == [datetime(2024, 2, 1), datetime(2024, 3, 1)]
+
+
+@pytest.mark.parametrize("sunday", ["0", "7"])
+def test_sunday_is_zero_and_seven(sunday):
+    # 2024-06-02 was a Sunday
+    assert CronSchedule(f"0 6 * * {sunday}").next_after(datetime(2024, 5, 29)) == datetime(2024, 6, 2, 6, 0)
+
+
+def test_weekday_range():
+    moments = fires("0 9 * * 1-5", datetime(2024, 6, 1), 5)
+    assert [moment.weekday() for moment in moments] == [0, 1, 2, 3, 4]
+
+
+def test_lists_and_offset_steps():
+    schedule = CronSchedule("5/20 1,13 * * *")
+    assert schedule.minutes == frozenset({5, 25, 45})
+    assert schedule.hours == frozenset({1, 13})
+
+
+def test_month_rollover_into_next_year():
+    assert CronSchedule("0 0 1 1 *").next_after(datetime(2024, 3, 1)) == datetime(2025, 1, 1)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* * * * 8", "*/0 * * * *", "0 0 31 2 *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression).next_after(datetime(2024, 1, 1))
+
+
+def test_one_lease_holder_at_a_time(sqlite_backend):
+    first, second = ScheduleStore("host-a:1"), ScheduleStore("host-b:2")
+    assert first.last_runs(["usage"]) == {"usage": None}
+    assert first.acquire("usage")
+    assert not second.acquire("usage")
+    ran_at = datetime(2024, 1, 1, 2, 0)
+    first.release(["usage"], ran_at, "SUCCESS", 1)
+    assert second.acquire("usage")
+    assert second.last_runs(["usage"]) == {"usage": ran_at}
+
+
+def test_expired_lease_closes_the_abandoned_run(sqlite_backend, conn):
+    conn.execute("INSERT INTO PipelineRunHistory (run_id, run_start_time, status) VALUES (5, ?, 'IN_PROGRESS')",
+                 (datetime(2024, 1, 1),))
+    conn.commit()
+    crashed = ScheduleStore("host-a:1", lease_seconds=1)
+    assert crashed.acquire("usage")
+    crashed.attach_run(["usage"], 5)
+    conn.execute("UPDATE PipelineSchedule SET lease_expires_at = ?", (datetime(2000, 1, 1),))
+    conn.commit()
+    assert ScheduleStore("host-b:2").acquire("usage")
+    assert conn.execute("SELECT status FROM PipelineRunHistory WHERE run_id = 5").fetchone()[0] == "FAILED"
+
+
+def test_schedule_table_comes_from_a_migration(sqlite_backend, conn):
+    conn.execute("DROP TABLE PipelineSchedule")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="0005_pipeline_schedule"):
+        ScheduleStore().last_runs(["usage"])
@@ -0,0 +1,29 @@
+COLUMNS = ["ereserve_id", "integration_user_id", "item_id", "item_usage_id", "row_hash"]
+
+
+def stage(conn, rows):
+    conn.execute("DROP TABLE IF EXISTS temp.Source")
+    conn.execute(f"CREATE TEMP TABLE Source ({', '.join(COLUMNS)})")
+    conn.executemany("INSERT INTO Source VALUES (?, 1, 1, 1, ?)", rows)
+
+
+def test_upsert_reports_inserted_and_updated(conn, sqlite_backend):
+    cursor = conn.cursor()
+    stage(conn, [(1, 10), (2, 20), (3, 30)])
+    assert sqlite_backend.upsert_from_select(cursor, "ReadingUtilisation", "ereserve_id", COLUMNS,
+                                             "SELECT * FROM temp.Source", change_column="row_hash") == (3, 0)
+    # 1 unchanged, 2 changed, 4 new
+    stage(conn, [(1, 10), (2, 21), (4, 40)])
+    assert sqlite_backend.upsert_from_select(cursor, "ReadingUtilisation", "ereserve_id", COLUMNS,
+                                             "SELECT * FROM temp.Source", change_column="row_hash") == (1, 1)
+    assert conn.execute("SELECT ereserve_id, row_hash FROM ReadingUtilisation ORDER BY 1").fetchall() == [
+        (1, 10), (2, 21), (3, 30), (4, 40)
+    ]
+
+
+def test_upsert_updates_rows_without_a_hash(conn, sqlite_backend):
+    conn.execute("INSERT INTO ReadingUtilisation (ereserve_id, integration_user_id, item_id, item_usage_id) "
+                 "VALUES (1, 1, 1, 1)")
+    stage(conn, [(1, 10)])
+    assert sqlite_backend.upsert_from_select(conn.cursor(), "ReadingUtilisation", "ereserve_id", COLUMNS,
+                                             "SELECT * FROM temp.Source", change_column="row_hash") == (0, 1)
@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import pytest
+from fedpipeline.entity_state import MISSING, EntityState, stamp
+
+
+@pytest.fixture
+def state(tmp_path):
+    store = EntityState("Reading", str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_stamp_accepts_api_strings_and_database_values():
+    assert stamp("2024-05-01T10:00:00Z") == stamp(datetime(2024, 5, 1, 10, 0)) == stamp("2024-05-01 10:00:00")
+    assert stamp(None) == MISSING
+    assert stamp("not a date") == MISSING
+
+
+def test_missing_file_does_not_open(state):
+    assert not state.open()
+
+
+def test_write_and_lookup(state):
+    state.write([(1, 10, 100), (5, 50, 500), (9, 90, MISSING)])
+    assert state.count == 3
+    assert state.get(5) == (50, 500)
+    assert state.get(9) == (90, MISSING)
+    assert state.get(4) is None
+    assert state.get(None) is None
+
+
+def test_changes_are_visible_before_and_after_flush(state, tmp_path):
+    state.write([(1, 10, 100), (5, 50, 500), (9, 90, 900)])
+    state.update([(5, 55, 555), (3, 30, 300), (12, 120, 1200), (0, 1, 2)])
+    assert state.get(5) == (55, 555)
+    state.flush()
+    assert state.count == 6
+    reopened = EntityState("Reading", str(tmp_path))
+    assert reopened.open()
+    assert [reopened.get(key) for key in (0, 1, 3, 5, 9, 12)] == [
+        (1, 2), (10, 100), (30, 300), (55, 555), (90, 900), (120, 1200)
+    ]
+    reopened.close()
+
+
+def test_damaged_file_does_not_open(state):
+    state.write([(1, 10, 100)])
+    state.close()
+    with open(state.path, "ab") as handle:
+        handle.write(b"\0")
+    assert not state.open()
+
+
+def test_rebuild_from_the_table(conn, tmp_path):
+    conn.executemany("INSERT INTO ReadingUtilisation (ereserve_id, integration_user_id, item_id, item_usage_id, "
+                     "updated_at, row_hash) VALUES (?, 1, 1, 1, ?, ?)",
+                     [(7, "2024-05-01 10:00:00", 77), (3, None, None), (5, "2024-05-02 00:00:00", -5)])
+    conn.commit()
+    state = EntityState("ReadingUtilisation", str(tmp_path))
+    state.rebuild(conn)
+    assert state.count == 3
+    assert state.get(3) == (MISSING, MISSING)
+    assert state.get(5) == (stamp("2024-05-02T00:00:00Z"), -5)
+    assert state.get(7) == (stamp(datetime(2024, 5, 1, 10)), 77)
+    state.close()
+
+
+def test_change_tracker_drops_unchanged_records(conn, tmp_path, monkeypatch):
+    from fedpipeline.config import ENTITY_STATE_CONFIG
+    from fedpipeline.entity_state import ChangeTracker
+    monkeypatch.setitem(ENTITY_STATE_CONFIG, "PATH", str(tmp_path))
+    conn.execute("INSERT INTO Reading (ereserve_id, reading_title, updated_at) VALUES (1, 't', '2024-05-01 10:00:00')")
+    conn.commit()
+    items = [{"id": "1", "attributes": {"updated-at": "2024-05-01T10:00:00Z"}},
+             {"id": "1", "attributes": {"updated-at": "2024-05-02T10:00:00Z"}},
+             {"id": "2", "attributes": {"updated-at": "2024-05-01T10:00:00Z"}}]
+    with ChangeTracker("Reading", conn) as tracker:
+        assert [item["attributes"]["updated-at"][:10] for item in tracker.changed(items)] == ["2024-05-02", "2024-05-01"]
+        assert tracker.dropped == 1
+
+
+def test_stamps_are_rounded_to_sql_server_datetime_ticks():
+    # SQL Server stores .125 as .127 (1/300 s ticks) and returns that value
+    stored = datetime(2024, 5, 1, 10, 0, 0, 127000)
+    assert stamp("2024-05-01T10:00:00.125Z") != stamp(stored)
+    assert stamp("2024-05-01T10:00:00.125Z", 300) == stamp(stored, 300)
+    # .123 is stored as .123 (.1233...), .129 as .130
+    assert stamp("2024-05-01T10:00:00.123Z", 300) == stamp(datetime(2024, 5, 1, 10, 0, 0, 123333), 300)
+    assert stamp("2024-05-01T10:00:00.129Z", 300) == stamp("2024-05-01T10:00:00.130Z", 300)
+    assert stamp("2024-05-01T10:00:00.125Z", 300) != stamp("2024-05-01T10:00:00.123Z", 300)
+
+
+def test_change_tracker_matches_rounded_database_values(sqlite_backend, conn, tmp_path, monkeypatch):
+    # A table as SQL Server leaves it: the API's .125 read back as .127
+    from fedpipeline.config import ENTITY_STATE_CONFIG
+    from fedpipeline.entity_state import ChangeTracker
+    monkeypatch.setitem(ENTITY_STATE_CONFIG, "PATH", str(tmp_path))
+    monkeypatch.setattr(sqlite_backend, "datetime_ticks", 300)
+    conn.execute("INSERT INTO Reading (ereserve_id, reading_title, updated_at) "
+                 "VALUES (1, 't', '2024-05-01 10:00:00.127000')")
+    conn.commit()
+    items = [{"id": "1", "attributes": {"updated-at": "2024-05-01T10:00:00.125Z"}}]
+    with ChangeTracker("Reading", conn) as tracker:
+        assert list(tracker.changed(items)) == []
+    # committed() reads back the rounded value, which still matches
+    with ChangeTracker("Reading", conn) as tracker:
+        tracker.committed([("1",)])
+    with ChangeTracker("Reading", conn) as tracker:
+        assert list(tracker.changed(items)) == []
+        assert tracker.dropped == 1
+
+
+def test_state_with_the_same_count_but_other_ids_is_rebuilt(conn, tmp_path, monkeypatch):
+    from fedpipeline.config import ENTITY_STATE_CONFIG
+    from fedpipeline.entity_state import ChangeTracker
+    monkeypatch.setitem(ENTITY_STATE_CONFIG, "PATH", str(tmp_path))
+    conn.executemany("INSERT INTO Reading (ereserve_id, reading_title, updated_at) VALUES (?, 't', ?)",
+                     [(1, "2024-05-01 10:00:00"), (2, "2024-05-01 10:00:00")])
+    conn.commit()
+    with ChangeTracker("Reading", conn):
+        pass
+    # Deleted and inserted outside the tracked paths: the count is unchanged
+    conn.execute("DELETE FROM Reading WHERE ereserve_id = 2")
+    conn.execute("INSERT INTO Reading (ereserve_id, reading_title, updated_at) VALUES (3, 't', '2024-05-01 10:00:00')")
+    conn.commit()
+    with ChangeTracker("Reading", conn) as tracker:
+        assert tracker.state.get(2) is None
+        assert tracker.state.get(3) is not None
+        assert tracker.state.key_sum == 4
@@ -0,0 +1,25 @@
+import pytest
+from fedpipeline.initial_load import InitialLoadCheckFailed, initial_load_mode
+
+
+def test_clean_load_finishes(conn, sqlite_backend):
+    with initial_load_mode():
+        conn.execute("INSERT INTO School (ereserve_id, name) VALUES (1, 'Arts')")
+        conn.execute("INSERT INTO Unit (ereserve_id, code, name, school_id) VALUES (10, 'ART101', 'Art', 1)")
+        conn.commit()
+    assert sqlite_backend.enforce_foreign_keys
+
+
+def test_failed_constraint_check_fails_the_load(conn, sqlite_backend):
+    with pytest.raises(InitialLoadCheckFailed, match="--finish"):
+        with initial_load_mode():
+            conn.execute("INSERT INTO Unit (ereserve_id, code, name, school_id) VALUES (10, 'ART101', 'Art', 99)")
+            conn.commit()
+
+
+def test_load_error_is_not_masked_by_the_check(conn, sqlite_backend):
+    with pytest.raises(ValueError):
+        with initial_load_mode():
+            conn.execute("INSERT INTO Unit (ereserve_id, code, name, school_id) VALUES (10, 'ART101', 'Art', 99)")
+            conn.commit()
+            raise ValueError("load failed")
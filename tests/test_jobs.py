@@ -0,0 +1,60 @@
+import subprocess
+import sys
+
+import pytest
+from fedpipeline import api_handler, jobs
+from fedpipeline.jobs import row_hash, with_row_hash
+
+ROW = (101, 7, 3, "2024-05-01T10:00:00Z", None)
+
+
+def test_row_hash_is_pinned():
+    # Stored in the usage tables, so a change here re-merges every row once
+    assert row_hash(ROW) == -2767251598119984459
+
+
+def test_row_hash_is_stable_across_processes():
+    # Unlike hash(), which is salted per process
+    code = f"from fedpipeline.jobs import row_hash; print(row_hash({ROW!r}))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert int(output) == row_hash(ROW)
+
+
+def test_row_hash_is_a_signed_64_bit_value():
+    assert -(1 << 63) <= row_hash(ROW) < (1 << 63)
+
+
+def test_row_hash_changes_with_any_column():
+    changed = [ROW[:i] + ("x",) + ROW[i + 1:] for i in range(len(ROW))]
+    assert len({row_hash(row) for row in changed} | {row_hash(ROW)}) == len(ROW) + 1
+
+
+def test_row_hash_separates_columns():
+    assert row_hash(("ab", "c")) != row_hash(("a", "bc"))
+
+
+def test_with_row_hash_appends_the_hash():
+    assert with_row_hash([ROW]) == [ROW + (row_hash(ROW),)]
+
+
+@pytest.fixture
+def fresh_fallbacks():
+    jobs.reset_fallbacks()
+    yield
+    jobs.reset_fallbacks()
+    api_handler._last_failure.status = None
+
+
+def test_sparse_fields_fallback_only_when_refused(fresh_fallbacks):
+    url = jobs.with_sparse_fields("https://example.test/readings?page[size]=10", "readings")
+    assert "fields[readings]=" in url
+    api_handler._last_failure.status = None
+    assert jobs.sparse_fields_fallback(url, "readings") is None
+    api_handler._last_failure.status = 502
+    assert jobs.sparse_fields_fallback(url, "readings") is None
+    assert jobs.sparse_fields_active("readings")
+    api_handler._last_failure.status = 400
+    assert jobs.sparse_fields_fallback(url, "readings") == "https://example.test/readings?page[size]=10"
+    assert not jobs.sparse_fields_active("readings")
+    jobs.reset_fallbacks()
+    assert jobs.sparse_fields_active("readings")
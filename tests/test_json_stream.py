@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fedpipeline.json_stream import PageStream
+
+
+def chunked(document, size):
+    body = json.dumps(document).encode("utf-8")
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+PAGE = {
+    "data": [{"id": str(n), "type": "readings", "attributes": {"title": f"Lecture {n} – notes", "count": n * 1.5}}
+             for n in range(1, 6)],
+    "included": [{"id": "9", "type": "schools"}],
+    "links": {"next": "https://example.test/readings?page[number]=2"},
+    "meta": {"total": 5},
+}
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 65536])
+def test_items_match_a_full_decode(size):
+    stream = PageStream(chunked(PAGE, size), chunk_size=16)
+    assert list(stream.items()) == PAGE["data"]
+    assert stream.links == PAGE["links"]
+    assert stream.meta == PAGE["meta"]
+    assert stream.included == PAGE["included"]
+    assert stream.item_count == 5
+    assert stream.bytes_read == len(json.dumps(PAGE).encode("utf-8"))
+
+
+def test_members_before_data_are_captured():
+    document = {"links": {"next": None}, "meta": {"x": 1}, "data": [{"id": "1"}]}
+    stream = PageStream(chunked(document, 4))
+    assert list(stream.items()) == [{"id": "1"}]
+    assert stream.links == {"next": None}
+    assert stream.included is None
+
+
+def test_single_resource_document():
+    stream = PageStream(chunked({"data": {"id": "7", "type": "units"}}, 5))
+    assert list(stream.items()) == [{"id": "7", "type": "units"}]
+
+
+def test_empty_page_and_empty_document():
+    assert list(PageStream([b'{"data": [], "links": {}}']).items()) == []
+    assert list(PageStream([b"{ }"]).items()) == []
+
+
+def test_number_split_at_a_chunk_edge():
+    stream = PageStream([b'{"data": [{"id": 12', b'34}], "meta": {"n": 5', b"6}}"])
+    assert list(stream.items()) == [{"id": 1234}]
+    assert stream.meta == {"n": 56}
+
+
+def test_multibyte_character_split_across_chunks():
+    body = '{"data": [{"name": "Ünïcødé"}]}'.encode("utf-8")
+    split = body.index("Ü".encode("utf-8")) + 1
+    assert list(PageStream([body[:split], body[split:]]).items()) == [{"name": "Ünïcødé"}]
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'{"data": [{"id": 1}', b'{"data": [{"id": 1} {"id": 2}]}'])
+def test_malformed_pages(body):
+    with pytest.raises(ValueError):
+        list(PageStream([body]).items())
@@ -0,0 +1,100 @@
+import pytest
+from fedpipeline import api_handler, keyset_paging
+from fedpipeline.keyset_paging import KeysetCursor, SeenIds, id_range, id_range_url, keyset_fallback, keyset_url
+
+URL = "https://example.test/public/v1/readings?page[size]=3"
+NEXT = {"next": "https://example.test/public/v1/readings?page[size]=3&page[number]=2"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_fallbacks():
+    keyset_paging.reset_keyset_fallbacks()
+    yield
+    keyset_paging.reset_keyset_fallbacks()
+    api_handler._last_failure.status = None
+
+
+def test_keyset_url():
+    assert keyset_url(URL) == f"{URL}&sort=id"
+    assert keyset_url(f"{URL}&page[number]=4&sort=name", 17) == f"{URL}&sort=id&filter[id][gt]=17"
+
+
+def test_cursor_continues_after_the_last_id():
+    cursor = KeysetCursor(URL, "readings")
+    assert cursor.first_url() == f"{URL}&sort=id"
+    assert cursor.next_url(["1", "2", "5"], NEXT) == f"{URL}&sort=id&filter[id][gt]=5"
+    assert cursor.next_url(["6", "9", "12"], NEXT) == f"{URL}&sort=id&filter[id][gt]=12"
+    assert cursor.next_url(["13"], {"next": None}) is None
+    assert cursor.active
+
+
+def test_ignored_sort_is_detected():
+    cursor = KeysetCursor(URL, "readings")
+    assert cursor.next_url(["3", "1", "2"], NEXT) == NEXT["next"]
+    assert not cursor.active
+    # Later listings of the entity go straight to links.next
+    assert not KeysetCursor(URL, "readings").active
+
+
+def test_ignored_filter_is_detected():
+    cursor = KeysetCursor(URL, "readings")
+    cursor.next_url(["1", "2", "3"], NEXT)
+    # The "id > 3" page starts from the beginning again
+    assert cursor.next_url(["1", "2", "3"], NEXT) == NEXT["next"]
+    assert not cursor.active
+
+
+def test_id_range_urls():
+    url = id_range_url(URL, 100, 250)
+    assert url == f"{URL}&sort=id&filter[id][gt]=100&filter[id][lte]=250"
+    assert id_range(url) == (100, 250)
+    assert id_range(id_range_url(URL, None, 5)) == (None, 5)
+    assert id_range(URL) == (None, None)
+
+
+def test_cursor_reads_an_id_range():
+    cursor = KeysetCursor(id_range_url(URL, 100, 106), "readings")
+    assert cursor.first_url() == f"{URL}&filter[id][lte]=106&sort=id&filter[id][gt]=100"
+    assert cursor.next_url(["101", "102", "103"], NEXT) == f"{URL}&filter[id][lte]=106&sort=id&filter[id][gt]=103"
+    # Stops at the upper bound even when the server offers more
+    assert cursor.next_url(["104", "105", "106"], NEXT) is None
+    assert cursor.active
+
+
+def test_cursor_detects_an_ignored_lower_bound():
+    cursor = KeysetCursor(id_range_url(URL, 100, None), "readings")
+    assert cursor.next_url(["1", "2", "3"], NEXT) == NEXT["next"]
+    assert not cursor.active
+
+
+def test_page_ranges_and_max_pages_are_not_keyset_paged():
+    assert not KeysetCursor(f"{URL}&page[number]=3", "readings").active
+    assert not KeysetCursor(URL, "readings", max_pages=2).active
+    assert not KeysetCursor(URL, None).active
+
+
+def test_fallback_only_when_refused():
+    cursor = KeysetCursor(URL, "readings")
+    first = cursor.first_url()
+    api_handler._last_failure.status = 503
+    assert cursor.fallback(first) is None
+    assert cursor.active
+    api_handler._last_failure.status = 422
+    assert cursor.fallback(first) == URL
+    assert not cursor.active
+
+
+def test_fallback_lasts_until_reset():
+    api_handler._last_failure.status = 400
+    assert keyset_fallback(f"{URL}&sort=id", "readings") == URL
+    assert not KeysetCursor(URL, "readings").active
+    keyset_paging.reset_keyset_fallbacks()
+    assert KeysetCursor(URL, "readings").active
+
+
+def test_seen_ids_drop_repeats():
+    seen = SeenIds("readings")
+    assert [item["id"] for item in seen.fresh([{"id": "1"}, {"id": "2"}])] == ["1", "2"]
+    assert [item["id"] for item in seen.fresh([{"id": "2"}, {"id": "3"}])] == ["3"]
+    assert seen.fresh_mask(["3", "4", None]) == [False, True, True]
+    assert seen.duplicates == 2
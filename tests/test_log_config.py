@@ -0,0 +1,99 @@
+import json
+import logging
+
+import pytest
+from fedpipeline import log_config
+from fedpipeline.log_config import JsonFormatter, ModuleLevelFilter, RecordLogSampler, configure_logging, stop_logging
+
+
+def make_record(level=logging.INFO, msg="hello %s", args=("world",), module="jobs", name="root"):
+    return logging.LogRecord(name, level, f"/src/{module}.py", 10, msg, args, None, func="load")
+
+
+def test_json_formatter_adds_fields():
+    record = make_record()
+    record.fields = {"table": "Reading", "rows": 3}
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "hello world" and entry["level"] == "INFO" and entry["module"] == "jobs"
+    assert entry["table"] == "Reading" and entry["rows"] == 3
+
+
+def test_module_levels():
+    level_filter = ModuleLevelFilter(logging.INFO, {"jobs": logging.WARNING, "urllib3": logging.DEBUG})
+    assert not level_filter.filter(make_record(logging.INFO, module="jobs"))
+    assert level_filter.filter(make_record(logging.WARNING, module="jobs"))
+    assert level_filter.filter(make_record(logging.INFO, module="db_handler"))
+    assert not level_filter.filter(make_record(logging.DEBUG, module="db_handler"))
+    # Libraries are matched on their logger name
+    assert level_filter.filter(make_record(logging.DEBUG, module="connectionpool", name="urllib3.connectionpool"))
+
+
+@pytest.fixture
+def configure(tmp_path, monkeypatch):
+    # configure_logging on a root logger without handlers (pytest adds its
+    # own during the test, so they are set aside at call time)
+    root = logging.getLogger()
+    saved = {}
+
+    def configure_bare(**kwargs):
+        saved.setdefault("state", (root.handlers[:], root.level))
+        root.handlers = []
+        configure_logging(filename=str(tmp_path / "pipeline.log"), **kwargs)
+
+    monkeypatch.setattr(log_config, "_log_file", None)
+    yield configure_bare
+    stop_logging()
+    if "state" in saved:
+        for handler in root.handlers:
+            handler.close()
+        root.handlers, root.level = saved["state"]
+
+
+def test_async_logging_writes_after_stop(configure, tmp_path):
+    configure(level="INFO", fmt="text", use_async=True, module_levels={})
+    values = ["first"]
+    logging.info("values: %s", values)
+    values.append("changed later")
+    logging.debug("not written")
+    stop_logging()
+    lines = (tmp_path / "pipeline.log").read_text().splitlines()
+    assert len(lines) == 1 and lines[0].endswith("| INFO     | values: ['first']")
+    assert log_config.log_file() == str(tmp_path / "pipeline.log")
+
+
+def test_json_lines_with_a_verbose_module(configure, tmp_path):
+    configure(level="WARNING", fmt="json", use_async=False, module_levels={"db_handler": "DEBUG"})
+    assert logging.getLogger().level == logging.DEBUG
+    logging.info("dropped")
+    logging.warning("kept")
+    logging.getLogger().handle(make_record(logging.DEBUG, "batch %s", (1,), module="db_handler"))
+    entries = [json.loads(line) for line in (tmp_path / "pipeline.log").read_text().splitlines()]
+    assert [(entry["module"], entry["msg"]) for entry in entries] == [
+        ("test_log_config", "kept"), ("db_handler", "batch 1")
+    ]
+
+
+def test_configure_logging_keeps_existing_handlers(tmp_path):
+    handlers = logging.getLogger().handlers[:]
+    configure_logging(filename=str(tmp_path / "pipeline.log"))
+    assert logging.getLogger().handlers == handlers
+    assert not (tmp_path / "pipeline.log").exists()
+
+
+def test_record_sampler(caplog):
+    caplog.set_level(logging.INFO)
+    sampler = RecordLogSampler("Reading", 10, every=4, max_errors=2)
+    for index in range(10):
+        sampler.record(index, ("row", index))
+    for _ in range(5):
+        sampler.failure(("bad",), ValueError("too long"))
+    sampler.summary()
+    messages = [record.getMessage() for record in caplog.records]
+    assert [m for m in messages if "record " in m and "/10" in m] == [
+        "Reading record 1/10: ('row', 0)", "Reading record 5/10: ('row', 4)", "Reading record 9/10: ('row', 8)"
+    ]
+    assert sum("Failed to insert record" in m for m in messages) == 2
+    assert "3 more Reading records failed (5/10 in total); most common errors:" in messages
+    assert "  5 x ValueError: too long" in messages
+    # Attributed to the caller, so MODULE_LEVELS applies to the loading module
+    assert {record.module for record in caplog.records} == {"test_log_config"}
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+from fedpipeline import migrations
+from fedpipeline.migrations import MigrationRunner, apply_migrations, prepare_schema
+
+
+@pytest.fixture
+def extra_migration(tmp_path, monkeypatch, sqlite_backend):
+    # A copy of the migrations directory with room for one more migration
+    directory = tmp_path / "migrations"
+    (directory / "sqlite").mkdir(parents=True)
+    for filename in os.listdir(os.path.join(migrations.MIGRATIONS_DIR, "sqlite")):
+        if filename.endswith(".sql"):
+            source = os.path.join(migrations.MIGRATIONS_DIR, "sqlite", filename)
+            (directory / "sqlite" / filename).write_text(open(source, encoding="utf-8").read())
+    monkeypatch.setattr(migrations, "MIGRATIONS_DIR", str(directory))
+    return directory / "sqlite" / "9999_extra.sql"
+
+
+def test_every_migration_is_applied(sqlite_backend):
+    assert "pending" not in [applied_at for _, _, applied_at in MigrationRunner().status()]
+    assert apply_migrations(optional=[]) == []
+
+
+def test_prepare_schema_applies_pending(extra_migration, sqlite_backend, conn):
+    extra_migration.write_text("CREATE TABLE Extra (id INT);")
+    assert prepare_schema(auto_apply=True) == ["9999"]
+    assert sqlite_backend.table_exists(conn.cursor(), "Extra")
+
+
+def test_prepare_schema_refuses_pending_without_auto_apply(extra_migration):
+    extra_migration.write_text("CREATE TABLE Extra (id INT);")
+    with pytest.raises(RuntimeError, match="9999"):
+        prepare_schema(auto_apply=False)
+    assert prepare_schema(auto_apply=True) == ["9999"]
+    assert prepare_schema(auto_apply=False) == []
+
+
+def test_failed_migration_is_raised_and_not_recorded(extra_migration):
+    extra_migration.write_text("CREATE TABLE Extra (id INT);\nALTER TABLE Missing ADD COLUMN x INT;")
+    with pytest.raises(Exception):
+        prepare_schema(auto_apply=True)
+    assert ("9999", "extra", "pending") in MigrationRunner().status()
@@ -0,0 +1,55 @@
+import requests
+from benchmarks.mock_api import MockServerSettings, SCALES, create_server, start_in_thread
+from fedpipeline.api_handler import fetch_with_retry
+
+
+def ids(document):
+    return [int(item["id"]) for item in document["data"]]
+
+
+def get(server, path):
+    return server.build_page(*path.split("?", 1))
+
+
+def test_pages_follow_links(mock_api):
+    url = f"{mock_api.base_url}/schools?page[size]=2"
+    seen = []
+    while url:
+        body = fetch_with_retry(url).json()
+        seen.extend(ids(body))
+        url = body["links"].get("next")
+    assert seen == list(range(1, SCALES["tiny"]["schools"] + 1))
+
+
+def test_requests_need_a_token(mock_api):
+    response = requests.get(f"{mock_api.base_url}/schools", timeout=5)
+    assert response.status_code == 401
+
+
+def test_id_filters():
+    server = create_server("tiny")
+    assert ids(get(server, "readings?page[size]=5&sort=id&filter[id][gt]=10")) == [11, 12, 13, 14, 15]
+    assert ids(get(server, "readings?page[size]=50&sort=id&filter[id][gt]=10&filter[id][lte]=13")) == [11, 12, 13]
+    assert ids(get(server, "readings?filter[id]=3,1,999")) == [1, 3]
+
+
+def test_sparse_fieldsets_and_includes():
+    server = create_server("tiny")
+    document = get(server, "reading-list-items?page[size]=3&fields[reading-list-items]=&include=reading")
+    assert all(not item.get("attributes") for item in document["data"])
+    assert {item["type"] for item in document["included"]} == {"readings"}
+
+
+def test_data_is_the_same_on_every_request():
+    server = create_server("tiny")
+    assert get(server, "reading-utilisations?page[size]=20") == get(server, "reading-utilisations?page[size]=20")
+
+
+def test_injected_errors():
+    server = create_server("tiny", settings=MockServerSettings(error_rate=1.0))
+    start_in_thread(server)
+    try:
+        assert requests.post(f"{server.base_url}/users/login", json={}, timeout=5).status_code == 503
+    finally:
+        server.shutdown()
+        server.server_close()
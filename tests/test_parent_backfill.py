@@ -0,0 +1,75 @@
+import pytest
+from fedpipeline import parent_backfill
+from fedpipeline.parent_backfill import ParentBackfill
+from fedpipeline.parent_keys import ParentKeyIndex
+
+
+@pytest.fixture
+def backfill(sqlite_backend, conn, mock_api, monkeypatch):
+    monkeypatch.setattr(parent_backfill, "_filter_unsupported", set())
+    return ParentBackfill(conn, ParentKeyIndex(conn), sqlite_backend)
+
+
+def ids(conn, table):
+    return [row[0] for row in conn.execute(f"SELECT ereserve_id FROM {table} ORDER BY ereserve_id")]
+
+
+def test_missing_ids_are_fetched_and_inserted(backfill, conn, mock_api):
+    conn.execute("INSERT INTO IntegrationUser (ereserve_id) VALUES (3)")
+    conn.commit()
+    assert backfill.backfill({"IntegrationUser": ["3", "7", 12, "999"]}) == {"IntegrationUser": 2}
+    assert ids(conn, "IntegrationUser") == [3, 7, 12]
+
+    # Ids asked for once, found or not, are not asked for again
+    pages = mock_api.stats.pages
+    assert backfill.backfill({"IntegrationUser": ["7", "999"]}) == {}
+    assert mock_api.stats.pages == pages
+
+
+def test_parents_of_backfilled_rows_are_fetched_too(backfill, conn):
+    conn.executemany("INSERT INTO Unit (ereserve_id, code, name, school_id) VALUES (?, 'U', 'Unit', 1)",
+                     [(i,) for i in range(1, 31)])
+    conn.commit()
+    added = backfill.backfill({"ReadingListItem": [5]})
+    assert added["ReadingListItem"] == 1
+    assert added["ReadingList"] == 1 and added["Reading"] == 1
+    list_id, reading_id = conn.execute("SELECT list_id, reading_id FROM ReadingListItem").fetchone()
+    assert ids(conn, "ReadingList") == [list_id]
+    assert ids(conn, "Reading") == [reading_id]
+
+
+def test_rows_whose_own_parents_stay_missing_are_left_out(backfill, conn):
+    # Units cannot be backfilled, so a list of a missing unit stays out
+    added = backfill.backfill({"ReadingList": [1]})
+    assert "ReadingList" not in added
+    assert ids(conn, "ReadingList") == []
+
+
+def test_included_resources_are_inserted_without_fetching(backfill, conn, mock_api, monkeypatch):
+    monkeypatch.setitem(parent_backfill.PARENT_BACKFILL_CONFIG, "ENABLED", False)
+    pages = mock_api.stats.pages
+    reading = {"id": "42", "type": "readings", "attributes": {"reading-title": "Included"}}
+    assert backfill.backfill({"Reading": ["42", "43"]}, included={"Reading": [reading]}) == {"Reading": 1}
+    assert ids(conn, "Reading") == [42]
+    assert mock_api.stats.pages == pages
+
+
+def test_server_ignoring_the_id_filter(backfill, conn, monkeypatch):
+    everything = [{"id": str(i), "type": "readings", "attributes": {}} for i in range(1, 4)]
+    monkeypatch.setattr(parent_backfill.jobs, "iter_pages", lambda url, entity, record=True: iter([everything]))
+    assert backfill.backfill({"Reading": [2]}) == {}
+    assert "readings" in parent_backfill._filter_unsupported
+    assert ids(conn, "Reading") == []
+
+
+def test_pages_are_not_recorded(backfill, monkeypatch):
+    calls = []
+    iter_pages = parent_backfill.jobs.iter_pages
+
+    def recording(url, entity=None, record=True, **kwargs):
+        calls.append(record)
+        return iter_pages(url, entity, record=record, **kwargs)
+
+    monkeypatch.setattr(parent_backfill.jobs, "iter_pages", recording)
+    backfill.backfill({"IntegrationUser": [1]})
+    assert calls == [False]
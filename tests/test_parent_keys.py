@@ -0,0 +1,62 @@
+from fedpipeline.parent_keys import BITMAP_MAX_ID, KeySet, ParentKeyIndex, as_key
+
+
+def test_as_key():
+    assert as_key("42") == 42
+    assert as_key(7) == 7
+    assert as_key(None) is None
+    assert as_key("abc") is None
+
+
+def test_key_set_membership():
+    keys = KeySet([0, 1, 9, 1000, 9])
+    assert len(keys) == 4
+    assert 9 in keys and 1000 in keys and 0 in keys
+    assert 2 not in keys and 999 not in keys and 10 ** 6 not in keys
+    assert None not in keys
+
+
+def test_key_set_outliers():
+    keys = KeySet([-5, BITMAP_MAX_ID, BITMAP_MAX_ID + 1])
+    assert len(keys) == 3
+    assert -5 in keys and BITMAP_MAX_ID + 1 in keys
+    assert -4 not in keys and BITMAP_MAX_ID + 2 not in keys
+    keys.add(-5)
+    assert len(keys) == 3
+
+
+def test_key_set_grows_with_ascending_ids():
+    keys = KeySet(range(0, 100_000, 3))
+    assert len(keys) == 33_334
+    assert 99_999 in keys and 99_998 not in keys
+
+
+def test_index_reads_the_table_once(conn):
+    conn.cursor().executemany("INSERT INTO School (ereserve_id, name) VALUES (?, ?)", [(1, "A"), (2, "B")])
+    conn.commit()
+    index = ParentKeyIndex(conn)
+    assert 1 in index.keys("School") and 3 not in index.keys("School")
+    conn.cursor().execute("INSERT INTO School (ereserve_id, name) VALUES (3, 'C')")
+    conn.commit()
+    assert 3 not in index.keys("School")
+    index.add("School", [4])
+    assert 4 in index.keys("School")
+    index.forget("School")
+    assert 3 in index.keys("School") and 4 not in index.keys("School")
+
+
+def test_filter_rows(conn):
+    conn.cursor().executemany("INSERT INTO School (ereserve_id, name) VALUES (?, ?)", [(1, "A"), (2, "B")])
+    conn.commit()
+    index = ParentKeyIndex(conn)
+    index.add("Unit", [10])
+    rows = [
+        (100, "1", 10),     # both parents exist
+        (101, "3", 10),     # missing school
+        (102, "3", None),   # missing school, no unit (nullable)
+        (103, "2", 11),     # missing unit
+        (104, None, 10),    # school is not nullable
+    ]
+    kept, missing = index.filter_rows(rows, [(1, "School", "school", False), (2, "Unit", "unit", True)])
+    assert kept == [(100, "1", 10)]
+    assert missing == {"school": 2, "unit": 1}
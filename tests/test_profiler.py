@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+from fedpipeline import profiler
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    # Profiling on, reports under tmp_path
+    monkeypatch.setattr(profiler, "_enabled", True)
+    monkeypatch.setattr(profiler, "_trace_memory", False)
+    monkeypatch.setattr(profiler, "_log_dir", lambda: str(tmp_path))
+    profiler.begin_run(7)
+    yield tmp_path
+    profiler._run_dir = None
+
+
+def reports(tmp_path):
+    run_dirs = os.listdir(tmp_path / "profiles")
+    assert len(run_dirs) == 1 and run_dirs[0].startswith("run_7_")
+    directory = tmp_path / "profiles" / run_dirs[0]
+    return {name: (directory / name).read_text() for name in sorted(os.listdir(directory))}
+
+
+def test_disabled_stage_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "_enabled", False)
+    monkeypatch.setattr(profiler, "_log_dir", lambda: str(tmp_path))
+    with profiler.profile_stage("fetch"):
+        pass
+    assert not os.listdir(tmp_path)
+
+
+def test_stage_report(profiling):
+    with profiler.profile_stage("fetch readings/page 1"):
+        sum(range(1000))
+    files = reports(profiling)
+    assert list(files) == ["01_fetch_readings_page_1.txt"]
+    report = files["01_fetch_readings_page_1.txt"]
+    assert report.startswith("Stage: fetch readings/page 1\nWall time: ")
+    assert "Top functions" in report and "Peak traced memory" not in report
+
+
+def test_nested_stage_is_profiled_on_its_own(profiling):
+    with profiler.profile_stage("outer"):
+        with profiler.profile_stage("inner"):
+            time.sleep(0.01)
+    files = reports(profiling)
+    assert list(files) == ["01_outer.txt", "02_inner.txt"]
+    # The outer profile is paused while the inner stage runs
+    assert "time.sleep" in files["02_inner.txt"]
+    assert "time.sleep" not in files["01_outer.txt"]
+
+
+def test_memory_peak_is_reported(profiling, monkeypatch):
+    monkeypatch.setattr(profiler, "_trace_memory", True)
+    with profiler.profile_stage("build"):
+        data = [bytes(1024) for _ in range(1000)]
+        del data
+    report = reports(profiling)["01_build.txt"]
+    assert "Peak traced memory" in report and "Allocation hot spots" in report
+
+
+def test_a_failing_stage_is_still_reported(profiling):
+    with pytest.raises(ValueError):
+        with profiler.profile_stage("load"):
+            raise ValueError("boom")
+    assert list(reports(profiling)) == ["01_load.txt"]
@@ -0,0 +1,200 @@
+from array import array
+
+import pytest
+from fedpipeline import api_handler, keyset_paging, reconciliation
+from fedpipeline.reconciliation import find_missing
+
+
+@pytest.fixture(params=["bitmap", "merge"])
+def path(request, monkeypatch):
+    if request.param == "merge":
+        monkeypatch.setattr(reconciliation, "BITMAP_MAX_ID", 0)
+    return request.param
+
+
+def test_finds_ids_missing_upstream(path):
+    assert find_missing([5, 1, 9, 3], [1, 3, 4]) == [5, 9]
+
+
+def test_nothing_missing(path):
+    assert find_missing(array("q", [1, 2, 3]), array("q", [3, 2, 1, 7])) == []
+
+
+def test_empty_inputs(path):
+    assert find_missing([], [1, 2]) == []
+    assert find_missing([2, 1], []) in ([2, 1], [1, 2])
+
+
+def test_duplicate_remote_ids(path):
+    assert find_missing([1, 2, 3], [2, 2, 2]) == [1, 3]
+
+
+def test_bitmap_keeps_local_order():
+    assert find_missing([9, 2, 7, 4], [4]) == [9, 2, 7]
+
+
+def test_large_ids_use_the_merge():
+    top = reconciliation.BITMAP_MAX_ID + 10
+    assert find_missing([top, 1, top - 1], [1, top]) == [top - 1]
+
+
+def test_negative_ids_are_missing():
+    assert find_missing([-1, 1], [1]) == [-1]
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeApi:
+    # Serves the ids of one listing the way the eReserve API does: page[number]
+    # offsets with links.next, keyset paging (sort=id, filter[id][gt]) and
+    # filter[id] lookups, each of which can be switched off
+    def __init__(self, ids, page_size=3, keyset=True, id_filter=True, refuse_keyset=False):
+        self.ids = sorted(ids)
+        self.page_size = page_size
+        self.keyset = keyset
+        self.id_filter = id_filter
+        self.refuse_keyset = refuse_keyset
+        self.urls = []
+
+    def __call__(self, url, record=True, stream=False):
+        self.urls.append(url)
+        base, _, query = url.partition("?")
+        params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+        if self.refuse_keyset and "sort" in params:
+            api_handler._last_failure.status = 400
+            return None
+        ids = self.ids
+        if self.id_filter and "filter[id]" in params:
+            wanted = {int(value) for value in params["filter[id]"].split(",")}
+            ids = [record_id for record_id in ids if record_id in wanted]
+        if self.keyset and "filter[id][gt]" in params:
+            ids = [record_id for record_id in ids if record_id > int(params["filter[id][gt]"])]
+        number = int(params.get("page[number]", 1))
+        page = ids[(number - 1) * self.page_size:number * self.page_size]
+        more = number * self.page_size < len(ids)
+        kept = "&".join(part for part in query.split("&") if not part.startswith("page[number]="))
+        next_url = f"{base}?{kept}&page[number]={number + 1}" if more else None
+        return FakeResponse({"data": [{"id": str(record_id), "type": "readings"} for record_id in page],
+                             "links": {"next": next_url}})
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    def install(api):
+        monkeypatch.setattr(reconciliation, "fetch_with_retry", api)
+        return api
+    keyset_paging.reset_keyset_fallbacks()
+    yield install
+    keyset_paging.reset_keyset_fallbacks()
+
+
+def test_scan_pages_by_id(fake_api):
+    api = fake_api(FakeApi(range(1, 11)))
+    ids, id_ordered = reconciliation.fetch_remote_ids("readings", "")
+    assert list(ids) == list(range(1, 11))
+    assert id_ordered
+    assert all("sort=id" in url for url in api.urls)
+    assert "filter[id][gt]=3" in api.urls[1]
+
+
+def test_scan_detects_ignored_keyset(fake_api):
+    fake_api(FakeApi(range(1, 11), keyset=False))
+    ids, id_ordered = reconciliation.fetch_remote_ids("readings", "")
+    assert sorted(ids) == list(range(1, 11))
+    assert not id_ordered
+
+
+def test_scan_falls_back_when_keyset_is_refused(fake_api):
+    api = fake_api(FakeApi(range(1, 8), refuse_keyset=True))
+    ids, id_ordered = reconciliation.fetch_remote_ids("readings", "")
+    assert list(ids) == list(range(1, 8))
+    assert not id_ordered
+    assert "sort=" not in api.urls[-1]
+
+
+def test_confirm_missing_drops_rows_that_still_exist(fake_api):
+    fake_api(FakeApi([1, 2, 3, 50]))
+    assert reconciliation.confirm_missing("readings", [2, 40, 50, 60], "") == [40, 60]
+
+
+def test_confirm_missing_needs_the_id_filter(fake_api):
+    fake_api(FakeApi([1, 2, 3], id_filter=False))
+    assert reconciliation.confirm_missing("readings", [2, 40], "") is None
+
+
+def insert_readings(conn, ids):
+    conn.executemany("INSERT INTO Reading (ereserve_id, reading_title) VALUES (?, 'title')", [(i,) for i in ids])
+    conn.commit()
+
+
+def reading_ids(conn):
+    return [row[0] for row in conn.execute("SELECT ereserve_id FROM Reading ORDER BY ereserve_id")]
+
+
+def test_hard_mode_deletes_confirmed_rows(fake_api, conn):
+    insert_readings(conn, range(1, 11))
+    fake_api(FakeApi([i for i in range(1, 11) if i != 4]))
+    result = reconciliation.Reconciler("hard").run(["readings"])["readings"]
+    assert result["status"] == "ok" and result["removed"] == 1
+    assert 4 not in reading_ids(conn)
+
+
+def test_hard_mode_refuses_unconfirmable_offset_scan(fake_api, conn):
+    insert_readings(conn, range(1, 11))
+    fake_api(FakeApi([i for i in range(1, 11) if i != 4], keyset=False, id_filter=False))
+    result = reconciliation.Reconciler("hard").run(["readings"])["readings"]
+    assert result["status"] == "unverified"
+    assert reading_ids(conn) == list(range(1, 11))
+
+
+def test_offset_scan_rechecks_before_soft_delete(fake_api, conn, monkeypatch):
+    insert_readings(conn, range(1, 11))
+    api = fake_api(FakeApi(range(1, 11), keyset=False))
+    scan = reconciliation.fetch_remote_ids
+
+    def skipping_scan(entity, fieldset):
+        # Row 6 slips past the offset scan, as when an earlier row is deleted mid-scan
+        ids, id_ordered = scan(entity, fieldset)
+        return array("q", [record_id for record_id in ids if record_id != 6]), id_ordered
+
+    monkeypatch.setattr(reconciliation, "fetch_remote_ids", skipping_scan)
+    result = reconciliation.Reconciler("soft").run(["readings"])["readings"]
+    assert result["missing"] == 0 and result["removed"] == 0
+    assert any("filter[id]=6" in url for url in api.urls)
+
+
+def test_soft_mode_flags_and_restores(fake_api, conn):
+    insert_readings(conn, range(1, 6))
+    fake_api(FakeApi([1, 2, 3, 5]))
+    reconciliation.Reconciler("soft").run(["readings"])
+    assert conn.execute("SELECT ereserve_id FROM Reading WHERE is_deleted = 1").fetchall() == [(4,)]
+    fake_api(FakeApi([1, 2, 3, 4, 5]))
+    result = reconciliation.Reconciler("soft").run(["readings"])["readings"]
+    assert result["restored"] == 1
+    assert conn.execute("SELECT COUNT(*) FROM Reading WHERE is_deleted = 1").fetchone()[0] == 0
+
+
+def test_threshold_blocks_mass_removal(fake_api, conn):
+    insert_readings(conn, range(1, 11))
+    fake_api(FakeApi([1, 2]))
+    result = reconciliation.Reconciler("hard").run(["readings"])["readings"]
+    assert result["status"] == "over_threshold"
+    assert len(reading_ids(conn)) == 10
+
+
+def test_soft_mode_needs_the_migration(fake_api, conn):
+    # A database where migration 0003 has not been applied
+    conn.execute("ALTER TABLE Reading DROP COLUMN deleted_at")
+    conn.execute("ALTER TABLE Reading DROP COLUMN is_deleted")
+    conn.commit()
+    insert_readings(conn, range(1, 6))
+    fake_api(FakeApi([1, 2, 3, 5]))
+    result = reconciliation.Reconciler("soft").run(["readings"])["readings"]
+    assert result["status"] == "not_migrated"
+    assert conn.execute("SELECT COUNT(*) FROM Reading").fetchone()[0] == 5
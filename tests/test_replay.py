@@ -0,0 +1,71 @@
+import json
+from concurrent.futures import Future
+
+import pytest
+from benchmarks.mock_api import create_server
+from fedpipeline import replay
+from fedpipeline.config import LANDING_ZONE_CONFIG
+from fedpipeline.landing_zone import LandingZoneWriter
+
+
+@pytest.fixture
+def landing(tmp_path, monkeypatch):
+    monkeypatch.setitem(LANDING_ZONE_CONFIG, "PATH", str(tmp_path / "landing"))
+    return str(tmp_path / "landing")
+
+
+def write_run(root, run_key, document, pages_per_file=100):
+    writer = LandingZoneWriter(root, run_key, pages_per_file=pages_per_file)
+    writer.write_page("https://api.test/public/v1/readings?page[size]=50", json.dumps(document).encode("utf-8"))
+    writer.close()
+
+
+def readings_page(title=None, first=0, count=50):
+    document = create_server("tiny").build_page("readings", f"page[size]={count}&filter[id][gt]={first}")
+    if title:
+        for item in document["data"]:
+            item["attributes"]["reading-title"] = f"{title} {item['id']}"
+    return document
+
+
+def titles(conn):
+    return dict(conn.execute("SELECT ereserve_id, reading_title FROM Reading"))
+
+
+def test_newest_copy_wins(landing, conn):
+    write_run(landing, "20250601_020000_run1", readings_page("old"))
+    write_run(landing, "20250602_020000_run2", readings_page("new", first=25))
+    assert replay.replay(entities=["readings"], workers=2) == {"Reading": 75}
+    loaded = titles(conn)
+    assert loaded[1] == "old 1" and loaded[26] == "new 26" and loaded[75] == "new 75"
+
+
+def test_upsert_updates_loaded_rows(landing, conn):
+    write_run(landing, "20250601_020000_run1", readings_page("old"))
+    replay.replay(entities=["readings"], workers=1)
+    write_run(landing, "20250602_020000_run2", readings_page("fixed", first=40, count=20))
+    replay.replay(runs=["20250602_020000_run2"], entities=["readings"], workers=1, upsert=True)
+    loaded = titles(conn)
+    assert len(loaded) == 60
+    assert loaded[40] == "old 40" and loaded[41] == "fixed 41" and loaded[60] == "fixed 60"
+
+
+class CountingExecutor:
+    # Runs decode jobs inline and tracks how many results are held at once
+    def __init__(self):
+        self.held = self.most_held = 0
+
+    def submit(self, function, *args):
+        self.held += 1
+        self.most_held = max(self.most_held, self.held)
+        future = Future()
+        future.set_result(args)
+        return future
+
+
+def test_only_a_few_parts_are_decoded_ahead():
+    executor = CountingExecutor()
+    parts = [("readings", f"part-{n}") for n in range(20)]
+    for entity, args in replay.decoded_parts(executor, parts, ahead=3):
+        executor.held -= 1
+    assert executor.most_held == 4
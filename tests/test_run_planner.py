@@ -0,0 +1,86 @@
+import pytest
+from fedpipeline import run_planner
+from fedpipeline.config import API_CONFIG, PAGE_SIZE, PLANNER_CONFIG
+from fedpipeline.run_planner import (
+    Probe, RunPlan, StagePlan, finish_plan, load_history, plan_run, plan_stage, planned_load, planned_page_size,
+    probe,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_plan(monkeypatch):
+    monkeypatch.setattr(run_planner, "_plan", None)
+
+
+def make_plan(rows, first_run=True):
+    probes = {entity: Probe(entity, count, 5000, 0.01) for entity, count in rows.items()}
+    stages = [StagePlan(f"process_{entity}", (entity,)) for entity in rows]
+    return RunPlan(1, stages, probes, first_run=first_run)
+
+
+def test_probe_reads_size_and_page_limit(mock_api):
+    found = probe("readings", API_CONFIG["READINGS_URL"])
+    assert found.rows == 200
+    assert found.max_page_size == 5000
+
+
+def test_probe_detects_a_capped_page_size(mock_api, monkeypatch):
+    monkeypatch.setitem(PLANNER_CONFIG, "MAX_PAGE_SIZE", 10000)
+    found = probe("reading-utilisations", API_CONFIG["READING_UTILISATION_URL"])
+    assert found.rows == 2000
+    # The mock serves at most 5000 rows a page, and the listing is smaller than that
+    assert found.max_page_size == 10000
+
+    monkeypatch.setitem(mock_api.dataset.counts, "reading-utilisations", 6000)
+    assert probe("reading-utilisations", API_CONFIG["READING_UTILISATION_URL"]).max_page_size == 5000
+
+
+def test_page_sizes_and_work_items(sqlite_backend):
+    plan = make_plan({"readings": 200, "reading-utilisations": 120000})
+    assert plan.page_sizes == {"readings": max(200, PAGE_SIZE), "reading-utilisations": 5000}
+    # 24 pages: 4 workers of at least MIN_PAGES_PER_WORKER pages, 6 pages each
+    assert plan.pages_per_item["reading-utilisations"] == 6
+
+
+def test_bulk_loads_only_for_inserts_on_the_first_run(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(run_planner, "_plan", make_plan({"readings": 200, "reading-utilisations": 120000}))
+    bulk = (sqlite_backend.bulk_load_strategy, PLANNER_CONFIG["BULK_BATCH_SIZE"])
+    assert planned_load("ReadingUtilisation") == bulk
+    assert planned_load("Reading") is None
+
+    monkeypatch.setattr(run_planner, "_plan", make_plan({"reading-utilisations": 120000}, first_run=False))
+    assert planned_load("ReadingUtilisation") is None
+    assert planned_load("ReadingUtilisation", upsert=True) == bulk
+
+
+def test_without_a_plan_the_configuration_is_used():
+    assert planned_page_size("readings") == PAGE_SIZE
+    assert planned_load("Reading", upsert=True) is None
+
+
+def test_prediction_uses_earlier_runs(sqlite_backend):
+    plan = make_plan({"readings": 1000})
+    # 1000 rows in 2s, of which 1 page at 1s was requests: 0.001s a row
+    plan.predict({"process_readings": [(1000, 1, 1.0, 2.0)]})
+    stage = plan.stages["process_readings"]
+    assert stage.pages == 1
+    assert stage.predicted_seconds == pytest.approx(0.01 + 1000 * 0.001)
+
+
+def test_plan_run_records_stage_times(sqlite_backend, conn, mock_api):
+    plan = plan_run(7, [("process_readings", ("readings",)), ("process_schools", ("schools",))])
+    assert planned_page_size("readings") == plan.page_sizes["readings"]
+    with plan_stage("process_readings"):
+        pass
+    finish_plan()
+    assert run_planner._plan is None
+    history = load_history(conn, ["process_readings", "process_schools"])
+    assert list(history) == ["process_readings"]
+    assert history["process_readings"][0][0] == 200
+
+
+def test_plan_run_needs_the_stats_table(sqlite_backend, conn, mock_api):
+    conn.execute("DROP TABLE PipelineStageStats")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="0007_stage_stats"):
+        plan_run(None, [("process_schools", ("schools",))])
@@ -0,0 +1,92 @@
+import pytest
+from fedpipeline import jobs, sideloading
+from fedpipeline.config import API_CONFIG
+from fedpipeline.sideloading import Sideloads, load_sideloads, new_sideloads
+
+
+@pytest.fixture(autouse=True)
+def include_supported(monkeypatch):
+    monkeypatch.setattr(sideloading, "_include_unsupported", set())
+    monkeypatch.setitem(sideloading.SIDELOAD_CONFIG, "ENABLED", True)
+
+
+def reading(i):
+    return {"id": str(i), "type": "readings", "attributes": {"reading-title": f"Reading {i}"}}
+
+
+def item(i, reading_id):
+    return {"id": str(i), "type": "reading-list-items",
+            "relationships": {"reading": {"data": {"type": "readings", "id": str(reading_id)}}}}
+
+
+def ids(conn, table):
+    return [row[0] for row in conn.execute(f"SELECT ereserve_id FROM {table} ORDER BY ereserve_id")]
+
+
+def test_only_listings_with_relationships_sideload():
+    assert new_sideloads("schools") is None
+    assert new_sideloads("reading-list-items").relationships == {"list": "reading-lists", "reading": "readings"}
+
+
+def test_included_resources_are_kept_once(sqlite_backend):
+    sideloads = Sideloads("reading-list-items")
+    sideloads.flush_rows = 0
+    sideloads.add([item(1, 1), item(2, 1)], [reading(1), {"id": "9", "type": "schools"}])
+    sideloads.add([item(3, 1), item(4, 2)], [reading(1), reading(2)])
+    assert sideloads.count == 2
+    assert sideloads.by_table() == {"Reading": [reading(1), reading(2)]}
+
+
+def test_resources_are_flushed_during_the_crawl(sqlite_backend, conn):
+    sideloads = Sideloads("reading-list-items")
+    sideloads.flush_rows = 3
+    sideloads.add([item(1, 1)], [reading(1), reading(2)])
+    assert sideloads.count == 2 and ids(conn, "Reading") == []
+    sideloads.add([item(2, 3)], [reading(3), reading(1)])
+    # Three collected: inserted and let go
+    assert sideloads.items == {}
+    assert ids(conn, "Reading") == [1, 2, 3]
+    sideloads.add([item(3, 4)], [reading(4), reading(2)])
+    assert sideloads.count == 1
+
+    assert load_sideloads(sideloads) == {"Reading": 4}
+    assert sideloads.collected == 4
+    assert ids(conn, "Reading") == [1, 2, 3, 4]
+
+
+def test_server_ignoring_include(sqlite_backend):
+    sideloads = Sideloads("reading-list-items")
+    sideloads.add([item(1, 1)], None)
+    assert sideloads.relationships == {}
+    assert "reading-list-items" in sideloading._include_unsupported
+    assert new_sideloads("reading-list-items") is None
+
+
+def test_page_without_linkage_is_not_taken_for_ignored_include():
+    sideloads = Sideloads("reading-list-items")
+    sideloads.add([{"id": "1", "type": "reading-list-items"}], None)
+    assert sideloads.relationships
+
+
+def test_refused_include_falls_back(monkeypatch):
+    monkeypatch.setattr(sideloading, "last_request_rejected", lambda: True)
+    sideloads = Sideloads("reading-list-items")
+    url = ("http://api/reading-list-items?page[size]=10&include=list,reading"
+           "&fields[reading-list-items]=status,list,reading&fields[readings]=genre")
+    assert sideloads.fallback(url) == "http://api/reading-list-items?page[size]=10&fields[reading-list-items]=status"
+    assert sideloads.relationships == {}
+
+
+def test_crawl_loads_sideloaded_parents(sqlite_backend, conn, mock_api, monkeypatch):
+    monkeypatch.setitem(sideloading.SIDELOAD_CONFIG, "FLUSH_ROWS", 50)
+    sideloads = new_sideloads("reading-list-items")
+    url = f"{API_CONFIG['READING_LIST_ITEMS_URL']}?page[size]=100"
+    held = []
+    add = sideloads.add
+    monkeypatch.setattr(sideloads, "add", lambda data, included: add(data, included) or held.append(sideloads.count))
+    rows = jobs.fetch_rows(url, "reading-list-items", jobs.format_reading_list_items, sideloads=sideloads)
+    added = load_sideloads(sideloads)
+    referenced = {row[2] for row in rows}
+    assert set(map(str, ids(conn, "Reading"))) == {str(key) for key in referenced}
+    assert added["Reading"] == len(referenced)
+    assert max(held) < 50
@@ -0,0 +1,43 @@
+from fedpipeline.spill_buffer import SpillBuffer
+
+
+def rows(start, count):
+    return [(i, f"name {i}", "2024-01-01T00:00:00Z") for i in range(start, start + count)]
+
+
+def test_small_load_stays_in_memory(tmp_path):
+    with SpillBuffer("test", budget_bytes=10 ** 9, chunk_rows=4, directory=str(tmp_path)) as buffer:
+        buffer.extend(rows(0, 10))
+        assert buffer.spilled_rows == 0
+        assert [len(chunk) for chunk in buffer.chunks()] == [4, 4, 2]
+        assert len(buffer) == 10
+
+
+def test_rows_over_budget_are_spilled_in_order(tmp_path):
+    with SpillBuffer("test", budget_bytes=2000, chunk_rows=7, directory=str(tmp_path)) as buffer:
+        for start in range(0, 100, 10):
+            buffer.extend(rows(start, 10))
+        buffer.extend(iter(rows(100, 3)))
+        assert buffer.spilled_rows > 0
+        assert buffer.spilled_bytes > 0
+        assert len(buffer._rows) < 103
+        read = [row for chunk in buffer.chunks() for row in chunk]
+        assert read == rows(0, 103)
+        # chunks() can be read again
+        assert sum(len(chunk) for chunk in buffer.chunks()) == 103
+
+
+def test_empty_buffer(tmp_path):
+    with SpillBuffer("test", budget_bytes=100, directory=str(tmp_path)) as buffer:
+        buffer.extend([])
+        assert list(buffer.chunks()) == []
+        assert len(buffer) == 0
+
+
+def test_close_releases_everything(tmp_path):
+    buffer = SpillBuffer("test", budget_bytes=100, chunk_rows=5, directory=str(tmp_path / "spill"))
+    buffer.extend(rows(0, 20))
+    assert buffer._file is not None
+    buffer.close()
+    assert buffer._file is None
+    assert list(buffer.chunks()) == []
@@ -0,0 +1,140 @@
+import json
+import threading
+import pytest
+from fedpipeline import jobs, tracing
+from fedpipeline.config import API_CONFIG, TRACING_CONFIG
+from fedpipeline.tracing import begin_run, end_run, in_current_span, merge_traces, span, start_span, traced
+
+
+@pytest.fixture
+def traced_run(tmp_path, monkeypatch):
+    # Tracing on, with the run's trace written under tmp_path
+    monkeypatch.setattr(tracing, "_enabled", True)
+    monkeypatch.setattr(tracing, "_events", [])
+    monkeypatch.setattr(tracing, "_thread_names", {})
+    monkeypatch.setitem(TRACING_CONFIG, "OUTPUT_DIR", str(tmp_path))
+    yield tmp_path
+    end_run()
+
+
+def spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [event for event in json.load(f)["traceEvents"] if event["ph"] == "X"]
+
+
+def written(directory):
+    (path,) = directory.glob("run_*.json")
+    return {event["name"]: event for event in spans(path)}
+
+
+def test_nothing_is_kept_while_tracing_is_off(monkeypatch):
+    monkeypatch.setattr(tracing, "_enabled", False)
+    monkeypatch.setattr(tracing, "_events", [])
+    with span("stage") as current:
+        current.set(rows=1)
+    start_span("page").end()
+    assert traced("call")(lambda: [1])() == [1]
+    assert tracing._events == []
+
+
+def test_nested_spans_know_their_parent(traced_run):
+    begin_run(42)
+    with span("stage", "stage") as stage:
+        with span("page", "page", number=1) as page:
+            page.set(items=3)
+    end_run()
+    events = written(traced_run)
+    assert events["run"]["args"]["run_id"] == 42
+    assert events["stage"]["args"]["parent_id"] == events["run"]["args"]["span_id"]
+    assert events["page"]["args"] == dict(number=1, items=3, span_id=page.span_id, parent_id=stage.span_id)
+
+
+def test_failed_block_records_the_error(traced_run):
+    begin_run(1)
+    with pytest.raises(ValueError):
+        with span("stage"):
+            raise ValueError("bad row")
+    end_run()
+    assert written(traced_run)["stage"]["args"]["error"] == "ValueError: bad row"
+
+
+def test_started_span_is_current_only_when_activated(traced_run):
+    begin_run(1)
+    page = start_span("page", "page")
+    with span("sibling") as sibling:
+        pass
+    with tracing.activate(page):
+        with span("decode") as decode:
+            pass
+    page.end(items=2)
+    page.end(items=5)
+    end_run()
+    events = written(traced_run)
+    assert sibling.parent_id == page.parent_id
+    assert decode.parent_id == page.span_id
+    assert events["page"]["args"]["items"] == 2
+
+
+def test_thread_pool_work_keeps_its_parent(traced_run):
+    begin_run(1)
+    seen = []
+
+    def work(i):
+        with span("fetch", i=i) as current:
+            seen.append(current.parent_id)
+
+    with span("backfill") as parent:
+        threads = [threading.Thread(target=in_current_span(work), args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with span("unwrapped") as control:
+            pass
+    end_run()
+    assert seen == [parent.span_id] * 3
+    assert control.parent_id == parent.span_id
+
+
+def test_traced_function_counts_list_rows(traced_run):
+    begin_run(1)
+    assert traced("build_rows", "rows")(lambda n: list(range(n)))(4) == [0, 1, 2, 3]
+    end_run()
+    assert written(traced_run)["build_rows"]["args"]["rows"] == 4
+
+
+def test_spans_past_the_limit_are_dropped(traced_run, monkeypatch):
+    monkeypatch.setitem(TRACING_CONFIG, "MAX_EVENTS", 2)
+    begin_run(1)
+    for i in range(5):
+        with span(f"page {i}"):
+            pass
+    end_run()
+    assert sorted(written(traced_run)) == ["page 0", "page 1"]
+    assert tracing._dropped == 0
+
+
+def test_crawl_spans(traced_run, mock_api):
+    begin_run(1)
+    with span("stage", "stage"):
+        list(jobs.iter_pages(f"{API_CONFIG['READINGS_URL']}?page[size]=100", "readings"))
+    end_run()
+    (path,) = traced_run.glob("run_*.json")
+    events = spans(path)
+    by_id = {event["args"]["span_id"]: event for event in events}
+    pages = [event for event in events if event["name"] == "page"]
+    assert [page["args"].get("items") for page in pages][:2] == [100, 100]
+    for name, parent in (("page", "stage"), ("http.get", "page"), ("json.decode", "page")):
+        for event in events:
+            if event["name"] == name:
+                assert by_id[event["args"]["parent_id"]]["name"] == parent
+
+
+def test_merge_combines_process_files(tmp_path):
+    for pid, ts in ((1, 20), (2, 10)):
+        tracing.write_trace(str(tmp_path / f"run_1_pid{pid}.json"),
+                            [{"name": f"worker {pid}", "ph": "X", "ts": ts, "dur": 1, "pid": pid, "tid": 1}],
+                            {1: "MainThread"})
+    output = tmp_path / "merged" / "run_1.json"
+    assert merge_traces(sorted(map(str, tmp_path.glob("run_1_*.json"))), str(output)) == 2
+    assert [event["name"] for event in spans(output)] == ["worker 2", "worker 1"]
@@ -0,0 +1,95 @@
+import json
+import pytest
+from fedpipeline import jobs, transform_pool
+from fedpipeline.config import API_CONFIG
+from fedpipeline.transform_pool import TransformPool, shutdown_transform_pool, submit_page
+
+
+def school(i, updated="2024-05-01T09:00:00+10:00"):
+    return {"id": str(i), "type": "schools", "attributes": {"name": f"School {i}", "updated-at": updated}}
+
+
+def body(items, **document):
+    return json.dumps(dict(document, data=items)).encode()
+
+
+@pytest.fixture
+def pool():
+    started = TransformPool(1)
+    yield started
+    started.close()
+
+
+@pytest.fixture
+def pool_enabled(monkeypatch):
+    monkeypatch.setattr(transform_pool, "_enabled", True)
+    monkeypatch.setattr(transform_pool, "_workers", 1)
+    yield
+    shutdown_transform_pool()
+
+
+def test_worker_builds_the_same_rows(pool):
+    items = [school(1), school(2)]
+    page = pool.submit(body(items, links={"next": "http://api/schools?page=2"}), "format_schools",
+                       included=True, hashed=True)
+    assert page.ids == ["1", "2"]
+    assert page.links == {"next": "http://api/schools?page=2"}
+    assert page.first == items[0]
+    # Included was asked for but the document has none
+    assert page.included is None
+    assert page.rows() == (jobs.with_row_hash(jobs.format_schools(items)), None)
+
+
+def test_formatter_arguments_and_included(pool):
+    included = [{"id": "7", "type": "schools"}]
+    page = pool.submit(body([{"id": "3", "type": "units", "attributes": {}}], included=included),
+                       "format_units", (7,), included=True)
+    assert page.included == included
+    rows, _ = page.rows()
+    assert rows == jobs.format_units([{"id": "3", "type": "units", "attributes": {}}], 7)
+
+
+def test_rows_keep_only_fresh_items(pool):
+    items = [school(1, "a"), school(2, "b"), school(3, "c")]
+    page = pool.submit(body(items), "format_schools", stamps=True)
+    rows, updated = page.rows([True, False, True])
+    assert rows == jobs.format_schools([items[0], items[2]])
+    assert updated == ["a", "c"]
+
+
+def test_bad_page_fails_its_transform_only(pool):
+    bad = pool.submit(b"{not json", "format_schools")
+    with pytest.raises(RuntimeError, match="Transform worker failed: JSONDecodeError"):
+        bad.rows()
+    with pytest.raises(RuntimeError):
+        bad.ids
+    good = pool.submit(body([school(1)]), "format_schools")
+    assert good.ids == ["1"]
+    assert not pool.broken
+
+
+def test_dead_worker_breaks_the_pool(pool):
+    worker = pool._processes[0]
+    worker.kill()
+    worker.join()
+    page = pool.submit(body([school(1)]), "format_schools")
+    assert isinstance(page._rows.exception(timeout=10), RuntimeError)
+    assert "exited with code" in pool.broken
+    with pytest.raises(RuntimeError, match="Transform pool unavailable"):
+        pool.submit(body([school(1)]), "format_schools")
+
+
+def test_broken_pool_is_replaced(pool_enabled):
+    first = transform_pool._get_pool()
+    first._break("test")
+    page = submit_page(body([school(1)]), jobs.format_schools)
+    assert transform_pool._pool is not first
+    assert page.ids == ["1"]
+
+
+def test_pooled_crawl_matches_the_unpooled_one(mock_api, pool_enabled, monkeypatch):
+    url = f"{API_CONFIG['READINGS_URL']}?page[size]=50"
+    pooled = jobs.fetch_rows(url, "readings", jobs.format_readings)
+    monkeypatch.setattr(transform_pool, "_enabled", False)
+    assert pooled == jobs.fetch_rows(url, "readings", jobs.format_readings)
+    assert len(pooled) == 200
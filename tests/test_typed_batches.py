@@ -0,0 +1,63 @@
+from datetime import date, datetime
+
+from fedpipeline.jobs import READING_LIST_ITEM_USAGE_QUERY
+from fedpipeline.typed_batches import TypedBatch, bound_columns, to_bool, to_date, to_datetime, to_int
+
+
+def test_bound_columns_skip_literals():
+    query = "INSERT INTO T (a, b, c, d) VALUES (?, 1, ?, ?)"
+    assert bound_columns(query) == ["a", "c", "d"]
+    assert bound_columns("UPDATE T SET a = ?") is None
+
+
+def test_rows_are_converted_to_column_types():
+    batch = TypedBatch("TeachingSession", ["ereserve_id", "name", "start_date", "archived", "updated_at"],
+                       ["INT", "NVARCHAR(255)", "DATE", "BIT", "DATETIME"],
+                       [("12", "Semester 1", "2024-02-26", "false", "2024-05-01T10:00:00.123Z")])
+    assert batch.rows == [(12, "Semester 1", date(2024, 2, 26), False, datetime(2024, 5, 1, 10, 0, 0, 123000))]
+    assert batch.rejected == []
+
+
+def test_offsets_keep_the_written_clock_time():
+    assert to_datetime("2024-05-01T20:00:00+10:00") == datetime(2024, 5, 1, 20, 0)
+    assert to_datetime("2024-05-01T20:00:00Z") == datetime(2024, 5, 1, 20, 0)
+
+
+def test_booleans():
+    assert [to_bool(value) for value in (True, 0, 1, "TRUE", " no ", "f")] == [True, False, True, True, False, False]
+
+
+def test_empty_strings_are_null():
+    assert [to_bool(""), to_bool("  "), to_int(""), to_datetime(""), to_date(" ")] == [None] * 5
+    batch = TypedBatch("TeachingSession", ["ereserve_id", "archived", "start_date"], ["INT", "BIT", "DATE"],
+                       [("1", "", "")])
+    assert batch.rows == [(1, None, None)]
+
+
+def test_unknown_boolean_is_rejected():
+    batch = TypedBatch("TeachingSession", ["ereserve_id", "archived"], ["INT", "BIT"], [("1", "maybe")])
+    assert batch.rows == []
+    assert "archived (BIT)" in batch.rejected[0][1]
+
+
+def test_bad_rows_are_set_aside_with_a_reason():
+    batch = TypedBatch("School", ["ereserve_id", "name"], ["INT", "NVARCHAR(5)"],
+                       [(1, "Arts"), ("x", "Law"), (3, "Engineering"), (4, None)])
+    assert batch.rows == [(1, "Arts"), (4, None)]
+    assert [row for row, _ in batch.rejected] == [("x", "Law"), (3, "Engineering")]
+    assert "ereserve_id (INT)" in batch.rejected[0][1]
+    assert "name (NVARCHAR(5))" in batch.rejected[1][1]
+
+
+def test_for_query_uses_the_table_types():
+    columns = bound_columns(READING_LIST_ITEM_USAGE_QUERY)
+    row = tuple("2024-01-01T00:00:00Z" if column in ("created_at", "updated_at") else "5" for column in columns)
+    batch = TypedBatch.for_query("ReadingListItemUsage", READING_LIST_ITEM_USAGE_QUERY, [row])
+    assert batch.columns == columns
+    assert isinstance(batch.rows[0][0], int)
+    assert TypedBatch.for_query("NoSuchTable", READING_LIST_ITEM_USAGE_QUERY, [row]) is None
+
+
+def test_empty_batch():
+    batch = TypedBatch("School", ["ereserve_id", "name"], ["INT", "NVARCHAR(255)"], [])
+    assert batch.rows == [] and batch.rejected == []
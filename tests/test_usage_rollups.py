@@ -0,0 +1,73 @@
+import pytest
+from fedpipeline.usage_rollups import UsageRollups
+
+USAGE_COLUMNS = "ereserve_id, list_id, integration_user_id, item_usage_count, created_at, updated_at, row_hash"
+
+
+@pytest.fixture
+def usage(conn):
+    conn.executemany("INSERT INTO ReadingList (ereserve_id, unit_id, teaching_session_id, name) VALUES (?, ?, ?, 'list')",
+                     [(1, 10, 100), (2, 20, 200), (3, None, None)])
+    conn.executemany(f"INSERT INTO ReadingListUsage ({USAGE_COLUMNS}) VALUES (?, ?, 1, 0, ?, ?, ?)", [
+        (1, 1, "2024-05-01 09:00:00", "2024-05-01 09:00:00", 11),
+        (2, 1, "2024-05-01 12:00:00", "2024-05-01 12:00:00", 22),
+        (3, 2, "2024-05-02 08:00:00", "2024-05-02 08:00:00", 33),
+    ])
+    # So that UsageDailyByReading has a key too
+    conn.execute("INSERT INTO ReadingListItem (ereserve_id, list_id, reading_id) VALUES (1, 1, 5)")
+    conn.execute("INSERT INTO ReadingListItemUsage (ereserve_id, item_id, list_usage_id, integration_user_id, "
+                 "created_at) VALUES (1, 1, 1, 1, '2024-05-01 09:00:00')")
+    conn.commit()
+    return conn
+
+
+def unit_session_rollup(conn):
+    return conn.execute("SELECT unit_id, teaching_session_id, usage_date, list_usages FROM UsageDailyByUnitSession "
+                        "ORDER BY unit_id, usage_date").fetchall()
+
+
+def merge(conn, sqlite_backend, rows):
+    # What the staging MERGE does for ReadingListUsage: capture, upsert changed rows, apply
+    conn.execute(f"CREATE TEMP TABLE Source ({USAGE_COLUMNS})")
+    conn.executemany("INSERT INTO Source VALUES (?, ?, 1, 0, ?, ?, ?)", rows)
+    rollups = UsageRollups(conn, backend=sqlite_backend)
+    assert rollups.prepare() == "incremental"
+    source_query = "SELECT * FROM temp.Source"
+    rollups.capture("ReadingListUsage", source_query)
+    conn.execute(sqlite_backend.upsert_from_select_sql("ReadingListUsage", "ereserve_id", USAGE_COLUMNS.split(", "),
+                                                       source_query, change_column="row_hash"))
+    written = rollups.apply()
+    rollups.clear()
+    conn.commit()
+    return rollups, written
+
+
+def test_empty_rollups_are_rebuilt(usage, sqlite_backend):
+    rollups = UsageRollups(usage, backend=sqlite_backend)
+    assert rollups.prepare() == "rebuild"
+    rollups.apply()
+    assert unit_session_rollup(usage) == [(10, 100, "2024-05-01", 2), (20, 200, "2024-05-02", 1)]
+    assert usage.execute("SELECT * FROM UsageDailyByReading").fetchall() == [(5, "2024-05-01", 1, 0)]
+
+
+def test_deltas_follow_new_moved_and_unchanged_rows(usage, sqlite_backend):
+    UsageRollups(usage, backend=sqlite_backend).rebuild()
+    rollups, written = merge(usage, sqlite_backend, [
+        (1, 1, "2024-05-01 09:00:00", "2024-05-01 09:00:00", 11),   # unchanged
+        (3, 3, "2024-05-02 08:00:00", "2024-05-03 08:00:00", 34),   # moved to a list without a unit
+        (4, 2, "2024-05-04 08:00:00", "2024-05-04 08:00:00", 44),   # new
+    ])
+    assert unit_session_rollup(usage) == [
+        (0, 0, "2024-05-02", 1), (10, 100, "2024-05-01", 2), (20, 200, "2024-05-04", 1),
+    ]
+    # The key whose only row moved away is removed rather than left at zero
+    assert written["UsageDailyByUnitSession"] == 3
+    assert rollups.verify() == {"UsageDailyByUnitSession": 0, "UsageDailyByReading": 0}
+
+
+def test_unchanged_merge_writes_nothing(usage, sqlite_backend):
+    UsageRollups(usage, backend=sqlite_backend).rebuild()
+    before = unit_session_rollup(usage)
+    _, written = merge(usage, sqlite_backend, [(2, 1, "2024-05-01 12:00:00", "2024-05-01 12:00:00", 22)])
+    assert written["UsageDailyByUnitSession"] == 0
+    assert unit_session_rollup(usage) == before
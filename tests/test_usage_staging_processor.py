@@ -0,0 +1,97 @@
+import pytest
+from fedpipeline.config import DB_LOAD_CONFIG
+from fedpipeline.usage_staging_processor import UsageStagingProcessor
+
+USAGE_COLUMNS = "ereserve_id, list_id, integration_user_id, item_usage_count, created_at, updated_at, row_hash"
+ROWS = [(i, 1, 1, i, "2024-05-01 09:00:00", "2024-05-01 09:00:00", i * 11) for i in range(1, 11)]
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    monkeypatch.setitem(DB_LOAD_CONFIG, "MERGE_CHUNK_ROWS", 3)
+
+
+@pytest.fixture
+def staged(sqlite_backend):
+    # A connection with the staging tables of a new processor, holding ROWS
+    # for ReadingListUsage; the other usage tables stage nothing
+    connection = sqlite_backend.connect(autocommit=False)
+    connection.execute("INSERT INTO IntegrationUser (ereserve_id) VALUES (1)")
+    connection.execute("INSERT INTO ReadingList (ereserve_id, name) VALUES (1, 'list')")
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def stage(processor, conn):
+    assert processor.create_staging_tables(conn)
+    conn.executemany(f"INSERT INTO {processor.stage_table('ReadingListUsage')} ({USAGE_COLUMNS}) "
+                     f"VALUES (?, ?, ?, ?, ?, ?, ?)", ROWS)
+    conn.commit()
+
+
+def loaded(conn):
+    return [row[0] for row in conn.execute("SELECT ereserve_id FROM ReadingListUsage ORDER BY ereserve_id")]
+
+
+def test_chunked_merge_commits_every_range(chunked, staged):
+    processor = UsageStagingProcessor()
+    stage(processor, staged)
+    ranges = []
+    merge_table = processor.merge_table
+    processor.merge_table = lambda cursor, rollups, table, query: ranges.append(table) or merge_table(
+        cursor, rollups, table, query)
+    assert processor.finalize_staging_to_main(staged)
+    assert loaded(staged) == list(range(1, 11))
+    assert ranges.count("ReadingListUsage") == 4
+    assert processor.merged_ranges["ReadingListUsage"] == 10
+    assert processor.metrics["records_inserted"] == 10
+
+
+def test_retry_resumes_after_the_last_committed_chunk(chunked, staged):
+    processor = UsageStagingProcessor()
+    stage(processor, staged)
+    merge_table = processor.merge_table
+    calls = []
+
+    def failing_second_chunk(cursor, rollups, table, query):
+        calls.append(query)
+        if len(calls) == 2:
+            raise RuntimeError("deadlock")
+        return merge_table(cursor, rollups, table, query)
+
+    processor.merge_table = failing_second_chunk
+    assert not processor.finalize_staging_to_main(staged)
+    assert loaded(staged) == [1, 2, 3]
+    assert processor.merged_ranges["ReadingListUsage"] == 3
+
+    assert processor.finalize_staging_to_main(staged)
+    assert loaded(staged) == list(range(1, 11))
+    # The first chunk is not merged again, and its rows are counted once
+    assert not any("BETWEEN 1 AND 3" in query for query in calls[2:])
+    assert processor.metrics["records_inserted"] == 10
+
+
+def test_progress_is_not_kept_across_processors(chunked, staged):
+    # A new run merges its whole window again; the committed rows are unchanged
+    first = UsageStagingProcessor()
+    stage(first, staged)
+    assert first.finalize_staging_to_main(staged)
+
+    second = UsageStagingProcessor()
+    second.batch_id = first.batch_id + "_2"
+    stage(second, staged)
+    assert second.merged_ranges == {}
+    assert second.finalize_staging_to_main(staged)
+    assert second.metrics["records_inserted"] == 0
+    assert second.metrics["records_updated"] == 0
+    assert second.metrics["records_unchanged"] == 10
+
+
+def test_unchunked_merge_is_one_transaction(monkeypatch, staged):
+    monkeypatch.setitem(DB_LOAD_CONFIG, "MERGE_CHUNK_ROWS", 0)
+    processor = UsageStagingProcessor()
+    stage(processor, staged)
+    assert processor.finalize_staging_to_main(staged)
+    assert loaded(staged) == list(range(1, 11))
+    assert processor.merged_ranges == {}
@@ -0,0 +1,95 @@
+import pytest
+from fedpipeline import work_queue
+from fedpipeline.work_queue import WorkQueue, coordinate_run
+
+
+def item(phase, entity="schools", url=None):
+    return (phase, entity, url or f"http://api/{entity}", None, None)
+
+
+@pytest.fixture
+def queue(sqlite_backend):
+    return WorkQueue(worker="test-worker")
+
+
+def test_later_phase_waits_for_earlier_one(queue):
+    queue.enqueue(1, [item(0), item(1, "units")])
+    first = queue.claim(1)
+    assert first["entity"] == "schools"
+    # Phase 0 is still claimed
+    assert queue.claim(1) is None
+    queue.finish(first["item_id"], 10)
+    assert queue.claim(1)["entity"] == "units"
+
+
+def test_failed_attempt_goes_back_to_pending(queue):
+    queue.enqueue(1, [item(0)])
+    claimed = queue.claim(1)
+    queue.fail(claimed["item_id"], "boom")
+    assert queue.counts(1) == {"PENDING": 1}
+    assert queue.claim(1)["item_id"] == claimed["item_id"]
+
+
+def test_failed_item_blocks_later_phases(queue):
+    queue.max_attempts = 1
+    queue.enqueue(1, [item(0), item(1, "units")])
+    queue.fail(queue.claim(1)["item_id"], "boom")
+    assert queue.claim(1) is None
+    assert queue.counts(1) == {"FAILED": 1, "PENDING": 1}
+    assert queue.finished(1)
+
+
+def test_other_items_of_a_failed_phase_still_run(queue):
+    queue.max_attempts = 1
+    queue.enqueue(1, [item(0, "schools"), item(0, "readings"), item(1, "units")])
+    queue.fail(queue.claim(1)["item_id"], "boom")
+    assert not queue.finished(1)
+    assert queue.claim(1)["entity"] == "readings"
+
+
+def test_stale_claim_is_requeued(queue):
+    queue.enqueue(1, [item(0)])
+    queue.claim(1)
+    queue.claim_timeout = -1
+    assert queue.requeue_stale(1) == 1
+    assert queue.counts(1) == {"PENDING": 1}
+
+
+def test_runs_are_kept_apart(queue):
+    queue.enqueue(1, [item(0)])
+    queue.enqueue(2, [item(1, "units")])
+    # Run 2's only phase is its lowest, whatever run 1 is doing
+    assert queue.claim(2)["entity"] == "units"
+    assert queue.claim(2) is None
+    assert queue.claim(1)["entity"] == "schools"
+
+
+def test_coordinate_run_works_every_item(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(work_queue, "plan_run", lambda entities, usage_staging: [item(0), item(1, "units")])
+    processed = []
+    monkeypatch.setattr(work_queue, "process_item", lambda claimed: processed.append(claimed["entity"]) or 5)
+    assert coordinate_run(1, ["schools", "units"], False, local_workers=0) == {"DONE": 2}
+    assert processed == ["schools", "units"]
+
+
+def test_coordinate_run_stops_at_a_failed_phase(sqlite_backend, monkeypatch):
+    monkeypatch.setitem(work_queue.WORK_QUEUE_CONFIG, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(work_queue, "plan_run", lambda entities, usage_staging: [item(0), item(1, "units")])
+    processed = []
+
+    def process_item(claimed):
+        processed.append(claimed["entity"])
+        raise RuntimeError("server error")
+
+    monkeypatch.setattr(work_queue, "process_item", process_item)
+    with pytest.raises(RuntimeError, match="1 of 2 work items failed; 1 were not run"):
+        coordinate_run(1, ["schools", "units"], False, local_workers=0)
+    # Two attempts at the schools item; the units never ran
+    assert processed == ["schools", "schools"]
+
+
+def test_missing_table_names_the_migration(sqlite_backend, conn):
+    conn.cursor().execute("DROP TABLE PipelineWorkQueue")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="0006_work_queue"):
+        WorkQueue()